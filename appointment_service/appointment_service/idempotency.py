@@ -0,0 +1,162 @@
+# idempotency.py
+"""
+Header Idempotency-Key cho các API tạo mới (POST), dùng chung cho các service Django (appointment/clinical).
+Mỗi service giữ một bản sao giống hệt file này trong package project của nó; model lưu kết quả
+nằm trong app của service (settings.IDEMPOTENCY_MODEL, ví dụ 'appointments.IdempotencyRecord').
+Sửa ở một bản thì chép sang các bản còn lại: SharedModuleTests (appointment_service/appointments/tests.py) báo lỗi khi chúng khác nhau.
+
+- Client sinh một key ngẫu nhiên (UUID) cho mỗi thao tác và gửi lại đúng key đó khi retry.
+- Lần đầu: ghi 1 dòng "đang xử lý" (key -> hash của request), chạy view, lưu status + body của response.
+- Retry cùng key, cùng request: trả lại response đã lưu (header Idempotent-Replayed: true) bằng 1 query
+  trên bảng này, không chạy lại validate/ghi vào các bảng nghiệp vụ.
+- Cùng key nhưng khác request (method/path/body) -> 422; request đầu còn đang chạy -> 409.
+- Response 5xx/exception không được lưu: key được trả lại để client retry thật sự.
+- Key có hạn IDEMPOTENCY_TTL_SECONDS; dòng hết hạn được ghi đè khi dùng lại key, và được xóa
+  bằng lệnh `manage.py purge_idempotency_keys`.
+- Nếu process chết sau khi ghi dữ liệu nhưng trước khi lưu response, dòng "đang xử lý" bị bỏ sau
+  IDEMPOTENCY_LOCK_SECONDS và request được chạy lại (các ràng buộc unique của nghiệp vụ vẫn chặn trùng).
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.response import Response
+from rest_framework.utils import encoders
+
+from . import instrumentation
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+TTL_SECONDS = getattr(settings, 'IDEMPOTENCY_TTL_SECONDS', 24 * 3600)
+LOCK_SECONDS = getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 60)
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "Idempotency-Key này đã được dùng cho một request khác."
+    default_code = 'idempotency_key_reused'
+
+
+class IdempotentRequestInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Request với Idempotency-Key này đang được xử lý, vui lòng thử lại sau."
+    default_code = 'idempotent_request_in_progress'
+
+
+def get_model():
+    return apps.get_model(settings.IDEMPOTENCY_MODEL)
+
+
+# --- Hash ---
+def key_hash(user_id, key):
+    """Key gắn với user: hai user trùng key không thấy response của nhau. Lưu digest cố định 64 ký tự."""
+    return hashlib.sha256(f'{user_id}:{key}'.encode('utf-8')).hexdigest()
+
+
+def request_hash(request):
+    """Hash của method + path + body (đã parse, sắp xếp key) để phát hiện dùng lại key cho request khác."""
+    data = request.data
+    if hasattr(data, 'lists'): # QueryDict (form)
+        data = dict(data.lists())
+    body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f'{request.method}\n{request.path}\n{body}'.encode('utf-8')).hexdigest()
+
+
+# --- Lưu trữ ---
+def begin(user_id, key, fingerprint):
+    """
+    Đăng ký key trước khi chạy view. Trả về (record, replay):
+    replay=True nghĩa là record đã có response hoàn chỉnh để trả lại.
+    """
+    Record = get_model()
+    digest = key_hash(user_id, key)
+    now = timezone.now()
+    record = Record.objects.filter(key_hash=digest).first()
+    if record is None:
+        try:
+            with transaction.atomic():
+                return Record.objects.create(
+                    key_hash=digest, request_hash=fingerprint, expires_at=now + timedelta(seconds=TTL_SECONDS)
+                ), False
+        except IntegrityError:
+            # Retry song song vừa ghi key này trước
+            record = Record.objects.filter(key_hash=digest).first()
+
+    abandoned = record is not None and record.status_code is None and record.created_at <= now - timedelta(seconds=LOCK_SECONDS)
+    if record is None or record.expires_at <= now or abandoned:
+        # Key hết hạn / bị bỏ dở (hoặc vừa bị xóa): chiếm lại bằng compare-and-swap trên created_at
+        if record is None or not Record.objects.filter(pk=record.pk, created_at=record.created_at).update(
+            request_hash=fingerprint, status_code=None, response_body=None,
+            created_at=now, expires_at=now + timedelta(seconds=TTL_SECONDS)
+        ):
+            raise IdempotentRequestInProgress()
+        record.request_hash, record.status_code, record.response_body, record.created_at = fingerprint, None, None, now
+        return record, False
+    if record.request_hash != fingerprint:
+        raise IdempotencyKeyReused()
+    if record.status_code is None:
+        raise IdempotentRequestInProgress()
+    return record, True
+
+
+def complete(record, response):
+    """Lưu response của lần chạy đầu; 5xx thì trả lại key để client retry."""
+    if response.status_code >= 500:
+        release(record)
+        return
+    # Mã hóa bằng encoder của DRF (như JSONRenderer) để lần trả lại giống hệt lần đầu
+    body = json.loads(json.dumps(getattr(response, 'data', None), cls=encoders.JSONEncoder))
+    get_model().objects.filter(pk=record.pk).update(status_code=response.status_code, response_body=body)
+
+
+def release(record):
+    get_model().objects.filter(pk=record.pk, status_code__isnull=True).delete()
+
+
+def purge_expired():
+    """Xóa các key đã hết hạn. Trả về số dòng xóa."""
+    deleted, _ = get_model().objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def replay(record):
+    return Response(record.response_body, status=record.status_code, headers={REPLAYED_HEADER: 'true'})
+
+
+# --- View mixin ---
+class IdempotentCreateMixin:
+    """
+    Thêm vào trước lớp generic view (CreateAPIView, ListCreateAPIView...) để POST hỗ trợ header Idempotency-Key.
+    View không được tự định nghĩa post() (sẽ che mixin), logic riêng đặt trong create().
+    Không gửi header thì view chạy như cũ. Chạy sau xác thực/phân quyền (trong handler), nên key gắn với user.
+    """
+    def post(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return super().post(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            raise ParseError(f"{HEADER} không được dài quá {MAX_KEY_LENGTH} ký tự.")
+
+        record, replayed = begin(request.user.id, key, request_hash(request))
+        if replayed:
+            instrumentation.incr('idempotency:replayed')
+            return replay(record)
+        try:
+            response = super().post(request, *args, **kwargs)
+        except Exception as exc:
+            # Lỗi nghiệp vụ (400/404/409...) là kết quả của request này, lưu lại như response thường
+            try:
+                response = self.handle_exception(exc)
+            except Exception:
+                release(record)
+                raise
+        complete(record, response)
+        return response
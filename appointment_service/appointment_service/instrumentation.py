@@ -0,0 +1,243 @@
+# instrumentation.py
+"""
+Lớp đo đạc (instrumentation) dùng chung cho các service Django (user/appointment/clinical).
+Mỗi service giữ một bản sao giống hệt file này trong package project của nó.
+Sửa ở một bản thì chép sang các bản còn lại: SharedModuleTests (appointment_service/appointments/tests.py) báo lỗi khi chúng khác nhau.
+
+- span(name): đo thời gian một đoạn code; luôn cộng dồn vào thống kê theo tên span
+  (count/tổng/max, rất rẻ), chỉ ghi log chi tiết khi request hiện tại được lấy mẫu.
+- event(name, **fields): sự kiện debug có cấu trúc, CHỈ ghi khi request được lấy mẫu
+  (INSTRUMENTATION_SAMPLE_RATE, mặc định 1%). Request không được lấy mẫu gần như không tốn gì.
+- incr(name): bộ đếm theo view (middleware tự đếm số request/mã trạng thái/số query DB theo view).
+  INSTRUMENTATION_QUERY_HEADER = True thì mỗi response có thêm header X-DB-Queries (dùng cho benchmarks/).
+- Log đi qua NonBlockingQueueHandler: request chỉ put_nowait vào hàng đợi có giới hạn,
+  thread nền (QueueListener) mới ghi ra stderr. Hàng đợi đầy thì bỏ bản ghi và đếm số bị bỏ,
+  không bao giờ chặn request.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+logger = logging.getLogger('instrumentation')
+
+# Trạng thái theo request (an toàn với thread và async)
+_trace = contextvars.ContextVar('instrumentation_trace', default=None)
+
+_lock = threading.Lock()
+_counters = {}
+_span_stats = {}  # name -> [count, total_ms, max_ms]
+_dropped = 0
+
+
+class _Trace:
+    __slots__ = ('trace_id', 'sampled', 'view', 'queries')
+
+    def __init__(self, sampled, view=None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.sampled = sampled
+        self.view = view
+        self.queries = 0
+
+
+# --- API ---
+def sampled():
+    """True nếu request hiện tại được lấy mẫu (dùng để bỏ qua việc dựng dữ liệu debug tốn kém)."""
+    trace = _trace.get()
+    return trace is not None and trace.sampled
+
+
+def event(name, **fields):
+    """Ghi một sự kiện debug có cấu trúc nếu request hiện tại được lấy mẫu."""
+    trace = _trace.get()
+    if trace is None or not trace.sampled:
+        return
+    logger.debug(name, extra={'event': name, 'trace_id': trace.trace_id, 'fields': fields})
+
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+@contextmanager
+def span(name, **fields):
+    """Đo thời gian đoạn code trong khối with."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with _lock:
+            stats = _span_stats.get(name)
+            if stats is None:
+                _span_stats[name] = [1, elapsed_ms, elapsed_ms]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed_ms
+                if elapsed_ms > stats[2]:
+                    stats[2] = elapsed_ms
+        event('span', span=name, duration_ms=round(elapsed_ms, 3), **fields)
+
+
+def snapshot(reset=False):
+    """Ảnh chụp bộ đếm, thống kê span và số bản ghi log bị bỏ của process hiện tại (reset=True: đếm lại từ 0)."""
+    global _dropped
+    with _lock:
+        result = {
+            'counters': dict(_counters),
+            'spans': {
+                name: {'count': count, 'avg_ms': round(total / count, 3), 'max_ms': round(peak, 3)}
+                for name, (count, total, peak) in _span_stats.items()
+            },
+            'dropped_events': _dropped,
+        }
+        if reset:
+            _counters.clear()
+            _span_stats.clear()
+            _dropped = 0
+    return result
+
+
+# --- Logging không chặn ---
+class JsonFormatter(logging.Formatter):
+    """Mỗi bản ghi là 1 dòng JSON."""
+    def format(self, record):
+        payload = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'event': getattr(record, 'event', record.getMessage()),
+        }
+        trace_id = getattr(record, 'trace_id', None)
+        if trace_id:
+            payload['trace_id'] = trace_id
+        payload.update(getattr(record, 'fields', {}))
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler với hàng đợi có giới hạn và QueueListener riêng ghi ra stderr.
+    Cấu hình qua LOGGING trong settings: {'class': '<service>.instrumentation.NonBlockingQueueHandler', 'maxsize': 10000}
+    """
+    def __init__(self, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        target = logging.StreamHandler(sys.stderr)
+        target.setFormatter(JsonFormatter())
+        self.listener = logging.handlers.QueueListener(self.queue, target, respect_handler_level=False)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def prepare(self, record):
+        # Giữ nguyên extra (fields) để formatter ở thread nền xử lý; chỉ chốt message
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with _lock:
+                _dropped += 1
+
+
+# --- Đếm query DB theo request ---
+def _count_query(execute, sql, params, many, context):
+    # contextvar đi theo request vào cả thread của sync_to_async (ORM trong view async)
+    trace = _trace.get()
+    if trace is not None:
+        trace.queries += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+# --- Middleware ---
+class InstrumentationMiddleware:
+    """
+    Quyết định lấy mẫu cho mỗi request, đo span 'request' và đếm request theo view.
+    Định kỳ (INSTRUMENTATION_FLUSH_SECONDS) ghi ảnh chụp bộ đếm ra log.
+    Hỗ trợ cả sync và async (không ép view async chạy qua thread). Đặt ở đầu MIDDLEWARE.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        from django.conf import settings
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 0.01)
+        self.flush_seconds = getattr(settings, 'INSTRUMENTATION_FLUSH_SECONDS', 60)
+        self.query_header = getattr(settings, 'INSTRUMENTATION_QUERY_HEADER', False)
+        # Kết nối mở sau này (mỗi thread một kết nối) tự gắn bộ đếm; kết nối đã mở thì gắn ngay
+        connection_created.connect(_install_query_counter, dispatch_uid='instrumentation_query_counter')
+        for connection in connections.all(initialized_only=True):
+            _install_query_counter(connection)
+        self.next_flush = time.monotonic() + self.flush_seconds
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trace = _Trace(sampled=random.random() < self.sample_rate)
+        token = _trace.set(trace)
+        try:
+            with span('request', method=request.method, path=request.path):
+                response = self.get_response(request)
+        finally:
+            _trace.reset(token)
+        return self._finish(trace, response)
+
+    async def __acall__(self, request):
+        trace = _Trace(sampled=random.random() < self.sample_rate)
+        token = _trace.set(trace)
+        try:
+            with span('request', method=request.method, path=request.path):
+                response = await self.get_response(request)
+        finally:
+            _trace.reset(token)
+        return self._finish(trace, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        trace = _trace.get()
+        if trace is not None:
+            match = request.resolver_match
+            trace.view = match.view_name if match else view_func.__name__
+        return None
+
+    def _finish(self, trace, response):
+        view = trace.view or 'unresolved'
+        incr(f'requests:{view}')
+        incr(f'status:{view}:{response.status_code // 100}xx')
+        incr(f'queries:{view}', trace.queries)
+        if self.query_header:
+            response['X-DB-Queries'] = str(trace.queries)
+        if trace.sampled:
+            response['X-Trace-Id'] = trace.trace_id
+        self._maybe_flush()
+        return response
+
+    def _maybe_flush(self):
+        now = time.monotonic()
+        if now < self.next_flush:
+            return
+        self.next_flush = now + self.flush_seconds
+        logger.info('counters', extra={'event': 'counters', 'fields': snapshot(reset=True)})
@@ -0,0 +1,225 @@
+# outbox.py
+"""
+Transactional outbox dùng chung cho các service Django (appointment/clinical).
+Mỗi service giữ một bản sao giống hệt file này trong package project của nó; model lưu sự kiện
+nằm trong app của service (settings.OUTBOX_MODEL, ví dụ 'appointments.OutboxEvent').
+Sửa ở một bản thì chép sang các bản còn lại: SharedModuleTests (appointment_service/appointments/tests.py) báo lỗi khi chúng khác nhau.
+
+- record(type, payload, key): ghi 1 dòng sự kiện trong CÙNG transaction với thay đổi dữ liệu
+  (gọi trong transaction.atomic()). Rollback thì sự kiện cũng mất, commit thì chắc chắn còn:
+  không có cảnh ghi DB xong mà gửi message lỗi (hoặc ngược lại).
+- Request không chờ hệ thống nhận sự kiện: lệnh `manage.py publish_outbox` (process riêng) lấy
+  sự kiện chưa gửi theo lô, gửi cả lô tới sink rồi đánh dấu đã gửi bằng 1 câu UPDATE.
+- Gửi ít nhất một lần (at-least-once): sink lỗi giữa chừng thì cả lô được gửi lại ở lần sau,
+  bên nhận khử trùng theo 'id' của sự kiện. Thứ tự trong một lô theo id (thứ tự commit gần đúng).
+- Sink cấu hình qua OUTBOX_SINK = {'BACKEND': '<service>.outbox.FileSink', 'OPTIONS': {...}}:
+  FileSink (NDJSON ra file), SocketSink (NDJSON qua TCP/Unix socket), MemorySink (trong process, cho test).
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'OUTBOX_BATCH_SIZE', 500)
+RETENTION_HOURS = getattr(settings, 'OUTBOX_RETENTION_HOURS', 24)
+
+
+def get_model():
+    return apps.get_model(settings.OUTBOX_MODEL)
+
+
+# --- Ghi sự kiện ---
+def record(event_type, payload, key=''):
+    """
+    Thêm sự kiện vào outbox. Phải gọi trong transaction của thay đổi dữ liệu tương ứng.
+    key: định danh đối tượng (ví dụ 'appointment:12'), để bên nhận gom/sắp xếp theo đối tượng.
+    """
+    return get_model().objects.create(event_type=event_type, key=key, payload=payload)
+
+
+def record_many(events):
+    """Như record() cho nhiều sự kiện [(event_type, payload, key)], bằng 1 câu INSERT (theo thứ tự danh sách)."""
+    Event = get_model()
+    return Event.objects.bulk_create([Event(event_type=event_type, key=key, payload=payload) for event_type, payload, key in events])
+
+
+def envelope(event):
+    return {
+        'id': event.id,
+        'source': getattr(settings, 'OUTBOX_SOURCE', ''),
+        'type': event.event_type,
+        'key': event.key,
+        'occurred_at': event.created_at,
+        'payload': event.payload,
+    }
+
+
+def encode(message):
+    return json.dumps(message, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+# --- Sinks ---
+class FileSink:
+    """Ghi nối (append) mỗi sự kiện 1 dòng JSON; fsync sau mỗi lô trước khi lô được đánh dấu đã gửi."""
+    def __init__(self, path):
+        self.path = os.fspath(path)
+
+    def send(self, messages):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(encode(message) + '\n' for message in messages))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        pass
+
+
+class SocketSink:
+    """
+    Gửi NDJSON qua một kết nối giữ lâu (TCP 'host:port' hoặc đường dẫn Unix socket).
+    Lỗi mạng thì đóng kết nối và ném lỗi: lô được gửi lại ở lần sau qua kết nối mới.
+    """
+    def __init__(self, address, timeout=5.0):
+        self.address = address
+        self.timeout = timeout
+        self.sock = None
+
+    def _connect(self):
+        if ':' in self.address and not self.address.startswith('/'):
+            host, port = self.address.rsplit(':', 1)
+            return socket.create_connection((host, int(port)), timeout=self.timeout)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.address)
+        return sock
+
+    def send(self, messages):
+        data = ''.join(encode(message) + '\n' for message in messages).encode('utf-8')
+        try:
+            if self.sock is None:
+                self.sock = self._connect()
+            self.sock.sendall(data)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class MemorySink:
+    """Broker trong process (cho test/dev): giữ mọi message đã gửi và gọi các subscriber đăng ký."""
+    messages = []
+    subscribers = []
+    _lock = threading.Lock()
+
+    def send(self, messages):
+        with self._lock:
+            self.messages.extend(messages)
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            callback(messages)
+
+    def close(self):
+        pass
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.messages.clear()
+            cls.subscribers.clear()
+
+
+def get_sink(spec=None):
+    spec = spec or getattr(settings, 'OUTBOX_SINK', {'BACKEND': f'{__name__}.MemorySink'})
+    return import_string(spec['BACKEND'])(**spec.get('OPTIONS', {}))
+
+
+# --- Publisher ---
+def drain_batch(sink, batch_size=BATCH_SIZE):
+    """
+    Gửi 1 lô sự kiện chưa gửi (theo id tăng dần). Trả về số sự kiện đã gửi (0 = outbox trống).
+    select_for_update(skip_locked) cho phép chạy nhiều publisher song song trên PostgreSQL
+    (mỗi process lấy lô khác nhau); SQLite bỏ qua khóa dòng và khóa cả DB khi ghi.
+    """
+    Event = get_model()
+    with transaction.atomic():
+        events = list(
+            Event.objects.select_for_update(skip_locked=True)
+            .filter(published_at__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+        sink.send([envelope(event) for event in events])
+        Event.objects.filter(id__in=[event.id for event in events]).update(published_at=timezone.now())
+    return len(events)
+
+
+def drain(sink, batch_size=BATCH_SIZE, max_batches=None):
+    """Gửi cho tới khi outbox trống (hoặc đủ max_batches lô). Trả về tổng số sự kiện đã gửi."""
+    sent = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = drain_batch(sink, batch_size)
+        if not count:
+            break
+        sent += count
+        batches += 1
+    return sent
+
+
+def mark_failed(error, batch_size=BATCH_SIZE):
+    """Ghi nhận lỗi gửi cho lô đầu hàng đợi (để theo dõi sự kiện bị kẹt)."""
+    Event = get_model()
+    ids = list(Event.objects.filter(published_at__isnull=True).order_by('id').values_list('id', flat=True)[:batch_size])
+    Event.objects.filter(id__in=ids).update(attempts=F('attempts') + 1, last_error=str(error)[:500])
+
+
+def purge_published(older_than_hours=RETENTION_HOURS):
+    """Xóa các sự kiện đã gửi quá hạn lưu giữ. Trả về số dòng xóa."""
+    cutoff = timezone.now() - timedelta(hours=older_than_hours)
+    deleted, _ = get_model().objects.filter(published_at__lt=cutoff).delete()
+    return deleted
+
+
+def run(sink, interval=1.0, batch_size=BATCH_SIZE, once=False, max_backoff=60.0, purge_every=300.0):
+    """
+    Vòng lặp publisher: gửi hết, ngủ interval giây, lặp lại. Sink lỗi thì chờ lùi dần rồi thử lại.
+    Cứ purge_every giây dọn các sự kiện đã gửi quá RETENTION_HOURS.
+    """
+    backoff = interval
+    next_purge = time.monotonic()
+    while True:
+        if time.monotonic() >= next_purge:
+            purge_published()
+            next_purge = time.monotonic() + purge_every
+        try:
+            sent = drain(sink, batch_size)
+            backoff = interval
+        except Exception as exc:
+            logger.exception("Outbox publish failed")
+            mark_failed(exc, batch_size)
+            if once:
+                raise
+            time.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff)
+            continue
+        if once:
+            return sent
+        if not sent:
+            time.sleep(interval)
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 
@@ -47,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'appointment_service.instrumentation.InstrumentationMiddleware', # Đo thời gian/đếm request, lấy mẫu log debug
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,9 +87,56 @@ DATABASES = {
         'ENGINE': 'django.db.backends.sqlite3',
         # Đặt tên file DB khác với user_service
         'NAME': BASE_DIR / 'db_appointment.sqlite3',
+        # DB test dạng file (không dùng in-memory) để test đặt lịch đồng thời có thể mở
+        # nhiều kết nối từ nhiều thread
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db_appointment.sqlite3',
+        },
     }
 }
 
+# PostgreSQL local (benchmark/triển khai): đặt POSTGRES_DB, tùy chọn POSTGRES_USER/PASSWORD/HOST/PORT
+if os.environ.get('POSTGRES_DB'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Dùng cho bitmap slot trống (appointments/availability.py).
+# Khi chạy nhiều worker nên chuyển sang cache dùng chung (Redis/Memcached) để các worker thấy cùng dữ liệu.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'appointment-service',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000, # Mỗi (bác sĩ, ngày) là 1 entry nhỏ
+        },
+    }
+}
+AVAILABILITY_CACHE_TIMEOUT = 300 # giây
+
+# Giữ chỗ tạm thời slot khi bệnh nhân đang đặt lịch (appointments/holds.py)
+# Hold hết hạn được giải phóng bởi `manage.py release_expired_holds` (chạy định kỳ)
+SLOT_HOLD_SECONDS = 300
+SLOT_HOLD_MAX_SECONDS = 900
+SLOT_HOLD_MAX_PER_PATIENT = 3
+
+# Danh sách chờ (appointments/waitlist.py): slot bị hủy được giữ cho người chờ phù hợp nhất
+WAITLIST_OFFER_SECONDS = 900 # Thời gian bệnh nhân có để đặt slot được mời
+WAITLIST_MAX_WINDOW_DAYS = 7 # Độ dài tối đa của khoảng thời gian chờ
+
+# Push slot trống qua SSE (appointments/pubsub.py, cần chạy dưới ASGI, ví dụ: uvicorn appointment_service.asgi:application)
+SLOT_EVENTS_BUFFER_SIZE = 100 # Số message tối đa đệm cho mỗi client chậm
+SLOT_EVENTS_HEARTBEAT_SECONDS = 15
+SLOT_EVENTS_MAX_SECONDS = 600 # Đóng kết nối định kỳ, EventSource tự kết nối lại
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -133,15 +183,31 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         # Giả định JWT vẫn là phương thức chính (sẽ được validate bởi Gateway hoặc middleware sau này)
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Không tra bảng user trong DB của service này: request.user là TokenUser dựng từ claims (xem SIMPLE_JWT).
+        # JWTAuthentication tra auth_user theo user_id, mà user chỉ tồn tại ở user_service -> mọi token đều 401.
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
         # 'rest_framework.authentication.SessionAuthentication', # Có thể cần cho admin
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         # Yêu cầu xác thực mặc định, sẽ ghi đè ở các view cụ thể
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    # Token bucket theo user_id (JWT) hoặc IP, xem appointment_service/throttling.py. View chọn scope bằng throttle_scope.
+    'DEFAULT_THROTTLE_CLASSES': (
+        'appointment_service.throttling.TokenBucketThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': '60/min',
+        'user': '600/min',
+        'slots': '120/min', # available-slots/, next-available/... (kể cả bản async)
+        'booking': '30/min', # book/, holds/
+    },
 }
 
+# Phân trang keyset cho danh sách lịch hẹn (appointments/pagination.py)
+APPOINTMENT_PAGE_SIZE = 50
+APPOINTMENT_MAX_PAGE_SIZE = 200
+
 # LANGUAGE_CODE = 'en-us' # Hoặc 'vi-vn'
 TIME_ZONE = 'Asia/Ho_Chi_Minh' # Đặt timezone phù hợp (ví dụ: Việt Nam)
 USE_I18N = True
@@ -185,4 +251,71 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_EXP_CLAIM': 'refresh_exp',
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5),
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
-}
\ No newline at end of file
+}
+
+
+# Instrumentation (appointment_service/instrumentation.py)
+# Chỉ INSTRUMENTATION_SAMPLE_RATE request được ghi sự kiện debug chi tiết; log đi qua hàng đợi
+# không chặn, thread nền mới ghi ra stderr.
+INSTRUMENTATION_SAMPLE_RATE = 0.01
+INSTRUMENTATION_FLUSH_SECONDS = 60 # Chu kỳ ghi bộ đếm theo view ra log
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'instrumentation': {
+            'class': 'appointment_service.instrumentation.NonBlockingQueueHandler',
+            'maxsize': 10000,
+        },
+    },
+    'loggers': {
+        'instrumentation': {
+            'handlers': ['instrumentation'],
+            'level': 'DEBUG',
+            'propagate': False,
+        },
+    },
+}
+
+# Chạy test (manage.py test): tắt lấy mẫu và bỏ log instrumentation (không mở thread nền ghi JSON ra stderr).
+# Test cần log thì tự bật bằng override_settings(INSTRUMENTATION_SAMPLE_RATE=1) + assertLogs('instrumentation').
+TESTING = sys.argv[1:2] == ['test']
+if TESTING:
+    INSTRUMENTATION_SAMPLE_RATE = 0
+    LOGGING['handlers']['instrumentation'] = {'class': 'logging.NullHandler'}
+
+
+# Transactional outbox (appointment_service/outbox.py): sự kiện được ghi cùng transaction với dữ liệu,
+# lệnh `manage.py publish_outbox` gửi theo lô tới sink.
+OUTBOX_MODEL = 'appointments.OutboxEvent'
+OUTBOX_SOURCE = 'appointment_service'
+OUTBOX_SINK = {
+    # Hoặc 'appointment_service.outbox.SocketSink' với {'address': 'host:port'}, 'appointment_service.outbox.MemorySink' cho test
+    'BACKEND': 'appointment_service.outbox.FileSink',
+    'OPTIONS': {'path': BASE_DIR / 'outbox_events.ndjson'},
+}
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_RETENTION_HOURS = 24 # Giữ sự kiện đã gửi bao lâu trước khi xóa
+
+# Idempotency-Key cho các API tạo mới (appointment_service/idempotency.py)
+IDEMPOTENCY_MODEL = 'appointments.IdempotencyRecord'
+IDEMPOTENCY_TTL_SECONDS = 24 * 3600 # Thời gian client được retry với cùng key
+IDEMPOTENCY_LOCK_SECONDS = 60 # Request đầu "đang xử lý" quá lâu thì coi như đã chết
+
+# Nơi giữ các token bucket (appointment_service/throttling.py). FileStore dùng chung cho mọi worker trên cùng máy;
+# nhiều máy thì dùng 'appointment_service.throttling.SocketStore' với {'address': 'host:port'} (manage.py throttle_server),
+# test/dev 1 process có thể dùng 'appointment_service.throttling.LocMemStore'.
+# File bucket nằm cạnh DB của checkout này (không dùng /tmp chung); khi chạy test mỗi process giữ bucket riêng.
+THROTTLE_STORE = {
+    'BACKEND': 'appointment_service.throttling.FileStore',
+    'OPTIONS': {'path': str(BASE_DIR / 'appointment_service-throttle.buckets')},
+}
+if TESTING:
+    THROTTLE_STORE = {'BACKEND': 'appointment_service.throttling.LocMemStore'}
+
+# Chạy benchmark (benchmarks/suite.py): BENCHMARK_MODE=1 tắt giới hạn tần suất và trả header X-DB-Queries
+BENCHMARK_MODE = os.environ.get('BENCHMARK_MODE') == '1'
+INSTRUMENTATION_QUERY_HEADER = BENCHMARK_MODE
+if BENCHMARK_MODE:
+    REST_FRAMEWORK['DEFAULT_THROTTLE_CLASSES'] = ()
@@ -1,6 +1,6 @@
 # appointments/admin.py
 from django.contrib import admin
-from .models import DoctorSchedule, Appointment
+from .models import DoctorSchedule, Appointment, AppointmentSlot, ScheduleTemplate, ScheduleException, WaitlistEntry, DoctorDailyUtilization, OutboxEvent
 
 @admin.register(DoctorSchedule)
 class DoctorScheduleAdmin(admin.ModelAdmin):
@@ -19,6 +19,53 @@ class AppointmentAdmin(admin.ModelAdmin):
     raw_id_fields = ('schedule_slot',) # Hữu ích nếu có nhiều schedule slot
     readonly_fields = ('created_at', 'updated_at') # Không cho sửa các trường này
 
+@admin.register(AppointmentSlot)
+class AppointmentSlotAdmin(admin.ModelAdmin):
+    list_display = ('doctor_id', 'start_time', 'end_time', 'state', 'appointment')
+    list_filter = ('state', 'doctor_id')
+    search_fields = ('doctor_id',)
+    date_hierarchy = 'start_time'
+    raw_id_fields = ('schedule', 'appointment')
+    readonly_fields = ('state', 'appointment') # Trạng thái do hệ thống quản lý khi đặt/hủy lịch
+
+@admin.register(ScheduleTemplate)
+class ScheduleTemplateAdmin(admin.ModelAdmin):
+    list_display = ('doctor_id', 'weekday', 'start_time', 'end_time', 'valid_from', 'valid_until', 'is_active', 'materialized_until')
+    list_filter = ('weekday', 'is_active', 'doctor_id')
+    search_fields = ('doctor_id',)
+    readonly_fields = ('materialized_until',) # Do hệ thống quản lý khi sinh lịch
+
+@admin.register(ScheduleException)
+class ScheduleExceptionAdmin(admin.ModelAdmin):
+    list_display = ('date', 'doctor_id', 'start_time', 'end_time', 'reason')
+    list_filter = ('doctor_id',)
+    search_fields = ('doctor_id', 'reason')
+    date_hierarchy = 'date'
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'patient_id', 'doctor_id', 'window_start', 'window_end', 'priority', 'status', 'offered_until')
+    list_filter = ('status', 'doctor_id')
+    search_fields = ('patient_id', 'doctor_id')
+    list_editable = ('priority',) # Nhân viên điều chỉnh độ ưu tiên
+    readonly_fields = ('hold_token', 'offered_time', 'offered_until', 'created_at')
+
+@admin.register(DoctorDailyUtilization)
+class DoctorDailyUtilizationAdmin(admin.ModelAdmin):
+    list_display = ('date', 'doctor_id', 'scheduled_minutes', 'booked', 'confirmed', 'cancelled', 'completed')
+    list_filter = ('doctor_id',)
+    date_hierarchy = 'date'
+    # Do hệ thống cập nhật (appointments/rollups.py); sửa tay sẽ làm lệch số liệu, dùng lệnh rebuild_utilization
+    readonly_fields = ('doctor_id', 'date', 'scheduled_minutes', 'booked', 'confirmed', 'cancelled', 'completed')
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'key', 'created_at', 'published_at', 'attempts')
+    list_filter = ('event_type',)
+    search_fields = ('key', 'event_type')
+    # Hàng đợi của publish_outbox, chỉ để theo dõi (attempts/last_error cho sự kiện bị kẹt)
+    readonly_fields = ('event_type', 'key', 'payload', 'created_at', 'published_at', 'attempts', 'last_error')
+
 # Hoặc cách đăng ký đơn giản hơn:
 # admin.site.register(DoctorSchedule)
-# admin.site.register(Appointment)
\ No newline at end of file
+# admin.site.register(Appointment)
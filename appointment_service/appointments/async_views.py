@@ -0,0 +1,110 @@
+# appointments/async_views.py
+"""
+Bản async của các endpoint đọc nhiều: lịch làm việc, slot trống, lịch hẹn của bệnh nhân.
+
+Chạy dưới ASGI (uvicorn appointment_service.asgi:application), mỗi request là 1 coroutine trên
+event loop thay vì chiếm 1 thread, nên lúc chờ DB/cache không giữ worker nào.
+DRF chưa hỗ trợ view async, nên đây là django View async dùng lại serializer, pagination và
+các bước lọc/parse của bản sync (views.py) để 2 bản luôn trả cùng kết quả:
+- Xác thực JWT không tra DB (JWTStatelessUserAuthentication, như cấu hình SIMPLE_JWT).
+- Giới hạn tần suất bằng cùng DEFAULT_THROTTLE_CLASSES/throttle_scope với bản sync, chạy qua sync_to_async
+  vì store của throttle là I/O chặn (khóa file của FileStore, socket của SocketStore).
+- Truy vấn qua async ORM (async for, aget_many...). Phần ghi hiếm gặp (sinh lịch từ mẫu lặp lại
+  lần đầu) vẫn chạy sync qua sync_to_async.
+Đặt cạnh bản sync (các URL async/...) để so sánh bằng benchmarks/async_views.py.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, PermissionDenied, Throttled
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+
+from appointment_service import instrumentation
+
+from . import availability, recurring
+from .models import Appointment
+from .pagination import AppointmentKeysetPagination
+from .policies import AppointmentPolicy, ROLE_PATIENT
+from .serializers import AppointmentSerializer, DoctorScheduleSerializer
+from .views import AvailableSlotsView, DoctorScheduleListView
+
+
+class AsyncAPIView(View):
+    """
+    Khung chung: xác thực JWT, kiểm tra vai trò (required_role), giới hạn tần suất (throttle_scope)
+    và trả lỗi APIException dưới dạng JSON giống DRF ({'detail': ...}).
+    """
+    required_role = None
+    throttle_scope = None
+    authentication = JWTStatelessUserAuthentication()
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Request của DRF chỉ dùng cho query_params/build_absolute_uri (pagination), không parse body
+        request = Request(request)
+        try:
+            self.authenticate(request)
+            await sync_to_async(self.check_throttles, thread_sensitive=False)(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            response = JsonResponse({'detail': exc.detail}, status=exc.status_code)
+            if getattr(exc, 'wait', None):
+                response['Retry-After'] = '%d' % exc.wait
+            return response
+
+    def authenticate(self, request):
+        result = self.authentication.authenticate(request)
+        if result is None:
+            raise NotAuthenticated()
+        request.user, request.auth = result
+        if self.required_role is not None and self.required_role not in AppointmentPolicy.for_request(request).roles:
+            raise PermissionDenied()
+
+    def check_throttles(self, request):
+        # Chạy trong thread (xem dispatch): không để khóa file/round trip socket của store chặn event loop
+        for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+            throttle = throttle_class()
+            if not throttle.allow_request(request, self):
+                raise Throttled(throttle.wait())
+
+
+# --- Lịch làm việc của bác sĩ (bản async của DoctorScheduleListView) ---
+class AsyncDoctorScheduleListView(AsyncAPIView):
+    async def get(self, request, *args, **kwargs):
+        doctor_id, start_date, end_date = DoctorScheduleListView.parse_filters(request.query_params)
+        await recurring.aensure_materialized(*DoctorScheduleListView.materialize_horizon(doctor_id, end_date))
+        queryset = DoctorScheduleListView.build_queryset(doctor_id, start_date, end_date)
+        schedules = [schedule async for schedule in queryset]
+        return JsonResponse(DoctorScheduleSerializer(schedules, many=True).data, safe=False)
+
+
+# --- Slot trống của bác sĩ trong 1 ngày (bản async của AvailableSlotsView) ---
+class AsyncAvailableSlotsView(AsyncAPIView):
+    throttle_scope = 'slots'
+
+    async def get(self, request, *args, **kwargs):
+        doctor_id, requested_date = AvailableSlotsView.parse_params(request.query_params)
+        with instrumentation.span('available_slots.lookup'):
+            await recurring.aensure_materialized(requested_date, [doctor_id])
+            available_slots = await availability.aavailable_slots(doctor_id, requested_date)
+        instrumentation.event('available_slots.result', doctor_id=doctor_id, date=requested_date.isoformat(), count=len(available_slots))
+        return JsonResponse(AvailableSlotsView.format_slots(available_slots), safe=False, status=status.HTTP_200_OK)
+
+
+# --- Lịch hẹn của bệnh nhân hiện tại (bản async của PatientAppointmentListView) ---
+class AsyncPatientAppointmentListView(AsyncAPIView):
+    required_role = ROLE_PATIENT
+    keyset_descending = True
+
+    async def get(self, request, *args, **kwargs):
+        policy = AppointmentPolicy.for_request(request)
+        queryset = policy.visible(Appointment.objects.all(), as_role=ROLE_PATIENT)
+        paginator = AppointmentKeysetPagination()
+        page = await paginator.apaginate_queryset(queryset, request, view=self)
+        return JsonResponse({
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'results': AppointmentSerializer(page, many=True).data,
+        })
@@ -0,0 +1,463 @@
+# appointments/availability.py
+"""
+Engine tính khung giờ trống dựa trên bitmap.
+
+Mỗi ngày làm việc của một bác sĩ được lưu bằng 2 số nguyên, dựng từ bảng AppointmentSlot:
+- schedule: bit i = 1 nếu bác sĩ có slot i (sinh từ một DoctorSchedule còn hiệu lực)
+- booked:   bit i = 1 nếu slot i không còn trống (đã đặt hoặc đang được giữ)
+Slot i bắt đầu lúc 00:00 (giờ địa phương theo TIME_ZONE) + i * SLOT_MINUTES.
+
+Slot trống = schedule & ~booked, lọc thêm các slot đã qua bằng một mask.
+Bitmap được cache theo (doctor_id, ngày), nên mỗi lần tra cứu chỉ là vài phép toán bit.
+
+Mỗi (doctor_id, ngày) có thêm 1 khóa version (chuỗi ngẫu nhiên) trong cache. Bitmap được lưu kèm
+version đọc TRƯỚC khi query DB và chỉ được dùng khi version đó vẫn còn hiện hành. Khi trạng thái slot
+thay đổi (appointments/slots.py, holds.py), version được đổi SAU khi transaction commit. Vì vậy:
+- rollback không để lại bit sai trong cache;
+- không có bước đọc-sửa-ghi trên cache nên 2 worker cập nhật cùng ngày không ghi đè lẫn nhau;
+- bitmap dựng từ dữ liệu cũ (đọc DB trước khi transaction khác commit) bị bỏ qua ở lần đọc sau.
+"""
+import heapq
+import secrets
+from datetime import timedelta
+from itertools import islice
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from appointment_service import instrumentation
+
+from . import pubsub
+from .models import Appointment, AppointmentSlot
+from .queries import between, day_bounds
+
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+FULL_DAY_MASK = (1 << SLOTS_PER_DAY) - 1
+SLOT_DURATION = timedelta(minutes=SLOT_MINUTES)
+
+ACTIVE_STATUSES = (Appointment.STATUS_SCHEDULED, Appointment.STATUS_CONFIRMED)
+
+# Thời gian sống của bitmap trong cache (giây). Giới hạn độ lệch giữa các worker
+# khi dùng cache cục bộ (LocMemCache); với cache dùng chung (Redis, Memcached) có thể tăng lên.
+CACHE_TIMEOUT = getattr(settings, 'AVAILABILITY_CACHE_TIMEOUT', 300)
+CACHE_KEY_PREFIX = 'availability'
+# Khóa version sống lâu hơn bitmap; mất version chỉ làm lần đọc sau dựng lại từ DB
+VERSION_TIMEOUT = max(CACHE_TIMEOUT, 24 * 60 * 60)
+
+
+class DayBitmap(NamedTuple):
+    schedule: int
+    booked: int
+
+    @property
+    def free(self):
+        return self.schedule & ~self.booked
+
+
+# --- Các hàm tiện ích về thời gian/slot ---
+def range_mask(first, last):
+    """Mask với các bit trong khoảng [first, last)."""
+    if last <= first:
+        return 0
+    return ((1 << last) - 1) ^ ((1 << first) - 1)
+
+
+def slot_index(value):
+    """
+    Chỉ số slot của một datetime trong ngày (giờ địa phương).
+    Trả về None nếu thời điểm không nằm đúng mốc slot (ví dụ 08:15 với slot 30 phút).
+    """
+    local = timezone.localtime(value)
+    if local.second or local.microsecond or local.minute % SLOT_MINUTES:
+        return None
+    return (local.hour * 60 + local.minute) // SLOT_MINUTES
+
+
+def slot_start(day_start, index):
+    return day_start + index * SLOT_DURATION
+
+
+def interval_mask(day_start, start_time, end_time):
+    """Mask các slot nằm trọn trong [start_time, end_time), giới hạn trong ngày bắt đầu từ day_start."""
+    first_seconds = (start_time - day_start).total_seconds()
+    last_seconds = (end_time - day_start).total_seconds()
+    slot_seconds = SLOT_MINUTES * 60
+    # Làm tròn lên với mốc bắt đầu, làm tròn xuống với mốc kết thúc
+    first = max(0, -int(-first_seconds // slot_seconds))
+    last = min(SLOTS_PER_DAY, int(last_seconds // slot_seconds))
+    return range_mask(first, last)
+
+
+def iter_indexes(mask):
+    """Duyệt chỉ số các bit 1 theo thứ tự tăng dần."""
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+def future_mask(day, now=None):
+    """Mask các slot của ngày `day` bắt đầu SAU thời điểm now."""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    if day < today:
+        return 0
+    if day > today:
+        return FULL_DAY_MASK
+    local_now = timezone.localtime(now)
+    elapsed = (local_now.hour * 60 + local_now.minute) // SLOT_MINUTES
+    # Slot bắt đầu đúng bằng now cũng không còn hợp lệ, nên bỏ qua cả slot chứa now
+    return range_mask(elapsed + 1, SLOTS_PER_DAY)
+
+
+# --- Xây dựng và cache bitmap ---
+def cache_key(doctor_id, day):
+    return f"{CACHE_KEY_PREFIX}:{doctor_id}:{day.isoformat()}"
+
+
+def version_key(doctor_id, day):
+    return f"{CACHE_KEY_PREFIX}:version:{doctor_id}:{day.isoformat()}"
+
+
+def new_version():
+    return secrets.token_hex(8)
+
+
+def _cached_bitmap(cached, bitmap_key, current_version):
+    """DayBitmap từ giá trị cache nếu nó được dựng với version hiện hành, ngược lại None."""
+    value = cached.get(bitmap_key)
+    if value is None or current_version is None or value[0] != current_version:
+        return None
+    return DayBitmap(*value[1:])
+
+
+def _day_slot_states(doctor_id, day):
+    return AppointmentSlot.objects.filter(
+        between('start_time', *day_bounds(day)),
+        doctor_id=doctor_id
+    ).order_by().values_list('start_time', 'state')
+
+
+def build_day_bitmap(doctor_id, day):
+    """Tính bitmap của một ngày từ bảng AppointmentSlot (1 truy vấn theo khoảng trên unique index)."""
+    return _bitmap_from_states(_day_slot_states(doctor_id, day))
+
+
+async def abuild_day_bitmap(doctor_id, day):
+    """Như build_day_bitmap, dùng async ORM (không chiếm thread khi chạy dưới ASGI)."""
+    return _bitmap_from_states([row async for row in _day_slot_states(doctor_id, day)])
+
+
+def _bitmap_from_states(slot_states):
+    schedule = booked = 0
+    for start_time, state in slot_states:
+        index = slot_index(start_time)
+        if index is None:
+            continue
+        schedule |= 1 << index
+        if state != AppointmentSlot.STATE_FREE:
+            booked |= 1 << index
+    return DayBitmap(schedule, booked)
+
+
+def get_day_bitmap(doctor_id, day):
+    key, vkey = cache_key(doctor_id, day), version_key(doctor_id, day)
+    cached = cache.get_many([key, vkey])
+    version = cached.get(vkey)
+    bitmap = _cached_bitmap(cached, key, version)
+    from_cache = bitmap is not None
+    if bitmap is None:
+        if version is None:
+            version = new_version()
+            cache.set(vkey, version, VERSION_TIMEOUT)
+        with instrumentation.span('availability.build_day_bitmap'):
+            bitmap = build_day_bitmap(doctor_id, day)
+        cache.set(key, (version, *bitmap), CACHE_TIMEOUT)
+    _record_bitmap(doctor_id, day, bitmap, from_cache)
+    return bitmap
+
+
+async def aget_day_bitmap(doctor_id, day):
+    key, vkey = cache_key(doctor_id, day), version_key(doctor_id, day)
+    cached = await cache.aget_many([key, vkey])
+    version = cached.get(vkey)
+    bitmap = _cached_bitmap(cached, key, version)
+    from_cache = bitmap is not None
+    if bitmap is None:
+        if version is None:
+            version = new_version()
+            await cache.aset(vkey, version, VERSION_TIMEOUT)
+        with instrumentation.span('availability.build_day_bitmap'):
+            bitmap = await abuild_day_bitmap(doctor_id, day)
+        await cache.aset(key, (version, *bitmap), CACHE_TIMEOUT)
+    _record_bitmap(doctor_id, day, bitmap, from_cache)
+    return bitmap
+
+
+def _record_bitmap(doctor_id, day, bitmap, from_cache):
+    # Chẩn đoán chi tiết chỉ cho các request được lấy mẫu
+    if instrumentation.sampled():
+        instrumentation.event(
+            'availability.day_bitmap',
+            doctor_id=doctor_id,
+            date=day.isoformat(),
+            cache='hit' if from_cache else 'miss',
+            schedule=f'{bitmap.schedule:0{SLOTS_PER_DAY}b}',
+            booked=f'{bitmap.booked:0{SLOTS_PER_DAY}b}',
+        )
+
+
+def free_slot_mask(doctor_id, day, now=None):
+    return get_day_bitmap(doctor_id, day).free & future_mask(day, now)
+
+
+def available_slots(doctor_id, day, now=None):
+    """Danh sách thời điểm bắt đầu các slot còn trống (đã sắp xếp) của bác sĩ trong ngày."""
+    return _slots_from_mask(day, free_slot_mask(doctor_id, day, now))
+
+
+async def aavailable_slots(doctor_id, day, now=None):
+    bitmap = await aget_day_bitmap(doctor_id, day)
+    return _slots_from_mask(day, bitmap.free & future_mask(day, now))
+
+
+def _slots_from_mask(day, mask):
+    if not mask:
+        return []
+    day_start, _ = day_bounds(day)
+    return [slot_start(day_start, index) for index in iter_indexes(mask)]
+
+
+# --- Tra cứu hàng loạt (nhiều bác sĩ x nhiều ngày) ---
+def iter_days(start_date, end_date):
+    day = start_date
+    while day <= end_date:
+        yield day
+        day += timedelta(days=1)
+
+
+def build_bitmaps(start_date, end_date, doctor_ids=None):
+    """
+    Tính bitmap cho mọi cặp (bác sĩ, ngày) trong khoảng [start_date, end_date]
+    bằng 1 truy vấn gộp trên AppointmentSlot, không phụ thuộc số bác sĩ/số ngày.
+    doctor_ids=None nghĩa là tất cả bác sĩ có slot trong khoảng.
+    Trả về dict {(doctor_id, day): DayBitmap}, chỉ gồm các cặp có slot.
+    """
+    range_start, _ = day_bounds(start_date)
+    _, range_end = day_bounds(end_date)
+    slots = AppointmentSlot.objects.filter(between('start_time', range_start, range_end)).order_by()
+    if doctor_ids is not None:
+        slots = slots.filter(doctor_id__in=doctor_ids)
+
+    schedule_bits = {}
+    booked_bits = {}
+    for doctor_id, start_time, state in slots.values_list('doctor_id', 'start_time', 'state'):
+        index = slot_index(start_time)
+        if index is None:
+            continue
+        pair = (doctor_id, timezone.localdate(start_time))
+        bit = 1 << index
+        schedule_bits[pair] = schedule_bits.get(pair, 0) | bit
+        if state != AppointmentSlot.STATE_FREE:
+            booked_bits[pair] = booked_bits.get(pair, 0) | bit
+
+    return {
+        pair: DayBitmap(schedule, booked_bits.get(pair, 0))
+        for pair, schedule in schedule_bits.items()
+    }
+
+
+def get_bitmaps(start_date, end_date, doctor_ids=None):
+    """
+    Như build_bitmaps nhưng đọc cache trước (một lần get_many cả bitmap lẫn version) và chỉ truy vấn DB
+    cho các bác sĩ còn thiếu. Kết quả tính mới được ghi lại vào cache (một lần set_many).
+    """
+    days = list(iter_days(start_date, end_date))
+    bitmaps = {}
+    versions = {}
+    missing_doctors = doctor_ids
+    if doctor_ids is not None:
+        pairs = [(doctor_id, day) for doctor_id in doctor_ids for day in days]
+        cached = cache.get_many([key for pair in pairs for key in (cache_key(*pair), version_key(*pair))])
+        for pair in pairs:
+            versions[pair] = cached.get(version_key(*pair))
+            bitmap = _cached_bitmap(cached, cache_key(*pair), versions[pair])
+            if bitmap is not None:
+                bitmaps[pair] = bitmap
+        missing_doctors = sorted({pair[0] for pair in pairs if pair not in bitmaps})
+        if not missing_doctors:
+            return bitmaps
+
+    # Version phải được đọc/tạo trước khi query DB (xem docstring của module). doctor_ids=None thì chưa biết
+    # trước cặp nào sẽ có, nên kết quả không được ghi vào cache.
+    fresh_versions = {}
+    for doctor_id in missing_doctors or ():
+        for day in days:
+            if (doctor_id, day) not in bitmaps and versions.get((doctor_id, day)) is None:
+                versions[(doctor_id, day)] = fresh_versions[version_key(doctor_id, day)] = new_version()
+    if fresh_versions:
+        cache.set_many(fresh_versions, VERSION_TIMEOUT)
+
+    built = build_bitmaps(start_date, end_date, missing_doctors)
+    fresh = {}
+    for doctor_id in (missing_doctors if missing_doctors is not None else {pair[0] for pair in built}):
+        for day in days:
+            if (doctor_id, day) in bitmaps:
+                continue
+            bitmap = built.get((doctor_id, day), DayBitmap(0, 0))
+            bitmaps[(doctor_id, day)] = bitmap
+            version = versions.get((doctor_id, day))
+            if version is not None:
+                fresh[cache_key(doctor_id, day)] = (version, *bitmap)
+    cache.set_many(fresh, CACHE_TIMEOUT)
+    return bitmaps
+
+
+def batch_available_slots(start_date, end_date, doctor_ids=None, now=None):
+    """
+    Slot trống cho mọi cặp (bác sĩ, ngày): trả về dict {(doctor_id, day): [datetime, ...]},
+    bỏ qua các cặp không còn slot nào. Phép trừ slot đã đặt được làm trên bitmap của từng cặp.
+    """
+    now = now or timezone.now()
+    days = {day: (day_bounds(day)[0], future_mask(day, now)) for day in iter_days(start_date, end_date)}
+    results = {}
+    for (doctor_id, day), bitmap in sorted(get_bitmaps(start_date, end_date, doctor_ids).items()):
+        day_start, day_mask = days[day]
+        mask = bitmap.free & day_mask
+        if mask:
+            results[(doctor_id, day)] = [slot_start(day_start, index) for index in iter_indexes(mask)]
+    return results
+
+
+# --- Tìm slot trống sớm nhất (k-way merge) ---
+class _WindowLoader:
+    """
+    Nạp bitmap theo từng cửa sổ ngày cho TẤT CẢ bác sĩ cùng lúc, chỉ khi một luồng slot cần tới.
+    Cửa sổ tăng dần (1, 2, 4, ... ngày) để trường hợp có slot sớm chỉ tốn một lần nạp nhỏ.
+    """
+    max_window_days = 14
+
+    def __init__(self, doctor_ids, first_day, last_day):
+        self.doctor_ids = doctor_ids
+        self.last_day = last_day
+        self.loaded_until = first_day - timedelta(days=1)
+        self.window_days = 1
+        self.bitmaps = {}
+
+    def get(self, doctor_id, day):
+        if day > self.loaded_until:
+            start = self.loaded_until + timedelta(days=1)
+            end = min(max(day, start + timedelta(days=self.window_days - 1)), self.last_day)
+            self.bitmaps.update(get_bitmaps(start, end, self.doctor_ids))
+            self.loaded_until = end
+            self.window_days = min(self.window_days * 2, self.max_window_days)
+        return self.bitmaps.get((doctor_id, day))
+
+
+def _iter_doctor_slots(doctor_id, loader, after, now):
+    """Luồng (lazy) các slot trống của một bác sĩ từ thời điểm after, theo thứ tự thời gian."""
+    first_day = timezone.localdate(after)
+    for day in iter_days(first_day, loader.last_day):
+        bitmap = loader.get(doctor_id, day)
+        if bitmap is None:
+            continue
+        day_start, _ = day_bounds(day)
+        mask = bitmap.free & future_mask(day, now)
+        if day == first_day:
+            # Bỏ các slot bắt đầu trước after (làm tròn lên mốc slot)
+            first_index = -int(-(after - day_start).total_seconds() // (SLOT_MINUTES * 60))
+            mask &= range_mask(max(first_index, 0), SLOTS_PER_DAY)
+        for index in iter_indexes(mask):
+            yield slot_start(day_start, index), doctor_id
+
+
+def doctors_with_slots(after, until):
+    """ID các bác sĩ còn slot trống bắt đầu trong [after, until)."""
+    # order_by() bỏ ordering mặc định của model (nếu không start_time lọt vào DISTINCT)
+    return sorted(AppointmentSlot.objects.filter(
+        between('start_time', after, until),
+        state=AppointmentSlot.STATE_FREE
+    ).order_by().values_list('doctor_id', flat=True).distinct())
+
+
+def earliest_slots(limit, after=None, doctor_ids=None, horizon_days=60, now=None):
+    """
+    K slot trống sớm nhất của một nhóm bác sĩ kể từ thời điểm after.
+    Mỗi bác sĩ là một luồng slot đọc lười; các luồng được trộn bằng heap (heapq.merge)
+    và dừng ngay khi đủ `limit` slot, không phải dựng toàn bộ lịch của từng bác sĩ.
+    Trả về danh sách (slot_time, doctor_id).
+    """
+    now = now or timezone.now()
+    after = max(after or now, now)
+    first_day = timezone.localdate(after)
+    last_day = first_day + timedelta(days=horizon_days - 1)
+    if doctor_ids is None:
+        doctor_ids = doctors_with_slots(after, day_bounds(last_day)[1])
+    if not doctor_ids:
+        return []
+
+    loader = _WindowLoader(doctor_ids, first_day, last_day)
+    streams = [_iter_doctor_slots(doctor_id, loader, after, now) for doctor_id in doctor_ids]
+    return list(islice(heapq.merge(*streams), limit))
+
+
+# --- Vô hiệu hóa cache khi slot thay đổi (gọi từ signals) ---
+def invalidate_days(doctor_id, days):
+    """
+    Đổi version của các (bác sĩ, ngày) sau khi transaction hiện tại commit (ngoài transaction thì đổi ngay).
+    Bitmap cũ trong cache không còn khớp version nên lần đọc sau dựng lại từ DB.
+    """
+    keys = {version_key(doctor_id, day): new_version() for day in days}
+    transaction.on_commit(lambda: cache.set_many(keys, VERSION_TIMEOUT))
+
+
+def set_booked(doctor_id, appointment_time, booked):
+    """Slot vừa được đặt/giữ chỗ/trả lại: vô hiệu hóa bitmap của ngày đó và gửi delta tới client SSE."""
+    day = timezone.localdate(appointment_time)
+    _publish_slot_change(doctor_id, day, appointment_time, booked)
+    invalidate_days(doctor_id, [day])
+
+
+def invalidate_range(doctor_id, start_time, end_time):
+    """Vô hiệu hóa cache của mọi ngày mà khoảng [start_time, end_time) đi qua (dùng khi DoctorSchedule thay đổi)."""
+    days = list(iter_days(timezone.localdate(start_time), timezone.localdate(end_time)))
+    invalidate_days(doctor_id, days)
+    for value in days:
+        _publish_day_snapshot(doctor_id, value)
+
+
+# --- Đẩy thay đổi tới client đang theo dõi (appointments/pubsub.py, SSE) ---
+def topic(doctor_id, day):
+    return (doctor_id, day)
+
+
+def day_snapshot_event(doctor_id, day):
+    return pubsub.format_sse('snapshot', {
+        'doctor_id': doctor_id,
+        'date': day.isoformat(),
+        'slots': [slot.strftime("%Y-%m-%dT%H:%M:%S%z") for slot in available_slots(doctor_id, day)],
+    })
+
+
+def _publish_slot_change(doctor_id, day, slot_time, booked):
+    """1 slot vừa được đặt/trả: gửi delta, không cần đọc DB. Chỉ gửi sau khi transaction commit."""
+    if not pubsub.broker.has_subscribers(topic(doctor_id, day)):
+        return
+    message = pubsub.format_sse('slot', {
+        'doctor_id': doctor_id,
+        'date': day.isoformat(),
+        'slot': slot_time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'available': not booked and slot_time > timezone.now(),
+    })
+    transaction.on_commit(lambda: pubsub.broker.publish(topic(doctor_id, day), message))
+
+
+def _publish_day_snapshot(doctor_id, day):
+    """Lịch làm việc thay đổi: gửi lại toàn bộ slot trống của ngày (tính 1 lần cho mọi subscriber)."""
+    if not pubsub.broker.has_subscribers(topic(doctor_id, day)):
+        return
+    transaction.on_commit(lambda: pubsub.broker.publish(topic(doctor_id, day), day_snapshot_event(doctor_id, day)))
@@ -0,0 +1,108 @@
+# appointments/booking.py
+"""
+Đặt lịch hẹn không bị race condition.
+
+Thay vì kiểm tra bằng nhiều truy vấn exists() rồi mới INSERT (để hở một khoảng thời gian
+cho 2 bệnh nhân cùng qua được bước kiểm tra), việc đặt lịch diễn ra trong 1 transaction:
+1. INSERT Appointment: ràng buộc unique (chỉ áp dụng cho lịch đang active) chặn trùng lịch
+   của bác sĩ/bệnh nhân ngay trong DB.
+2. UPDATE có điều kiện trên AppointmentSlot (state = Free): chỉ một request chiếm được slot.
+Thua race ở bất kỳ bước nào -> rollback và trả về 409 Conflict.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Subquery
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from . import availability
+from .models import Appointment, AppointmentSlot
+
+
+class SlotUnavailable(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = _("The selected time slot is no longer available.")
+    default_code = 'slot_unavailable'
+
+
+class PatientConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = _("You already have an appointment at this time.")
+    default_code = 'patient_conflict'
+
+
+def claim_slot(appointment, hold_token=None):
+    """
+    Chiếm slot cho lịch hẹn bằng 1 câu UPDATE có điều kiện. Trả về True nếu thành công.
+    Không có hold_token: slot phải đang Free.
+    Có hold_token: slot phải đang được chính bệnh nhân này giữ và hold chưa hết hạn (xem appointments/holds.py).
+    """
+    slots = AppointmentSlot.objects.filter(
+        doctor_id=appointment.doctor_id,
+        start_time=appointment.appointment_time
+    )
+    if hold_token:
+        slots = slots.filter(
+            state=AppointmentSlot.STATE_HELD,
+            hold_token=hold_token,
+            held_by=appointment.patient_id,
+            held_until__gt=timezone.now()
+        )
+    else:
+        slots = slots.filter(state=AppointmentSlot.STATE_FREE)
+    claimed = slots.update(
+        state=AppointmentSlot.STATE_BOOKED,
+        appointment_id=appointment.id,
+        hold_token=None,
+        held_by=None,
+        held_until=None,
+        hold_number=None
+    )
+    return claimed == 1
+
+
+def _raise_booking_error(doctor_id, patient_id, appointment_time):
+    """Chỉ chạy khi đặt lịch thất bại: xác định lý do để trả lỗi rõ ràng cho client."""
+    if not AppointmentSlot.objects.filter(doctor_id=doctor_id, start_time=appointment_time).exists():
+        raise ValidationError({'non_field_errors': [_("The doctor is not available at the selected time.")]})
+    if Appointment.objects.filter(
+        patient_id=patient_id,
+        appointment_time=appointment_time,
+        status__in=availability.ACTIVE_STATUSES
+    ).exists():
+        raise PatientConflict()
+    raise SlotUnavailable()
+
+
+def book_appointment(patient_id, doctor_id, appointment_time, hold_token=None, **extra_fields):
+    """
+    Tạo lịch hẹn và chiếm slot tương ứng trong cùng một transaction.
+    hold_token: token giữ chỗ đã nhận từ API holds/ (nếu có).
+    Raise SlotUnavailable/PatientConflict (409) hoặc ValidationError (400) nếu không đặt được.
+    """
+    appointment = Appointment(
+        patient_id=patient_id,
+        doctor_id=doctor_id,
+        appointment_time=appointment_time,
+        status=Appointment.STATUS_SCHEDULED,
+        # schedule_slot lấy bằng subquery ngay trong câu INSERT, không tốn thêm round trip
+        schedule_slot_id=Subquery(
+            AppointmentSlot.objects.filter(doctor_id=doctor_id, start_time=appointment_time).values('schedule_id')[:1]
+        ),
+        **extra_fields
+    )
+    # Slot do hàm này tự chiếm, signals không cần đồng bộ lại
+    appointment._slot_managed = True
+    try:
+        with transaction.atomic():
+            appointment.save(force_insert=True)
+            if not claim_slot(appointment, hold_token):
+                raise SlotUnavailable()
+    except (IntegrityError, SlotUnavailable):
+        _raise_booking_error(doctor_id, patient_id, appointment_time)
+
+    availability.set_booked(doctor_id, appointment_time, booked=True)
+    # Thay subquery bằng giá trị thật (đọc theo khóa chính, ngoài transaction)
+    appointment.refresh_from_db(fields=['schedule_slot'])
+    return appointment
@@ -0,0 +1,68 @@
+# appointments/export.py
+"""
+Xuất lịch hẹn dạng luồng (NDJSON hoặc CSV) cho báo cáo.
+
+- Đọc bằng values_list(...).iterator(chunk_size): PostgreSQL dùng server-side cursor,
+  các DB khác đọc theo từng chunk, nên không bao giờ giữ toàn bộ kết quả trong bộ nhớ.
+- Mỗi dòng được mã hóa trực tiếp từ tuple, không qua ModelSerializer/model instance.
+- Generator được đưa thẳng vào StreamingHttpResponse: bộ nhớ giữ nguyên dù xuất 10k hay 10M dòng.
+"""
+import csv
+import json
+
+EXPORT_FIELDS = (
+    'id',
+    'patient_id',
+    'doctor_id',
+    'schedule_slot_id',
+    'appointment_time',
+    'status',
+    'reason',
+    'created_at',
+    'updated_at',
+)
+CHUNK_SIZE = 2000
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_CSV = 'csv'
+CONTENT_TYPES = {
+    FORMAT_NDJSON: 'application/x-ndjson',
+    FORMAT_CSV: 'text/csv; charset=utf-8',
+}
+
+
+class _Echo:
+    """'File' giả cho csv.writer: write() trả lại chuỗi thay vì ghi vào buffer."""
+    def write(self, value):
+        return value
+
+
+def _encode_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def iter_rows(queryset, chunk_size=CHUNK_SIZE):
+    """Các tuple giá trị theo EXPORT_FIELDS, sắp theo (appointment_time, id) để thứ tự ổn định."""
+    return queryset.order_by('appointment_time', 'id').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def iter_ndjson(queryset, chunk_size=CHUNK_SIZE):
+    for row in iter_rows(queryset, chunk_size):
+        yield json.dumps(
+            dict(zip(EXPORT_FIELDS, map(_encode_value, row))),
+            ensure_ascii=False,
+            separators=(',', ':')
+        ) + '\n'
+
+
+def iter_csv(queryset, chunk_size=CHUNK_SIZE):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in iter_rows(queryset, chunk_size):
+        yield writer.writerow([_encode_value(value) for value in row])
+
+
+def iter_export(queryset, output_format, chunk_size=CHUNK_SIZE):
+    if output_format == FORMAT_CSV:
+        return iter_csv(queryset, chunk_size)
+    return iter_ndjson(queryset, chunk_size)
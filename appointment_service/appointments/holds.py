@@ -0,0 +1,109 @@
+# appointments/holds.py
+"""
+Giữ chỗ tạm thời (hold) cho slot trong lúc bệnh nhân hoàn tất form đặt lịch.
+
+- Tạo hold: 1 câu UPDATE có điều kiện Free -> Held, trả về token và thời điểm hết hạn.
+- Giới hạn MAX_ACTIVE_HOLDS hold/bệnh nhân do DB đảm bảo: mỗi hold chiếm 1 số thứ tự hold_number trong
+  1..MAX_ACTIVE_HOLDS, unique theo (held_by, hold_number) với các slot Held. 2 request song song của cùng
+  bệnh nhân không thể cùng lấy 1 số, nên không vượt giới hạn dù đếm-rồi-ghi bị chen ngang.
+- Đặt lịch với token (appointments.booking): chỉ người giữ token mới chiếm được slot Held.
+- Hold hết hạn được trả về Free hàng loạt bằng lệnh định kỳ `manage.py release_expired_holds`,
+  không kiểm tra từng dòng ở mỗi lần đọc. Cho tới lúc đó slot vẫn được coi là không trống.
+"""
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ValidationError
+
+from . import availability
+from .booking import SlotUnavailable
+from .models import AppointmentSlot
+
+HOLD_SECONDS = getattr(settings, 'SLOT_HOLD_SECONDS', 300)
+MAX_HOLD_SECONDS = getattr(settings, 'SLOT_HOLD_MAX_SECONDS', 900)
+MAX_ACTIVE_HOLDS = getattr(settings, 'SLOT_HOLD_MAX_PER_PATIENT', 3)
+
+# Các cột cần xóa khi slot rời trạng thái Held
+CLEARED_HOLD_FIELDS = {'hold_token': None, 'held_by': None, 'held_until': None, 'hold_number': None}
+
+
+def create_hold(patient_id, doctor_id, start_time, seconds=None):
+    """Giữ slot Free trong `seconds` giây. Trả về (token, held_until); raise 409 nếu slot không còn trống."""
+    seconds = min(seconds or HOLD_SECONDS, MAX_HOLD_SECONDS)
+    now = timezone.now()
+    # Hold đã hết hạn của chính bệnh nhân này trả lại ngay để nhường số thứ tự
+    release_expired_holds(now=now, patient_id=patient_id)
+    in_use = set(AppointmentSlot.objects.filter(
+        state=AppointmentSlot.STATE_HELD,
+        held_by=patient_id
+    ).values_list('hold_number', flat=True))
+
+    token = secrets.token_urlsafe(24)
+    held_until = now + timedelta(seconds=seconds)
+    for number in range(1, MAX_ACTIVE_HOLDS + 1):
+        if number in in_use:
+            continue
+        try:
+            with transaction.atomic():
+                claimed = AppointmentSlot.objects.filter(
+                    doctor_id=doctor_id,
+                    start_time=start_time,
+                    start_time__gt=now,
+                    state=AppointmentSlot.STATE_FREE
+                ).update(state=AppointmentSlot.STATE_HELD, hold_token=token, held_by=patient_id,
+                         held_until=held_until, hold_number=number)
+        except IntegrityError:
+            continue # Request khác của bệnh nhân này vừa lấy số này: thử số tiếp theo
+        if not claimed:
+            raise SlotUnavailable()
+        availability.set_booked(doctor_id, start_time, booked=True)
+        return token, held_until
+    raise ValidationError(_("You are holding too many slots. Complete or release a hold first."))
+
+
+def release_hold(patient_id, token):
+    """Bệnh nhân tự hủy hold của mình. Trả về True nếu có slot được trả lại."""
+    slot = AppointmentSlot.objects.filter(
+        state=AppointmentSlot.STATE_HELD,
+        hold_token=token,
+        held_by=patient_id
+    ).values_list('id', 'doctor_id', 'start_time').first()
+    if slot is None:
+        return False
+    slot_id, doctor_id, start_time = slot
+    released = AppointmentSlot.objects.filter(id=slot_id, hold_token=token).update(
+        state=AppointmentSlot.STATE_FREE, **CLEARED_HOLD_FIELDS
+    )
+    if released:
+        availability.set_booked(doctor_id, start_time, booked=False)
+    return bool(released)
+
+
+def release_expired_holds(now=None, batch_size=1000, patient_id=None):
+    """
+    Trả mọi hold đã hết hạn (của patient_id, nếu có) về Free theo lô (mỗi lô 1 SELECT + 1 UPDATE trên index
+    từng phần của các slot Held). Trả về số slot được giải phóng.
+    """
+    now = now or timezone.now()
+    released = 0
+    held = AppointmentSlot.objects.filter(state=AppointmentSlot.STATE_HELD)
+    if patient_id is not None:
+        held = held.filter(held_by=patient_id)
+    while True:
+        # Sắp theo held_until để đi theo index từng phần slot_held_until_idx thay vì ordering mặc định của model
+        expired = list(held.filter(
+            held_until__lte=now
+        ).order_by('held_until').values_list('id', 'doctor_id', 'start_time')[:batch_size])
+        if not expired:
+            return released
+        released += AppointmentSlot.objects.filter(
+            id__in=[slot_id for slot_id, doctor_id, start_time in expired],
+            state=AppointmentSlot.STATE_HELD,
+            held_until__lte=now
+        ).update(state=AppointmentSlot.STATE_FREE, **CLEARED_HOLD_FIELDS)
+        for slot_id, doctor_id, start_time in expired:
+            availability.set_booked(doctor_id, start_time, booked=False)
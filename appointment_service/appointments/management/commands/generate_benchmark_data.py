@@ -0,0 +1,186 @@
+# appointments/management/commands/generate_benchmark_data.py
+import random
+import time
+from datetime import datetime, timedelta
+from datetime import time as dtime
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from appointments import rollups
+from appointments.availability import SLOT_DURATION
+from appointments.models import Appointment, AppointmentSlot, DoctorDailyUtilization, DoctorSchedule
+
+# Ca làm việc sinh cho mỗi bác sĩ mỗi ngày sắp tới, và khung giờ của lịch hẹn trong quá khứ
+SHIFT_START, SHIFT_HOURS = dtime(8), 4
+HISTORY_START, HISTORY_SLOTS_PER_DAY = dtime(8), 18 # 08:00 - 17:00
+REASONS = ['Khám tổng quát', 'Tái khám', 'Đau đầu', 'Sốt', 'Ho kéo dài', 'Đau bụng', 'Kiểm tra huyết áp', 'Tư vấn kết quả xét nghiệm']
+
+
+class Command(BaseCommand):
+    help = ("Sinh dữ liệu giả lập cho benchmark bằng bulk_create: lịch làm việc + slot cho các ngày tới, "
+            "lịch hẹn quá khứ (Completed/Cancelled) và sắp tới (Scheduled/Confirmed, đã chiếm slot). "
+            "ID bác sĩ/bệnh nhân lấy theo dải in ra bởi generate_benchmark_data của user_service. "
+            "Xong thì tính lại bảng utilization cho khoảng đã sinh.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=10000)
+        parser.add_argument('--first-doctor-id', type=int, default=1)
+        parser.add_argument('--patients', type=int, default=100000)
+        parser.add_argument('--first-patient-id', type=int, help="Mặc định ngay sau dải bác sĩ (như user_service sinh ra)")
+        parser.add_argument('--appointments', type=int, default=1000000)
+        parser.add_argument('--future-share', type=float, default=0.1, help="Tỉ lệ lịch hẹn sắp tới (đang chiếm slot)")
+        parser.add_argument('--days-back', type=int, default=180)
+        parser.add_argument('--days-ahead', type=int, default=7, help="Số ngày tới có lịch làm việc và slot")
+        parser.add_argument('--scale', type=float, default=1.0, help="Nhân số bác sĩ/bệnh nhân/lịch hẹn (ví dụ 0.01)")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true', help="Xóa dữ liệu cũ của dải bác sĩ này trước")
+        parser.add_argument('--skip-rollups', action='store_true', help="Không tính lại bảng utilization")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        doctors = max(1, int(options['doctors'] * options['scale']))
+        patients = max(1, int(options['patients'] * options['scale']))
+        total = int(options['appointments'] * options['scale'])
+        first_doctor = options['first_doctor_id']
+        first_patient = options['first_patient_id'] or first_doctor + int(options['doctors'] * options['scale'])
+        self.doctor_ids = range(first_doctor, first_doctor + doctors)
+        self.patient_ids = range(first_patient, first_patient + patients)
+        self.days_back, self.days_ahead = options['days_back'], options['days_ahead']
+        self.today = timezone.localdate()
+        self.slots_per_shift = int(timedelta(hours=SHIFT_HOURS) / SLOT_DURATION)
+        if connection.vendor == 'sqlite':
+            # Dữ liệu giả lập: không cần fsync từng transaction
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous = OFF')
+
+        if options['clear']:
+            self.clear()
+
+        # Bác sĩ "đông khách" có nhiều lịch hẹn hơn; số lịch mỗi bác sĩ bị chặn bởi số slot có thể có
+        weights = [self.rng.lognormvariate(0, 0.5) for _ in self.doctor_ids]
+        weight_sum = sum(weights)
+        future_total = int(total * options['future_share'])
+        future_cap = self.days_ahead * self.slots_per_shift
+        past_cap = self.days_back * HISTORY_SLOTS_PER_DAY
+
+        self.active_patient_times = set()
+        started = time.perf_counter()
+        counts = {'schedules': 0, 'slots': 0, 'appointments': 0}
+        pending = []
+        batch_rows = 0
+        for doctor_id, weight in zip(self.doctor_ids, weights):
+            share = weight / weight_sum
+            pending.append((
+                doctor_id,
+                min(future_cap, round(future_total * share)),
+                min(past_cap, round((total - future_total) * share)),
+            ))
+            batch_rows += pending[-1][1] + pending[-1][2] + self.days_ahead * (1 + self.slots_per_shift)
+            if batch_rows >= options['batch_size']:
+                self.create_batch(pending, counts)
+                pending, batch_rows = [], 0
+                self.progress(counts, started)
+        if pending:
+            self.create_batch(pending, counts)
+        self.stdout.write('')
+
+        if not options['skip_rollups']:
+            self.stdout.write("Tính lại bảng utilization...")
+            rollups.rebuild(self.today - timedelta(days=self.days_back), self.today + timedelta(days=self.days_ahead), list(self.doctor_ids))
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã tạo {counts['appointments']} lịch hẹn, {counts['schedules']} lịch làm việc, {counts['slots']} slot "
+            f"cho bác sĩ {first_doctor}..{first_doctor + doctors - 1} trong {time.perf_counter() - started:.1f}s."
+        ))
+
+    def progress(self, counts, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"  {counts['appointments']} lịch hẹn, {counts['slots']} slot ({elapsed:.0f}s)", ending='\r')
+
+    def at(self, day, start, index):
+        return timezone.make_aware(datetime.combine(day, start)) + index * SLOT_DURATION
+
+    def pick_patient(self, moment):
+        # Một bệnh nhân không có 2 lịch active cùng lúc (unique_active_patient_appointment)
+        while True:
+            patient_id = self.rng.choice(self.patient_ids)
+            if (patient_id, moment) not in self.active_patient_times:
+                self.active_patient_times.add((patient_id, moment))
+                return patient_id
+
+    @transaction.atomic
+    def create_batch(self, plan, counts):
+        """plan: [(doctor_id, số lịch sắp tới, số lịch quá khứ)] cho một nhóm bác sĩ."""
+        rng = self.rng
+        schedules = DoctorSchedule.objects.bulk_create([
+            DoctorSchedule(
+                doctor_id=doctor_id,
+                start_time=self.at(self.today + timedelta(days=offset), SHIFT_START, 0),
+                end_time=self.at(self.today + timedelta(days=offset), SHIFT_START, self.slots_per_shift),
+            )
+            for doctor_id, _, _ in plan
+            for offset in range(1, self.days_ahead + 1)
+        ])
+        by_doctor = {}
+        for schedule in schedules:
+            by_doctor.setdefault(schedule.doctor_id, []).append(schedule)
+
+        # Lịch hẹn sắp tới: mỗi lịch chiếm 1 slot khác nhau trong ca làm việc
+        future = []
+        for doctor_id, future_count, _ in plan:
+            positions = rng.sample(range(self.days_ahead * self.slots_per_shift), future_count)
+            for position in positions:
+                schedule = by_doctor[doctor_id][position // self.slots_per_shift]
+                moment = schedule.start_time + (position % self.slots_per_shift) * SLOT_DURATION
+                future.append(Appointment(
+                    patient_id=self.pick_patient(moment),
+                    doctor_id=doctor_id,
+                    schedule_slot=schedule,
+                    appointment_time=moment,
+                    reason=rng.choice(REASONS),
+                    status=Appointment.STATUS_SCHEDULED if rng.random() < 0.7 else Appointment.STATUS_CONFIRMED,
+                ))
+        future = Appointment.objects.bulk_create(future)
+        booked = {(appointment.doctor_id, appointment.appointment_time): appointment.id for appointment in future}
+
+        slots = []
+        for schedule in schedules:
+            for index in range(self.slots_per_shift):
+                start = schedule.start_time + index * SLOT_DURATION
+                appointment_id = booked.get((schedule.doctor_id, start))
+                slots.append(AppointmentSlot(
+                    doctor_id=schedule.doctor_id,
+                    schedule=schedule,
+                    start_time=start,
+                    end_time=start + SLOT_DURATION,
+                    state=AppointmentSlot.STATE_BOOKED if appointment_id else AppointmentSlot.STATE_FREE,
+                    appointment_id=appointment_id,
+                ))
+        AppointmentSlot.objects.bulk_create(slots)
+
+        # Lịch sử: Completed/Cancelled, không cần lịch làm việc
+        past = []
+        for doctor_id, _, past_count in plan:
+            for position in rng.sample(range(self.days_back * HISTORY_SLOTS_PER_DAY), past_count):
+                day = self.today - timedelta(days=1 + position // HISTORY_SLOTS_PER_DAY)
+                past.append(Appointment(
+                    patient_id=rng.choice(self.patient_ids),
+                    doctor_id=doctor_id,
+                    appointment_time=self.at(day, HISTORY_START, position % HISTORY_SLOTS_PER_DAY),
+                    reason=rng.choice(REASONS),
+                    status=Appointment.STATUS_COMPLETED if rng.random() < 0.85 else Appointment.STATUS_CANCELLED,
+                ))
+        Appointment.objects.bulk_create(past, batch_size=5000)
+
+        counts['schedules'] += len(schedules)
+        counts['slots'] += len(slots)
+        counts['appointments'] += len(future) + len(past)
+
+    def clear(self):
+        first, last = self.doctor_ids.start, self.doctor_ids.stop - 1
+        # Xóa thẳng bằng SQL (không nạp từng object / không phát signal rollups), bảng utilization tính lại sau
+        for model in (AppointmentSlot, Appointment, DoctorSchedule, DoctorDailyUtilization):
+            deleted = model.objects.filter(doctor_id__gte=first, doctor_id__lte=last)._raw_delete(model.objects.db)
+            self.stdout.write(f"Đã xóa {deleted} dòng {model._meta.model_name}.")
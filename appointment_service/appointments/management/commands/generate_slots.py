@@ -0,0 +1,47 @@
+# appointments/management/commands/generate_slots.py
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from appointments import availability, slots
+from appointments.models import DoctorSchedule
+
+
+class Command(BaseCommand):
+    help = "Sinh (hoặc bổ sung) các AppointmentSlot từ DoctorSchedule. Chạy lại nhiều lần không tạo trùng."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor-id', type=int, help="Chỉ sinh slot cho bác sĩ này")
+        parser.add_argument('--from', dest='from_date', help="Ngày bắt đầu (YYYY-MM-DD), mặc định hôm nay")
+        parser.add_argument('--to', dest='to_date', help="Ngày kết thúc (YYYY-MM-DD)")
+        parser.add_argument('--batch-size', type=int, default=500, help="Số schedule xử lý mỗi lô")
+
+    def handle(self, *args, **options):
+        try:
+            from_date = date.fromisoformat(options['from_date']) if options['from_date'] else timezone.localdate()
+            to_date = date.fromisoformat(options['to_date']) if options['to_date'] else None
+        except ValueError:
+            raise CommandError("Ngày phải có định dạng YYYY-MM-DD.")
+
+        schedules = DoctorSchedule.objects.filter(
+            is_available=True,
+            end_time__gt=availability.day_bounds(from_date)[0]
+        )
+        if to_date:
+            schedules = schedules.filter(start_time__lt=availability.day_bounds(to_date)[1])
+        if options['doctor_id']:
+            schedules = schedules.filter(doctor_id=options['doctor_id'])
+
+        batch_size = options['batch_size']
+        batch = []
+        created = 0
+        for schedule in schedules.order_by('id').iterator(chunk_size=batch_size):
+            batch.append(schedule)
+            if len(batch) >= batch_size:
+                created += slots.generate_slots(batch)
+                batch = []
+        if batch:
+            created += slots.generate_slots(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Đã tạo {created} slot mới."))
@@ -0,0 +1,28 @@
+# appointments/management/commands/materialize_schedules.py
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from appointments import recurring
+
+
+class Command(BaseCommand):
+    help = "Sinh trước DoctorSchedule (và slot) từ các mẫu lịch lặp lại tới một ngày. Chạy lại nhiều lần không tạo trùng."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor-id', type=int, action='append', dest='doctor_ids', help="Chỉ sinh cho bác sĩ này (có thể lặp lại)")
+        parser.add_argument('--until', dest='until', help="Sinh tới ngày (YYYY-MM-DD)")
+        parser.add_argument('--days', type=int, default=recurring.DEFAULT_HORIZON_DAYS, help="Sinh tới N ngày kể từ hôm nay (nếu không có --until)")
+
+    def handle(self, *args, **options):
+        try:
+            until = date.fromisoformat(options['until']) if options['until'] else timezone.localdate() + timedelta(days=options['days'])
+        except ValueError:
+            raise CommandError("Ngày phải có định dạng YYYY-MM-DD.")
+
+        # Bỏ qua cache horizon để luôn kiểm tra lại trong DB
+        for doctor_id in options['doctor_ids'] or [None]:
+            recurring.invalidate_horizon(doctor_id)
+        created = recurring.ensure_materialized(until, options['doctor_ids'])
+        self.stdout.write(self.style.SUCCESS(f"Đã tạo {created} lịch làm việc mới."))
@@ -0,0 +1,12 @@
+# appointments/management/commands/purge_idempotency_keys.py
+from django.core.management.base import BaseCommand
+
+from appointment_service import idempotency
+
+
+class Command(BaseCommand):
+    help = "Xóa các Idempotency-Key đã hết hạn (IDEMPOTENCY_TTL_SECONDS). Chạy định kỳ bằng cron."
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Đã xóa {deleted} key hết hạn."))
@@ -0,0 +1,53 @@
+# appointments/management/commands/rebuild_utilization.py
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from appointments import rollups
+from appointments.models import DoctorDailyUtilization
+
+
+class Command(BaseCommand):
+    help = ("Tính lại bảng tổng hợp sử dụng theo ngày (DoctorDailyUtilization) từ DoctorSchedule và Appointment. "
+            "Dùng để nạp dữ liệu cũ sau khi bật tính năng, hoặc với --check để kiểm tra độ lệch.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help="YYYY-MM-DD (mặc định: 90 ngày trước)")
+        parser.add_argument('--end-date', help="YYYY-MM-DD (mặc định: 90 ngày tới)")
+        parser.add_argument('--doctor-id', type=int, action='append', dest='doctor_ids', help="Chỉ tính cho bác sĩ này (có thể lặp lại)")
+        parser.add_argument('--check', action='store_true', help="Chỉ so sánh và báo các dòng lệch, không ghi")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        try:
+            start_date = date.fromisoformat(options['start_date']) if options['start_date'] else today - timedelta(days=90)
+            end_date = date.fromisoformat(options['end_date']) if options['end_date'] else today + timedelta(days=90)
+        except ValueError:
+            raise CommandError("Ngày phải có định dạng YYYY-MM-DD.")
+        if end_date < start_date:
+            raise CommandError("--end-date phải lớn hơn hoặc bằng --start-date.")
+
+        if not options['check']:
+            written = rollups.rebuild(start_date, end_date, options['doctor_ids'])
+            self.stdout.write(self.style.SUCCESS(f"Đã ghi {written} dòng tổng hợp từ {start_date} đến {end_date}."))
+            return
+
+        expected = rollups.compute(start_date, end_date, options['doctor_ids'])
+        stored = DoctorDailyUtilization.objects.filter(date__gte=start_date, date__lte=end_date)
+        if options['doctor_ids']:
+            stored = stored.filter(doctor_id__in=options['doctor_ids'])
+        actual = {
+            (row[0], row[1]): dict(zip(rollups.COUNTER_FIELDS, row[2:]))
+            for row in stored.values_list('doctor_id', 'date', *rollups.COUNTER_FIELDS)
+        }
+        mismatches = 0
+        for key in sorted(set(expected) | set(actual)):
+            want = {field: expected.get(key, {}).get(field, 0) for field in rollups.COUNTER_FIELDS}
+            have = actual.get(key, dict.fromkeys(rollups.COUNTER_FIELDS, 0))
+            if want != have:
+                mismatches += 1
+                self.stdout.write(f"Dr. ID {key[0]} {key[1]}: lưu {have}, đúng {want}")
+        if mismatches:
+            raise CommandError(f"{mismatches} dòng tổng hợp bị lệch. Chạy lại lệnh không có --check để sửa.")
+        self.stdout.write(self.style.SUCCESS("Bảng tổng hợp khớp với dữ liệu gốc."))
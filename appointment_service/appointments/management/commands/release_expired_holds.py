@@ -0,0 +1,27 @@
+# appointments/management/commands/release_expired_holds.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from appointments import holds, waitlist
+
+
+class Command(BaseCommand):
+    help = ("Trả các slot giữ chỗ (Held) đã hết hạn về trạng thái Free, rồi mời người tiếp theo trong danh sách chờ "
+            "cho các slot của lời mời đã hết hạn. Chạy định kỳ (cron) hoặc với --interval.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Chạy lặp lại mỗi N giây (0 = chạy một lần rồi thoát)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        while True:
+            released = holds.release_expired_holds(batch_size=options['batch_size'])
+            expired_offers = waitlist.expire_offers()
+            waitlist.wait_idle()
+            if released or expired_offers or options['verbosity'] > 1:
+                self.stdout.write(f"Đã giải phóng {released} slot hết hạn giữ chỗ, {expired_offers} lời mời danh sách chờ hết hạn.")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,22 @@
+# appointments/management/commands/throttle_server.py
+from django.core.management.base import BaseCommand
+
+from appointment_service import throttling
+
+
+class Command(BaseCommand):
+    help = ("Chạy server giữ các token bucket cho THROTTLE_STORE = SocketStore "
+            "(giới hạn tần suất dùng chung giữa nhiều máy/worker).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('address', nargs='?', default='127.0.0.1:7070', help="'host:port' hoặc đường dẫn Unix socket")
+
+    def handle(self, *args, **options):
+        server = throttling.make_server(options['address'])
+        self.stdout.write(self.style.SUCCESS(f"Throttle server đang chạy tại {options['address']}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
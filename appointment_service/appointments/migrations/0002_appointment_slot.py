@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doctor_id', models.IntegerField(help_text='ID of the Doctor from the User Service', verbose_name='doctor id')),
+                ('start_time', models.DateTimeField(verbose_name='start time')),
+                ('end_time', models.DateTimeField(verbose_name='end time')),
+                ('state', models.CharField(choices=[('Free', 'Free'), ('Held', 'Held'), ('Booked', 'Booked')], default='Free', max_length=10, verbose_name='state')),
+                ('appointment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='slots', to='appointments.appointment', verbose_name='appointment')),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='appointments.doctorschedule', verbose_name='schedule')),
+            ],
+            options={
+                'verbose_name': 'appointment slot',
+                'verbose_name_plural': 'appointment slots',
+                'ordering': ['doctor_id', 'start_time'],
+                'unique_together': {('doctor_id', 'start_time')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_appointment_slot'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='appointment',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['Scheduled', 'Confirmed'])), fields=('patient_id', 'appointment_time'), name='unique_active_patient_appointment'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['Scheduled', 'Confirmed'])), fields=('doctor_id', 'appointment_time'), name='unique_active_doctor_appointment'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_active_appointment_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointmentslot',
+            name='held_by',
+            field=models.IntegerField(blank=True, null=True, verbose_name='held by patient id'),
+        ),
+        migrations.AddField(
+            model_name='appointmentslot',
+            name='held_until',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='held until'),
+        ),
+        migrations.AddField(
+            model_name='appointmentslot',
+            name='hold_token',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='hold token'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_slot_holds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doctor_id', models.IntegerField(blank=True, db_index=True, help_text='Leave empty for a holiday that applies to all doctors.', null=True, verbose_name='doctor id')),
+                ('date', models.DateField(db_index=True, verbose_name='date')),
+                ('start_time', models.TimeField(blank=True, null=True, verbose_name='start time')),
+                ('end_time', models.TimeField(blank=True, null=True, verbose_name='end time')),
+                ('reason', models.CharField(blank=True, max_length=255, verbose_name='reason')),
+            ],
+            options={
+                'verbose_name': 'schedule exception',
+                'verbose_name_plural': 'schedule exceptions',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ScheduleTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doctor_id', models.IntegerField(db_index=True, help_text='ID of the Doctor from the User Service', verbose_name='doctor id')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')], verbose_name='weekday')),
+                ('start_time', models.TimeField(verbose_name='start time')),
+                ('end_time', models.TimeField(verbose_name='end time')),
+                ('valid_from', models.DateField(verbose_name='valid from')),
+                ('valid_until', models.DateField(blank=True, help_text='Leave empty for no end date.', null=True, verbose_name='valid until')),
+                ('is_active', models.BooleanField(default=True, verbose_name='is active')),
+                ('materialized_until', models.DateField(blank=True, editable=False, null=True, verbose_name='materialized until')),
+            ],
+            options={
+                'verbose_name': 'schedule template',
+                'verbose_name_plural': 'schedule templates',
+                'ordering': ['doctor_id', 'weekday', 'start_time'],
+            },
+        ),
+        migrations.AddField(
+            model_name='doctorschedule',
+            name='template',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='schedules', to='appointments.scheduletemplate', verbose_name='template'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0005_schedule_templates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient_id', 'appointment_time', 'id'], name='appt_patient_time_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor_id', 'appointment_time', 'id'], name='appt_doctor_time_id_idx'),
+        ),
+    ]
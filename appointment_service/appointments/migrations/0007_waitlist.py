@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_appointment_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patient_id', models.IntegerField(db_index=True, help_text='ID of the Patient from the User Service', verbose_name='patient id')),
+                ('doctor_id', models.IntegerField(help_text='ID of the Doctor from the User Service', verbose_name='doctor id')),
+                ('window_start', models.DateTimeField(verbose_name='window start')),
+                ('window_end', models.DateTimeField(verbose_name='window end')),
+                ('priority', models.SmallIntegerField(default=0, verbose_name='priority')),
+                ('status', models.CharField(choices=[('Waiting', 'Waiting'), ('Offered', 'Offered'), ('Fulfilled', 'Fulfilled'), ('Expired', 'Expired'), ('Cancelled', 'Cancelled')], default='Waiting', max_length=20, verbose_name='status')),
+                ('hold_token', models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='hold token')),
+                ('offered_time', models.DateTimeField(blank=True, null=True, verbose_name='offered appointment time')),
+                ('offered_until', models.DateTimeField(blank=True, null=True, verbose_name='offered until')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'waitlist entry',
+                'verbose_name_plural': 'waitlist entries',
+                'ordering': ['-priority', 'created_at'],
+                'indexes': [models.Index(fields=['doctor_id', 'status', 'window_start'], name='waitlist_doctor_window_idx'), models.Index(fields=['status', 'offered_until'], name='waitlist_offer_expiry_idx')],
+            },
+        ),
+    ]
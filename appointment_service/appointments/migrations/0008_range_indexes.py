@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0007_waitlist'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointmentslot',
+            name='held_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='held until'),
+        ),
+        migrations.AlterField(
+            model_name='doctorschedule',
+            name='doctor_id',
+            field=models.IntegerField(help_text='ID of the Doctor from the User Service', verbose_name='doctor id'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor_id', 'appointment_time', 'status'], name='appt_doctor_time_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentslot',
+            index=models.Index(condition=models.Q(('state', 'Free')), fields=['start_time', 'doctor_id'], name='slot_free_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentslot',
+            index=models.Index(condition=models.Q(('state', 'Held')), fields=['held_until'], name='slot_held_until_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentslot',
+            index=models.Index(condition=models.Q(('state', 'Held')), fields=['held_by', 'held_until'], name='slot_held_by_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorschedule',
+            index=models.Index(fields=['doctor_id', 'start_time', 'end_time'], name='sched_doctor_range_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorschedule',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['start_time'], name='sched_available_start_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0008_range_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorDailyUtilization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doctor_id', models.IntegerField(help_text='ID of the Doctor from the User Service', verbose_name='doctor id')),
+                ('date', models.DateField(verbose_name='date')),
+                ('scheduled_minutes', models.IntegerField(default=0, verbose_name='scheduled minutes')),
+                ('booked', models.IntegerField(default=0, verbose_name='booked')),
+                ('confirmed', models.IntegerField(default=0, verbose_name='confirmed')),
+                ('cancelled', models.IntegerField(default=0, verbose_name='cancelled')),
+                ('completed', models.IntegerField(default=0, verbose_name='completed')),
+            ],
+            options={
+                'verbose_name': 'doctor daily utilization',
+                'verbose_name_plural': 'doctor daily utilization',
+                'ordering': ['date', 'doctor_id'],
+                'indexes': [models.Index(fields=['date'], name='utilization_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('doctor_id', 'date'), name='unique_doctor_daily_utilization')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0011_idempotency_records'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointmentslot',
+            name='hold_number',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='hold number'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointmentslot',
+            constraint=models.UniqueConstraint(condition=models.Q(('state', 'Held')), fields=('held_by', 'hold_number'), name='unique_patient_hold_number'),
+        ),
+    ]
@@ -1,8 +1,70 @@
 # appointments/models.py
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings # Có thể cần nếu dùng AUTH_USER_MODEL, nhưng ở đây ta dùng ID
 
+# Model Mẫu lịch làm việc lặp lại hằng tuần của Bác sĩ
+# Các DoctorSchedule cụ thể được sinh dần từ mẫu khi có truy vấn cần tới (xem appointments/recurring.py),
+# thay vì tạo sẵn hàng nghìn dòng cho nhiều tháng.
+class ScheduleTemplate(models.Model):
+    WEEKDAY_CHOICES = [
+        (0, _('Monday')),
+        (1, _('Tuesday')),
+        (2, _('Wednesday')),
+        (3, _('Thursday')),
+        (4, _('Friday')),
+        (5, _('Saturday')),
+        (6, _('Sunday')),
+    ]
+
+    doctor_id = models.IntegerField(
+        _("doctor id"),
+        db_index=True,
+        help_text=_("ID of the Doctor from the User Service")
+    )
+    weekday = models.PositiveSmallIntegerField(_("weekday"), choices=WEEKDAY_CHOICES)
+    # Giờ địa phương (theo TIME_ZONE); end_time <= start_time nghĩa là ca kết thúc vào ngày hôm sau
+    start_time = models.TimeField(_("start time"))
+    end_time = models.TimeField(_("end time"))
+    valid_from = models.DateField(_("valid from"))
+    valid_until = models.DateField(_("valid until"), null=True, blank=True, help_text=_("Leave empty for no end date."))
+    is_active = models.BooleanField(_("is active"), default=True)
+    # Đã sinh DoctorSchedule tới ngày nào (do hệ thống quản lý)
+    materialized_until = models.DateField(_("materialized until"), null=True, blank=True, editable=False)
+
+    class Meta:
+        verbose_name = _('schedule template')
+        verbose_name_plural = _('schedule templates')
+        ordering = ['doctor_id', 'weekday', 'start_time']
+
+    def __str__(self):
+        return f"Dr. ID {self.doctor_id}: {self.get_weekday_display()} {self.start_time.strftime('%H:%M')} - {self.end_time.strftime('%H:%M')}"
+
+# Model Ngoại lệ của lịch lặp lại: bác sĩ nghỉ (cả ngày hoặc một khoảng giờ), hoặc ngày lễ (doctor_id trống)
+class ScheduleException(models.Model):
+    doctor_id = models.IntegerField(
+        _("doctor id"),
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text=_("Leave empty for a holiday that applies to all doctors.")
+    )
+    date = models.DateField(_("date"), db_index=True)
+    # Bỏ trống cả hai = nghỉ cả ngày
+    start_time = models.TimeField(_("start time"), null=True, blank=True)
+    end_time = models.TimeField(_("end time"), null=True, blank=True)
+    reason = models.CharField(_("reason"), max_length=255, blank=True)
+
+    class Meta:
+        verbose_name = _('schedule exception')
+        verbose_name_plural = _('schedule exceptions')
+        ordering = ['date']
+
+    def __str__(self):
+        target = f"Dr. ID {self.doctor_id}" if self.doctor_id is not None else "Holiday"
+        return f"{target}: {self.date.isoformat()} {self.reason}".strip()
+
 # Model Lịch làm việc của Bác sĩ
 class DoctorSchedule(models.Model):
     # Lưu ID của bác sĩ từ UserService
@@ -10,7 +72,7 @@ class DoctorSchedule(models.Model):
     # vì đây là 2 service/database riêng biệt.
     doctor_id = models.IntegerField(
         _("doctor id"),
-        db_index=True, # Tạo index để query nhanh hơn theo doctor_id
+        # Không cần index riêng: index (doctor_id, start_time, end_time) trong Meta phục vụ cả lọc theo doctor_id
         help_text=_("ID of the Doctor from the User Service")
     )
     # Có thể lưu tên bác sĩ ở đây (dữ liệu sao chép) để tiện hiển thị,
@@ -19,20 +81,35 @@ class DoctorSchedule(models.Model):
 
     start_time = models.DateTimeField(_("start time"))
     end_time = models.DateTimeField(_("end time"))
-    # Cân nhắc: Thay vì start/end time, có thể chia thành các slot nhỏ hơn (ví dụ 15 phút/slot)
-    # và đánh dấu slot nào còn trống (is_available). Hoặc giữ start/end và kiểm tra logic khi book.
+    # Mỗi schedule được chia thành các slot nhỏ (AppointmentSlot, xem appointments/slots.py)
+    # để đánh dấu slot nào còn trống và kiểm tra khi book.
 
     is_available = models.BooleanField(
         _("is available"),
         default=True,
         help_text=_("Is this time slot generally available (before considering appointments)?")
     )
+    # Mẫu lịch lặp lại đã sinh ra schedule này (nếu có)
+    template = models.ForeignKey(
+        ScheduleTemplate,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='schedules',
+        verbose_name=_("template")
+    )
 
     class Meta:
         verbose_name = _('doctor schedule')
         verbose_name_plural = _('doctor schedules')
         # Đảm bảo không có lịch trình trùng lặp cho cùng một bác sĩ
         # unique_together = ('doctor_id', 'start_time', 'end_time') # Có thể gây khó khăn nếu lịch linh hoạt
+        # Truy vấn lịch theo khoảng nửa mở [start, end) trên start_time (xem appointments/queries.py)
+        indexes = [
+            models.Index(fields=['doctor_id', 'start_time', 'end_time'], name='sched_doctor_range_idx'),
+            # Xem lịch mọi bác sĩ: chỉ lịch còn trống
+            models.Index(fields=['start_time'], condition=models.Q(is_available=True), name='sched_available_start_idx'),
+        ]
         ordering = ['doctor_id', 'start_time']
 
     def __str__(self):
@@ -107,8 +184,236 @@ class Appointment(models.Model):
         verbose_name_plural = _('appointments')
         # Đảm bảo một bệnh nhân không đặt 2 lịch cùng lúc
         # Hoặc một bác sĩ không có 2 lịch cùng lúc
-        unique_together = (('patient_id', 'appointment_time'), ('doctor_id', 'appointment_time'))
+        # Chỉ áp dụng cho lịch đang active, để slot đã hủy có thể được đặt lại
+        constraints = [
+            models.UniqueConstraint(
+                fields=['patient_id', 'appointment_time'],
+                condition=models.Q(status__in=['Scheduled', 'Confirmed']),
+                name='unique_active_patient_appointment'
+            ),
+            models.UniqueConstraint(
+                fields=['doctor_id', 'appointment_time'],
+                condition=models.Q(status__in=['Scheduled', 'Confirmed']),
+                name='unique_active_doctor_appointment'
+            ),
+        ]
+        # Phục vụ phân trang keyset (appointments/pagination.py): mỗi trang là 1 range scan
+        indexes = [
+            models.Index(fields=['patient_id', 'appointment_time', 'id'], name='appt_patient_time_id_idx'),
+            models.Index(fields=['doctor_id', 'appointment_time', 'id'], name='appt_doctor_time_id_idx'),
+            # Tra lịch hẹn của bác sĩ theo khoảng thời gian + trạng thái mà không phải đọc dòng (covering)
+            models.Index(fields=['doctor_id', 'appointment_time', 'status'], name='appt_doctor_time_status_idx'),
+        ]
         ordering = ['appointment_time']
 
     def __str__(self):
-        return f"Appt ID: {self.id} - Patient: {self.patient_id} with Dr: {self.doctor_id} at {self.appointment_time.strftime('%Y-%m-%d %H:%M')}"
\ No newline at end of file
+        return f"Appt ID: {self.id} - Patient: {self.patient_id} with Dr: {self.doctor_id} at {self.appointment_time.strftime('%Y-%m-%d %H:%M')}"
+
+# Model Slot khám đã được "vật chất hóa" từ DoctorSchedule
+# Mỗi DoctorSchedule được chia thành các slot SLOT_MINUTES phút (xem appointments/slots.py),
+# mỗi slot lưu trạng thái Free/Held/Booked để tra cứu và đặt lịch bằng một truy vấn theo index.
+class AppointmentSlot(models.Model):
+    STATE_FREE = 'Free'
+    STATE_HELD = 'Held' # Đang được giữ tạm (chưa đặt xong)
+    STATE_BOOKED = 'Booked'
+
+    STATE_CHOICES = [
+        (STATE_FREE, _('Free')),
+        (STATE_HELD, _('Held')),
+        (STATE_BOOKED, _('Booked')),
+    ]
+
+    doctor_id = models.IntegerField(
+        _("doctor id"),
+        help_text=_("ID of the Doctor from the User Service")
+    )
+    schedule = models.ForeignKey(
+        DoctorSchedule,
+        on_delete=models.CASCADE, # Xóa lịch làm việc thì xóa luôn các slot sinh ra từ nó
+        related_name='slots',
+        verbose_name=_("schedule")
+    )
+    start_time = models.DateTimeField(_("start time"))
+    end_time = models.DateTimeField(_("end time"))
+    state = models.CharField(
+        _("state"),
+        max_length=10,
+        choices=STATE_CHOICES,
+        default=STATE_FREE,
+    )
+    # Thông tin giữ chỗ tạm thời (chỉ dùng khi state = Held, xem appointments/holds.py)
+    hold_token = models.CharField(_("hold token"), max_length=64, null=True, blank=True, unique=True)
+    held_by = models.IntegerField(_("held by patient id"), null=True, blank=True)
+    held_until = models.DateTimeField(_("held until"), null=True, blank=True)
+    # Số thứ tự của hold trong các hold đang giữ của bệnh nhân (1..SLOT_HOLD_MAX_PER_PATIENT), xem constraints
+    hold_number = models.PositiveSmallIntegerField(_("hold number"), null=True, blank=True)
+    # Lịch hẹn đang chiếm slot (nếu có)
+    appointment = models.ForeignKey(
+        Appointment,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='slots',
+        verbose_name=_("appointment")
+    )
+
+    class Meta:
+        verbose_name = _('appointment slot')
+        verbose_name_plural = _('appointment slots')
+        # Mỗi bác sĩ chỉ có 1 slot tại 1 thời điểm; index này cũng phục vụ các truy vấn theo khoảng thời gian
+        unique_together = ('doctor_id', 'start_time')
+        # Index từng phần (partial): chỉ chứa các slot ở đúng trạng thái mà truy vấn cần, nên nhỏ và rẻ khi ghi
+        indexes = [
+            # Tìm bác sĩ còn slot trống trong một khoảng thời gian (availability.doctors_with_slots)
+            models.Index(fields=['start_time', 'doctor_id'], condition=models.Q(state='Free'), name='slot_free_start_idx'),
+            # Dọn hold hết hạn và đếm hold đang giữ của bệnh nhân (appointments/holds.py)
+            models.Index(fields=['held_until'], condition=models.Q(state='Held'), name='slot_held_until_idx'),
+            models.Index(fields=['held_by', 'held_until'], condition=models.Q(state='Held'), name='slot_held_by_idx'),
+        ]
+        # Giới hạn số hold mỗi bệnh nhân do DB đảm bảo: mỗi số thứ tự chỉ dùng cho 1 slot Held
+        constraints = [
+            models.UniqueConstraint(
+                fields=['held_by', 'hold_number'],
+                condition=models.Q(state='Held'),
+                name='unique_patient_hold_number'
+            ),
+        ]
+        ordering = ['doctor_id', 'start_time']
+
+    def __str__(self):
+        return f"Dr. ID {self.doctor_id}: {self.start_time.strftime('%Y-%m-%d %H:%M')} ({self.state})"
+
+# Model Danh sách chờ: bệnh nhân muốn khám với bác sĩ trong một khoảng thời gian
+# Khi có lịch hẹn bị hủy, slot vừa trống được giữ chỗ (hold) cho ứng viên phù hợp nhất (xem appointments/waitlist.py).
+class WaitlistEntry(models.Model):
+    STATUS_WAITING = 'Waiting'
+    STATUS_OFFERED = 'Offered' # Đã giữ một slot cho bệnh nhân, chờ bệnh nhân đặt
+    STATUS_FULFILLED = 'Fulfilled'
+    STATUS_EXPIRED = 'Expired' # Hết hạn lời mời mà bệnh nhân không đặt
+    STATUS_CANCELLED = 'Cancelled'
+
+    STATUS_CHOICES = [
+        (STATUS_WAITING, _('Waiting')),
+        (STATUS_OFFERED, _('Offered')),
+        (STATUS_FULFILLED, _('Fulfilled')),
+        (STATUS_EXPIRED, _('Expired')),
+        (STATUS_CANCELLED, _('Cancelled')),
+    ]
+
+    patient_id = models.IntegerField(
+        _("patient id"),
+        db_index=True,
+        help_text=_("ID of the Patient from the User Service")
+    )
+    doctor_id = models.IntegerField(
+        _("doctor id"),
+        help_text=_("ID of the Doctor from the User Service")
+    )
+    # Khoảng thời gian bệnh nhân có thể đến khám (tối đa WAITLIST_MAX_WINDOW_DAYS ngày)
+    window_start = models.DateTimeField(_("window start"))
+    window_end = models.DateTimeField(_("window end"))
+    # Số càng lớn càng được ưu tiên (do nhân viên đặt, ví dụ ca bệnh nặng)
+    priority = models.SmallIntegerField(_("priority"), default=0)
+    status = models.CharField(
+        _("status"),
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_WAITING,
+    )
+    # Lời mời hiện tại (khi status = Offered): token giữ chỗ dùng khi POST book/
+    hold_token = models.CharField(_("hold token"), max_length=64, null=True, blank=True, unique=True)
+    offered_time = models.DateTimeField(_("offered appointment time"), null=True, blank=True)
+    offered_until = models.DateTimeField(_("offered until"), null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('waitlist entry')
+        verbose_name_plural = _('waitlist entries')
+        indexes = [
+            # Tìm ứng viên cho slot vừa trống: (bác sĩ, trạng thái, khoảng ngày) là 1 range scan
+            models.Index(fields=['doctor_id', 'status', 'window_start'], name='waitlist_doctor_window_idx'),
+            models.Index(fields=['status', 'offered_until'], name='waitlist_offer_expiry_idx'),
+        ]
+        ordering = ['-priority', 'created_at']
+
+    def __str__(self):
+        return f"Waitlist #{self.id}: Patient {self.patient_id} for Dr. ID {self.doctor_id} ({self.status})"
+
+# Model Bảng tổng hợp sử dụng theo ngày của từng bác sĩ (pre-aggregated, xem appointments/rollups.py)
+# Được cộng/trừ dần mỗi khi lịch làm việc/lịch hẹn thay đổi, để dashboard đọc vài trăm dòng thay vì quét bảng gốc.
+class DoctorDailyUtilization(models.Model):
+    doctor_id = models.IntegerField(
+        _("doctor id"),
+        help_text=_("ID of the Doctor from the User Service")
+    )
+    date = models.DateField(_("date")) # Ngày theo giờ địa phương (TIME_ZONE)
+    # Tổng số phút làm việc từ các DoctorSchedule còn hiệu lực (is_available) trong ngày
+    scheduled_minutes = models.IntegerField(_("scheduled minutes"), default=0)
+    # Số lịch hẹn trong ngày theo trạng thái hiện tại
+    booked = models.IntegerField(_("booked"), default=0) # Scheduled: đã đặt, chưa xác nhận
+    confirmed = models.IntegerField(_("confirmed"), default=0)
+    cancelled = models.IntegerField(_("cancelled"), default=0)
+    completed = models.IntegerField(_("completed"), default=0)
+
+    class Meta:
+        verbose_name = _('doctor daily utilization')
+        verbose_name_plural = _('doctor daily utilization')
+        constraints = [
+            models.UniqueConstraint(fields=['doctor_id', 'date'], name='unique_doctor_daily_utilization'),
+        ]
+        indexes = [
+            # Báo cáo toàn phòng khám (mọi bác sĩ) theo khoảng ngày
+            models.Index(fields=['date'], name='utilization_date_idx'),
+        ]
+        ordering = ['date', 'doctor_id']
+
+    def __str__(self):
+        return f"Dr. ID {self.doctor_id} on {self.date.isoformat()}: {self.booked + self.confirmed + self.completed} booked"
+
+# Model Sự kiện chờ gửi ra ngoài (transactional outbox, xem appointment_service/outbox.py)
+# Được ghi trong cùng transaction với thay đổi dữ liệu; lệnh publish_outbox gửi theo lô tới sink.
+class OutboxEvent(models.Model):
+    event_type = models.CharField(_("event type"), max_length=100) # Ví dụ: 'appointment.created'
+    key = models.CharField(_("key"), max_length=100, blank=True) # Đối tượng liên quan, ví dụ 'appointment:12'
+    payload = models.JSONField(_("payload"), encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(_("published at"), null=True, blank=True)
+    # Số lần gửi lỗi và lỗi gần nhất (theo dõi sự kiện bị kẹt)
+    attempts = models.PositiveIntegerField(_("attempts"), default=0)
+    last_error = models.TextField(_("last error"), blank=True)
+
+    class Meta:
+        verbose_name = _('outbox event')
+        verbose_name_plural = _('outbox events')
+        indexes = [
+            # Publisher chỉ đọc các sự kiện chưa gửi theo id: index từng phần chỉ chứa hàng đợi hiện tại
+            models.Index(fields=['id'], condition=models.Q(published_at__isnull=True), name='outbox_pending_idx'),
+            # Dọn các sự kiện đã gửi quá hạn lưu giữ
+            models.Index(fields=['published_at'], name='outbox_published_idx'),
+        ]
+        ordering = ['id']
+
+    def __str__(self):
+        return f"Outbox #{self.id}: {self.event_type} {self.key}".strip()
+
+
+class IdempotencyRecord(models.Model):
+    # sha256(user_id:Idempotency-Key) và sha256(method, path, body) - xem appointment_service/idempotency.py
+    key_hash = models.CharField(_("key hash"), max_length=64, unique=True)
+    request_hash = models.CharField(_("request hash"), max_length=64)
+    # None = request đầu tiên đang được xử lý
+    status_code = models.PositiveSmallIntegerField(_("status code"), null=True, blank=True)
+    response_body = models.JSONField(_("response body"), null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+    expires_at = models.DateTimeField(_("expires at"))
+
+    class Meta:
+        verbose_name = _('idempotency record')
+        verbose_name_plural = _('idempotency records')
+        indexes = [
+            # purge_idempotency_keys xóa theo hạn
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"Idempotency {self.key_hash[:12]}... -> {self.status_code or 'pending'}"
@@ -0,0 +1,145 @@
+# appointments/pagination.py
+"""
+Phân trang keyset (cursor) cho danh sách lịch hẹn.
+
+Thay vì OFFSET (càng cuộn sâu DB càng phải bỏ qua nhiều dòng), mỗi trang lọc theo khóa
+(appointment_time, id) của dòng cuối trang trước:
+    appointment_time > t OR (appointment_time = t AND id > id_cuối)
+nên mỗi trang chỉ là 1 range scan trên index (…, appointment_time, id), chi phí không đổi theo độ sâu.
+id giúp thứ tự ổn định khi nhiều lịch hẹn trùng appointment_time.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Khoảng giá trị của khóa chính (BigAutoField)
+MIN_ID, MAX_ID = -2 ** 63, 2 ** 63 - 1
+
+
+class AppointmentKeysetPagination(BasePagination):
+    """
+    Query params:
+    - cursor: chuỗi mờ lấy từ 'next'/'previous' của trang trước
+    - page_size: số lịch hẹn mỗi trang (mặc định APPOINTMENT_PAGE_SIZE, tối đa APPOINTMENT_MAX_PAGE_SIZE)
+    View đặt `keyset_descending = True` để sắp xếp mới nhất trước.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = getattr(settings, 'APPOINTMENT_PAGE_SIZE', 50)
+    max_page_size = getattr(settings, 'APPOINTMENT_MAX_PAGE_SIZE', 200)
+    time_field = 'appointment_time'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._finish_page(list(self._page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Như paginate_queryset, dùng async ORM (cho các view async)."""
+        return self._finish_page([row async for row in self._page_queryset(queryset, request, view)])
+
+    def _page_queryset(self, queryset, request, view):
+        self.request = request
+        self.descending = getattr(view, 'keyset_descending', False)
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        # Trang "previous": duyệt ngược chiều từ đầu trang hiện tại rồi đảo lại kết quả
+        reverse = cursor is not None and cursor[2]
+        descending = self.descending != reverse
+        if cursor is not None:
+            queryset = queryset.filter(self._after(cursor[0], cursor[1], descending))
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.time_field}', f'{prefix}id')
+        self.reverse = reverse
+        self.has_cursor = cursor is not None
+        # Lấy dư 1 dòng để biết còn trang tiếp theo hay không (không cần COUNT)
+        return queryset[:self.page_size + 1]
+
+    def _finish_page(self, rows):
+        reverse = self.reverse
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = self.has_cursor and (has_more if reverse else True)
+        self.first = rows[0] if rows else None
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    # --- Cursor ---
+    def _after(self, time_value, pk, descending):
+        """Điều kiện 'đứng sau (time_value, pk)' theo chiều sắp xếp."""
+        op = 'lt' if descending else 'gt'
+        return Q(**{f'{self.time_field}__{op}': time_value}) | Q(**{self.time_field: time_value, f'id__{op}': pk})
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            time_value, pk = datetime.fromisoformat(payload['t']), int(payload['i'])
+            if not MIN_ID <= pk <= MAX_ID: # Số quá lớn làm driver DB lỗi (OverflowError) khi query
+                raise ValueError(pk)
+            if timezone.is_naive(time_value):
+                time_value = timezone.make_aware(time_value)
+            return time_value, pk, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError, AttributeError):
+            # Cursor bị sửa/hỏng là lỗi của request: 400 thay vì 404/500
+            raise ParseError(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        payload = {'t': getattr(row, self.time_field).isoformat(), 'i': row.pk}
+        if reverse:
+            payload['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first is None:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.first, reverse=True)
@@ -3,84 +3,56 @@ from rest_framework.permissions import BasePermission, SAFE_METHODS
 from django.utils import timezone # Cần cho ví dụ nâng cao
 from datetime import timedelta  # Cần cho ví dụ nâng cao
 
+from .policies import AppointmentPolicy, PATIENT_STATUSES, ROLE_DOCTOR, ROLE_PATIENT
+
 class IsAdminClaim(BasePermission): # Kiểm tra is_staff từ claim
     def has_permission(self, request, view):
         return bool(
             request.user and
             request.user.is_authenticated and
-            request.user.get('is_staff', False)
+            AppointmentPolicy.for_request(request).is_staff
         )
 
 class IsDoctorClaim(BasePermission):
     def has_permission(self, request, view):
         if not (request.user and request.user.is_authenticated):
             return False
-        return 'Doctor' in request.user.get('roles', [])
+        return ROLE_DOCTOR in AppointmentPolicy.for_request(request).roles
 
 class IsPatientClaim(BasePermission):
     def has_permission(self, request, view):
         if not (request.user and request.user.is_authenticated):
             return False
-        return 'Patient' in request.user.get('roles', [])
+        return ROLE_PATIENT in AppointmentPolicy.for_request(request).roles
+
+class HasAppointmentRoleClaim(BasePermission):
+    # Quyền xem lịch hẹn dựa hoàn toàn vào claim roles: token thiếu claim này (và không phải Admin) bị 403
+    def has_permission(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return False
+        policy = AppointmentPolicy.for_request(request)
+        return policy.is_staff or bool(policy.roles & {ROLE_PATIENT, ROLE_DOCTOR})
 
+# Hai permission dưới đây dùng cho object đã load sẵn; các view đọc lịch hẹn nên lọc queryset
+# bằng appointments.policies.AppointmentPolicy để không phải load dòng của người khác.
 class IsAppointmentOwnerOrAdminOrAssociatedDoctor(BasePermission):
     def has_object_permission(self, request, view, obj): # obj là instance của Appointment
-        # Admin có mọi quyền
-        if request.user.get('is_staff', False):
-            return True
-
-        # Bệnh nhân sở hữu lịch hẹn
-        if obj.patient_id == request.user.get('user_id'):
-            # Bệnh nhân có thể xem (GET, HEAD, OPTIONS)
-            if request.method in SAFE_METHODS:
-                return True
-            # Bệnh nhân có thể hủy (ví dụ nếu action là 'cancel' hoặc method là PATCH/PUT với status 'Cancelled')
-            # Logic này cần cụ thể hơn, ví dụ cho phép PATCH status thành 'Cancelled'
-            if request.method in ['PUT', 'PATCH'] and request.data.get('status') == obj.STATUS_CANCELLED:
-                # Thêm kiểm tra thời gian hủy hợp lệ ở đây
-                # if obj.appointment_time < timezone.now() + timedelta(hours=24): return False
-                return True
-            return False # Các hành động khác không cho phép
+        policy = AppointmentPolicy.for_request(request)
+        # Admin, bệnh nhân sở hữu và bác sĩ liên quan được xem
+        if request.method in SAFE_METHODS:
+            return policy.can_view(obj)
+        # Ghi: chỉ Admin, hoặc bệnh nhân hủy lịch của chính mình
+        new_status = request.data.get('status')
+        return (policy.is_staff or new_status in PATIENT_STATUSES) and policy.can_modify(obj, new_status)
 
-        # Bác sĩ liên quan đến lịch hẹn có thể xem
-        if request.method in SAFE_METHODS and obj.doctor_id == request.user.get('user_id'):
-             # Giả định user_id của bác sĩ cũng là doctor_id trong appointment
-             # Điều này cần đảm bảo khi bác sĩ đăng nhập, user_id của họ được dùng làm doctor_id
-             return True # Bác sĩ có thể xem
-
-        return False
-    
 class CanModifyOrViewAppointment(BasePermission):
     def has_object_permission(self, request, view, obj): # obj là instance của Appointment
-        user = request.user
-        if not (user and user.is_authenticated):
-            return False
-
-        # Admin có mọi quyền
-        if user.get('is_staff', False):
-            return True
-
-        # Bệnh nhân sở hữu lịch hẹn
-        if obj.patient_id == user.get('user_id'): # Giả định user_id từ token là patient_id
-            if request.method in SAFE_METHODS: # GET, HEAD, OPTIONS
-                return True
-            # Bệnh nhân có thể hủy (PATCH/PUT với status là Cancelled)
-            if request.method in ['PUT', 'PATCH'] and request.data.get('status') == obj.STATUS_CANCELLED:
-                # (Tùy chọn) Thêm logic kiểm tra thời gian hủy, ví dụ:
-                # if obj.appointment_time < timezone.now() + timedelta(hours=24):
-                #     self.message = "Cannot cancel appointment less than 24 hours in advance."
-                #     return False
-                return True
-            return False # Các hành động ghi khác của bệnh nhân không được phép
-
-        # Bác sĩ liên quan đến lịch hẹn có thể xem
-        if request.method in SAFE_METHODS and obj.doctor_id == user.get('user_id'): # Giả định user_id của doctor là doctor_id
-            return True
-        
-        # Bác sĩ liên quan có thể cập nhật status thành Confirmed hoặc Completed
-        if obj.doctor_id == user.get('user_id') and request.method in ['PUT', 'PATCH']:
-            allowed_doctor_statuses = [obj.STATUS_CONFIRMED, obj.STATUS_COMPLETED]
-            if request.data.get('status') in allowed_doctor_statuses:
-                return True
-
-        return False
\ No newline at end of file
+        policy = AppointmentPolicy.for_request(request)
+        if request.method in SAFE_METHODS: # GET, HEAD, OPTIONS
+            return policy.can_view(obj)
+        # Bệnh nhân có thể hủy (Cancelled); bác sĩ liên quan có thể chuyển sang Confirmed/Completed
+        # (Tùy chọn) Thêm logic kiểm tra thời gian hủy, ví dụ:
+        # if obj.appointment_time < timezone.now() + timedelta(hours=24):
+        #     self.message = "Cannot cancel appointment less than 24 hours in advance."
+        #     return False
+        return policy.can_modify(obj, request.data.get('status'))
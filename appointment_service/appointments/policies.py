@@ -0,0 +1,87 @@
+# appointments/policies.py
+"""
+Phân quyền theo dòng (row-level) cho Appointment, biên dịch thành điều kiện lọc queryset.
+
+Claims trong JWT (user_id, roles, is_staff) được đọc đúng 1 lần mỗi request và chuyển thành Q:
+- Admin (is_staff): thấy mọi lịch hẹn.
+- Patient: lịch hẹn có patient_id = user_id.
+- Doctor: lịch hẹn có doctor_id = user_id (user_id của bác sĩ chính là doctor_id).
+Lọc ngay trong câu SQL nên ID không được phép chỉ tốn 1 lần tra index rồi trả 404,
+và các view danh sách dùng chung policy mà không phải duyệt rồi lọc từng dòng trong Python.
+"""
+from django.db.models import Q
+
+from .models import Appointment
+
+ROLE_PATIENT = 'Patient'
+ROLE_DOCTOR = 'Doctor'
+
+# Trạng thái mỗi vai trò được phép chuyển lịch hẹn sang
+PATIENT_STATUSES = {Appointment.STATUS_CANCELLED}
+DOCTOR_STATUSES = {Appointment.STATUS_CONFIRMED, Appointment.STATUS_COMPLETED}
+
+NOTHING = Q(pk__in=[]) # Django bỏ qua truy vấn, trả về rỗng ngay
+
+
+def _claims(user):
+    """(user_id, roles, is_staff) từ TokenUser (token JWT) hoặc user Django thông thường."""
+    token = getattr(user, 'token', None)
+    if token is not None:
+        return token.get('user_id'), frozenset(token.get('roles', ()) or ()), bool(token.get('is_staff', False))
+    return getattr(user, 'id', None), frozenset(getattr(user, 'roles', ()) or ()), bool(getattr(user, 'is_staff', False))
+
+
+class AppointmentPolicy:
+    def __init__(self, user):
+        if user is None or not user.is_authenticated:
+            self.user_id, self.roles, self.is_staff = None, frozenset(), False
+        else:
+            self.user_id, self.roles, self.is_staff = _claims(user)
+
+    @classmethod
+    def for_request(cls, request):
+        """Policy của request (tạo 1 lần, dùng lại cho mọi view/permission trong request)."""
+        policy = getattr(request, '_appointment_policy', None)
+        if policy is None:
+            policy = cls(request.user)
+            request._appointment_policy = policy
+        return policy
+
+    # --- Điều kiện lọc ---
+    def _role_q(self, role):
+        if self.user_id is None or role not in self.roles:
+            return NOTHING
+        if role == ROLE_PATIENT:
+            return Q(patient_id=self.user_id)
+        return Q(doctor_id=self.user_id)
+
+    def read_q(self, as_role=None):
+        """
+        Điều kiện cho các lịch hẹn user được xem.
+        as_role: chỉ xét với tư cách một vai trò (ví dụ danh sách 'lịch hẹn của tôi' của bệnh nhân).
+        """
+        if as_role is not None:
+            return self._role_q(as_role)
+        if self.is_staff:
+            return Q()
+        return self._role_q(ROLE_PATIENT) | self._role_q(ROLE_DOCTOR)
+
+    def visible(self, queryset, as_role=None):
+        return queryset.filter(self.read_q(as_role))
+
+    # --- Kiểm tra trên object đã load (cho permission class) ---
+    def can_view(self, appointment):
+        if self.is_staff:
+            return True
+        return self.user_id is not None and (
+            (ROLE_PATIENT in self.roles and appointment.patient_id == self.user_id) or
+            (ROLE_DOCTOR in self.roles and appointment.doctor_id == self.user_id)
+        )
+
+    def can_modify(self, appointment, new_status=None):
+        if self.is_staff:
+            return True
+        return self.user_id is not None and (
+            (new_status in PATIENT_STATUSES and ROLE_PATIENT in self.roles and appointment.patient_id == self.user_id) or
+            (new_status in DOCTOR_STATUSES and ROLE_DOCTOR in self.roles and appointment.doctor_id == self.user_id)
+        )
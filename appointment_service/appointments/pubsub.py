@@ -0,0 +1,106 @@
+# appointments/pubsub.py
+"""
+Pub/sub trong process cho các kết nối push (SSE) theo topic (bác sĩ, ngày).
+
+- publish() gọi được từ bất kỳ thread nào (view sync, signals, worker danh sách chờ);
+  message được chuyển sang event loop của từng subscriber bằng call_soon_threadsafe.
+- Mỗi subscriber có bộ đệm giới hạn (deque maxlen): client chậm chỉ mất các message cũ nhất
+  của chính nó và được báo 'resync' để tải lại, không làm phình bộ nhớ hay chặn người publish.
+- Payload được dựng 1 lần cho mỗi sự kiện rồi phát cho mọi subscriber: số subscriber không
+  làm tăng số truy vấn DB.
+Chỉ phát trong process hiện tại. Chạy nhiều worker ASGI thì cần broker dùng chung (ví dụ Redis pub/sub).
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+
+from django.conf import settings
+
+BUFFER_SIZE = getattr(settings, 'SLOT_EVENTS_BUFFER_SIZE', 100)
+
+
+def format_sse(event, data):
+    """Mã hóa 1 message Server-Sent Events (dựng 1 lần, gửi nguyên văn cho mọi subscriber)."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Subscriber:
+    """Một kết nối client. Chỉ được đọc (get) từ event loop đã tạo ra nó."""
+
+    def __init__(self, topics, buffer_size=BUFFER_SIZE):
+        self.topics = frozenset(topics)
+        self.loop = asyncio.get_running_loop()
+        self.buffer = deque(maxlen=buffer_size)
+        self.overflowed = False
+        self._ready = asyncio.Event()
+
+    def push(self, message):
+        """Gọi từ thread bất kỳ."""
+        try:
+            self.loop.call_soon_threadsafe(self._deliver, message)
+        except RuntimeError:
+            pass # Event loop đã đóng: kết nối đã kết thúc
+
+    def _deliver(self, message):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.overflowed = True # Message cũ nhất sẽ bị bỏ
+        self.buffer.append(message)
+        self._ready.set()
+
+    async def get(self, timeout=None):
+        """
+        Chờ message tiếp theo. Trả về (overflowed, messages) — lấy hết bộ đệm một lần;
+        (False, []) nếu hết timeout mà không có gì (dùng để gửi heartbeat).
+        """
+        if not self.buffer:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return False, []
+        messages = list(self.buffer)
+        self.buffer.clear()
+        overflowed, self.overflowed = self.overflowed, False
+        return overflowed, messages
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._topics = {}
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            for topic in subscriber.topics:
+                self._topics.setdefault(topic, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            for topic in subscriber.topics:
+                subscribers = self._topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._topics[topic]
+
+    def has_subscribers(self, topic):
+        return topic in self._topics
+
+    def publish(self, topic, message):
+        """Phát message tới mọi subscriber của topic. Trả về số subscriber nhận."""
+        with self._lock:
+            subscribers = tuple(self._topics.get(topic, ()))
+        for subscriber in subscribers:
+            subscriber.push(message)
+        return len(subscribers)
+
+    def subscriber_count(self, topic=None):
+        with self._lock:
+            if topic is not None:
+                return len(self._topics.get(topic, ()))
+            return len({subscriber for subscribers in self._topics.values() for subscriber in subscribers})
+
+
+broker = Broker()
@@ -0,0 +1,39 @@
+# appointments/queries.py
+"""
+Điều kiện lọc theo khoảng thời gian dạng nửa mở [start, end) trên chính cột datetime.
+
+Không dùng các lookup __date/__year/...: chúng bọc cột trong hàm (DATE(...), django_datetime_cast_date)
+nên DB không dùng được index trên cột đó. Thay vào đó ngày được đổi sang mốc datetime theo
+timezone của service (TIME_ZONE) rồi so sánh trực tiếp: `col >= đầu ngày AND col < đầu ngày kế tiếp`.
+Các index tương ứng khai báo trong Meta của model (migration 0008_range_indexes).
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+def day_bounds(day):
+    """Trả về [đầu ngày, đầu ngày hôm sau) theo timezone hiện tại (khoảng nửa mở)."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def between(field, start=None, end=None):
+    """field thuộc [start, end); bỏ trống một đầu thì không giới hạn phía đó."""
+    condition = Q()
+    if start is not None:
+        condition &= Q(**{f'{field}__gte': start})
+    if end is not None:
+        condition &= Q(**{f'{field}__lt': end})
+    return condition
+
+
+def on_dates(field, start_date=None, end_date=None):
+    """field rơi vào các ngày từ start_date đến hết end_date (theo giờ địa phương)."""
+    return between(
+        field,
+        day_bounds(start_date)[0] if start_date else None,
+        day_bounds(end_date)[1] if end_date else None,
+    )
@@ -0,0 +1,228 @@
+# appointments/recurring.py
+"""
+Sinh DoctorSchedule từ mẫu lịch lặp lại (ScheduleTemplate) theo nhu cầu.
+
+- Chỉ sinh tới ngày mà truy vấn cần (làm tròn tới cuối tuần), bằng bulk_create,
+  rồi sinh slot cho các schedule mới (appointments.slots).
+- ScheduleTemplate.materialized_until đánh dấu đã sinh tới đâu; việc "nhận" một khoảng để sinh
+  là một câu UPDATE có điều kiện nên 2 request đồng thời không sinh trùng.
+- Horizon đã sinh của từng bác sĩ được cache, nên các lần đọc sau chỉ tốn 1 lần cache.get_many.
+- Ngoại lệ (nghỉ phép, nghỉ một khoảng giờ) và ngày lễ (ScheduleException.doctor_id = NULL)
+  được trừ khỏi các khung giờ khi sinh.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import availability, rollups, slots
+from .models import ScheduleTemplate, ScheduleException, DoctorSchedule, AppointmentSlot
+
+HORIZON_CACHE_TIMEOUT = 3600
+DEFAULT_HORIZON_DAYS = 28 # Horizon mặc định khi truy vấn không nói rõ tới ngày nào
+ALL_DOCTORS = 'all'
+BULK_BATCH_SIZE = 1000
+
+
+def _horizon_key(doctor_id):
+    return f"recurring:horizon:{doctor_id}"
+
+
+def invalidate_horizon(doctor_id=None):
+    """Xóa cache horizon của bác sĩ (và của nhóm 'tất cả bác sĩ'). doctor_id=None: ngày lễ, xóa hết."""
+    if doctor_id is None:
+        doctor_ids = ScheduleTemplate.objects.values_list('doctor_id', flat=True).distinct()
+        cache.delete_many([_horizon_key(ALL_DOCTORS)] + [_horizon_key(value) for value in doctor_ids])
+    else:
+        cache.delete_many([_horizon_key(ALL_DOCTORS), _horizon_key(doctor_id)])
+
+
+# --- Tính các khung giờ cụ thể từ mẫu ---
+def _load_exceptions(doctor_ids, start_date, end_date):
+    """{(doctor_id hoặc None, ngày): [(start_time, end_time) hoặc None (nghỉ cả ngày)]}"""
+    exceptions = ScheduleException.objects.filter(date__gte=start_date, date__lte=end_date).filter(
+        Q(doctor_id__in=doctor_ids) | Q(doctor_id__isnull=True)
+    ).values_list('doctor_id', 'date', 'start_time', 'end_time')
+    result = defaultdict(list)
+    for doctor_id, day, start_time, end_time in exceptions:
+        result[(doctor_id, day)].append((start_time, end_time) if start_time and end_time else None)
+    return result
+
+
+def _subtract(windows, start, end):
+    """Trừ khoảng [start, end) khỏi danh sách khung giờ."""
+    remaining = []
+    for window_start, window_end in windows:
+        if end <= window_start or start >= window_end:
+            remaining.append((window_start, window_end))
+            continue
+        if window_start < start:
+            remaining.append((window_start, start))
+        if end < window_end:
+            remaining.append((end, window_end))
+    return remaining
+
+
+def template_windows(template, day, exceptions):
+    """Các khung giờ (aware datetime) của mẫu trong một ngày, sau khi trừ ngoại lệ/ngày lễ."""
+    start = timezone.make_aware(datetime.combine(day, template.start_time))
+    end = timezone.make_aware(datetime.combine(day, template.end_time))
+    if end <= start:
+        end += timedelta(days=1) # Ca qua đêm
+    windows = [(start, end)]
+    for rule in exceptions.get((template.doctor_id, day), []) + exceptions.get((None, day), []):
+        if rule is None:
+            return []
+        rule_start = timezone.make_aware(datetime.combine(day, rule[0]))
+        rule_end = timezone.make_aware(datetime.combine(day, rule[1]))
+        windows = _subtract(windows, rule_start, rule_end)
+    return windows
+
+
+def _build_schedules(templates, ranges, exceptions):
+    """DoctorSchedule (chưa lưu) cho từng mẫu trong khoảng ngày tương ứng ranges[template.id]."""
+    schedules = []
+    for template in templates:
+        first_day, last_day = ranges[template.id]
+        # Nhảy thẳng tới ngày đầu tiên đúng thứ trong tuần
+        day = first_day + timedelta(days=(template.weekday - first_day.weekday()) % 7)
+        while day <= last_day:
+            for start, end in template_windows(template, day, exceptions):
+                schedules.append(DoctorSchedule(
+                    doctor_id=template.doctor_id,
+                    start_time=start,
+                    end_time=end,
+                    template=template
+                ))
+            day += timedelta(days=7)
+    return schedules
+
+
+def _persist(schedules):
+    """bulk_create schedule rồi sinh slot cho chúng (bulk_create không phát signal)."""
+    if not schedules:
+        return 0
+    DoctorSchedule.objects.bulk_create(schedules, batch_size=BULK_BATCH_SIZE)
+    slots.generate_slots(schedules)
+    rollups.schedules_created(schedules)
+    return len(schedules)
+
+
+# --- Sinh theo horizon ---
+def _horizon(end_date, doctor_ids):
+    end_date = end_date + timedelta(days=6 - end_date.weekday()) # Làm tròn tới Chủ nhật
+    keys = [_horizon_key(ALL_DOCTORS)] if doctor_ids is None else [_horizon_key(doctor_id) for doctor_id in doctor_ids]
+    return end_date, keys
+
+
+def _covered(cached, keys, end_date):
+    return len(cached) == len(keys) and all(value >= end_date for value in cached.values())
+
+
+async def aensure_materialized(end_date, doctor_ids=None):
+    """
+    Bản async của ensure_materialized: trường hợp thường gặp (đã sinh đủ) chỉ là 1 lần đọc cache async;
+    chỉ khi thật sự cần sinh lịch mới chuyển sang thread (sync_to_async).
+    """
+    rounded, keys = _horizon(end_date, doctor_ids)
+    if _covered(await cache.aget_many(keys), keys, rounded):
+        return 0
+    return await sync_to_async(ensure_materialized)(end_date, doctor_ids)
+
+
+def ensure_materialized(end_date, doctor_ids=None):
+    """
+    Đảm bảo các mẫu lịch của các bác sĩ (None = tất cả) đã được sinh thành DoctorSchedule tới end_date.
+    Gọi trước khi đọc lịch/slot trong một khoảng ngày. Trả về số schedule mới tạo.
+    """
+    end_date, keys = _horizon(end_date, doctor_ids)
+    if _covered(cache.get_many(keys), keys, end_date):
+        return 0
+
+    today = timezone.localdate()
+    templates = ScheduleTemplate.objects.filter(
+        is_active=True,
+        valid_from__lte=end_date
+    ).filter(
+        Q(valid_until__isnull=True) | Q(valid_until__gte=today)
+    ).filter(
+        Q(materialized_until__isnull=True) | Q(materialized_until__lt=end_date)
+    )
+    if doctor_ids is not None:
+        templates = templates.filter(doctor_id__in=doctor_ids)
+
+    created = 0
+    templates = list(templates)
+    if templates:
+        with transaction.atomic():
+            claimed = []
+            ranges = {}
+            for template in templates:
+                # "Nhận" khoảng cần sinh: chỉ 1 request cập nhật được materialized_until từ giá trị cũ
+                if not ScheduleTemplate.objects.filter(
+                    pk=template.pk,
+                    materialized_until=template.materialized_until
+                ).update(materialized_until=end_date):
+                    continue
+                first_day = max(today, template.valid_from)
+                if template.materialized_until:
+                    first_day = max(first_day, template.materialized_until + timedelta(days=1))
+                last_day = min(end_date, template.valid_until or end_date)
+                if first_day <= last_day:
+                    claimed.append(template)
+                    ranges[template.id] = (first_day, last_day)
+            if claimed:
+                exceptions = _load_exceptions(
+                    {template.doctor_id for template in claimed},
+                    min(first for first, last in ranges.values()),
+                    max(last for first, last in ranges.values())
+                )
+                created = _persist(_build_schedules(claimed, ranges, exceptions))
+
+    cache.set_many({key: end_date for key in keys}, HORIZON_CACHE_TIMEOUT)
+    return created
+
+
+# --- Sinh lại khi mẫu/ngoại lệ thay đổi ---
+def _retire_generated(schedules):
+    """
+    Gỡ các schedule đã sinh từ mẫu: schedule chưa có ai đặt/giữ thì xóa,
+    schedule đã có slot Booked/Held thì tắt (is_available=False) để giữ lại lịch hẹn.
+    """
+    busy_ids = set(AppointmentSlot.objects.filter(schedule__in=schedules).exclude(
+        state=AppointmentSlot.STATE_FREE
+    ).values_list('schedule_id', flat=True))
+    schedules.exclude(id__in=busy_ids).delete()
+    for schedule in DoctorSchedule.objects.filter(id__in=busy_ids, is_available=True):
+        schedule.is_available = False
+        schedule.save() # signals xóa các slot Free còn lại
+
+
+def rematerialize_day(day, doctor_id=None):
+    """Sinh lại lịch từ mẫu cho một ngày (sau khi thêm/sửa/xóa ngoại lệ). doctor_id=None: mọi bác sĩ."""
+    day_start, day_end = availability.day_bounds(day)
+    generated = DoctorSchedule.objects.filter(template__isnull=False, start_time__gte=day_start, start_time__lt=day_end)
+    templates = ScheduleTemplate.objects.filter(is_active=True, weekday=day.weekday(), materialized_until__gte=day,
+                                                valid_from__lte=day).filter(Q(valid_until__isnull=True) | Q(valid_until__gte=day))
+    if doctor_id is not None:
+        generated = generated.filter(doctor_id=doctor_id)
+        templates = templates.filter(doctor_id=doctor_id)
+
+    with transaction.atomic():
+        _retire_generated(generated)
+        templates = list(templates)
+        if templates:
+            exceptions = _load_exceptions({template.doctor_id for template in templates}, day, day)
+            _persist(_build_schedules(templates, {template.id: (day, day) for template in templates}, exceptions))
+
+
+def reset_template(template):
+    """Mẫu thay đổi: gỡ các schedule tương lai đã sinh từ mẫu, lần đọc sau sẽ sinh lại theo mẫu mới."""
+    with transaction.atomic():
+        _retire_generated(DoctorSchedule.objects.filter(template=template, start_time__gte=timezone.now()))
+        ScheduleTemplate.objects.filter(pk=template.pk).update(materialized_until=timezone.localdate() - timedelta(days=1))
+    invalidate_horizon(template.doctor_id)
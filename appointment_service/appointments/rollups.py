@@ -0,0 +1,192 @@
+# appointments/rollups.py
+"""
+Bảng tổng hợp sử dụng theo ngày của từng bác sĩ (DoctorDailyUtilization).
+
+- Mỗi thay đổi lịch làm việc/lịch hẹn (appointments/signals.py, và recurring._persist cho bulk_create)
+  được đổi thành các delta (bác sĩ, ngày) -> {cột: +/-n} rồi cộng vào bảng bằng UPDATE ... SET col = col + n,
+  trong cùng transaction với thay đổi gốc: rollback thì bộ đếm cũng rollback.
+- Lịch hẹn được đếm theo trạng thái hiện tại (chuyển trạng thái = -1 cột cũ, +1 cột mới),
+  lịch làm việc đóng góp số phút (tách theo ngày nếu qua nửa đêm), chỉ khi is_available.
+- Báo cáo theo tháng chỉ đọc ~30 dòng mỗi bác sĩ. Dữ liệu có trước khi bật tính năng, hoặc khi nghi
+  lệch (sửa DB trực tiếp, QuerySet.update), chạy `manage.py rebuild_utilization` để tính lại từ bảng gốc.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .availability import SLOT_MINUTES
+from .models import Appointment, DoctorDailyUtilization, DoctorSchedule
+from .queries import between, day_bounds
+
+# Trạng thái lịch hẹn -> cột đếm
+STATUS_FIELDS = {
+    Appointment.STATUS_SCHEDULED: 'booked',
+    Appointment.STATUS_CONFIRMED: 'confirmed',
+    Appointment.STATUS_CANCELLED: 'cancelled',
+    Appointment.STATUS_COMPLETED: 'completed',
+}
+COUNTER_FIELDS = ('scheduled_minutes', 'booked', 'confirmed', 'cancelled', 'completed')
+# Lịch hẹn đang chiếm giờ làm việc của bác sĩ
+OCCUPIED_FIELDS = ('booked', 'confirmed', 'completed')
+
+
+# --- Delta ---
+def _new_deltas():
+    return defaultdict(Counter)
+
+
+def _add_appointment(deltas, state, sign):
+    doctor_id, appointment_time, status = state
+    field = STATUS_FIELDS.get(status)
+    if doctor_id is None or appointment_time is None or field is None:
+        return
+    deltas[(doctor_id, timezone.localdate(appointment_time))][field] += sign
+
+
+def _add_schedule(deltas, state, sign):
+    doctor_id, start_time, end_time, is_available = state
+    if doctor_id is None or not (start_time and end_time) or not is_available:
+        return
+    for day, minutes in split_minutes(start_time, end_time):
+        deltas[(doctor_id, day)]['scheduled_minutes'] += sign * minutes
+
+
+def split_minutes(start_time, end_time):
+    """[(ngày, số phút)] của khoảng [start_time, end_time), tách tại nửa đêm giờ địa phương."""
+    result = []
+    day = timezone.localdate(start_time)
+    while start_time < end_time:
+        day_end = day_bounds(day)[1]
+        part_end = min(end_time, day_end)
+        result.append((day, int((part_end - start_time).total_seconds() // 60)))
+        start_time, day = part_end, day + timedelta(days=1)
+    return result
+
+
+def apply(deltas):
+    """Cộng các delta vào bảng tổng hợp (1 UPDATE mỗi (bác sĩ, ngày); dòng chưa có thì tạo)."""
+    for (doctor_id, day), fields in deltas.items():
+        fields = {field: value for field, value in fields.items() if value}
+        if not fields:
+            continue
+        rows = DoctorDailyUtilization.objects.filter(doctor_id=doctor_id, date=day)
+        increments = {field: F(field) + value for field, value in fields.items()}
+        if rows.update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                DoctorDailyUtilization.objects.create(doctor_id=doctor_id, date=day, **fields)
+        except IntegrityError:
+            rows.update(**increments) # Request khác vừa tạo dòng này
+
+
+# --- Gọi từ signals / recurring ---
+def appointment_changed(old, new):
+    """old/new: (doctor_id, appointment_time, status); None nếu lịch hẹn mới tạo/vừa bị xóa."""
+    if old == new:
+        return
+    deltas = _new_deltas()
+    if old is not None:
+        _add_appointment(deltas, old, -1)
+    if new is not None:
+        _add_appointment(deltas, new, +1)
+    apply(deltas)
+
+
+def schedule_changed(old, new):
+    """old/new: (doctor_id, start_time, end_time, is_available); None nếu schedule mới tạo/vừa bị xóa."""
+    if old == new:
+        return
+    deltas = _new_deltas()
+    if old is not None:
+        _add_schedule(deltas, old, -1)
+    if new is not None:
+        _add_schedule(deltas, new, +1)
+    apply(deltas)
+
+
+def schedules_created(schedules):
+    """Cho các schedule tạo bằng bulk_create (không phát signal): gộp delta rồi ghi 1 lần."""
+    deltas = _new_deltas()
+    for schedule in schedules:
+        _add_schedule(deltas, (schedule.doctor_id, schedule.start_time, schedule.end_time, schedule.is_available), +1)
+    apply(deltas)
+
+
+# --- Tính lại từ bảng gốc ---
+def compute(start_date, end_date, doctor_ids=None):
+    """Giá trị đúng của bảng tổng hợp trong [start_date, end_date], tính từ DoctorSchedule và Appointment."""
+    deltas = _new_deltas()
+    range_start, range_end = day_bounds(start_date)[0], day_bounds(end_date)[1]
+    # Schedule có thể bắt đầu từ hôm trước và kéo qua nửa đêm
+    schedules = DoctorSchedule.objects.filter(
+        between('start_time', range_start - timedelta(days=1), range_end),
+        end_time__gt=range_start,
+        is_available=True
+    ).order_by()
+    appointments = Appointment.objects.filter(between('appointment_time', range_start, range_end)).order_by()
+    if doctor_ids is not None:
+        schedules = schedules.filter(doctor_id__in=doctor_ids)
+        appointments = appointments.filter(doctor_id__in=doctor_ids)
+
+    for state in schedules.values_list('doctor_id', 'start_time', 'end_time', 'is_available').iterator(chunk_size=2000):
+        _add_schedule(deltas, state, +1)
+    for state in appointments.values_list('doctor_id', 'appointment_time', 'status').iterator(chunk_size=2000):
+        _add_appointment(deltas, state, +1)
+    return {
+        key: fields for key, fields in deltas.items()
+        if start_date <= key[1] <= end_date and any(fields.values())
+    }
+
+
+def rebuild(start_date, end_date, doctor_ids=None):
+    """Thay các dòng tổng hợp trong khoảng bằng giá trị tính lại. Trả về số dòng ghi."""
+    expected = compute(start_date, end_date, doctor_ids)
+    rows = DoctorDailyUtilization.objects.filter(date__gte=start_date, date__lte=end_date)
+    if doctor_ids is not None:
+        rows = rows.filter(doctor_id__in=doctor_ids)
+    with transaction.atomic():
+        rows.delete()
+        DoctorDailyUtilization.objects.bulk_create([
+            DoctorDailyUtilization(doctor_id=doctor_id, date=day, **{field: fields.get(field, 0) for field in COUNTER_FIELDS})
+            for (doctor_id, day), fields in expected.items()
+        ], batch_size=1000)
+    return len(expected)
+
+
+# --- Báo cáo ---
+GROUPINGS = {
+    'doctor': ('doctor_id',),
+    'day': ('date',),
+    'doctor_day': ('doctor_id', 'date'),
+}
+
+
+def _with_ratios(row):
+    booked_minutes = sum(row[field] for field in OCCUPIED_FIELDS) * SLOT_MINUTES
+    row['booked_minutes'] = booked_minutes
+    row['utilization'] = round(booked_minutes / row['scheduled_minutes'], 4) if row['scheduled_minutes'] > 0 else None
+    return row
+
+
+def summarize(start_date, end_date, doctor_ids=None, group_by='doctor'):
+    """
+    Tổng hợp bảng theo nhóm ('doctor', 'day' = toàn phòng khám theo ngày, 'doctor_day').
+    Trả về (các dòng theo nhóm, tổng cả khoảng); mỗi dòng có thêm booked_minutes và utilization
+    (= phút đã có lịch hẹn / phút làm việc).
+    """
+    rows = DoctorDailyUtilization.objects.filter(date__gte=start_date, date__lte=end_date)
+    if doctor_ids is not None:
+        rows = rows.filter(doctor_id__in=doctor_ids)
+    sums = {field: Sum(field) for field in COUNTER_FIELDS}
+    keys = GROUPINGS[group_by]
+    groups = [
+        _with_ratios(row)
+        for row in rows.values(*keys).annotate(**sums).order_by(*keys)
+    ]
+    totals = rows.aggregate(**sums)
+    totals = _with_ratios({field: totals[field] or 0 for field in COUNTER_FIELDS})
+    return groups, totals
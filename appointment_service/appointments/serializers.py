@@ -1,7 +1,11 @@
 # appointments/serializers.py
 from rest_framework import serializers
 from django.utils import timezone
-from .models import DoctorSchedule, Appointment
+from django.utils.translation import gettext_lazy as _
+from datetime import timedelta
+
+from .models import DoctorSchedule, Appointment, WaitlistEntry
+from .waitlist import MAX_WINDOW_DAYS
 
 # --- Serializer cho Lịch làm việc của Bác sĩ ---
 class DoctorScheduleSerializer(serializers.ModelSerializer):
@@ -37,6 +41,8 @@ class AppointmentSerializer(serializers.ModelSerializer):
 class AppointmentCreateSerializer(serializers.ModelSerializer):
     # Client chỉ cần gửi doctor_id, appointment_time, reason.
     # patient_id sẽ được lấy từ thông tin user đang request (trong view).
+    # hold_token: token giữ chỗ nhận từ API holds/ (tùy chọn)
+    hold_token = serializers.CharField(write_only=True, required=False, max_length=64)
 
     class Meta:
         model = Appointment
@@ -44,9 +50,13 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
             'doctor_id',
             'appointment_time',
             'reason',
-            'schedule_slot', # Tùy chọn: client có thể gửi ID slot nếu thiết kế theo slot
+            'schedule_slot', # Gán tự động theo slot được đặt (read-only)
+            'hold_token',
         ]
+        read_only_fields = ('schedule_slot',)
         # Không bao gồm patient_id, status (sẽ set mặc định), created_at, updated_at
+        # Ràng buộc unique do DB kiểm tra lúc INSERT, không cần query exists() trước
+        validators = []
 
     def validate_appointment_time(self, value):
         """
@@ -61,51 +71,52 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
 
     def validate(self, attrs):
         """
-        Kiểm tra logic nghiệp vụ phức tạp hơn:
-        1. Bác sĩ có lịch làm việc vào thời điểm đó không?
-        2. Thời điểm đó đã có người khác đặt chưa (cả bác sĩ và bệnh nhân)?
+        Chỉ kiểm tra dữ liệu đầu vào, không truy vấn DB.
+        Việc bác sĩ có slot trống và trùng lịch (bác sĩ/bệnh nhân) được kiểm tra nguyên tử
+        lúc ghi, trong appointments.booking.book_appointment (lỗi trả về 400/409).
+        Thời điểm hẹn phải trùng với mốc bắt đầu của một slot (xem appointments/slots.py).
         """
-        appointment_time = attrs.get('appointment_time')
-        doctor_id = attrs.get('doctor_id')
         # Giả định patient_id được truyền vào context từ view
         patient_id = self.context.get('patient_id')
 
         if not patient_id:
              raise serializers.ValidationError(_("Patient information is missing."))
 
-        # 1. Kiểm tra lịch làm việc của bác sĩ (logic này cần chính xác hóa)
-        # Ví dụ đơn giản: Bác sĩ có schedule bao phủ thời gian appointment_time không?
-        # Lưu ý: Cần xử lý cẩn thận nếu thời gian khám > 1 slot
-        schedule_exists = DoctorSchedule.objects.filter(
-            doctor_id=doctor_id,
-            start_time__lte=appointment_time,
-            end_time__gt=appointment_time, # Giả sử lịch hẹn bắt đầu trong khoảng thời gian làm việc
-            is_available=True
-        ).exists()
-
-        if not schedule_exists:
-            raise serializers.ValidationError(_("The doctor is not available at the selected time."))
-
-        # 2. Kiểm tra trùng lịch của Bác sĩ
-        doctor_conflict = Appointment.objects.filter(
-            doctor_id=doctor_id,
-            appointment_time=appointment_time,
-            status__in=[Appointment.STATUS_SCHEDULED, Appointment.STATUS_CONFIRMED] # Chỉ kiểm tra các lịch đang active
-        ).exists()
-
-        if doctor_conflict:
-            raise serializers.ValidationError(_("The doctor already has an appointment at this time."))
+        return attrs
 
-        # 3. Kiểm tra trùng lịch của Bệnh nhân
-        patient_conflict = Appointment.objects.filter(
-            patient_id=patient_id,
-            appointment_time=appointment_time,
-            status__in=[Appointment.STATUS_SCHEDULED, Appointment.STATUS_CONFIRMED]
-        ).exists()
+# --- Serializer cho việc GIỮ CHỖ tạm thời một slot ---
+class SlotHoldCreateSerializer(serializers.Serializer):
+    doctor_id = serializers.IntegerField()
+    appointment_time = serializers.DateTimeField()
+    # Thời gian giữ chỗ (giây), bị giới hạn bởi SLOT_HOLD_MAX_SECONDS
+    seconds = serializers.IntegerField(required=False, min_value=30)
 
-        if patient_conflict:
-            raise serializers.ValidationError(_("You already have an appointment at this time."))
+# --- Serializer cho Danh sách chờ ---
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WaitlistEntry
+        fields = [
+            'id',
+            'doctor_id',
+            'window_start',
+            'window_end',
+            'priority',
+            'status',
+            'hold_token', # Có khi status = Offered: gửi kèm khi POST book/
+            'offered_time',
+            'offered_until',
+            'created_at',
+        ]
+        # priority do nhân viên đặt qua trang admin
+        read_only_fields = ('id', 'priority', 'status', 'hold_token', 'offered_time', 'offered_until', 'created_at')
 
+    def validate(self, attrs):
+        if attrs['window_end'] <= attrs['window_start']:
+            raise serializers.ValidationError(_("window_end must be after window_start."))
+        if attrs['window_end'] <= timezone.now():
+            raise serializers.ValidationError(_("The waiting window is already in the past."))
+        if attrs['window_end'] - attrs['window_start'] > timedelta(days=MAX_WINDOW_DAYS):
+            raise serializers.ValidationError(_("The waiting window cannot be longer than %(days)s days.") % {'days': MAX_WINDOW_DAYS})
         return attrs
 
 # --- Serializer riêng cho việc CẬP NHẬT trạng thái Lịch hẹn ---
@@ -0,0 +1,108 @@
+# appointments/signals.py
+"""
+Giữ cho bảng AppointmentSlot, cache bitmap slot (appointments/availability.py) và bảng tổng hợp
+sử dụng theo ngày (appointments/rollups.py) đồng bộ với DB.
+Lưu ý: QuerySet.update()/bulk_create() không phát signal, cần tự gọi appointments.slots/rollups nếu dùng.
+"""
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from . import availability, recurring, rollups, slots, waitlist
+from .models import DoctorSchedule, Appointment, ScheduleTemplate, ScheduleException
+
+
+# Ghi nhớ trạng thái lúc load để biết lịch hẹn chuyển từ trạng thái nào sang trạng thái nào
+# (đọc từ __dict__ để không kích hoạt query cho các trường bị defer)
+@receiver(post_init, sender=Appointment)
+def remember_appointment_state(sender, instance, **kwargs):
+    values = instance.__dict__
+    instance._loaded_state = (values.get('doctor_id'), values.get('appointment_time'), values.get('status'))
+
+
+@receiver(post_save, sender=Appointment)
+def update_slot_on_appointment_save(sender, instance, created, **kwargs):
+    old_doctor_id, old_time, old_status = getattr(instance, '_loaded_state', (None, None, None))
+    was_active = not created and old_status in availability.ACTIVE_STATUSES and old_time is not None
+    is_active = instance.status in availability.ACTIVE_STATUSES
+    moved = (old_doctor_id, old_time) != (instance.doctor_id, instance.appointment_time)
+
+    # Hủy lịch (hoặc đổi giờ): trả slot cũ về Free. Hoàn thành (Completed) vẫn giữ slot Booked.
+    # Slot vừa trống được mời cho người trong danh sách chờ (worker nền, sau commit)
+    if was_active and (instance.status == Appointment.STATUS_CANCELLED or moved):
+        if slots.release_slot(instance, old_doctor_id, old_time):
+            waitlist.schedule_match(old_doctor_id, old_time)
+    # Lịch tạo qua appointments.booking đã tự chiếm slot trong transaction của nó
+    if is_active and (created or not was_active or moved) and not getattr(instance, '_slot_managed', False):
+        slots.book_slot(instance)
+
+    new_state = (instance.doctor_id, instance.appointment_time, instance.status)
+    rollups.appointment_changed(None if created else (old_doctor_id, old_time, old_status), new_state)
+    instance._loaded_state = new_state
+
+
+@receiver(post_delete, sender=Appointment)
+def update_availability_on_appointment_delete(sender, instance, **kwargs):
+    rollups.appointment_changed((instance.doctor_id, instance.appointment_time, instance.status), None)
+    if instance.status in availability.ACTIVE_STATUSES:
+        if slots.release_orphaned_slot(instance.doctor_id, instance.appointment_time):
+            waitlist.schedule_match(instance.doctor_id, instance.appointment_time)
+
+
+@receiver(post_init, sender=DoctorSchedule)
+def remember_schedule_range(sender, instance, **kwargs):
+    values = instance.__dict__
+    instance._loaded_range = (values.get('doctor_id'), values.get('start_time'), values.get('end_time'), values.get('is_available'))
+
+
+@receiver(post_save, sender=DoctorSchedule)
+def sync_slots_on_schedule_save(sender, instance, created, **kwargs):
+    old_range = getattr(instance, '_loaded_range', (None, None, None, None))
+    old_doctor_id, old_start, old_end, _ = old_range
+    slots.sync_schedule_slots(instance)
+    if old_doctor_id is not None and old_start and old_end:
+        availability.invalidate_range(old_doctor_id, old_start, old_end)
+    new_range = (instance.doctor_id, instance.start_time, instance.end_time, instance.is_available)
+    rollups.schedule_changed(None if created else old_range, new_range)
+    instance._loaded_range = new_range
+
+
+@receiver(post_delete, sender=DoctorSchedule)
+def invalidate_availability_on_schedule_delete(sender, instance, **kwargs):
+    rollups.schedule_changed((instance.doctor_id, instance.start_time, instance.end_time, instance.is_available), None)
+    # Slot của schedule đã bị xóa theo (CASCADE)
+    availability.invalidate_range(instance.doctor_id, instance.start_time, instance.end_time)
+
+
+# Mẫu lịch thay đổi: gỡ các schedule tương lai đã sinh, lần đọc sau sinh lại theo mẫu mới
+@receiver(post_save, sender=ScheduleTemplate)
+def reset_template_on_save(sender, instance, created, **kwargs):
+    if created:
+        recurring.invalidate_horizon(instance.doctor_id)
+    else:
+        recurring.reset_template(instance)
+
+
+@receiver(pre_delete, sender=ScheduleTemplate)
+def retire_template_schedules_on_delete(sender, instance, **kwargs):
+    recurring.reset_template(instance)
+
+
+@receiver(post_init, sender=ScheduleException)
+def remember_exception_day(sender, instance, **kwargs):
+    values = instance.__dict__
+    instance._loaded_day = (values.get('doctor_id'), values.get('date'))
+
+
+# Ngoại lệ/ngày lễ thay đổi: sinh lại lịch từ mẫu cho (các) ngày bị ảnh hưởng
+@receiver(post_save, sender=ScheduleException)
+def rematerialize_on_exception_save(sender, instance, **kwargs):
+    old_doctor_id, old_date = getattr(instance, '_loaded_day', (None, None))
+    if old_date is not None and (old_doctor_id, old_date) != (instance.doctor_id, instance.date):
+        recurring.rematerialize_day(old_date, old_doctor_id)
+    recurring.rematerialize_day(instance.date, instance.doctor_id)
+    instance._loaded_day = (instance.doctor_id, instance.date)
+
+
+@receiver(post_delete, sender=ScheduleException)
+def rematerialize_on_exception_delete(sender, instance, **kwargs):
+    recurring.rematerialize_day(instance.date, instance.doctor_id)
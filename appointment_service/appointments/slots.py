@@ -0,0 +1,142 @@
+# appointments/slots.py
+"""
+Quản lý bảng slot đã vật chất hóa (AppointmentSlot).
+
+- Sinh slot hàng loạt (bulk_create) từ các DoctorSchedule, theo lưới SLOT_MINUTES phút
+  giống bitmap trong appointments/availability.py.
+- Cập nhật trạng thái slot tại chỗ khi lịch hẹn được tạo/hủy/hoàn thành (gọi từ signals),
+  đồng thời vô hiệu hóa bitmap của ngày đó trong cache (sau khi transaction commit).
+"""
+from datetime import timedelta
+
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
+
+from . import availability
+from .models import AppointmentSlot, Appointment
+
+BULK_BATCH_SIZE = 1000
+
+
+def iter_schedule_slots(schedule):
+    """Các cặp (start, end) của những slot nằm trọn trong schedule."""
+    day = timezone.localdate(schedule.start_time)
+    last_day = timezone.localdate(schedule.end_time)
+    while day <= last_day:
+        day_start, _ = availability.day_bounds(day)
+        mask = availability.interval_mask(day_start, schedule.start_time, schedule.end_time)
+        for index in availability.iter_indexes(mask):
+            start = availability.slot_start(day_start, index)
+            yield start, start + availability.SLOT_DURATION
+        day += timedelta(days=1)
+
+
+def generate_slots(schedules):
+    """
+    Sinh slot cho danh sách schedule bằng bulk_create (bỏ qua slot đã tồn tại),
+    rồi đánh dấu Booked các slot đã có lịch hẹn active. Trả về số slot mới tạo.
+    """
+    schedules = [schedule for schedule in schedules if schedule.is_available]
+    if not schedules:
+        return 0
+
+    new_slots = [
+        AppointmentSlot(doctor_id=schedule.doctor_id, schedule=schedule, start_time=start, end_time=end)
+        for schedule in schedules
+        for start, end in iter_schedule_slots(schedule)
+    ]
+    if not new_slots:
+        return 0
+    before = AppointmentSlot.objects.filter(schedule__in=schedules).count()
+    AppointmentSlot.objects.bulk_create(new_slots, batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
+    created = AppointmentSlot.objects.filter(schedule__in=schedules).count() - before
+
+    # Đồng bộ trạng thái với các lịch hẹn đã có trong khoảng thời gian này: 1 câu UPDATE cho cả lô,
+    # lịch hẹn active của từng slot lấy bằng subquery tương quan theo (doctor_id, appointment_time)
+    doctor_ids = {schedule.doctor_id for schedule in schedules}
+    range_start = min(schedule.start_time for schedule in schedules)
+    range_end = max(schedule.end_time for schedule in schedules)
+    active_appointment = Appointment.objects.filter(
+        doctor_id=OuterRef('doctor_id'),
+        appointment_time=OuterRef('start_time'),
+        status__in=availability.ACTIVE_STATUSES
+    ).order_by().values('id')[:1]
+    AppointmentSlot.objects.filter(
+        doctor_id__in=doctor_ids,
+        start_time__gte=range_start,
+        start_time__lt=range_end,
+        state=AppointmentSlot.STATE_FREE
+    ).filter(Exists(active_appointment)).update(
+        state=AppointmentSlot.STATE_BOOKED, appointment_id=Subquery(active_appointment)
+    )
+
+    for schedule in schedules:
+        availability.invalidate_range(schedule.doctor_id, schedule.start_time, schedule.end_time)
+    return created
+
+
+def sync_schedule_slots(schedule):
+    """
+    Sinh lại slot sau khi schedule thay đổi: xóa các slot còn Free của schedule
+    rồi sinh lại theo khoảng thời gian mới. Slot đang Held/Booked được giữ nguyên.
+    """
+    AppointmentSlot.objects.filter(schedule=schedule, state=AppointmentSlot.STATE_FREE).delete()
+    generate_slots([schedule])
+
+
+def find_free_slot(doctor_id, start_time):
+    """Slot còn trống của bác sĩ tại đúng thời điểm start_time (1 truy vấn theo unique index)."""
+    return AppointmentSlot.objects.filter(
+        doctor_id=doctor_id,
+        start_time=start_time,
+        state=AppointmentSlot.STATE_FREE
+    ).first()
+
+
+def mark_slot(doctor_id, start_time, state, appointment_id=None, expected_appointment_id=None, expected_state=None):
+    """
+    Cập nhật trạng thái slot tại chỗ (1 câu UPDATE) và vô hiệu hóa bitmap của ngày đó trong cache.
+    expected_appointment_id: chỉ giải phóng slot nếu nó đang thuộc về lịch hẹn này.
+    expected_state: chỉ cập nhật nếu slot đang ở trạng thái này.
+    """
+    slots = AppointmentSlot.objects.filter(doctor_id=doctor_id, start_time=start_time)
+    if expected_appointment_id is not None:
+        slots = slots.filter(appointment_id=expected_appointment_id)
+    if expected_state is not None:
+        slots = slots.filter(state=expected_state)
+    updated = slots.update(state=state, appointment_id=appointment_id)
+    if updated:
+        availability.set_booked(doctor_id, start_time, booked=state != AppointmentSlot.STATE_FREE)
+    return updated
+
+
+def book_slot(appointment):
+    return mark_slot(
+        appointment.doctor_id,
+        appointment.appointment_time,
+        AppointmentSlot.STATE_BOOKED,
+        appointment.id,
+        expected_state=AppointmentSlot.STATE_FREE
+    )
+
+
+def release_slot(appointment, doctor_id=None, appointment_time=None):
+    return mark_slot(
+        doctor_id or appointment.doctor_id,
+        appointment_time or appointment.appointment_time,
+        AppointmentSlot.STATE_FREE,
+        expected_appointment_id=appointment.id
+    )
+
+
+def release_orphaned_slot(doctor_id, start_time):
+    """Trả về Free slot Booked không còn lịch hẹn (appointment đã bị xóa, FK đã được SET_NULL)."""
+    updated = AppointmentSlot.objects.filter(
+        doctor_id=doctor_id,
+        start_time=start_time,
+        state=AppointmentSlot.STATE_BOOKED,
+        appointment__isnull=True
+    ).update(state=AppointmentSlot.STATE_FREE)
+    if updated:
+        availability.set_booked(doctor_id, start_time, booked=False)
+    return updated
@@ -1,3 +1,1139 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken
+
+from appointment_service import instrumentation, outbox, throttling
+
+from . import availability, booking, export, holds, queries, recurring, rollups, slots, waitlist
+from .async_views import AsyncAvailableSlotsView
+from .models import (
+    DoctorSchedule, Appointment, AppointmentSlot, DoctorDailyUtilization, IdempotencyRecord, OutboxEvent,
+    ScheduleException, ScheduleTemplate, WaitlistEntry,
+)
+from .policies import AppointmentPolicy
+from .views import DoctorScheduleListView
+
+
+def make_token(user_id, roles=('Patient',), is_staff=False):
+    token = AccessToken()
+    token['user_id'] = user_id
+    if roles is not None:
+        token['roles'] = list(roles)
+    if is_staff:
+        token['is_staff'] = True
+    return token
+
+
+def make_client(user_id, roles=('Patient',), is_staff=False):
+    client = APIClient()
+    client.force_authenticate(user=TokenUser(make_token(user_id, roles, is_staff)))
+    return client
+
+
+# --- Kiểm tra đặt lịch đồng thời: nhiều request cùng tranh một slot ---
+class ConcurrentBookingTests(TransactionTestCase):
+    attempts = 200
+    workers = 32
+
+    def setUp(self):
+        day = timezone.localdate() + timedelta(days=1)
+        self.slot_time = timezone.make_aware(datetime.combine(day, time(9)))
+        DoctorSchedule.objects.create(
+            doctor_id=1,
+            start_time=self.slot_time,
+            end_time=self.slot_time + timedelta(minutes=30)
+        )
+
+    def _book(self, patient_id):
+        try:
+            booking.book_appointment(patient_id=patient_id, doctor_id=1, appointment_time=self.slot_time)
+            return 'booked'
+        except booking.SlotUnavailable:
+            return 'conflict'
+        finally:
+            connection.close()
+
+    def test_only_one_booking_wins(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(self._book, range(1000, 1000 + self.attempts)))
+
+        self.assertEqual(results.count('booked'), 1)
+        self.assertEqual(results.count('conflict'), self.attempts - 1)
+        appointment = Appointment.objects.get(doctor_id=1, appointment_time=self.slot_time)
+        slot = AppointmentSlot.objects.get(doctor_id=1, start_time=self.slot_time)
+        self.assertEqual(slot.state, AppointmentSlot.STATE_BOOKED)
+        self.assertEqual(slot.appointment_id, appointment.id)
+
+    def test_cancelled_slot_can_be_booked_again(self):
+        first = booking.book_appointment(patient_id=1000, doctor_id=1, appointment_time=self.slot_time)
+        first.status = Appointment.STATUS_CANCELLED
+        first.save()
+
+        second = booking.book_appointment(patient_id=1001, doctor_id=1, appointment_time=self.slot_time)
+        slot = AppointmentSlot.objects.get(doctor_id=1, start_time=self.slot_time)
+        self.assertEqual(slot.appointment_id, second.id)
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.book_appointment(patient_id=1002, doctor_id=1, appointment_time=self.slot_time)
+
+
+# --- Kiểm tra query plan: các truy vấn nóng phải đi qua index (không quét toàn bảng) ---
+class QueryPlanTests(TestCase):
+    """
+    Chạy đúng code path thật, bắt mọi câu SELECT/UPDATE/DELETE nó phát ra rồi EXPLAIN từng câu.
+    Fail nếu có câu nào quét toàn bảng (SQLite: "SCAN <bảng>", PostgreSQL: "Seq Scan"),
+    ví dụ khi ai đó đổi lại sang start_time__date hay xóa mất một index.
+    """
+    # SQLite: SCAN không kèm index, hoặc SCAN cả một index (covering) thay vì SEARCH theo khoảng
+    SQLITE_FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.day = timezone.localdate() + timedelta(days=1)
+        cls.start = timezone.make_aware(datetime.combine(cls.day, time(9)))
+        DoctorSchedule.objects.create(doctor_id=1, start_time=cls.start, end_time=cls.start + timedelta(hours=2))
+        booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=cls.start)
+
+    def setUp(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest("Chỉ kiểm tra query plan trên SQLite và PostgreSQL.")
+        if connection.vendor == 'postgresql':
+            # Bảng test rất nhỏ, planner sẽ luôn chọn Seq Scan nếu được phép
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                return [row[-1] for row in cursor.fetchall() if self.SQLITE_FULL_SCAN.match(row[-1])]
+            cursor.execute('EXPLAIN ' + sql)
+            return [row[0] for row in cursor.fetchall() if 'Seq Scan' in row[0]]
+
+    def assertUsesIndexes(self, func):
+        with CaptureQueriesContext(connection) as captured:
+            func()
+        statements = [query['sql'] for query in captured.captured_queries
+                      if query['sql'].lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE'))]
+        self.assertTrue(statements, "Code path không phát ra truy vấn nào")
+        for sql in statements:
+            scans = self.full_scans(sql)
+            self.assertFalse(scans, f"Truy vấn quét toàn bảng: {scans}\n{sql}")
+
+    def test_schedule_list(self):
+        self.assertUsesIndexes(lambda: list(DoctorScheduleListView.build_queryset(1, self.day, self.day)))
+        self.assertUsesIndexes(lambda: list(DoctorScheduleListView.build_queryset(None, self.day, self.day + timedelta(days=6))))
+
+    def test_slot_availability(self):
+        self.assertUsesIndexes(lambda: availability.build_day_bitmap(1, self.day))
+        self.assertUsesIndexes(lambda: availability.build_bitmaps(self.day, self.day + timedelta(days=6), [1, 2]))
+        self.assertUsesIndexes(lambda: availability.doctors_with_slots(self.start, self.start + timedelta(days=7)))
+
+    def test_slot_generation(self):
+        schedule = DoctorSchedule.objects.get(doctor_id=1)
+        self.assertUsesIndexes(lambda: slots.generate_slots([schedule]))
+
+    def test_holds(self):
+        self.assertUsesIndexes(lambda: holds.create_hold(200, 1, self.start + timedelta(minutes=30)))
+        self.assertUsesIndexes(lambda: holds.release_expired_holds(now=self.start + timedelta(days=1)))
+
+    def test_booking(self):
+        self.assertUsesIndexes(lambda: booking.book_appointment(patient_id=101, doctor_id=1, appointment_time=self.start + timedelta(minutes=60)))
+        with self.assertRaises(booking.SlotUnavailable):
+            self.assertUsesIndexes(lambda: booking.book_appointment(patient_id=102, doctor_id=1, appointment_time=self.start))
+
+    def test_appointment_lists(self):
+        doctor_list = Appointment.objects.filter(queries.on_dates('appointment_time', self.day), doctor_id=1)
+        self.assertUsesIndexes(lambda: list(doctor_list.order_by('appointment_time', 'id')[:51]))
+        self.assertUsesIndexes(lambda: list(Appointment.objects.filter(patient_id=100).order_by('-appointment_time', '-id')[:51]))
+        export_range = Appointment.objects.filter(queries.on_dates('appointment_time', self.day, self.day))
+        self.assertUsesIndexes(lambda: list(export.iter_rows(export_range)))
+
+    def test_waitlist_candidates(self):
+        self.assertUsesIndexes(lambda: waitlist.find_candidates(1, self.start, self.start + availability.SLOT_DURATION))
+
+    def test_utilization_rollups(self):
+        self.assertUsesIndexes(lambda: rollups.summarize(self.day, self.day + timedelta(days=30), group_by='day'))
+        self.assertUsesIndexes(lambda: rollups.summarize(self.day, self.day + timedelta(days=30), [1, 2], group_by='doctor_day'))
+        self.assertUsesIndexes(lambda: rollups.appointment_changed(None, (1, self.start, Appointment.STATUS_CONFIRMED)))
+
+
+# --- Kiểm tra Idempotency-Key: retry trả lại response cũ, không chạm bảng nghiệp vụ ---
+@override_settings(THROTTLE_STORE={'BACKEND': 'appointment_service.throttling.LocMemStore'})
+class IdempotencyTests(TestCase):
+    url = '/api/v1/appointments/book/'
+
+    def setUp(self):
+        day = timezone.localdate() + timedelta(days=1)
+        self.slot_time = timezone.make_aware(datetime.combine(day, time(9)))
+        DoctorSchedule.objects.create(doctor_id=1, start_time=self.slot_time, end_time=self.slot_time + timedelta(hours=1))
+        token = AccessToken()
+        token['user_id'] = 100
+        token['roles'] = ['Patient']
+        self.client = APIClient()
+        self.client.force_authenticate(user=TokenUser(token))
+        self.body = {'doctor_id': 1, 'appointment_time': self.slot_time.isoformat(), 'reason': 'Khám'}
+
+    def book(self, body, key='retry-1'):
+        return self.client.post(self.url, body, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_first_response(self):
+        first = self.book(self.body)
+        self.assertEqual(first.status_code, 201)
+        with CaptureQueriesContext(connection) as captured:
+            retry = self.book(self.body)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(captured), 1) # Chỉ đọc bảng idempotency
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_key_reused_for_different_request(self):
+        self.book(self.body)
+        response = self.book(dict(self.body, reason='Khác'))
+        self.assertEqual(response.status_code, 422)
+
+    def test_error_responses_are_replayed(self):
+        self.book(self.body, key='a')
+        conflict = self.book(self.body, key='b')
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(self.book(self.body, key='b').content, conflict.content)
+        self.assertEqual(IdempotencyRecord.objects.filter(status_code__isnull=True).count(), 0)
+
+
+# --- Kiểm tra token bucket: dùng hết dung lượng thì bị chặn, các store dùng chung trạng thái ---
+class ThrottleStoreTests(TestCase):
+    def assertBucket(self, *stores):
+        results = [stores[i % len(stores)].take('slots:u1', 3, 0.001)[0] for i in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+        self.assertTrue(stores[0].take('slots:u2', 3, 0.001)[0]) # Bucket riêng cho từng người gọi
+
+    def test_locmem_store(self):
+        self.assertBucket(throttling.LocMemStore())
+
+    def test_file_store_is_shared_between_instances(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'buckets')
+            self.assertBucket(throttling.FileStore(path, slots=1024), throttling.FileStore(path, slots=1024))
+
+    def test_file_store_keeps_colliding_keys_limited(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = throttling.FileStore(os.path.join(directory, 'buckets'), slots=4) # 1 nhóm: mọi key trùng nhóm
+            keys = [f'slots:u{i}' for i in range(4)]
+            results = [store.take(key, 3, 0.001)[0] for _ in range(4) for key in keys]
+            self.assertEqual(results, [True] * 12 + [False] * 4)
+
+    def test_refill(self):
+        self.assertEqual(throttling.consume(0.0, 100.0, 101.5, capacity=3, refill=2.0), (True, 2.0, 0.0))
+        allowed, tokens, wait = throttling.consume(0.0, 100.0, 100.25, capacity=3, refill=2.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 0.25)
+
+
+# --- Kiểm tra xác thực của kênh SSE slot trống ---
+class SlotEventsAuthTests(TestCase):
+    def setUp(self):
+        self.url = f'/api/v1/appointments/events/slots/?topics=1:{timezone.localdate() + timedelta(days=1)}'
+
+    def test_missing_token_is_rejected(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_invalid_tokens_are_rejected(self):
+        expired = make_token(100)
+        expired.set_exp(lifetime=-timedelta(minutes=1))
+        without_user = AccessToken()
+        for raw in ('abc', str(expired), str(without_user)):
+            with self.subTest(token=raw[:20]):
+                self.assertEqual(self.client.get(f'{self.url}&token={raw}').status_code, 401)
+                self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION=f'Bearer {raw}').status_code, 401)
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer').status_code, 401)
+
+    def test_valid_token_opens_stream(self):
+        for kwargs in ({'path': f'{self.url}&token={make_token(100)}'},
+                       {'path': self.url, 'HTTP_AUTHORIZATION': f'Bearer {make_token(100)}'}):
+            response = self.client.get(**kwargs)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            response.close()
+
+
+# --- Kiểm tra phân quyền xem lịch hẹn (appointments/policies.py) ---
+class AppointmentPolicyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(9)))
+        # Bệnh nhân 100, 101; bác sĩ 1, 2
+        cls.own = Appointment.objects.create(patient_id=100, doctor_id=1, appointment_time=start)
+        cls.other_patient = Appointment.objects.create(patient_id=101, doctor_id=1, appointment_time=start + timedelta(minutes=30))
+        cls.other_doctor = Appointment.objects.create(patient_id=101, doctor_id=2, appointment_time=start + timedelta(hours=1))
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return sorted(row['id'] for row in response.data['results'])
+
+    def detail(self, client, appointment):
+        return client.get(f'/api/v1/appointments/{appointment.pk}/').status_code
+
+    def test_patient_sees_only_own_appointments(self):
+        client = make_client(100)
+        self.assertEqual(self.ids(client.get('/api/v1/appointments/my-appointments/')), [self.own.pk])
+        self.assertEqual(self.detail(client, self.own), 200)
+        self.assertEqual(self.detail(client, self.other_patient), 404)
+
+    def test_doctor_sees_only_own_appointments(self):
+        client = make_client(1, roles=['Doctor'])
+        self.assertEqual(self.ids(client.get('/api/v1/appointments/doctor-appointments/')), [self.own.pk, self.other_patient.pk])
+        # Bác sĩ không lọc được sang lịch của bác sĩ khác
+        self.assertEqual(self.ids(client.get('/api/v1/appointments/doctor-appointments/?doctor_id=2')), [self.own.pk, self.other_patient.pk])
+        self.assertEqual(self.detail(client, self.other_patient), 200)
+        self.assertEqual(self.detail(client, self.other_doctor), 404)
+
+    def test_admin_sees_all_appointments(self):
+        client = make_client(900, roles=['Doctor'], is_staff=True)
+        everything = sorted([self.own.pk, self.other_patient.pk, self.other_doctor.pk])
+        self.assertEqual(self.ids(client.get('/api/v1/appointments/doctor-appointments/')), everything)
+        self.assertEqual(self.ids(client.get('/api/v1/appointments/doctor-appointments/?doctor_id=2')), [self.other_doctor.pk])
+        for appointment in (self.own, self.other_patient, self.other_doctor):
+            self.assertEqual(self.detail(make_client(900, roles=None, is_staff=True), appointment), 200)
+
+    def test_token_without_roles_claim_is_forbidden(self):
+        client = make_client(100, roles=None)
+        self.assertEqual(client.get('/api/v1/appointments/my-appointments/').status_code, 403)
+        self.assertEqual(client.get('/api/v1/appointments/doctor-appointments/').status_code, 403)
+        self.assertEqual(self.detail(client, self.own), 403)
+
+    def test_policy_rules(self):
+        patient = AppointmentPolicy(TokenUser(make_token(100)))
+        doctor = AppointmentPolicy(TokenUser(make_token(1, roles=['Doctor'])))
+        admin = AppointmentPolicy(TokenUser(make_token(900, roles=None, is_staff=True)))
+        no_roles = AppointmentPolicy(TokenUser(make_token(100, roles=None)))
+
+        visible = lambda policy: set(policy.visible(Appointment.objects.all()).values_list('pk', flat=True))
+        self.assertEqual(visible(patient), {self.own.pk})
+        self.assertEqual(visible(doctor), {self.own.pk, self.other_patient.pk})
+        self.assertEqual(visible(admin), {self.own.pk, self.other_patient.pk, self.other_doctor.pk})
+        self.assertEqual(visible(no_roles), set())
+
+        self.assertTrue(patient.can_view(self.own))
+        self.assertFalse(patient.can_view(self.other_patient))
+        self.assertFalse(no_roles.can_view(self.own))
+        self.assertTrue(doctor.can_view(self.other_patient))
+        self.assertFalse(doctor.can_view(self.other_doctor))
+
+        # Bệnh nhân chỉ được hủy lịch của mình; bác sĩ chỉ được xác nhận/hoàn thành lịch của mình
+        self.assertTrue(patient.can_modify(self.own, Appointment.STATUS_CANCELLED))
+        self.assertFalse(patient.can_modify(self.own, Appointment.STATUS_CONFIRMED))
+        self.assertFalse(patient.can_modify(self.other_patient, Appointment.STATUS_CANCELLED))
+        self.assertTrue(doctor.can_modify(self.own, Appointment.STATUS_COMPLETED))
+        self.assertFalse(doctor.can_modify(self.own, Appointment.STATUS_CANCELLED))
+        self.assertFalse(doctor.can_modify(self.other_doctor, Appointment.STATUS_CONFIRMED))
+        self.assertTrue(admin.can_modify(self.other_doctor, Appointment.STATUS_CANCELLED))
+
+
+# --- Kiểm tra engine bitmap slot trống và cache của nó ---
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.start = timezone.make_aware(datetime.combine(self.day, time(9)))
+        self.now = self.start - timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            DoctorSchedule.objects.create(doctor_id=1, start_time=self.start, end_time=self.start + timedelta(minutes=90))
+
+    def bits(self, *hours):
+        """Mask của các slot bắt đầu lúc các giờ (số thực) trong ngày."""
+        return sum(1 << int(hour * 60 // availability.SLOT_MINUTES) for hour in hours)
+
+    def test_build_day_bitmap(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=self.start + timedelta(minutes=30))
+        bitmap = availability.build_day_bitmap(1, self.day)
+        self.assertEqual(bitmap.schedule, self.bits(9, 9.5, 10))
+        self.assertEqual(bitmap.booked, self.bits(9.5))
+        self.assertEqual(bitmap.free, self.bits(9, 10))
+        self.assertEqual(availability.build_day_bitmap(2, self.day), availability.DayBitmap(0, 0))
+
+    def test_booking_invalidates_cached_bitmap_after_commit(self):
+        self.assertEqual(availability.get_day_bitmap(1, self.day).booked, 0)
+        with self.assertNumQueries(0):
+            availability.get_day_bitmap(1, self.day)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=self.start)
+                # Chưa commit: cache vẫn giữ trạng thái đã commit trước đó
+                with self.assertNumQueries(0):
+                    self.assertEqual(availability.get_day_bitmap(1, self.day).booked, 0)
+        self.assertEqual(availability.get_day_bitmap(1, self.day).booked, self.bits(9))
+        self.assertEqual(availability.get_bitmaps(self.day, self.day, [1])[(1, self.day)].booked, self.bits(9))
+
+    def test_rolled_back_change_leaves_cache_untouched(self):
+        availability.get_day_bitmap(1, self.day)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                slots.mark_slot(1, self.start, AppointmentSlot.STATE_BOOKED)
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        with self.assertNumQueries(0):
+            self.assertEqual(availability.get_day_bitmap(1, self.day).booked, 0)
+
+    def test_bitmap_built_before_commit_is_discarded(self):
+        # Worker khác đọc version rồi đọc DB trước khi transaction đặt lịch commit, ghi cache sau đó
+        availability.get_day_bitmap(1, self.day)
+        stale_version = cache.get(availability.version_key(1, self.day))
+        stale = availability.build_day_bitmap(1, self.day)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=self.start)
+        cache.set(availability.cache_key(1, self.day), (stale_version, *stale))
+        self.assertEqual(availability.get_day_bitmap(1, self.day).booked, self.bits(9))
+
+    def test_set_booked_without_cached_day(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            availability.set_booked(1, self.start, booked=True)
+        self.assertIsNotNone(cache.get(availability.version_key(1, self.day)))
+        self.assertEqual(availability.get_day_bitmap(1, self.day).booked, 0) # Cache không phải nguồn dữ liệu
+
+    def test_earliest_slots(self):
+        second_start = self.start + timedelta(minutes=30)
+        with self.captureOnCommitCallbacks(execute=True):
+            DoctorSchedule.objects.create(doctor_id=2, start_time=second_start, end_time=second_start + timedelta(hours=1))
+            DoctorSchedule.objects.create(doctor_id=2, start_time=self.start + timedelta(days=3), end_time=self.start + timedelta(days=3, minutes=30))
+            booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=self.start + timedelta(minutes=30))
+
+        self.assertEqual(availability.earliest_slots(4, now=self.now), [
+            (self.start, 1),
+            (second_start, 2),
+            (self.start + timedelta(minutes=60), 1),
+            (self.start + timedelta(minutes=60), 2),
+        ])
+        # Lọc bác sĩ, bắt đầu tìm từ after, tìm sang các ngày sau khi hết slot trong ngày
+        self.assertEqual(availability.earliest_slots(10, after=self.start + timedelta(minutes=45), doctor_ids=[2], now=self.now), [
+            (self.start + timedelta(minutes=60), 2),
+            (self.start + timedelta(days=3), 2),
+        ])
+        self.assertEqual(availability.earliest_slots(10, doctor_ids=[2], horizon_days=2, now=self.now), [
+            (second_start, 2),
+            (self.start + timedelta(minutes=60), 2),
+        ])
+        self.assertEqual(availability.earliest_slots(5, doctor_ids=[3], now=self.now), [])
+
+
+# --- Kiểm tra các view async: cùng kết quả, xác thực và giới hạn tần suất như bản sync ---
+@override_settings(THROTTLE_STORE={'BACKEND': 'appointment_service.throttling.LocMemStore'})
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.day = timezone.localdate() + timedelta(days=1)
+        cls.start = timezone.make_aware(datetime.combine(cls.day, time(9)))
+        DoctorSchedule.objects.create(doctor_id=1, start_time=cls.start, end_time=cls.start + timedelta(hours=3))
+        for index in range(3):
+            booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=cls.start + index * availability.SLOT_DURATION)
+        booking.book_appointment(patient_id=101, doctor_id=1, appointment_time=cls.start + 3 * availability.SLOT_DURATION)
+
+    def setUp(self):
+        cache.clear()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {make_token(100)}'}
+
+    def assertSameAsSync(self, path):
+        sync_response = make_client(100).get(f'/api/v1/appointments/{path}')
+        async_response = self.client.get(f'/api/v1/appointments/async/{path}', **self.auth)
+        self.assertEqual(async_response.status_code, 200)
+        self.assertEqual(async_response.json(), sync_response.json())
+        return async_response.json()
+
+    def test_schedules_match_sync_view(self):
+        self.assertEqual(len(self.assertSameAsSync(f'schedules/?doctor_id=1&start_date={self.day}')), 1)
+
+    def test_available_slots_match_sync_view(self):
+        self.assertEqual(len(self.assertSameAsSync(f'available-slots/?doctor_id=1&date={self.day}')), 2)
+
+    def test_patient_appointments_are_paginated_and_filtered(self):
+        first = self.client.get('/api/v1/appointments/async/my-appointments/?page_size=2', **self.auth).json()
+        second = self.client.get(first['next'], **self.auth).json()
+        ids = [row['id'] for row in first['results'] + second['results']]
+        expected = list(Appointment.objects.filter(patient_id=100).order_by('-appointment_time').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertIsNone(second['next'])
+
+    def test_authentication_and_role(self):
+        url = '/api/v1/appointments/async/my-appointments/'
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer abc').status_code, 401)
+        doctor = make_token(1, roles=['Doctor'])
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {doctor}').status_code, 403)
+
+    def test_throttled_requests_get_429(self):
+        url = f'/api/v1/appointments/async/available-slots/?doctor_id=1&date={self.day}'
+        with mock.patch.object(AsyncAvailableSlotsView, 'throttle_rate', '2/min', create=True):
+            statuses = [self.client.get(url, **self.auth).status_code for _ in range(3)]
+            throttled = self.client.get(url, **self.auth)
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertGreaterEqual(int(throttled['Retry-After']), 1)
+
+
+# --- Kiểm tra xác thực JWT không tra DB: token do user_service ký, user không có trong DB của service này ---
+class StatelessJWTAuthTests(TestCase):
+    def test_signed_token_is_accepted_without_user_lookup(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {make_token(100)}')
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get('/api/v1/appointments/my-appointments/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query['sql'] for query in captured.captured_queries if 'auth_user' in query['sql']])
+
+    def test_claims_drive_permissions(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {make_token(1, roles=["Doctor"])}')
+        self.assertEqual(client.get('/api/v1/appointments/doctor-appointments/').status_code, 200)
+        self.assertEqual(client.get('/api/v1/appointments/my-appointments/').status_code, 403)
+        client.credentials(HTTP_AUTHORIZATION='Bearer abc')
+        self.assertEqual(client.get('/api/v1/appointments/my-appointments/').status_code, 401)
+
+
+# --- Kiểm tra bảng slot vật chất hóa: sinh slot, giải phóng khi hủy, xóa theo lịch làm việc ---
+class SlotTableTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.start = timezone.make_aware(datetime.combine(self.day, time(9)))
+
+    def slot_states(self, doctor_id=1):
+        return dict(AppointmentSlot.objects.filter(doctor_id=doctor_id).values_list('start_time', 'state'))
+
+    def test_schedule_generates_slots_on_the_grid(self):
+        # 09:10-11:00: slot 09:00 không nằm trọn trong lịch nên bị bỏ
+        schedule = DoctorSchedule.objects.create(doctor_id=1, start_time=self.start + timedelta(minutes=10), end_time=self.start + timedelta(hours=2))
+        self.assertEqual(sorted(self.slot_states()), [self.start + timedelta(minutes=minutes) for minutes in (30, 60, 90)])
+        self.assertEqual(set(AppointmentSlot.objects.values_list('schedule_id', flat=True)), {schedule.id})
+        # Sinh lại không tạo trùng
+        self.assertEqual(slots.generate_slots([schedule]), 0)
+        self.assertEqual(AppointmentSlot.objects.count(), 3)
+
+    def test_existing_appointments_are_marked_in_one_update(self):
+        times = [self.start + index * availability.SLOT_DURATION for index in range(4)]
+        appointments = [Appointment.objects.create(patient_id=100 + index, doctor_id=1, appointment_time=value) for index, value in enumerate(times[:3])]
+        appointments[2].status = Appointment.STATUS_CANCELLED
+        appointments[2].save()
+        schedule = DoctorSchedule(doctor_id=1, start_time=self.start, end_time=self.start + timedelta(hours=2))
+        DoctorSchedule.objects.bulk_create([schedule]) # Không qua signal, gọi generate_slots trực tiếp
+        schedule = DoctorSchedule.objects.get()
+
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(slots.generate_slots([schedule]), 4)
+        updates = [query['sql'] for query in captured.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        booked = dict(AppointmentSlot.objects.filter(state=AppointmentSlot.STATE_BOOKED).values_list('start_time', 'appointment_id'))
+        self.assertEqual(booked, {times[0]: appointments[0].id, times[1]: appointments[1].id})
+
+    def test_cancellation_frees_slot(self):
+        DoctorSchedule.objects.create(doctor_id=1, start_time=self.start, end_time=self.start + timedelta(hours=1))
+        appointment = booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=self.start)
+        self.assertEqual(self.slot_states()[self.start], AppointmentSlot.STATE_BOOKED)
+
+        appointment.status = Appointment.STATUS_CANCELLED
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save()
+        slot = AppointmentSlot.objects.get(start_time=self.start)
+        self.assertEqual((slot.state, slot.appointment_id), (AppointmentSlot.STATE_FREE, None))
+        self.assertIn(self.start, availability.available_slots(1, self.day))
+
+    def test_completed_appointment_keeps_slot(self):
+        DoctorSchedule.objects.create(doctor_id=1, start_time=self.start, end_time=self.start + timedelta(hours=1))
+        appointment = booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=self.start)
+        appointment.status = Appointment.STATUS_COMPLETED
+        appointment.save()
+        self.assertEqual(self.slot_states()[self.start], AppointmentSlot.STATE_BOOKED)
+
+    def test_schedule_deletion_removes_slots(self):
+        schedule = DoctorSchedule.objects.create(doctor_id=1, start_time=self.start, end_time=self.start + timedelta(hours=1))
+        appointment = booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=self.start)
+        self.assertEqual(len(availability.available_slots(1, self.day)), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule.delete()
+        self.assertFalse(AppointmentSlot.objects.exists())
+        self.assertEqual(availability.available_slots(1, self.day), [])
+        appointment.refresh_from_db()
+        self.assertIsNone(appointment.schedule_slot_id) # Lịch hẹn vẫn còn, chỉ mất liên kết
+
+
+# --- Kiểm tra giữ chỗ: giới hạn số hold, hết hạn/trả lại, đặt slot người khác đang giữ ---
+class SlotHoldTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        day = timezone.localdate() + timedelta(days=1)
+        self.start = timezone.make_aware(datetime.combine(day, time(9)))
+        self.times = [self.start + index * availability.SLOT_DURATION for index in range(6)]
+        DoctorSchedule.objects.create(doctor_id=1, start_time=self.start, end_time=self.times[-1] + availability.SLOT_DURATION)
+
+    def state(self, start_time):
+        return AppointmentSlot.objects.get(start_time=start_time).state
+
+    def test_limit_per_patient(self):
+        for start_time in self.times[:holds.MAX_ACTIVE_HOLDS]:
+            holds.create_hold(100, 1, start_time)
+        with self.assertRaises(ValidationError):
+            holds.create_hold(100, 1, self.times[holds.MAX_ACTIVE_HOLDS])
+        self.assertEqual(self.state(self.times[holds.MAX_ACTIVE_HOLDS]), AppointmentSlot.STATE_FREE)
+        # Giới hạn tính riêng cho từng bệnh nhân
+        holds.create_hold(101, 1, self.times[holds.MAX_ACTIVE_HOLDS])
+
+    def test_released_and_expired_holds_free_the_quota(self):
+        tokens = [holds.create_hold(100, 1, start_time, seconds=60)[0] for start_time in self.times[:holds.MAX_ACTIVE_HOLDS]]
+        self.assertTrue(holds.release_hold(100, tokens[0]))
+        self.assertFalse(holds.release_hold(101, tokens[1])) # Không trả được hold của người khác
+        self.assertEqual(self.state(self.times[0]), AppointmentSlot.STATE_FREE)
+        holds.create_hold(100, 1, self.times[0])
+
+        # Hold hết hạn (chưa được job định kỳ dọn) không còn tính vào giới hạn của bệnh nhân
+        AppointmentSlot.objects.filter(hold_token=tokens[1]).update(held_until=timezone.now() - timedelta(seconds=1))
+        holds.create_hold(100, 1, self.times[4])
+        self.assertEqual(self.state(self.times[1]), AppointmentSlot.STATE_FREE)
+
+    def test_release_expired_holds(self):
+        holds.create_hold(100, 1, self.times[0], seconds=60)
+        holds.create_hold(101, 1, self.times[1], seconds=600)
+        self.assertEqual(holds.release_expired_holds(now=timezone.now() + timedelta(seconds=120)), 1)
+        slot = AppointmentSlot.objects.get(start_time=self.times[0])
+        self.assertEqual((slot.state, slot.hold_token, slot.held_by, slot.hold_number), (AppointmentSlot.STATE_FREE, None, None, None))
+        self.assertEqual(self.state(self.times[1]), AppointmentSlot.STATE_HELD)
+
+    def test_held_slot_is_reserved_for_its_holder(self):
+        token, _ = holds.create_hold(100, 1, self.times[0])
+        with self.assertRaises(booking.SlotUnavailable):
+            holds.create_hold(101, 1, self.times[0])
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.book_appointment(patient_id=101, doctor_id=1, appointment_time=self.times[0])
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.book_appointment(patient_id=101, doctor_id=1, appointment_time=self.times[0], hold_token=token)
+        self.assertNotIn(self.times[0], availability.available_slots(1, self.times[0].date()))
+
+        appointment = booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=self.times[0], hold_token=token)
+        slot = AppointmentSlot.objects.get(start_time=self.times[0])
+        self.assertEqual((slot.state, slot.appointment_id, slot.hold_number), (AppointmentSlot.STATE_BOOKED, appointment.id, None))
+
+    def test_hold_api(self):
+        client = make_client(100)
+        response = client.post('/api/v1/appointments/holds/', {'doctor_id': 1, 'appointment_time': self.times[0].isoformat()}, format='json')
+        self.assertEqual(response.status_code, 201)
+        other = make_client(101).post('/api/v1/appointments/book/', {'doctor_id': 1, 'appointment_time': self.times[0].isoformat()}, format='json')
+        self.assertEqual(other.status_code, 409)
+        self.assertEqual(client.delete(f"/api/v1/appointments/holds/{response.data['hold_token']}/").status_code, 204)
+        self.assertEqual(self.state(self.times[0]), AppointmentSlot.STATE_FREE)
+
+
+class ConcurrentHoldTests(TransactionTestCase):
+    def setUp(self):
+        day = timezone.localdate() + timedelta(days=1)
+        self.start = timezone.make_aware(datetime.combine(day, time(8)))
+        DoctorSchedule.objects.create(doctor_id=1, start_time=self.start, end_time=self.start + timedelta(hours=8))
+
+    def _hold(self, index):
+        try:
+            holds.create_hold(100, 1, self.start + index * availability.SLOT_DURATION)
+            return 'held'
+        except ValidationError:
+            return 'limit'
+        finally:
+            connection.close()
+
+    def test_parallel_holds_respect_limit(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(self._hold, range(16)))
+        self.assertEqual(results.count('held'), holds.MAX_ACTIVE_HOLDS)
+        self.assertEqual(AppointmentSlot.objects.filter(state=AppointmentSlot.STATE_HELD, held_by=100).count(), holds.MAX_ACTIVE_HOLDS)
+
+
+# --- Kiểm tra phân trang keyset: không trùng/sót khi trùng appointment_time, cursor hỏng trả 400 ---
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(9)))
+        cls.times = [start, start + timedelta(minutes=30), start + timedelta(hours=1)]
+        # 3 bác sĩ cùng giờ: nhiều lịch hẹn trùng appointment_time
+        for doctor_id in (3, 1, 2):
+            for value in cls.times:
+                Appointment.objects.create(patient_id=100 + doctor_id, doctor_id=doctor_id, appointment_time=value)
+        # Bệnh nhân 200: nhiều lịch đã hủy trùng giờ với 1 lịch còn hiệu lực
+        for index in range(4):
+            Appointment.objects.create(patient_id=200, doctor_id=10 + index, appointment_time=start,
+                                       status=Appointment.STATUS_CANCELLED if index else Appointment.STATUS_SCHEDULED)
+        Appointment.objects.create(patient_id=200, doctor_id=9, appointment_time=start + timedelta(hours=2))
+
+    def walk(self, client, url):
+        """Đi hết các trang theo 'next', rồi quay lại theo 'previous'. Trả về (id theo thứ tự, các trang)."""
+        pages = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.data['results']])
+            last = response.data
+            url = response.data['next']
+        self.assertIsNone(last['next'])
+        back, url = [], last['previous']
+        while url:
+            response = client.get(url)
+            back.insert(0, [row['id'] for row in response.data['results']])
+            url = response.data['previous']
+        self.assertEqual(back, pages[:-1])
+        return [pk for page in pages for pk in page], pages
+
+    def test_ties_ascending(self):
+        client = make_client(900, roles=['Doctor'], is_staff=True)
+        ids, pages = self.walk(client, '/api/v1/appointments/doctor-appointments/?page_size=2')
+        expected = list(Appointment.objects.order_by('appointment_time', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual([len(page) for page in pages], [2] * 7)
+
+    def test_ties_descending(self):
+        ids, _ = self.walk(make_client(200), '/api/v1/appointments/my-appointments/?page_size=2')
+        expected = list(Appointment.objects.filter(patient_id=200).order_by('-appointment_time', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_last_page_has_no_next(self):
+        response = make_client(200).get('/api/v1/appointments/my-appointments/?page_size=5')
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+        self.assertIsNone(response.data['previous'])
+
+    def test_invalid_cursor_is_400(self):
+        def encode(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        valid_time = self.times[0].isoformat()
+        cursors = [
+            'abc', '%%%', 'é', encode([1, 2]), encode('x'), encode({'t': valid_time}), encode({'t': 'hôm qua', 'i': 1}),
+            encode({'t': 5, 'i': 1}), encode({'t': valid_time, 'i': 'x'}), encode({'t': valid_time, 'i': 10 ** 30}),
+        ]
+        client = make_client(200)
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(client.get('/api/v1/appointments/my-appointments/', {'cursor': cursor}).status_code, 400)
+                response = self.client.get('/api/v1/appointments/async/my-appointments/', {'cursor': cursor},
+                                           HTTP_AUTHORIZATION=f'Bearer {make_token(200)}')
+                self.assertEqual(response.status_code, 400)
+
+
+# --- Kiểm tra danh sách chờ: slot vừa bị hủy được mời cho ứng viên phù hợp nhất ---
+@override_settings(THROTTLE_STORE={'BACKEND': 'appointment_service.throttling.LocMemStore'})
+class WaitlistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(waitlist, 'RUN_ASYNC', False) # Ghép ngay sau commit thay vì worker nền
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        day = timezone.localdate() + timedelta(days=1)
+        self.slot = timezone.make_aware(datetime.combine(day, time(9)))
+        DoctorSchedule.objects.create(doctor_id=1, start_time=self.slot, end_time=self.slot + timedelta(hours=1))
+        self.appointment = booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=self.slot)
+
+        window = {'doctor_id': 1, 'window_start': self.slot - timedelta(hours=1), 'window_end': self.slot + timedelta(hours=2)}
+        self.early = WaitlistEntry.objects.create(patient_id=200, **window)
+        self.urgent = WaitlistEntry.objects.create(patient_id=201, priority=1, **window)
+        # Cửa sổ không chứa slot, hoặc của bác sĩ khác: không được mời
+        WaitlistEntry.objects.create(patient_id=202, doctor_id=1, window_start=self.slot + timedelta(minutes=30), window_end=self.slot + timedelta(hours=2))
+        WaitlistEntry.objects.create(patient_id=203, **dict(window, doctor_id=2))
+
+    def cancel_appointment(self):
+        self.appointment.status = Appointment.STATUS_CANCELLED
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.save()
+
+    def test_cancellation_offers_slot_to_best_candidate(self):
+        self.cancel_appointment()
+        self.urgent.refresh_from_db()
+        self.assertEqual(self.urgent.status, WaitlistEntry.STATUS_OFFERED)
+        self.assertEqual(self.urgent.offered_time, self.slot)
+        slot = AppointmentSlot.objects.get(start_time=self.slot)
+        self.assertEqual((slot.state, slot.held_by, slot.hold_token), (AppointmentSlot.STATE_HELD, 201, self.urgent.hold_token))
+        self.assertEqual(WaitlistEntry.objects.filter(status=WaitlistEntry.STATUS_OFFERED).count(), 1)
+
+        # Người khác không đặt được slot đang mời; ứng viên đặt bằng hold_token -> Fulfilled
+        body = {'doctor_id': 1, 'appointment_time': self.slot.isoformat()}
+        self.assertEqual(make_client(300).post('/api/v1/appointments/book/', body, format='json').status_code, 409)
+        response = make_client(201).post('/api/v1/appointments/book/', dict(body, hold_token=self.urgent.hold_token), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.urgent.refresh_from_db()
+        self.assertEqual(self.urgent.status, WaitlistEntry.STATUS_FULFILLED)
+
+    def test_expired_offer_moves_to_next_candidate(self):
+        self.cancel_appointment()
+        later = timezone.now() + timedelta(seconds=waitlist.OFFER_SECONDS + 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            holds.release_expired_holds(now=later)
+            self.assertEqual(waitlist.expire_offers(now=later), 1)
+        self.urgent.refresh_from_db()
+        self.early.refresh_from_db()
+        self.assertEqual(self.urgent.status, WaitlistEntry.STATUS_EXPIRED)
+        self.assertEqual(self.early.status, WaitlistEntry.STATUS_OFFERED)
+        self.assertEqual(AppointmentSlot.objects.get(start_time=self.slot).held_by, 200)
+
+    def test_leaving_waitlist_passes_offer_on(self):
+        self.cancel_appointment()
+        self.urgent.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = make_client(201).delete(f'/api/v1/appointments/waitlist/{self.urgent.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.early.refresh_from_db()
+        self.assertEqual(self.early.status, WaitlistEntry.STATUS_OFFERED)
+
+    def test_no_candidate_leaves_slot_free(self):
+        WaitlistEntry.objects.filter(patient_id__in=[200, 201]).update(status=WaitlistEntry.STATUS_CANCELLED)
+        self.cancel_appointment()
+        self.assertEqual(AppointmentSlot.objects.get(start_time=self.slot).state, AppointmentSlot.STATE_FREE)
+        self.assertFalse(WaitlistEntry.objects.filter(status=WaitlistEntry.STATUS_OFFERED).exists())
+
+
+# --- Kiểm tra transactional outbox: sự kiện ghi cùng transaction với lịch hẹn, publisher gửi theo lô ---
+@override_settings(THROTTLE_STORE={'BACKEND': 'appointment_service.throttling.LocMemStore'})
+class OutboxTests(TestCase):
+    class FailingSink:
+        def send(self, messages):
+            raise OSError("broker down")
+
+    def setUp(self):
+        day = timezone.localdate() + timedelta(days=1)
+        self.slot = timezone.make_aware(datetime.combine(day, time(9)))
+        DoctorSchedule.objects.create(doctor_id=1, start_time=self.slot, end_time=self.slot + timedelta(hours=1))
+        self.body = {'doctor_id': 1, 'appointment_time': self.slot.isoformat()}
+        outbox.MemorySink.reset()
+        self.addCleanup(outbox.MemorySink.reset)
+
+    def test_booking_records_event(self):
+        response = make_client(100).post('/api/v1/appointments/book/', self.body, format='json')
+        self.assertEqual(response.status_code, 201)
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.event_type, event.key), ('appointment.created', f"appointment:{Appointment.objects.get().id}"))
+        self.assertEqual(event.payload['patient_id'], 100)
+        self.assertIsNone(event.published_at)
+
+        # Đặt lịch thất bại (409) không để lại sự kiện
+        self.assertEqual(make_client(101).post('/api/v1/appointments/book/', self.body, format='json').status_code, 409)
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+    def test_event_and_appointment_share_transaction(self):
+        with mock.patch.object(outbox, 'record', side_effect=RuntimeError("outbox unavailable")):
+            with self.assertRaises(RuntimeError):
+                make_client(100).post('/api/v1/appointments/book/', self.body, format='json')
+        self.assertFalse(Appointment.objects.exists())
+        self.assertEqual(AppointmentSlot.objects.get(start_time=self.slot).state, AppointmentSlot.STATE_FREE)
+
+    def test_drain_publishes_in_batches_once(self):
+        for index in range(5):
+            outbox.record('test.event', {'index': index}, key=f'test:{index}')
+        sink = outbox.MemorySink()
+        self.assertEqual(outbox.drain(sink, batch_size=2), 5)
+        self.assertEqual([message['payload']['index'] for message in sink.messages], list(range(5)))
+        self.assertEqual(sink.messages[0]['source'], 'appointment_service')
+        self.assertFalse(OutboxEvent.objects.filter(published_at__isnull=True).exists())
+        self.assertEqual(outbox.drain(sink), 0)
+
+    def test_failed_send_is_retried(self):
+        outbox.record('test.event', {}, key='test:1')
+        with self.assertRaises(OSError), self.assertLogs('appointment_service.outbox', 'ERROR'):
+            outbox.run(self.FailingSink(), once=True)
+        event = OutboxEvent.objects.get()
+        self.assertIsNone(event.published_at)
+        self.assertEqual((event.attempts, event.last_error), (1, 'broker down'))
+
+        self.assertEqual(outbox.run(outbox.MemorySink(), once=True), 1)
+        self.assertIsNotNone(OutboxEvent.objects.get().published_at)
+
+    def test_purge_published(self):
+        outbox.record('test.event', {})
+        outbox.drain(outbox.MemorySink())
+        self.assertEqual(outbox.purge_published(older_than_hours=1), 0)
+        OutboxEvent.objects.update(published_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(outbox.purge_published(older_than_hours=1), 1)
+
+
+# --- Kiểm tra xuất lịch hẹn NDJSON/CSV cho Admin ---
+class ExportTests(TestCase):
+    url = '/api/v1/appointments/export/'
+
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(9)))
+        cls.later = Appointment.objects.create(patient_id=100, doctor_id=1, appointment_time=start + timedelta(hours=1), reason='Tái khám, "đau đầu"')
+        cls.first = Appointment.objects.create(patient_id=101, doctor_id=2, appointment_time=start)
+        cls.cancelled = Appointment.objects.create(patient_id=100, doctor_id=2, appointment_time=start + timedelta(hours=2),
+                                                   status=Appointment.STATUS_CANCELLED)
+        # Lịch trong quá khứ: ngoài khoảng mặc định (từ hôm nay)
+        cls.past = Appointment.objects.create(patient_id=100, doctor_id=1, appointment_time=start - timedelta(days=10))
+
+    def setUp(self):
+        self.admin = make_client(900, roles=None, is_staff=True)
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_rows(self):
+        response = self.admin.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.first.pk, self.later.pk, self.cancelled.pk])
+        self.assertEqual(list(rows[1]), list(export.EXPORT_FIELDS))
+        self.assertEqual(rows[1]['reason'], 'Tái khám, "đau đầu"')
+        self.assertEqual(datetime.fromisoformat(rows[1]['appointment_time']), self.later.appointment_time)
+
+    def test_csv_rows(self):
+        response = self.admin.get(self.url, {'output': 'csv', 'doctor_id': 1})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        header, *rows = list(csv.reader(self.content(response).splitlines()))
+        self.assertEqual(header, list(export.EXPORT_FIELDS))
+        self.assertEqual(len(rows), 1)
+        row = dict(zip(header, rows[0]))
+        self.assertEqual((int(row['id']), row['status'], row['reason']), (self.later.pk, 'Scheduled', 'Tái khám, "đau đầu"'))
+
+    def test_filters(self):
+        def ids(params):
+            return [json.loads(line)['id'] for line in self.content(self.admin.get(self.url, params)).splitlines()]
+        self.assertEqual(ids({'patient_id': 100, 'status': Appointment.STATUS_CANCELLED}), [self.cancelled.pk])
+        past_day = timezone.localtime(self.past.appointment_time).date().isoformat()
+        self.assertEqual(ids({'start_date': past_day, 'end_date': past_day}), [self.past.pk])
+        for params in ({'output': 'xml'}, {'start_date': '05/01/2025'}, {'doctor_id': 'x'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.admin.get(self.url, params).status_code, 400)
+
+    def test_admin_only(self):
+        self.assertEqual(make_client(100).get(self.url).status_code, 403)
+        self.assertEqual(make_client(1, roles=['Doctor']).get(self.url).status_code, 403)
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+
+
+# --- Kiểm tra mẫu lịch lặp lại: sinh DoctorSchedule/slot theo nhu cầu, trừ ngoại lệ và ngày lễ ---
+class RecurringScheduleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.day = timezone.localdate() + timedelta(days=7)
+        self.template = ScheduleTemplate.objects.create(
+            doctor_id=1, weekday=self.day.weekday(), start_time=time(9), end_time=time(11), valid_from=self.day
+        )
+
+    def at(self, hour, minute=0, day=None):
+        return timezone.make_aware(datetime.combine(day or self.day, time(hour, minute)))
+
+    def windows(self, day=None):
+        schedules = DoctorSchedule.objects.filter(doctor_id=1, start_time__date=day or self.day).order_by('start_time')
+        return [(schedule.start_time, schedule.end_time) for schedule in schedules]
+
+    def test_materialized_lazily_up_to_horizon(self):
+        self.assertFalse(DoctorSchedule.objects.exists())
+        self.assertEqual(recurring.ensure_materialized(self.day, [1]), 1)
+        self.assertEqual(self.windows(), [(self.at(9), self.at(11))])
+        self.assertEqual(AppointmentSlot.objects.filter(doctor_id=1, state=AppointmentSlot.STATE_FREE).count(), 4)
+        # Đã sinh đủ: không sinh trùng; xa hơn thì chỉ sinh phần còn thiếu
+        self.assertEqual(recurring.ensure_materialized(self.day, [1]), 0)
+        self.assertEqual(recurring.ensure_materialized(self.day + timedelta(days=7), [1]), 1)
+        self.assertEqual(DoctorSchedule.objects.filter(template=self.template).count(), 2)
+
+    def test_exceptions_and_holidays(self):
+        ScheduleException.objects.create(doctor_id=1, date=self.day, start_time=time(9, 30), end_time=time(10))
+        ScheduleException.objects.create(doctor_id=None, date=self.day + timedelta(days=7))
+        recurring.ensure_materialized(self.day + timedelta(days=7), [1])
+        self.assertEqual(self.windows(), [(self.at(9), self.at(9, 30)), (self.at(10), self.at(11))])
+        self.assertEqual(self.windows(self.day + timedelta(days=7)), [])
+
+    def test_exception_added_later_rematerializes_day(self):
+        recurring.ensure_materialized(self.day, [1])
+        ScheduleException.objects.create(doctor_id=1, date=self.day, reason='Nghỉ phép')
+        self.assertEqual(self.windows(), [])
+        self.assertFalse(AppointmentSlot.objects.filter(doctor_id=1).exists())
+
+    def test_template_change_keeps_booked_schedules(self):
+        recurring.ensure_materialized(self.day, [1])
+        booked = booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=self.at(9))
+        self.template.start_time = time(14)
+        self.template.end_time = time(15)
+        self.template.save()
+
+        # Schedule cũ có lịch hẹn được giữ lại nhưng không nhận đặt thêm; lần đọc sau sinh theo mẫu mới
+        old = DoctorSchedule.objects.get(doctor_id=1, start_time=self.at(9))
+        self.assertFalse(old.is_available)
+        self.assertEqual(AppointmentSlot.objects.get(schedule=old).appointment_id, booked.id)
+        recurring.ensure_materialized(self.day, [1])
+        self.assertEqual(self.windows(), [(self.at(9), self.at(11)), (self.at(14), self.at(15))])
+
+    def test_available_slots_view_materializes(self):
+        response = make_client(100).get('/api/v1/appointments/available-slots/', {'doctor_id': 1, 'date': self.day.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 4)
+
+
+# --- Kiểm tra bảng tổng hợp sử dụng theo ngày: bộ đếm đi theo từng thay đổi lịch hẹn/lịch làm việc ---
+@override_settings(THROTTLE_STORE={'BACKEND': 'appointment_service.throttling.LocMemStore'})
+class UtilizationRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.next_day = self.day + timedelta(days=1)
+        self.start = timezone.make_aware(datetime.combine(self.day, time(9)))
+        self.next_start = timezone.make_aware(datetime.combine(self.next_day, time(9)))
+        DoctorSchedule.objects.create(doctor_id=1, start_time=self.start, end_time=self.start + timedelta(hours=2))
+        DoctorSchedule.objects.create(doctor_id=1, start_time=self.next_start, end_time=self.next_start + timedelta(hours=1))
+
+    def counts(self, day, doctor_id=1):
+        row = DoctorDailyUtilization.objects.filter(doctor_id=doctor_id, date=day).values(*rollups.COUNTER_FIELDS).first()
+        return {field: value for field, value in (row or {}).items() if value}
+
+    def assertMatchesSource(self):
+        stored = {
+            (row.doctor_id, row.date): {field: getattr(row, field) for field in rollups.COUNTER_FIELDS if getattr(row, field)}
+            for row in DoctorDailyUtilization.objects.all()
+        }
+        expected = {key: {field: value for field, value in fields.items() if value}
+                    for key, fields in rollups.compute(self.day, self.next_day).items()}
+        self.assertEqual({key: fields for key, fields in stored.items() if fields}, expected)
+
+    def test_book_cancel_reschedule(self):
+        self.assertEqual(self.counts(self.day), {'scheduled_minutes': 120})
+        appointment = booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=self.start)
+        self.assertEqual(self.counts(self.day), {'scheduled_minutes': 120, 'booked': 1})
+
+        # Đổi giờ sang ngày hôm sau: -1 ngày cũ, +1 ngày mới
+        appointment.appointment_time = self.next_start
+        appointment.save()
+        self.assertEqual(self.counts(self.day), {'scheduled_minutes': 120})
+        self.assertEqual(self.counts(self.next_day), {'scheduled_minutes': 60, 'booked': 1})
+
+        admin = make_client(900, roles=None, is_staff=True)
+        response = admin.patch(f'/api/v1/appointments/{appointment.pk}/', {'status': Appointment.STATUS_CANCELLED}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts(self.next_day), {'scheduled_minutes': 60, 'cancelled': 1})
+        self.assertMatchesSource()
+
+    def test_rollback_reverts_counters(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=self.start)
+            raise RuntimeError
+        self.assertEqual(self.counts(self.day), {'scheduled_minutes': 120})
+
+    def test_schedule_changes_and_rebuild(self):
+        schedule = DoctorSchedule.objects.get(start_time=self.next_start)
+        schedule.is_available = False
+        schedule.save()
+        self.assertEqual(self.counts(self.next_day), {})
+        # Ca qua đêm được tách theo ngày
+        late = timezone.make_aware(datetime.combine(self.day, time(23)))
+        DoctorSchedule.objects.create(doctor_id=1, start_time=late, end_time=late + timedelta(hours=2))
+        self.assertEqual(self.counts(self.day), {'scheduled_minutes': 180})
+        self.assertEqual(self.counts(self.next_day), {'scheduled_minutes': 60})
+        self.assertMatchesSource()
+
+        # Bộ đếm lệch (sửa DB trực tiếp) được rebuild tính lại
+        DoctorDailyUtilization.objects.update(scheduled_minutes=0, booked=5)
+        self.assertEqual(rollups.rebuild(self.day, self.next_day), 2)
+        self.assertMatchesSource()
+
+    def test_utilization_view(self):
+        booking.book_appointment(patient_id=100, doctor_id=1, appointment_time=self.start)
+        DoctorSchedule.objects.create(doctor_id=2, start_time=self.start, end_time=self.start + timedelta(hours=1))
+        params = {'start_date': self.day.isoformat(), 'end_date': self.next_day.isoformat()}
+
+        response = make_client(900, roles=None, is_staff=True).get('/api/v1/appointments/analytics/utilization/', params)
+        self.assertEqual(response.status_code, 200)
+        rows = {row['doctor_id']: row for row in response.data['results']}
+        self.assertEqual((rows[1]['scheduled_minutes'], rows[1]['booked'], rows[1]['utilization']), (180, 1, round(30 / 180, 4)))
+        self.assertEqual((rows[2]['scheduled_minutes'], rows[2]['utilization']), (60, 0))
+        self.assertEqual(response.data['totals']['scheduled_minutes'], 240)
+
+        # Bác sĩ chỉ xem số liệu của mình; bệnh nhân không được xem
+        response = make_client(2, roles=['Doctor']).get('/api/v1/appointments/analytics/utilization/', {**params, 'doctor_ids': '1,2'})
+        self.assertEqual([row['doctor_id'] for row in response.data['results']], [2])
+        self.assertEqual(make_client(100).get('/api/v1/appointments/analytics/utilization/', params).status_code, 403)
+
+
+# --- Kiểm tra các module dùng chung: mỗi service build image từ thư mục riêng nên giữ bản sao, các bản phải giống hệt nhau ---
+class SharedModuleTests(TestCase):
+    root = Path(__file__).resolve().parents[2]
+    copies = {
+        'instrumentation.py': ('appointment_service/appointment_service', 'clinical_service/clinical_service', 'user_service'),
+        'throttling.py': ('appointment_service/appointment_service', 'clinical_service/clinical_service', 'user_service'),
+        'idempotency.py': ('appointment_service/appointment_service', 'clinical_service/clinical_service'),
+        'outbox.py': ('appointment_service/appointment_service', 'clinical_service/clinical_service'),
+    }
+
+    def test_copies_are_identical(self):
+        for name, directories in self.copies.items():
+            paths = [self.root / directory / name for directory in directories]
+            missing = [path for path in paths if not path.exists()]
+            if missing:
+                # Chỉ có thư mục của service này (ví dụ trong Docker image): không có gì để so
+                self.skipTest(f"Thiếu {missing[0]}: cần chạy từ bản checkout đầy đủ của repo.")
+            with self.subTest(name=name):
+                reference = paths[0].read_bytes()
+                different = [str(path.relative_to(self.root)) for path in paths[1:] if path.read_bytes() != reference]
+                self.assertEqual(different, [], f"{name} khác với bản trong {directories[0]}; chép thay đổi sang mọi bản sao.")
+
+
+# --- Kiểm tra instrumentation: đếm query theo request, lấy mẫu log, hàng đợi log đầy thì bỏ bản ghi ---
+@override_settings(THROTTLE_STORE={'BACKEND': 'appointment_service.throttling.LocMemStore'})
+class InstrumentationTests(TestCase):
+    url = '/api/v1/appointments/my-appointments/'
+
+    def setUp(self):
+        Appointment.objects.create(patient_id=100, doctor_id=1, appointment_time=timezone.now() + timedelta(days=1))
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {make_token(100)}'}
+
+    @override_settings(INSTRUMENTATION_QUERY_HEADER=True)
+    def test_query_header_counts_request_queries(self):
+        counter = 'queries:appointments:patient-appointment-list'
+        before = instrumentation.snapshot()['counters'].get(counter, 0)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.url, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(captured), 0)
+        self.assertEqual(int(response['X-DB-Queries']), len(captured))
+        self.assertEqual(instrumentation.snapshot()['counters'][counter] - before, len(captured))
+
+    def test_no_header_or_logs_by_default(self):
+        with mock.patch.object(instrumentation.logger, 'debug') as debug:
+            response = self.client.get(self.url, **self.auth)
+        self.assertNotIn('X-DB-Queries', response)
+        self.assertNotIn('X-Trace-Id', response)
+        debug.assert_not_called()
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=1)
+    def test_sampled_request_logs_events(self):
+        with self.assertLogs('instrumentation', 'DEBUG') as logs:
+            response = self.client.get(self.url, **self.auth)
+        trace_id = response['X-Trace-Id']
+        spans = [record.fields['span'] for record in logs.records if record.event == 'span']
+        self.assertIn('request', spans)
+        self.assertTrue(all(record.trace_id == trace_id for record in logs.records))
+
+    def test_full_queue_drops_and_counts(self):
+        # Không chạy QueueListener: bản ghi nằm lại trong hàng đợi, bản sau bị bỏ
+        with mock.patch.object(instrumentation.logging.handlers.QueueListener, 'start'), \
+                mock.patch.object(instrumentation.atexit, 'register'):
+            handler = instrumentation.NonBlockingQueueHandler(maxsize=2)
+        dropped = instrumentation.snapshot()['dropped_events']
+        record = logging.LogRecord('instrumentation', logging.DEBUG, __file__, 0, 'span', None, None)
+        for _ in range(5):
+            handler.handle(record)
+        self.assertEqual(handler.queue.qsize(), 2)
+        self.assertEqual(instrumentation.snapshot()['dropped_events'], dropped + 3)
+
+        # Ảnh chụp có reset trả số đã bỏ rồi đếm lại từ 0 như các bộ đếm khác
+        self.assertEqual(instrumentation.snapshot(reset=True)['dropped_events'], dropped + 3)
+        self.assertEqual(instrumentation.snapshot()['dropped_events'], 0)
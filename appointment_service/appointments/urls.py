@@ -7,7 +7,17 @@ from .views import (
     DoctorAppointmentListView,
     AppointmentDetailView,
     AvailableSlotsView, # Sẽ thêm view này nếu cần logic phức tạp hơn
+    BatchAvailableSlotsView,
+    NextAvailableSlotsView,
+    SlotHoldCreateView,
+    SlotHoldReleaseView,
+    AppointmentExportView,
+    WaitlistEntryListCreateView,
+    WaitlistEntryCancelView,
+    SlotEventsView,
+    UtilizationAnalyticsView,
 )
+from .async_views import AsyncDoctorScheduleListView, AsyncAvailableSlotsView, AsyncPatientAppointmentListView
 
 app_name = 'appointments'
 
@@ -15,10 +25,25 @@ urlpatterns = [
     # Lịch làm việc của bác sĩ
     path('schedules/', DoctorScheduleListView.as_view(), name='doctor-schedule-list'),
     path('available-slots/', AvailableSlotsView.as_view(), name='available-slots'), # URL cho xem slot trống
+    path('available-slots/batch/', BatchAvailableSlotsView.as_view(), name='available-slots-batch'), # Nhiều bác sĩ x nhiều ngày
+    path('next-available/', NextAvailableSlotsView.as_view(), name='next-available'), # K slot trống sớm nhất
+    path('events/slots/', SlotEventsView.as_view(), name='slot-events'), # Push (SSE) thay cho poll available-slots
 
     # Quản lý lịch hẹn
+    path('holds/', SlotHoldCreateView.as_view(), name='slot-hold-create'), # Giữ chỗ tạm thời trước khi book
+    path('holds/<str:token>/', SlotHoldReleaseView.as_view(), name='slot-hold-release'),
+    path('waitlist/', WaitlistEntryListCreateView.as_view(), name='waitlist'), # Danh sách chờ slot bị hủy
+    path('waitlist/<int:pk>/', WaitlistEntryCancelView.as_view(), name='waitlist-cancel'),
     path('book/', AppointmentCreateView.as_view(), name='appointment-create'),
     path('my-appointments/', PatientAppointmentListView.as_view(), name='patient-appointment-list'),
     path('doctor-appointments/', DoctorAppointmentListView.as_view(), name='doctor-appointment-list'), # Cần ?doctor_id=...
+    path('export/', AppointmentExportView.as_view(), name='appointment-export'), # Admin: xuất NDJSON/CSV dạng luồng
+    path('analytics/utilization/', UtilizationAnalyticsView.as_view(), name='utilization-analytics'), # Tỉ lệ sử dụng theo bác sĩ/ngày
+
+    # Bản async (ASGI) của các endpoint đọc nhiều, cùng tham số và kết quả với bản sync
+    path('async/schedules/', AsyncDoctorScheduleListView.as_view(), name='async-doctor-schedule-list'),
+    path('async/available-slots/', AsyncAvailableSlotsView.as_view(), name='async-available-slots'),
+    path('async/my-appointments/', AsyncPatientAppointmentListView.as_view(), name='async-patient-appointment-list'),
+
     path('<int:pk>/', AppointmentDetailView.as_view(), name='appointment-detail'), # Xem chi tiết, cập nhật status, hủy
 ]
\ No newline at end of file
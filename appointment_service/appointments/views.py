@@ -1,23 +1,37 @@
 # appointments/views.py
 from rest_framework import generics, permissions, status, views, viewsets
 from rest_framework.response import Response
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from django.utils import timezone
 from datetime import date, timedelta, datetime
-from .models import DoctorSchedule, Appointment
+from .models import DoctorSchedule, Appointment, WaitlistEntry
+from . import availability, booking, export, holds, pubsub, queries, recurring, rollups, waitlist
+from .pagination import AppointmentKeysetPagination
+from .policies import AppointmentPolicy, ROLE_PATIENT, ROLE_DOCTOR
+from appointment_service import idempotency, instrumentation, outbox
 from .serializers import (
     DoctorScheduleSerializer,
     AppointmentSerializer,
     AppointmentCreateSerializer,
     AppointmentStatusUpdateSerializer,
+    SlotHoldCreateSerializer,
+    WaitlistEntrySerializer,
 )
 from rest_framework.permissions import IsAuthenticated, IsAdminUser # Import permissions cơ bản
-from .permissions import IsAdminClaim, IsDoctorClaim, IsPatientClaim, IsAppointmentOwnerOrAdminOrAssociatedDoctor
+from .permissions import IsAdminClaim, IsDoctorClaim, IsPatientClaim, HasAppointmentRoleClaim
 from rest_framework.permissions import IsAuthenticated
 from .permissions import IsAdminClaim, IsDoctorClaim, IsPatientClaim, CanModifyOrViewAppointment
 
 from datetime import date, time, timedelta, datetime
 from django.utils import timezone # Dùng timezone hiện tại
-from rest_framework.exceptions import ParseError, NotFound
+from rest_framework.exceptions import AuthenticationFailed, ParseError, NotFound, PermissionDenied, ValidationError
 
 # --- View lấy danh sách lịch làm việc của bác sĩ ---
 class DoctorScheduleListView(generics.ListAPIView):
@@ -30,45 +44,75 @@ class DoctorScheduleListView(generics.ListAPIView):
     permission_classes = [IsAuthenticated] # Bất kỳ ai đăng nhập cũng có thể xem lịch
 
     def get_queryset(self):
-        queryset = DoctorSchedule.objects.filter(is_available=True, end_time__gte=timezone.now()) # Chỉ lấy lịch còn hiệu lực và còn trống
-        doctor_id = self.request.query_params.get('doctor_id')
-        start_date_str = self.request.query_params.get('start_date')
-        end_date_str = self.request.query_params.get('end_date')
-
-        if doctor_id:
-            queryset = queryset.filter(doctor_id=doctor_id)
-
-        if start_date_str:
+        doctor_id, start_date, end_date = self.parse_filters(self.request.query_params)
+        # Sinh lịch từ mẫu lặp lại tới ngày cần xem (mặc định recurring.DEFAULT_HORIZON_DAYS ngày tới)
+        recurring.ensure_materialized(*self.materialize_horizon(doctor_id, end_date))
+        return self.build_queryset(doctor_id, start_date, end_date)
+
+    # Các bước dưới đây dùng chung với bản async (appointments/async_views.py)
+    @staticmethod
+    def parse_filters(params):
+        """(doctor_id, start_date, end_date) từ query params; giá trị sai format được bỏ qua."""
+        values = []
+        for name, parse in (('doctor_id', int), ('start_date', date.fromisoformat), ('end_date', date.fromisoformat)):
             try:
-                start_date = date.fromisoformat(start_date_str)
-                queryset = queryset.filter(start_time__date__gte=start_date)
+                values.append(parse(params[name]) if params.get(name) else None)
             except ValueError:
-                pass # Bỏ qua nếu format ngày sai
+                values.append(None) # Bỏ qua nếu format sai
+        return tuple(values)
 
-        if end_date_str:
-            try:
-                end_date = date.fromisoformat(end_date_str)
-                # Lấy đến cuối ngày end_date
-                queryset = queryset.filter(start_time__date__lte=end_date)
-            except ValueError:
-                pass # Bỏ qua nếu format ngày sai
+    @staticmethod
+    def materialize_horizon(doctor_id, end_date):
+        horizon = end_date or timezone.localdate() + timedelta(days=recurring.DEFAULT_HORIZON_DAYS)
+        return horizon, [doctor_id] if doctor_id is not None else None
 
-        return queryset.order_by('start_time')
+    @staticmethod
+    def build_queryset(doctor_id, start_date, end_date):
+        queryset = DoctorSchedule.objects.filter(is_available=True, end_time__gte=timezone.now()) # Chỉ lấy lịch còn hiệu lực và còn trống
+        if doctor_id is not None:
+            queryset = queryset.filter(doctor_id=doctor_id)
+        # Lọc theo khoảng [đầu ngày start_date, đầu ngày sau end_date) trên cột start_time
+        # thay vì start_time__date, để DB dùng được index (doctor_id, start_time, end_time)
+        return queryset.filter(queries.on_dates('start_time', start_date, end_date)).order_by('start_time')
 
 # --- View Tạo Lịch hẹn mới ---
-class AppointmentCreateView(generics.CreateAPIView):
+class AppointmentCreateView(idempotency.IdempotentCreateMixin, generics.CreateAPIView):
     """
     API để bệnh nhân đặt lịch hẹn mới.
+    Hỗ trợ header Idempotency-Key: client retry với cùng key nhận lại đúng response lần đầu.
     """
     serializer_class = AppointmentCreateSerializer
     permission_classes = [IsAuthenticated, IsPatientClaim] # Yêu cầu đăng nhập để đặt lịch
+    throttle_scope = 'booking'
 
     def perform_create(self, serializer):
         # Tự động gán patient_id từ user đang thực hiện request
         # Quan trọng: Giả định ID user trong hệ thống user_service chính là patient_id
         # Cần đảm bảo cơ chế lấy ID này là đúng (ví dụ: từ JWT payload)
-        serializer.save(patient_id=self.request.user.id, status=Appointment.STATUS_SCHEDULED)
-        # Có thể gửi sự kiện vào Message Queue ở đây để NotificationService gửi thông báo
+        # Tạo lịch và chiếm slot nguyên tử; thua race -> 409 Conflict (xem appointments/booking.py)
+        data = serializer.validated_data
+        recurring.ensure_materialized(timezone.localdate(data['appointment_time']), [data['doctor_id']])
+        with instrumentation.span('appointment_create.book'), transaction.atomic():
+            appointment = booking.book_appointment(
+                patient_id=self.request.user.id,
+                doctor_id=data['doctor_id'],
+                appointment_time=data['appointment_time'],
+                reason=data.get('reason'),
+                hold_token=data.get('hold_token'),
+            )
+            if data.get('hold_token'):
+                # Slot được mời từ danh sách chờ
+                waitlist.mark_fulfilled(self.request.user.id, data['hold_token'])
+            # Sự kiện cho NotificationService... ghi vào outbox cùng transaction, publish_outbox gửi đi sau
+            outbox.record('appointment.created', {
+                'appointment_id': appointment.id,
+                'patient_id': appointment.patient_id,
+                'doctor_id': appointment.doctor_id,
+                'appointment_time': appointment.appointment_time,
+                'status': appointment.status,
+                'from_waitlist': bool(data.get('hold_token')),
+            }, key=f'appointment:{appointment.id}')
+        serializer.instance = appointment
 
     def get_serializer_context(self):
         """
@@ -82,15 +126,17 @@ class AppointmentCreateView(generics.CreateAPIView):
 class PatientAppointmentListView(generics.ListAPIView):
     """
     API xem danh sách lịch hẹn của bệnh nhân đang đăng nhập.
+    Phân trang keyset theo (appointment_time, id), mới nhất trước: ?page_size=50&cursor=...
     """
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated, IsPatientClaim]
+    pagination_class = AppointmentKeysetPagination
+    keyset_descending = True
 
     def get_queryset(self):
-        # Lấy user hiện tại (patient_id)
-        user_id = self.request.user.id
-        # Lọc các lịch hẹn của user đó, sắp xếp theo thời gian gần nhất
-        return Appointment.objects.filter(patient_id=user_id).order_by('-appointment_time')
+        # Lịch hẹn của user hiện tại với tư cách bệnh nhân (patient_id = user_id), lọc trong SQL
+        policy = AppointmentPolicy.for_request(self.request)
+        return policy.visible(Appointment.objects.all(), as_role=ROLE_PATIENT).order_by('-appointment_time')
 
 # --- View Lấy danh sách lịch hẹn của Bác sĩ (Yêu cầu quyền Admin hoặc Doctor) ---
 class DoctorAppointmentListView(generics.ListAPIView):
@@ -99,44 +145,38 @@ class DoctorAppointmentListView(generics.ListAPIView):
     Cần doctor_id làm query parameter.
     Yêu cầu quyền Admin hoặc chính bác sĩ đó.
     Ví dụ: /api/v1/appointments/doctor-appointments/?doctor_id=5
+    Phân trang keyset theo (appointment_time, id), sớm nhất trước: ?page_size=50&cursor=...
     """
     serializer_class = AppointmentSerializer
+    pagination_class = AppointmentKeysetPagination
     # permission_classes = [IsAuthenticated, IsAdminOrAssociatedDoctor] # Cần permission tùy chỉnh
     permission_classes = [IsAuthenticated, IsDoctorClaim] # Tạm thời chỉ cho Admin
 
     def get_queryset(self):
-        user = self.request.user
-        if 'Doctor' in user.get('roles', []) and not user.get('is_staff', False):
-            # Nếu là Doctor, chỉ lấy lịch của chính doctor đó (user.id là doctor_id)
-            return Appointment.objects.filter(
-                doctor_id=user.get('user_id'), # Giả định user_id của doctor là doctor_id
-                appointment_time__gte=timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            ).order_by('appointment_time')
-        elif user.get('is_staff', False):
-            # Nếu là Admin, cho phép lọc theo doctor_id từ query params
+        policy = AppointmentPolicy.for_request(self.request)
+        queryset = Appointment.objects.filter(queries.on_dates('appointment_time', timezone.localdate()))
+        if policy.is_staff:
+            # Admin: cho phép lọc theo doctor_id từ query params, không có thì xem tất cả
             doctor_id_param = self.request.query_params.get('doctor_id')
             if doctor_id_param:
                 try:
-                    return Appointment.objects.filter(
-                        doctor_id=int(doctor_id_param),
-                        appointment_time__gte=timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-                    ).order_by('appointment_time')
+                    queryset = queryset.filter(doctor_id=int(doctor_id_param))
                 except (ValueError, TypeError):
                     return Appointment.objects.none()
-            return Appointment.objects.filter( # Admin xem tất cả nếu không có doctor_id
-                appointment_time__gte=timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            ).order_by('appointment_time')
-        return Appointment.objects.none() # Không có quyền
+            return queryset.order_by('appointment_time')
+        # Bác sĩ: chỉ lịch của chính mình (user_id của doctor là doctor_id)
+        return policy.visible(queryset, as_role=ROLE_DOCTOR).order_by('appointment_time')
 
 
 # --- View Xem chi tiết, Cập nhật (trạng thái), Hủy lịch hẹn ---
 class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     API xem chi tiết, cập nhật trạng thái (hủy), hoặc xóa lịch hẹn.
+    Quyền xem được lọc ngay trong queryset (appointments/policies.py): ID của người khác trả 404
+    sau 1 lần tra index, không load dòng rồi mới kiểm tra trong Python.
     """
-    queryset = Appointment.objects.all()
-    # permission_classes = [IsAuthenticated, IsOwnerOrAdminOrDoctor] # Cần permission tùy chỉnh
-    permission_classes = [IsAuthenticated, IsAppointmentOwnerOrAdminOrAssociatedDoctor, CanModifyOrViewAppointment]
+    def get_queryset(self):
+        return AppointmentPolicy.for_request(self.request).visible(Appointment.objects.all())
 
     def get_serializer_class(self):
         # Dùng serializer khác nhau cho việc đọc và cập nhật status
@@ -153,9 +193,10 @@ class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
             return [IsAdminUser()] # Tạm thời chỉ cho Admin sửa/xóa
         # Cho phép xem chi tiết nếu là chủ sở hữu hoặc admin hoặc bác sĩ liên quan
         # return [IsAuthenticated(), IsOwnerOrAdminOrDoctor()]
+        # Token không có claim roles (và không phải Admin) bị 403; còn lại chỉ thấy lịch hẹn được phép, đã lọc trong get_queryset
         if self.request.method in ['GET']: # GET
-            return [IsAuthenticated()] # Tạm thời cho ai cũng xem nếu biết ID, sẽ được lọc bởi has_object_permission
-        return [IsAuthenticated(), CanModifyOrViewAppointment()] # Tạm thời cho ai đăng nhập cũng xem được detail nếu biết ID
+            return [IsAuthenticated(), HasAppointmentRoleClaim()]
+        return [IsAuthenticated(), HasAppointmentRoleClaim(), CanModifyOrViewAppointment()]
 
 
     # Ghi đè phương thức update/partial_update để chỉ cho phép cập nhật status
@@ -203,14 +244,30 @@ class AvailableSlotsView(views.APIView):
     API lấy danh sách các khung giờ còn trống để đặt lịch hẹn.
     Yêu cầu: doctor_id và date (YYYY-MM-DD) trong query params.
     Ví dụ: /api/v1/appointments/available-slots/?doctor_id=1&date=2025-05-10
-    Giả định mỗi slot là 30 phút.
+    Mỗi slot dài availability.SLOT_MINUTES (30 phút), bắt đầu từ các mốc tròn trong ngày.
     """
     permission_classes = [IsAuthenticated] # Ai đăng nhập cũng có thể xem slot
+    throttle_scope = 'slots'
 
     def get(self, request, *args, **kwargs):
         # 1. Lấy và Validate query parameters
-        doctor_id_str = request.query_params.get('doctor_id')
-        date_str = request.query_params.get('date')
+        doctor_id, requested_date = self.parse_params(request.query_params)
+
+        # 2. Tra bitmap slot trống của bác sĩ trong ngày (xem appointments/availability.py)
+        # Bitmap được cache và cập nhật tăng dần khi lịch hẹn thay đổi, nên không cần
+        # query lại Appointment/DoctorSchedule hay duyệt từng slot ở mỗi request.
+        with instrumentation.span('available_slots.lookup'):
+            recurring.ensure_materialized(requested_date, [doctor_id])
+            available_slots = availability.available_slots(doctor_id, requested_date)
+        instrumentation.event('available_slots.result', doctor_id=doctor_id, date=requested_date.isoformat(), count=len(available_slots))
+
+        return Response(self.format_slots(available_slots), status=status.HTTP_200_OK)
+
+    # Dùng chung với bản async (appointments/async_views.py)
+    @staticmethod
+    def parse_params(params):
+        doctor_id_str = params.get('doctor_id')
+        date_str = params.get('date')
 
         if not doctor_id_str or not date_str:
             raise ParseError("Cần cung cấp 'doctor_id' và 'date' (YYYY-MM-DD).")
@@ -229,90 +286,411 @@ class AvailableSlotsView(views.APIView):
         current_date = timezone.now().date()
         if requested_date < current_date:
              raise ParseError("Không thể xem slot cho ngày trong quá khứ.")
+        return doctor_id, requested_date
+
+    @staticmethod
+    def format_slots(slots):
+        return [slot.strftime("%Y-%m-%dT%H:%M:%S%z") for slot in slots]
+
+# --- View Tìm slot trống hàng loạt cho nhiều bác sĩ trong nhiều ngày ---
+class BatchAvailableSlotsView(views.APIView):
+    """
+    API tìm slot trống cho nhiều bác sĩ trong một khoảng ngày, trả về trong một lần gọi.
+    Query params:
+    - doctor_ids: danh sách ID cách nhau bởi dấu phẩy (bỏ trống = tất cả bác sĩ có lịch)
+    - start_date, end_date: YYYY-MM-DD (end_date mặc định = start_date + 6 ngày)
+    Ví dụ: /api/v1/appointments/available-slots/batch/?doctor_ids=1,2,3&start_date=2025-05-10&end_date=2025-05-16
+    Chỉ trả về các cặp (bác sĩ, ngày) còn slot trống.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'slots'
+    max_days = 31
+    max_doctors = 200
+
+    def get(self, request, *args, **kwargs):
+        doctor_ids_str = request.query_params.get('doctor_ids')
+        start_date_str = request.query_params.get('start_date')
+        end_date_str = request.query_params.get('end_date')
+
+        if not start_date_str:
+            raise ParseError("Cần cung cấp 'start_date' (YYYY-MM-DD).")
+
+        doctor_ids = None
+        if doctor_ids_str:
+            try:
+                doctor_ids = sorted({int(value) for value in doctor_ids_str.split(',') if value.strip()})
+            except ValueError:
+                raise ParseError("'doctor_ids' phải là danh sách số nguyên, cách nhau bởi dấu phẩy.")
+            if len(doctor_ids) > self.max_doctors:
+                raise ParseError(f"Chỉ được tìm tối đa {self.max_doctors} bác sĩ mỗi lần.")
+
+        try:
+            start_date = date.fromisoformat(start_date_str)
+            end_date = date.fromisoformat(end_date_str) if end_date_str else start_date + timedelta(days=6)
+        except ValueError:
+            raise ParseError("'start_date' và 'end_date' phải có định dạng YYYY-MM-DD.")
+
+        current_date = timezone.localdate()
+        if end_date < start_date:
+            raise ParseError("'end_date' phải lớn hơn hoặc bằng 'start_date'.")
+        if end_date < current_date:
+            raise ParseError("Không thể xem slot cho ngày trong quá khứ.")
+        start_date = max(start_date, current_date)
+        if (end_date - start_date).days + 1 > self.max_days:
+            raise ParseError(f"Khoảng ngày tối đa là {self.max_days} ngày.")
+
+        # Toàn bộ (bác sĩ x ngày) được tính cùng lúc: 1 lần đọc cache + tối đa 1 truy vấn gộp trên bảng slot
+        with instrumentation.span('available_slots_batch.lookup'):
+            recurring.ensure_materialized(end_date, doctor_ids)
+            slots_by_pair = availability.batch_available_slots(start_date, end_date, doctor_ids)
+
+        results = [
+            {
+                'doctor_id': doctor_id,
+                'date': day.isoformat(),
+                'slots': [slot.strftime("%Y-%m-%dT%H:%M:%S%z") for slot in slots],
+            }
+            for (doctor_id, day), slots in slots_by_pair.items()
+        ]
+        return Response({
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'results': results,
+        }, status=status.HTTP_200_OK)
+
+
+# --- View Tìm các slot trống sớm nhất trên nhiều bác sĩ ---
+class NextAvailableSlotsView(views.APIView):
+    """
+    API trả về K slot trống sớm nhất của một nhóm bác sĩ, kể từ một thời điểm.
+    Query params:
+    - doctor_ids: danh sách ID cách nhau bởi dấu phẩy (bỏ trống = tất cả bác sĩ có lịch)
+    - after: thời điểm bắt đầu tìm (ISO 8601, mặc định là hiện tại)
+    - limit: số slot cần lấy (mặc định 10)
+    Ví dụ: /api/v1/appointments/next-available/?doctor_ids=1,2,3&limit=5
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'slots'
+    default_limit = 10
+    max_limit = 100
+    horizon_days = 60 # Không tìm xa hơn số ngày này
+    max_doctors = 200
+
+    def get(self, request, *args, **kwargs):
+        doctor_ids_str = request.query_params.get('doctor_ids')
+        after_str = request.query_params.get('after')
+        limit_str = request.query_params.get('limit')
+
+        doctor_ids = None
+        if doctor_ids_str:
+            try:
+                doctor_ids = sorted({int(value) for value in doctor_ids_str.split(',') if value.strip()})
+            except ValueError:
+                raise ParseError("'doctor_ids' phải là danh sách số nguyên, cách nhau bởi dấu phẩy.")
+            if len(doctor_ids) > self.max_doctors:
+                raise ParseError(f"Chỉ được tìm tối đa {self.max_doctors} bác sĩ mỗi lần.")
+
+        after = None
+        if after_str:
+            try:
+                after = datetime.fromisoformat(after_str)
+            except ValueError:
+                raise ParseError("'after' phải có định dạng ISO 8601 (YYYY-MM-DDTHH:MM).")
+            if timezone.is_naive(after):
+                after = timezone.make_aware(after)
+
+        try:
+            limit = int(limit_str) if limit_str else self.default_limit
+        except ValueError:
+            raise ParseError("'limit' phải là số nguyên.")
+        if not 1 <= limit <= self.max_limit:
+            raise ParseError(f"'limit' phải nằm trong khoảng 1..{self.max_limit}.")
+
+        search_from = timezone.localdate(after) if after else timezone.localdate()
+        recurring.ensure_materialized(search_from + timedelta(days=self.horizon_days), doctor_ids)
+        with instrumentation.span('next_available.search'):
+            slots = availability.earliest_slots(limit, after=after, doctor_ids=doctor_ids, horizon_days=self.horizon_days)
+
+        return Response([
+            {'doctor_id': doctor_id, 'slot': slot.strftime("%Y-%m-%dT%H:%M:%S%z")}
+            for slot, doctor_id in slots
+        ], status=status.HTTP_200_OK)
+
+
+# --- View Giữ chỗ tạm thời một slot trong lúc bệnh nhân điền form đặt lịch ---
+class SlotHoldCreateView(idempotency.IdempotentCreateMixin, generics.CreateAPIView):
+    """
+    API giữ chỗ một slot trong N giây (mặc định SLOT_HOLD_SECONDS).
+    Trả về hold_token để gửi kèm khi POST book/. Slot đang được giữ không hiện trong available-slots.
+    Body: {"doctor_id": 1, "appointment_time": "2025-05-10T09:00:00+07:00", "seconds": 300}
+    Hỗ trợ header Idempotency-Key (retry nhận lại cùng hold_token).
+    """
+    serializer_class = SlotHoldCreateSerializer
+    permission_classes = [IsAuthenticated, IsPatientClaim]
+    throttle_scope = 'booking'
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        recurring.ensure_materialized(timezone.localdate(data['appointment_time']), [data['doctor_id']])
+        token, held_until = holds.create_hold(
+            patient_id=request.user.id,
+            doctor_id=data['doctor_id'],
+            start_time=data['appointment_time'],
+            seconds=data.get('seconds'),
+        )
+        return Response({
+            'hold_token': token,
+            'doctor_id': data['doctor_id'],
+            'appointment_time': data['appointment_time'],
+            'held_until': held_until,
+        }, status=status.HTTP_201_CREATED)
+
+
+# --- View Hủy giữ chỗ ---
+class SlotHoldReleaseView(views.APIView):
+    """
+    API trả lại slot đang giữ (khi bệnh nhân rời trang đặt lịch).
+    Ví dụ: DELETE /api/v1/appointments/holds/<hold_token>/
+    """
+    permission_classes = [IsAuthenticated, IsPatientClaim]
+
+    def delete(self, request, token, *args, **kwargs):
+        if not holds.release_hold(request.user.id, token):
+            raise NotFound("Không tìm thấy slot đang được giữ với token này.")
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+# --- View Xuất lịch hẹn dạng luồng (NDJSON/CSV) cho Admin ---
+class AppointmentExportView(views.APIView):
+    """
+    API xuất lịch hẹn cho báo cáo, gửi dần từng dòng (không dựng toàn bộ danh sách trong bộ nhớ).
+    Query params:
+    - output: ndjson (mặc định) hoặc csv
+    - doctor_id, patient_id, status: lọc tùy chọn
+    - start_date, end_date: YYYY-MM-DD (mặc định từ hôm nay, không giới hạn cuối)
+    Ví dụ: /api/v1/appointments/export/?output=csv&start_date=2025-05-01&end_date=2025-05-31
+    """
+    permission_classes = [IsAuthenticated, IsAdminClaim]
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        output_format = params.get('output', export.FORMAT_NDJSON)
+        if output_format not in export.CONTENT_TYPES:
+            raise ParseError("'output' phải là 'ndjson' hoặc 'csv'.")
+
+        try:
+            start_date = date.fromisoformat(params['start_date']) if params.get('start_date') else timezone.localdate()
+            end_date = date.fromisoformat(params['end_date']) if params.get('end_date') else None
+        except ValueError:
+            raise ParseError("'start_date' và 'end_date' phải có định dạng YYYY-MM-DD.")
+
+        queryset = Appointment.objects.filter(queries.on_dates('appointment_time', start_date, end_date))
+        try:
+            if params.get('doctor_id'):
+                queryset = queryset.filter(doctor_id=int(params['doctor_id']))
+            if params.get('patient_id'):
+                queryset = queryset.filter(patient_id=int(params['patient_id']))
+        except ValueError:
+            raise ParseError("'doctor_id' và 'patient_id' phải là số nguyên.")
+        if params.get('status'):
+            queryset = queryset.filter(status=params['status'])
+
+        response = StreamingHttpResponse(
+            export.iter_export(queryset, output_format),
+            content_type=export.CONTENT_TYPES[output_format]
+        )
+        filename = f"appointments-{start_date.isoformat()}.{output_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+# --- View Danh sách chờ của bệnh nhân ---
+class WaitlistEntryListCreateView(idempotency.IdempotentCreateMixin, generics.ListCreateAPIView):
+    """
+    GET: danh sách chờ của bệnh nhân đang đăng nhập (kèm lời mời nếu có).
+    POST: đăng ký chờ slot của một bác sĩ trong một khoảng thời gian.
+    Body: {"doctor_id": 1, "window_start": "2025-05-10T08:00:00+07:00", "window_end": "2025-05-12T17:00:00+07:00"}
+    Khi có lịch hẹn bị hủy trong khoảng đó, slot được giữ cho bệnh nhân (status = Offered, kèm hold_token).
+    POST hỗ trợ header Idempotency-Key.
+    """
+    serializer_class = WaitlistEntrySerializer
+    permission_classes = [IsAuthenticated, IsPatientClaim]
+    max_active_entries = 5
+
+    def get_queryset(self):
+        return WaitlistEntry.objects.filter(patient_id=self.request.user.id).order_by('-created_at')
+
+    def perform_create(self, serializer):
+        active = WaitlistEntry.objects.filter(
+            patient_id=self.request.user.id,
+            status__in=[WaitlistEntry.STATUS_WAITING, WaitlistEntry.STATUS_OFFERED]
+        ).count()
+        if active >= self.max_active_entries:
+            raise ValidationError("Bạn đang có quá nhiều yêu cầu trong danh sách chờ.")
+        serializer.save(patient_id=self.request.user.id)
+
 
-        # 2. Lấy các lịch hẹn đã được đặt của bác sĩ trong ngày đó
-        start_of_day_dt = timezone.make_aware(datetime.combine(requested_date, time.min))
-        end_of_day_dt = timezone.make_aware(datetime.combine(requested_date, time.max))
+# --- View Rời danh sách chờ ---
+class WaitlistEntryCancelView(generics.DestroyAPIView):
+    """
+    API rời danh sách chờ. Nếu đang có lời mời, slot được trả lại và mời người tiếp theo.
+    Ví dụ: DELETE /api/v1/appointments/waitlist/<id>/
+    """
+    permission_classes = [IsAuthenticated, IsPatientClaim]
 
-        booked_appointments = Appointment.objects.filter(
-            doctor_id=doctor_id,
-            appointment_time__gte=start_of_day_dt,
-            appointment_time__lte=end_of_day_dt, # Chỉ lấy trong ngày yêu cầu
-            status__in=[Appointment.STATUS_SCHEDULED, Appointment.STATUS_CONFIRMED]
+    def get_queryset(self):
+        return WaitlistEntry.objects.filter(
+            patient_id=self.request.user.id,
+            status__in=[WaitlistEntry.STATUS_WAITING, WaitlistEntry.STATUS_OFFERED]
         )
-        booked_start_times = {appt.appointment_time for appt in booked_appointments}
-        print(f"--- Debugging AvailableSlots ---")
-        print(f"Requested Doctor ID: {doctor_id}, Date: {requested_date}")
-        print(f"Booked start times on {requested_date}: {booked_start_times}")
-
-
-        # 3. Lấy các schedule của bác sĩ *chồng lấn* với ngày yêu cầu
-        schedules_overlapping = DoctorSchedule.objects.filter(
-            doctor_id=doctor_id,
-            start_time__date__lte=requested_date, # Bắt đầu trước hoặc trong ngày yêu cầu
-            end_time__date__gte=requested_date,   # Kết thúc trong hoặc sau ngày yêu cầu
-            is_available=True
-        ).order_by('start_time')
-        print(f"Found overlapping schedules count: {schedules_overlapping.count()}")
-
-
-        # 4. Tạo danh sách các slot trống
-        available_slots = set() # Dùng set để tự loại bỏ trùng lặp
-        appointment_duration = timedelta(minutes=30)
-        now = timezone.now()
-        print(f"Current time (now): {now}")
-
-        for schedule in schedules_overlapping:
-            print(f"Processing schedule: ID={schedule.id}, Start={schedule.start_time}, End={schedule.end_time}")
-
-            # Xác định khoảng thời gian hiệu lực của schedule TRONG ngày yêu cầu
-            effective_start_dt = max(schedule.start_time, start_of_day_dt)
-            effective_end_dt = min(schedule.end_time, end_of_day_dt)
-            print(f"  Effective range for {requested_date}: {effective_start_dt} to {effective_end_dt}")
-
-            # Xác định thời điểm bắt đầu vòng lặp slot
-            # Phải lớn hơn hoặc bằng thời điểm hiện tại nếu là ngày hôm nay
-            current_potential_start = effective_start_dt
-            if requested_date == current_date:
-                # Làm tròn thời gian hiện tại lên mốc 30 phút tiếp theo
-                minutes_to_add = 30 - (now.minute % 30) if now.minute % 30 != 0 else 0
-                rounded_now = (now + timedelta(minutes=minutes_to_add)).replace(second=0, microsecond=0)
-                current_potential_start = max(effective_start_dt, rounded_now)
-
-            print(f"  Starting slot check from: {current_potential_start}")
-
-            # Bắt đầu tạo và kiểm tra slot
-            slot_start_time = current_potential_start
-            loop_count = 0
-            while slot_start_time < effective_end_dt and loop_count < 100: # Lặp trong khoảng hiệu lực của ngày
-                slot_end_time = slot_start_time + appointment_duration
-
-                # Chỉ xét slot nếu nó KẾT THÚC TRƯỚC hoặc BẰNG thời gian kết thúc hiệu lực
-                if slot_end_time > effective_end_dt:
-                    print(f"    Slot {slot_start_time.strftime('%H:%M')} - {slot_end_time.strftime('%H:%M')} ends after effective end ({effective_end_dt.strftime('%H:%M')}). Stopping for this schedule.")
-                    break
-
-                # Kiểm tra xem slot đã bị đặt chưa
-                is_booked = slot_start_time in booked_start_times
-                print(f"    Checking slot: {slot_start_time.strftime('%H:%M')} - {slot_end_time.strftime('%H:%M')}. Booked? {is_booked}")
-
-                if not is_booked:
-                    # Kiểm tra lại lần nữa xem có đúng là > now không (đề phòng edge case)
-                    if slot_start_time > now:
-                        print(f"    >>> Adding slot: {slot_start_time}")
-                        available_slots.add(slot_start_time)
-                    else:
-                         print(f"    Slot {slot_start_time.strftime('%H:%M')} is not in the future (Now: {now.strftime('%H:%M')}). Skipping.")
-
-                slot_start_time += appointment_duration
-                loop_count+=1
-            if loop_count >=100:
-                print(f"    WARNING: Loop limit reached for schedule {schedule.id}")
-
-
-        # Sắp xếp và format output
-        sorted_slots = sorted(list(available_slots))
-        formatted_slots = [slot.strftime("%Y-%m-%dT%H:%M:%S%z") for slot in sorted_slots]
-        print(f"Final available slots (formatted): {formatted_slots}")
-
-        return Response(formatted_slots, status=status.HTTP_200_OK)
\ No newline at end of file
+
+    def perform_destroy(self, instance):
+        waitlist.cancel_entry(instance)
+
+
+# --- View Thống kê mức sử dụng lịch của bác sĩ (đọc bảng tổng hợp theo ngày) ---
+class UtilizationAnalyticsView(views.APIView):
+    """
+    API cho dashboard vận hành: số phút làm việc, số lịch hẹn theo trạng thái và tỉ lệ sử dụng.
+    Query params:
+    - start_date, end_date: YYYY-MM-DD (bắt buộc, tối đa max_days ngày)
+    - doctor_ids: danh sách ID cách nhau bởi dấu phẩy (bỏ trống = mọi bác sĩ)
+    - group_by: doctor (mặc định) | day (toàn phòng khám theo ngày) | doctor_day
+    Ví dụ: /api/v1/appointments/analytics/utilization/?start_date=2025-05-01&end_date=2025-05-31&group_by=day
+    Admin xem mọi bác sĩ; bác sĩ chỉ xem số liệu của chính mình.
+    Đọc từ DoctorDailyUtilization (appointments/rollups.py): mỗi bác sĩ 1 dòng/ngày, không quét bảng lịch hẹn.
+    """
+    permission_classes = [IsAuthenticated]
+    max_days = 366
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        policy = AppointmentPolicy.for_request(request)
+        if not policy.is_staff and ROLE_DOCTOR not in policy.roles:
+            raise PermissionDenied("Chỉ Admin hoặc bác sĩ được xem thống kê.")
+
+        try:
+            start_date = date.fromisoformat(params.get('start_date', ''))
+            end_date = date.fromisoformat(params.get('end_date', ''))
+        except ValueError:
+            raise ParseError("Cần cung cấp 'start_date' và 'end_date' (YYYY-MM-DD).")
+        if end_date < start_date:
+            raise ParseError("'end_date' phải lớn hơn hoặc bằng 'start_date'.")
+        if (end_date - start_date).days + 1 > self.max_days:
+            raise ParseError(f"Khoảng ngày tối đa là {self.max_days} ngày.")
+
+        group_by = params.get('group_by', 'doctor')
+        if group_by not in rollups.GROUPINGS:
+            raise ParseError(f"'group_by' phải là một trong: {', '.join(rollups.GROUPINGS)}.")
+
+        doctor_ids = None
+        if params.get('doctor_ids'):
+            try:
+                doctor_ids = sorted({int(value) for value in params['doctor_ids'].split(',') if value.strip()})
+            except ValueError:
+                raise ParseError("'doctor_ids' phải là danh sách số nguyên, cách nhau bởi dấu phẩy.")
+        if not policy.is_staff:
+            doctor_ids = [policy.user_id] # user_id của bác sĩ chính là doctor_id
+
+        with instrumentation.span('analytics.utilization'):
+            groups, totals = rollups.summarize(start_date, end_date, doctor_ids, group_by)
+        for row in groups:
+            if 'date' in row:
+                row['date'] = row['date'].isoformat()
+        return Response({
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'group_by': group_by,
+            'results': groups,
+            'totals': totals,
+        }, status=status.HTTP_200_OK)
+
+
+# --- View Đẩy thay đổi slot trống theo thời gian thực (Server-Sent Events, cần chạy dưới ASGI) ---
+class SlotEventsView(View):
+    """
+    Kênh push thay cho việc poll available-slots. Client (EventSource) theo dõi các topic (bác sĩ, ngày):
+    GET /api/v1/appointments/events/slots/?topics=1:2025-05-10,2:2025-05-10&token=<access token>
+    (EventSource không gửi được header, nên token JWT đi trong query string; header Authorization vẫn dùng được.)
+    Sự kiện:
+    - snapshot: toàn bộ slot trống của (bác sĩ, ngày) — gửi khi mới kết nối và khi lịch làm việc đổi
+    - slot: 1 slot vừa được đặt/giữ chỗ/trả lại ({"slot": ..., "available": true/false})
+    Kết nối tự đóng sau SLOT_EVENTS_MAX_SECONDS giây, EventSource sẽ tự kết nối lại.
+    Mỗi (bác sĩ, ngày) chỉ tốn 1 lần dựng payload cho mỗi thay đổi dù có bao nhiêu client (appointments/pubsub.py).
+    """
+    max_topics = 20
+    heartbeat_seconds = getattr(settings, 'SLOT_EVENTS_HEARTBEAT_SECONDS', 15)
+    max_seconds = getattr(settings, 'SLOT_EVENTS_MAX_SECONDS', 600)
+
+    authentication = JWTStatelessUserAuthentication()
+
+    async def get(self, request, *args, **kwargs):
+        if self.authenticate(request) is None:
+            return JsonResponse({'detail': 'Token không hợp lệ hoặc đã hết hạn.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        try:
+            topics = self.parse_topics(request.GET.get('topics', ''))
+        except ParseError as exc:
+            return JsonResponse({'detail': exc.detail}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(self.stream(topics), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no' # Không để nginx gom buffer
+        return response
+
+    def authenticate(self, request):
+        """TokenUser từ ?token= hoặc header Authorization (cùng cách kiểm tra token/claim như các view DRF), None nếu thiếu hoặc không hợp lệ."""
+        raw_token = request.GET.get('token')
+        try:
+            if not raw_token:
+                header = self.authentication.get_header(request)
+                raw_token = header and self.authentication.get_raw_token(header)
+            if not raw_token:
+                return None
+            return self.authentication.get_user(self.authentication.get_validated_token(raw_token))
+        except AuthenticationFailed:
+            return None
+
+    def parse_topics(self, value):
+        topics = []
+        for item in filter(None, (part.strip() for part in value.split(','))):
+            try:
+                doctor_id, day = item.split(':', 1)
+                topics.append(availability.topic(int(doctor_id), date.fromisoformat(day)))
+            except ValueError:
+                raise ParseError("'topics' phải có dạng doctor_id:YYYY-MM-DD, cách nhau bởi dấu phẩy.")
+        topics = sorted(set(topics))
+        if not topics:
+            raise ParseError("Cần cung cấp ít nhất một topic.")
+        if len(topics) > self.max_topics:
+            raise ParseError(f"Chỉ được theo dõi tối đa {self.max_topics} topic mỗi kết nối.")
+        if any(day < timezone.localdate() for doctor_id, day in topics):
+            raise ParseError("Không thể theo dõi slot cho ngày trong quá khứ.")
+        return topics
+
+    @staticmethod
+    def snapshots(topics):
+        for doctor_id, day in topics:
+            recurring.ensure_materialized(day, [doctor_id])
+        return ''.join(availability.day_snapshot_event(doctor_id, day) for doctor_id, day in topics)
+
+    async def stream(self, topics):
+        # Đăng ký trước khi gửi snapshot để không lỡ thay đổi xảy ra trong lúc đó
+        subscriber = pubsub.broker.subscribe(pubsub.Subscriber(topics))
+        instrumentation.incr('slot_events:connections')
+        deadline = asyncio.get_running_loop().time() + self.max_seconds
+        try:
+            yield 'retry: 5000\n\n' + await sync_to_async(self.snapshots)(topics)
+            while asyncio.get_running_loop().time() < deadline:
+                overflowed, messages = await subscriber.get(timeout=self.heartbeat_seconds)
+                if overflowed:
+                    # Client quá chậm, đã mất message: gửi lại trạng thái đầy đủ thay cho các delta
+                    yield await sync_to_async(self.snapshots)(topics)
+                elif messages:
+                    yield ''.join(messages)
+                else:
+                    yield ': ping\n\n'
+        finally:
+            pubsub.broker.unsubscribe(subscriber)
@@ -0,0 +1,176 @@
+# appointments/waitlist.py
+"""
+Danh sách chờ: tự động lấp slot vừa bị hủy.
+
+- Lịch hẹn bị hủy/đổi giờ (appointments/signals.py) -> sau khi transaction commit, slot được đưa vào
+  hàng đợi của worker nền; request hủy lịch không phải chờ việc ghép.
+- Worker tìm ứng viên bằng 1 range scan trên index (doctor_id, status, window_start): cửa sổ chờ dài
+  tối đa MAX_WINDOW_DAYS ngày nên chỉ cần quét các entry bắt đầu trong [slot - MAX_WINDOW_DAYS, slot].
+- Ứng viên được xếp trong priority queue (heapq) theo (priority cao trước, đăng ký sớm trước);
+  người đứng đầu được giữ chỗ slot (appointments/holds.py) trong OFFER_SECONDS giây.
+- Bệnh nhân đặt lịch bằng hold_token đó -> entry Fulfilled. Hết hạn không đặt -> Expired và slot
+  được ghép cho người tiếp theo (lệnh `manage.py release_expired_holds`).
+"""
+import heapq
+import logging
+import queue
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from appointment_service import instrumentation
+
+from . import availability, holds
+from .booking import SlotUnavailable
+from .models import Appointment, AppointmentSlot, WaitlistEntry
+
+logger = logging.getLogger(__name__)
+
+OFFER_SECONDS = getattr(settings, 'WAITLIST_OFFER_SECONDS', 900)
+MAX_WINDOW_DAYS = getattr(settings, 'WAITLIST_MAX_WINDOW_DAYS', 7)
+# False: ghép ngay trong thread hiện tại (sau commit), dùng cho lệnh quản trị/test
+RUN_ASYNC = getattr(settings, 'WAITLIST_ASYNC', True)
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+# --- Ghép slot với ứng viên ---
+def find_candidates(doctor_id, start_time, end_time):
+    """Các entry đang chờ có cửa sổ chứa trọn slot, xếp thành heap theo độ ưu tiên."""
+    entries = WaitlistEntry.objects.filter(
+        doctor_id=doctor_id,
+        status=WaitlistEntry.STATUS_WAITING,
+        window_start__gte=start_time - timedelta(days=MAX_WINDOW_DAYS),
+        window_start__lte=start_time,
+        window_end__gte=end_time
+    ).values_list('priority', 'created_at', 'id', 'patient_id')
+    heap = [(-priority, created_at, entry_id, patient_id) for priority, created_at, entry_id, patient_id in entries]
+    heapq.heapify(heap)
+    return heap
+
+
+def match_slot(doctor_id, start_time):
+    """
+    Mời ứng viên tốt nhất cho slot (nếu slot vẫn còn Free). Trả về WaitlistEntry id được mời hoặc None.
+    Ứng viên đã có lịch vào giờ đó, hoặc đang giữ quá nhiều slot, được bỏ qua.
+    """
+    if start_time <= timezone.now():
+        return None
+    end_time = start_time + availability.SLOT_DURATION
+    with instrumentation.span('waitlist.match_slot'):
+        candidates = find_candidates(doctor_id, start_time, end_time)
+        while candidates:
+            _, _, entry_id, patient_id = heapq.heappop(candidates)
+            if Appointment.objects.filter(
+                patient_id=patient_id,
+                appointment_time=start_time,
+                status__in=availability.ACTIVE_STATUSES
+            ).exists():
+                continue
+            try:
+                token, held_until = holds.create_hold(patient_id, doctor_id, start_time, seconds=OFFER_SECONDS)
+            except SlotUnavailable:
+                return None # Slot đã có người khác lấy
+            except ValidationError:
+                continue # Bệnh nhân đang giữ quá nhiều slot
+            offered = WaitlistEntry.objects.filter(id=entry_id, status=WaitlistEntry.STATUS_WAITING).update(
+                status=WaitlistEntry.STATUS_OFFERED,
+                hold_token=token,
+                offered_time=start_time,
+                offered_until=held_until
+            )
+            if offered:
+                instrumentation.incr('waitlist:offered')
+                instrumentation.event('waitlist.offered', entry_id=entry_id, doctor_id=doctor_id, slot=start_time.isoformat())
+                return entry_id
+            # Entry vừa bị hủy trong lúc ghép: trả slot lại rồi thử người tiếp theo
+            holds.release_hold(patient_id, token)
+    return None
+
+
+# --- Worker nền ---
+def _run_worker():
+    while True:
+        doctor_id, start_time = _queue.get()
+        try:
+            match_slot(doctor_id, start_time)
+        except Exception:
+            logger.exception("Waitlist match failed for doctor %s at %s", doctor_id, start_time)
+        finally:
+            close_old_connections()
+            _queue.task_done()
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name='waitlist-worker', daemon=True)
+            _worker.start()
+
+
+def _submit(doctor_id, start_time):
+    if not RUN_ASYNC:
+        match_slot(doctor_id, start_time)
+        return
+    _ensure_worker()
+    _queue.put((doctor_id, start_time))
+
+
+def schedule_match(doctor_id, start_time):
+    """Đưa slot vừa trống vào hàng đợi ghép, sau khi transaction hiện tại commit."""
+    transaction.on_commit(lambda: _submit(doctor_id, start_time))
+
+
+def wait_idle():
+    """Chờ worker xử lý hết hàng đợi (dùng trong lệnh quản trị/test)."""
+    if RUN_ASYNC:
+        _queue.join()
+
+
+# --- Vòng đời lời mời ---
+def mark_fulfilled(patient_id, hold_token):
+    """Bệnh nhân đã đặt lịch bằng token của lời mời."""
+    return WaitlistEntry.objects.filter(
+        patient_id=patient_id,
+        hold_token=hold_token,
+        status=WaitlistEntry.STATUS_OFFERED
+    ).update(status=WaitlistEntry.STATUS_FULFILLED)
+
+
+def expire_offers(now=None):
+    """
+    Đánh dấu Expired các lời mời quá hạn và ghép lại slot của chúng cho người tiếp theo.
+    Gọi sau holds.release_expired_holds() để slot đã về Free. Trả về số lời mời hết hạn.
+    """
+    now = now or timezone.now()
+    expired = list(WaitlistEntry.objects.filter(
+        status=WaitlistEntry.STATUS_OFFERED,
+        offered_until__lte=now
+    ).values_list('id', 'doctor_id', 'offered_time'))
+    if not expired:
+        return 0
+    WaitlistEntry.objects.filter(
+        id__in=[entry_id for entry_id, doctor_id, offered_time in expired],
+        status=WaitlistEntry.STATUS_OFFERED
+    ).update(status=WaitlistEntry.STATUS_EXPIRED, hold_token=None)
+    for doctor_id, offered_time in {(doctor_id, offered_time) for entry_id, doctor_id, offered_time in expired}:
+        schedule_match(doctor_id, offered_time)
+    return len(expired)
+
+
+def cancel_entry(entry):
+    """Bệnh nhân rời danh sách chờ; nếu đang có lời mời thì trả slot cho người tiếp theo."""
+    with transaction.atomic():
+        was_offered = entry.status == WaitlistEntry.STATUS_OFFERED and entry.hold_token
+        if was_offered and holds.release_hold(entry.patient_id, entry.hold_token):
+            schedule_match(entry.doctor_id, entry.offered_time)
+        entry.status = WaitlistEntry.STATUS_CANCELLED
+        entry.hold_token = None
+        entry.save(update_fields=['status', 'hold_token'])
@@ -0,0 +1,16 @@
+# benchmarks/__init__.py
+"""
+Benchmark HTTP cho các service. Chỉ dùng thư viện chuẩn (urllib + thread), chạy từ thư mục gốc repo:
+    python -m benchmarks.async_views --help
+    python -m benchmarks.suite --help
+    python -m benchmarks.compare --help
+
+Dữ liệu giả lập (bulk_create, --scale 0.01 để chạy thử nhanh), theo thứ tự vì 2 service sau dùng dải ID của user_service:
+    python manage.py generate_benchmark_data --manifest bench.json # 10k bác sĩ + 100k bệnh nhân
+    cd appointment_service && python manage.py generate_benchmark_data # 1M lịch hẹn, lịch làm việc/slot 7 ngày tới
+    cd clinical_service && python manage.py generate_benchmark_data # 1M chẩn đoán, 5M dòng thuốc
+Lệnh của clinical_service cũng gán version hồ sơ, đếm lại ICD-10 và dựng EHR snapshot như đường ghi thật;
+nạp danh mục (load_icd10) trước khi sinh, nếu không số đếm ICD-10 để trống.
+Mặc định dùng SQLite của từng service; đặt POSTGRES_DB (và POSTGRES_USER/PASSWORD/HOST/PORT) để dùng Postgres local.
+Khi đo, chạy các service với BENCHMARK_MODE=1 (tắt throttle, thêm header X-DB-Queries) rồi chạy benchmarks.suite.
+"""
@@ -0,0 +1,65 @@
+# benchmarks/async_views.py
+"""
+So sánh throughput bản sync và async của các endpoint đọc nhiều trong appointment_service.
+
+1. Chạy service dưới ASGI (cả 2 bản chạy trong cùng 1 process để so sánh công bằng):
+       cd appointment_service && uvicorn appointment_service.asgi:application --workers 1
+2. Lấy access token của 1 bệnh nhân từ user_service, rồi:
+       python -m benchmarks.async_views --token <access> --doctor-id 1 --date 2025-05-10 \
+           --concurrency 10 50 200 --output results.json
+Mỗi cặp (sync, async) chạy với từng mức concurrency; in bảng throughput/p50/p99 và ghi JSON nếu có --output.
+"""
+import argparse
+import json
+import sys
+from urllib.parse import urlencode
+
+from . import loadgen
+
+# (tên, đường dẫn sync, đường dẫn async, hàm dựng query string)
+ENDPOINTS = [
+    ('schedules', 'schedules/', 'async/schedules/',
+     lambda args: {'doctor_id': args.doctor_id, 'start_date': args.date, 'end_date': args.date}),
+    ('available-slots', 'available-slots/', 'async/available-slots/',
+     lambda args: {'doctor_id': args.doctor_id, 'date': args.date}),
+    ('my-appointments', 'my-appointments/', 'async/my-appointments/',
+     lambda args: {'page_size': 50}),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000/api/v1/appointments/')
+    parser.add_argument('--token', required=True, help="Access token JWT của một bệnh nhân (role Patient)")
+    parser.add_argument('--doctor-id', type=int, required=True)
+    parser.add_argument('--date', required=True, help="YYYY-MM-DD, không ở quá khứ")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--duration', type=float, default=10.0, help="Số giây mỗi lượt chạy")
+    parser.add_argument('--only', choices=[name for name, *_ in ENDPOINTS], action='append')
+    parser.add_argument('--output', help="Ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    headers = {'Authorization': f'Bearer {args.token}'}
+    results = []
+    for name, sync_path, async_path, params in ENDPOINTS:
+        if args.only and name not in args.only:
+            continue
+        query = urlencode(params(args))
+        for concurrency in args.concurrency:
+            for variant, path in (('sync', sync_path), ('async', async_path)):
+                url = f'{args.base_url}{path}?{query}'
+                summary = loadgen.run([url], concurrency=concurrency, duration=args.duration, headers=headers)
+                summary.update(endpoint=name, variant=variant, concurrency=concurrency)
+                results.append(summary)
+                print(f"{name:16} {variant:5} c={concurrency:<4} {summary['throughput_rps']} req/s "
+                      f"p50={summary['latency_ms']['p50']}ms p99={summary['latency_ms']['p99']}ms "
+                      f"errors={summary['errors']}", file=sys.stderr)
+
+    if args.output:
+        loadgen.write_results(args.output, results)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
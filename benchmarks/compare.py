@@ -0,0 +1,55 @@
+# benchmarks/compare.py
+"""
+So sánh 2 file kết quả của benchmarks/suite.py (ví dụ trước và sau một commit):
+    python -m benchmarks.compare results/baseline.json results/new.json
+In bảng theo (kịch bản, concurrency): throughput, p50/p95/p99 và số query trung bình, kèm % thay đổi.
+"""
+import argparse
+import json
+
+METRICS = [
+    ('req/s', lambda run: run['throughput_rps']),
+    ('p50', lambda run: run['latency_ms']['p50']),
+    ('p95', lambda run: run['latency_ms']['p95']),
+    ('p99', lambda run: run['latency_ms']['p99']),
+    ('queries', lambda run: (run.get('db_queries') or {}).get('mean')),
+]
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        results = json.load(f)
+    return results.get('meta', {}), {(run['scenario'], run['concurrency']): run for run in results['runs']}
+
+
+def change(old, new):
+    if old is None or new is None:
+        return ''
+    if not old:
+        return '' if not new else '+inf'
+    return f'{(new - old) / old * 100:+.1f}%'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    args = parser.parse_args(argv)
+
+    base_meta, base = load(args.baseline)
+    new_meta, new = load(args.candidate)
+    print(f"baseline:  {base_meta.get('label') or args.baseline} ({base_meta.get('commit')})")
+    print(f"candidate: {new_meta.get('label') or args.candidate} ({new_meta.get('commit')})")
+    print(f"{'scenario':10}{'c':>5}  " + ''.join(f'{name:>26}' for name, _ in METRICS))
+    for key in sorted(base.keys() | new.keys()):
+        old_run, new_run = base.get(key), new.get(key)
+        cells = []
+        for _, metric in METRICS:
+            old = metric(old_run) if old_run else None
+            value = metric(new_run) if new_run else None
+            cells.append(f"{old if old is not None else '-'} -> {value if value is not None else '-'} {change(old, value):>8}")
+        print(f'{key[0]:10}{key[1]:>5}  ' + ''.join(f'{cell:>26}' for cell in cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# benchmarks/loadgen.py
+"""
+Bộ sinh tải HTTP đơn giản: N client đồng thời (thread) gửi request liên tục trong D giây,
+đo throughput, phân vị độ trễ, phân bố status và số query DB mỗi request (header X-DB-Queries).
+"""
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(sorted_values, p):
+    """Phân vị p (0-100) của danh sách đã sắp xếp, nội suy tuyến tính."""
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (k - low)
+
+
+def summarize(latencies_ms, errors, elapsed, statuses=None, queries=None):
+    latencies_ms = sorted(latencies_ms)
+    summary = {
+        'requests': len(latencies_ms),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies_ms) / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            f'p{p}': round(percentile(latencies_ms, p), 2) if latencies_ms else None
+            for p in (50, 90, 95, 99)
+        },
+        'max_ms': round(latencies_ms[-1], 2) if latencies_ms else None,
+    }
+    if statuses is not None:
+        summary['statuses'] = {str(code): count for code, count in sorted(statuses.items())}
+    if queries is not None:
+        # Số query DB mỗi request, đọc từ header X-DB-Queries (server chạy với BENCHMARK_MODE=1)
+        queries = sorted(queries)
+        summary['db_queries'] = {
+            'mean': round(sum(queries) / len(queries), 2),
+            'p50': percentile(queries, 50),
+            'p95': percentile(queries, 95),
+            'max': queries[-1],
+        } if queries else None
+    return summary
+
+
+def run_requests(make_request, concurrency=50, duration=10.0, timeout=30.0, expected_statuses=None):
+    """
+    `concurrency` client đồng thời, mỗi client gọi `make_request(rng)` -> urllib.request.Request
+    rồi gửi đi, lặp lại trong `duration` giây (rng: random.Random riêng của client).
+    Status nằm trong `expected_statuses` (mặc định: mọi 2xx) được tính vào độ trễ; còn lại và lỗi mạng
+    được đếm vào errors. Kết quả có thêm số lượng theo status và thống kê header X-DB-Queries.
+    """
+    deadline = time.perf_counter() + duration
+    lock = threading.Lock()
+    latencies, queries, errors, statuses = [], [], [0], Counter()
+
+    def expected(code):
+        return code in expected_statuses if expected_statuses else 200 <= code < 300
+
+    def client(index):
+        rng = random.Random(index)
+        local, local_queries, local_statuses, failed = [], [], Counter(), 0
+        while time.perf_counter() < deadline:
+            request = make_request(rng)
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+                    code, count = response.status, response.headers.get('X-DB-Queries')
+            except urllib.error.HTTPError as exc:
+                exc.read()
+                code, count = exc.code, exc.headers.get('X-DB-Queries')
+            except (urllib.error.URLError, OSError):
+                failed += 1
+                continue
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            local_statuses[code] += 1
+            if not expected(code):
+                failed += 1
+                continue
+            local.append(elapsed_ms)
+            if count is not None:
+                local_queries.append(int(count))
+        with lock:
+            latencies.extend(local)
+            queries.extend(local_queries)
+            statuses.update(local_statuses)
+            errors[0] += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    return summarize(latencies, errors[0], time.perf_counter() - started, statuses, queries)
+
+
+def json_request(url, method='GET', body=None, headers=None):
+    """Request JSON cho run_requests (body là dict, được mã hóa JSON)."""
+    headers = dict(headers or {})
+    data = None
+    if body is not None:
+        data = json.dumps(body).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    return urllib.request.Request(url, data=data, headers=headers, method=method)
+
+
+def run(urls, concurrency=50, duration=10.0, headers=None, timeout=30.0):
+    """
+    Gọi lần lượt (xoay vòng) các URL với `concurrency` client đồng thời trong `duration` giây.
+    Response khác 2xx hoặc lỗi mạng được đếm vào errors và không tính vào độ trễ.
+    """
+    headers = headers or {}
+    counter = itertools.count()
+
+    def make_request(rng):
+        return urllib.request.Request(urls[next(counter) % len(urls)], headers=headers)
+
+    summary = run_requests(make_request, concurrency=concurrency, duration=duration, timeout=timeout)
+    # Giữ nguyên định dạng kết quả cũ (benchmarks/async_views.py)
+    del summary['statuses']
+    if summary['db_queries'] is None:
+        del summary['db_queries']
+    return summary
+
+
+def write_results(path, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,137 @@
+# benchmarks/scenarios.py
+"""
+Các kịch bản tải cho benchmarks/suite.py. Mỗi kịch bản nhận Context (URL các service, dải ID bác sĩ/bệnh nhân
+do generate_benchmark_data sinh ra, token đã cấp sẵn) và trả về (make_request, expected_statuses) cho loadgen.run_requests.
+"""
+import json
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from . import loadgen
+
+SLOT_MINUTES = 30
+SHIFT_START, SHIFT_SLOTS = time(8), 8 # Ca 08:00 - 12:00 như generate_benchmark_data của appointment_service
+
+
+@dataclass
+class Context:
+    user_url: str # http://127.0.0.1:8000/api/v1/
+    appointment_url: str # http://127.0.0.1:8001/api/v1/appointments/
+    clinical_url: str # http://127.0.0.1:8002/api/v1/clinical/
+    doctor_ids: range
+    patient_ids: range
+    password: str
+    days_ahead: int = 7
+    timezone: str = 'Asia/Ho_Chi_Minh'
+    tokens: dict = field(default_factory=dict) # patient_id -> access token (issue_tokens)
+    token_ids: list = field(default_factory=list)
+
+    def patient_username(self, patient_id):
+        # bench_patient_N đánh số từ 1 theo thứ tự ID (user_service tạo liên tiếp)
+        return f'bench_patient_{patient_id - self.patient_ids.start + 1}'
+
+    def today(self):
+        return datetime.now(ZoneInfo(self.timezone)).date()
+
+    def future_day(self, rng):
+        return self.today() + timedelta(days=rng.randint(1, self.days_ahead))
+
+    def auth(self, rng):
+        """(patient_id, header Authorization) của một bệnh nhân ngẫu nhiên trong nhóm đã có token."""
+        patient_id = rng.choice(self.token_ids)
+        return patient_id, {'Authorization': f'Bearer {self.tokens[patient_id]}'}
+
+
+# --- Kịch bản ---
+def token(ctx):
+    """Cấp token (POST /token/) cho bệnh nhân ngẫu nhiên: chủ yếu đo chi phí băm mật khẩu + truy vấn user."""
+    def make_request(rng):
+        patient_id = rng.choice(ctx.patient_ids)
+        body = {'username': ctx.patient_username(patient_id), 'password': ctx.password}
+        return loadgen.json_request(f'{ctx.user_url}token/', 'POST', body)
+    return make_request, None
+
+
+def slots(ctx):
+    """Xem slot trống của bác sĩ ngẫu nhiên trong một ngày sắp tới."""
+    def make_request(rng):
+        _, headers = ctx.auth(rng)
+        url = f'{ctx.appointment_url}available-slots/?doctor_id={rng.choice(ctx.doctor_ids)}&date={ctx.future_day(rng).isoformat()}'
+        return loadgen.json_request(url, headers=headers)
+    return make_request, None
+
+
+def booking(ctx):
+    """
+    Đặt lịch vào slot ngẫu nhiên trong ca làm việc của bác sĩ ngẫu nhiên. Slot đã bị chiếm / bệnh nhân đã có
+    lịch cùng giờ -> 409, là kết quả hợp lệ (đo cả đường từ chối), nên không tính là lỗi.
+    """
+    zone = ZoneInfo(ctx.timezone)
+
+    def make_request(rng):
+        _, headers = ctx.auth(rng)
+        moment = datetime.combine(ctx.future_day(rng), SHIFT_START, tzinfo=zone) + timedelta(
+            minutes=SLOT_MINUTES * rng.randrange(SHIFT_SLOTS)
+        )
+        body = {'doctor_id': rng.choice(ctx.doctor_ids), 'appointment_time': moment.isoformat(), 'reason': 'Benchmark'}
+        return loadgen.json_request(f'{ctx.appointment_url}book/', 'POST', body, headers)
+    return make_request, {201, 409}
+
+
+def ehr(ctx):
+    """Bệnh nhân đọc hồ sơ EHR của chính mình."""
+    def make_request(rng):
+        patient_id, headers = ctx.auth(rng)
+        return loadgen.json_request(f'{ctx.clinical_url}ehr/patient/{patient_id}/', headers=headers)
+    return make_request, None
+
+
+def ehr_snapshot(ctx):
+    """Bệnh nhân đọc toàn bộ hồ sơ từ bản dựng sẵn (?snapshot=1), nhận gzip như trình duyệt/app."""
+    def make_request(rng):
+        patient_id, headers = ctx.auth(rng)
+        headers['Accept-Encoding'] = 'gzip'
+        return loadgen.json_request(f'{ctx.clinical_url}ehr/patient/{patient_id}/?snapshot=1', headers=headers)
+    return make_request, None
+
+
+# Tên thuốc để mô phỏng gõ dần từng ký tự (danh mục nạp bằng manage.py load_medications của clinical_service)
+TYPED_NAMES = ['paracetamol', 'amoxicillin', 'ibuprofen', 'omeprazole', 'metformin', 'amlodipine', 'cetirizine', 'salbutamol']
+
+
+def medication_autocomplete(ctx):
+    """Bác sĩ gõ tên thuốc: mỗi request là 1 tiền tố dài 1-6 ký tự của một tên thuốc."""
+    def make_request(rng):
+        _, headers = ctx.auth(rng)
+        prefix = rng.choice(TYPED_NAMES)[:rng.randint(1, 6)]
+        return loadgen.json_request(f'{ctx.clinical_url}medications/autocomplete/?q={prefix}', headers=headers)
+    return make_request, None
+
+
+SCENARIOS = {
+    'token': token,
+    'slots': slots,
+    'booking': booking,
+    'ehr': ehr,
+    'ehr_snapshot': ehr_snapshot,
+    'medication_autocomplete': medication_autocomplete,
+}
+# Kịch bản cần token bệnh nhân cấp sẵn
+NEEDS_TOKENS = {'slots', 'booking', 'ehr', 'ehr_snapshot', 'medication_autocomplete'}
+
+
+def issue_tokens(ctx, patient_ids, concurrency=8, timeout=30.0):
+    """Cấp sẵn access token cho các bệnh nhân (đồng thời), ghi vào ctx.tokens. Trả về số token lấy được."""
+    def obtain(patient_id):
+        body = {'username': ctx.patient_username(patient_id), 'password': ctx.password}
+        request = loadgen.json_request(f'{ctx.user_url}token/', 'POST', body)
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return patient_id, json.load(response)['access']
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        ctx.tokens.update(pool.map(obtain, patient_ids))
+    ctx.token_ids = sorted(ctx.tokens)
+    return len(ctx.tokens)
@@ -0,0 +1,106 @@
+# benchmarks/suite.py
+"""
+Chạy các kịch bản tải (benchmarks/scenarios.py) lên 3 service và ghi kết quả JSON để so sánh giữa các commit.
+
+1. Sinh dữ liệu (xem benchmarks/__init__.py), ví dụ --manifest bench.json ở user_service.
+2. Chạy 3 service với BENCHMARK_MODE=1 (tắt throttle, thêm header X-DB-Queries), rồi:
+       python -m benchmarks.suite --manifest bench.json --scenario slots booking ehr token \
+           --concurrency 10 50 --duration 20 --label baseline --output results/baseline.json
+3. So sánh: python -m benchmarks.compare results/baseline.json results/new.json
+"""
+import argparse
+import json
+import random
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+from . import loadgen, scenarios
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def id_range(value):
+    """'101-1100' -> range(101, 1101)."""
+    first, last = value.split('-')
+    return range(int(first), int(last) + 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user-url', default='http://127.0.0.1:8000/api/v1/')
+    parser.add_argument('--appointment-url', default='http://127.0.0.1:8001/api/v1/appointments/')
+    parser.add_argument('--clinical-url', default='http://127.0.0.1:8002/api/v1/clinical/')
+    parser.add_argument('--manifest', help="File JSON ghi bởi `manage.py generate_benchmark_data --manifest` của user_service")
+    parser.add_argument('--doctor-ids', type=id_range, help="Dải ID bác sĩ, ví dụ 1-100 (thay cho --manifest)")
+    parser.add_argument('--patient-ids', type=id_range, help="Dải ID bệnh nhân, ví dụ 101-1100 (thay cho --manifest)")
+    parser.add_argument('--password', help="Mật khẩu chung của user benchmark (mặc định lấy từ manifest)")
+    parser.add_argument('--days-ahead', type=int, default=7, help="Số ngày tới có lịch làm việc (như lúc sinh dữ liệu)")
+    parser.add_argument('--scenario', nargs='+', choices=list(scenarios.SCENARIOS), default=list(scenarios.SCENARIOS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--duration', type=float, default=10.0, help="Số giây mỗi lượt chạy")
+    parser.add_argument('--token-pool', type=int, default=200, help="Số bệnh nhân được cấp token sẵn cho các kịch bản cần đăng nhập")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--label', help="Nhãn của lần chạy (ví dụ tên nhánh)")
+    parser.add_argument('--output', help="Ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    manifest = {}
+    if args.manifest:
+        with open(args.manifest, encoding='utf-8') as f:
+            manifest = json.load(f)
+    doctor_ids = args.doctor_ids or (id_range('{}-{}'.format(*manifest['doctor_ids'])) if manifest.get('doctor_ids') else None)
+    patient_ids = args.patient_ids or (id_range('{}-{}'.format(*manifest['patient_ids'])) if manifest.get('patient_ids') else None)
+    if not doctor_ids or not patient_ids:
+        parser.error("Cần --manifest hoặc cả --doctor-ids và --patient-ids.")
+
+    ctx = scenarios.Context(
+        user_url=args.user_url, appointment_url=args.appointment_url, clinical_url=args.clinical_url,
+        doctor_ids=doctor_ids, patient_ids=patient_ids,
+        password=args.password or manifest.get('password', 'benchmark'), days_ahead=args.days_ahead,
+    )
+    if scenarios.NEEDS_TOKENS.intersection(args.scenario):
+        pool = random.Random(args.seed).sample(patient_ids, min(args.token_pool, len(patient_ids)))
+        print(f"Cấp token cho {len(pool)} bệnh nhân...", file=sys.stderr)
+        scenarios.issue_tokens(ctx, pool)
+
+    runs = []
+    for name in args.scenario:
+        make_request, expected = scenarios.SCENARIOS[name](ctx)
+        for concurrency in args.concurrency:
+            summary = loadgen.run_requests(make_request, concurrency=concurrency, duration=args.duration, expected_statuses=expected)
+            summary.update(scenario=name, concurrency=concurrency)
+            runs.append(summary)
+            queries = summary['db_queries'] or {}
+            print(f"{name:8} c={concurrency:<4} {summary['throughput_rps']} req/s "
+                  f"p50={summary['latency_ms']['p50']}ms p95={summary['latency_ms']['p95']}ms "
+                  f"p99={summary['latency_ms']['p99']}ms queries={queries.get('mean')} "
+                  f"errors={summary['errors']} statuses={summary['statuses']}", file=sys.stderr)
+
+    results = {
+        'meta': {
+            'label': args.label,
+            'commit': git_commit(),
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'doctors': len(doctor_ids),
+            'patients': len(patient_ids),
+            'duration_s': args.duration,
+            'token_pool': len(ctx.tokens),
+        },
+        'runs': runs,
+    }
+    if args.output:
+        loadgen.write_results(args.output, results)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
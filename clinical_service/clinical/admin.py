@@ -1,6 +1,6 @@
 # clinical/admin.py
 from django.contrib import admin
-from .models import Diagnosis, Prescription, PrescribedMedication, LabOrder
+from .models import Diagnosis, Prescription, PrescribedMedication, LabOrder, IcdCode, Medication, OutboxEvent
 
 # Inline admin cho PrescribedMedication để hiển thị trong Prescription
 class PrescribedMedicationInline(admin.TabularInline): # TabularInline hiển thị dạng bảng
@@ -45,7 +45,7 @@ class DiagnosisAdmin(admin.ModelAdmin):
     list_filter = ('diagnosis_time', 'doctor_id')
     search_fields = ('appointment_id', 'patient_id', 'doctor_id', 'diagnosis_code', 'description')
     inlines = [PrescriptionInline, LabOrderInline] # Hiển thị Đơn thuốc và Yêu cầu XN inline
-    readonly_fields = ('diagnosis_time',)
+    readonly_fields = ('diagnosis_time', 'version')
 
 @admin.register(LabOrder)
 class LabOrderAdmin(admin.ModelAdmin):
@@ -55,4 +55,28 @@ class LabOrderAdmin(admin.ModelAdmin):
     list_editable = ('status',) # Cho phép sửa status từ danh sách
     readonly_fields = ('order_time',)
 
+@admin.register(Medication)
+class MedicationAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'generic_name', 'strength', 'form', 'is_active')
+    list_filter = ('is_active', 'form')
+    # Tìm theo tiền tố (istartswith) để dùng được index, không quét cả danh mục
+    search_fields = ('=code', '^name', '^generic_name')
+    readonly_fields = ('loaded_version',)
+
+@admin.register(IcdCode)
+class IcdCodeAdmin(admin.ModelAdmin):
+    list_display = ('code', 'level', 'title', 'parent_code')
+    list_filter = ('level',)
+    search_fields = ('=code', '^title')
+    # Cây và khoảng mã do load_icd10 tính; sửa tay dễ làm lệch số đếm theo nút
+    readonly_fields = ('parent_code', 'range_start', 'range_end', 'loaded_version')
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'key', 'created_at', 'published_at', 'attempts')
+    list_filter = ('event_type',)
+    search_fields = ('key', 'event_type')
+    # Hàng đợi của publish_outbox, chỉ để theo dõi (attempts/last_error cho sự kiện bị kẹt)
+    readonly_fields = ('event_type', 'key', 'payload', 'created_at', 'published_at', 'attempts', 'last_error')
+
 # Không cần đăng ký PrescribedMedication riêng vì đã inline
\ No newline at end of file
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ClinicalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clinical'
+
+    def ready(self):
+        # Đăng ký signals để tăng phiên bản hồ sơ EHR (clinical/sync.py)
+        from . import signals  # noqa: F401
@@ -0,0 +1,188 @@
+# clinical/catalog.py
+"""
+Danh mục dùng chung (thuốc...) và chỉ mục tra cứu trong bộ nhớ của từng process.
+
+- Mỗi danh mục có 1 version (CatalogVersion), tăng khi danh mục thay đổi: lệnh nạp tăng 1 lần cho cả lô,
+  sửa từng dòng (admin...) tăng qua signal (clinical/signals.py).
+- CachedIndex giữ chỉ mục đã dựng và so version với DB tối đa mỗi CATALOG_CHECK_SECONDS giây;
+  version khác thì dựng lại. Giữa 2 lần kiểm tra, tra cứu không chạm DB.
+- Gợi ý thuốc (medications/autocomplete/): PrefixIndex là mảng khóa đã sắp xếp + bisect, mỗi lần tra
+  O(log n + limit), thay cho LIKE '%x%' quét cả bảng.
+"""
+import csv
+import json
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import CatalogVersion, Medication
+
+MEDICATIONS = 'medications'
+
+
+# --- Version ---
+def current_version(name):
+    version = CatalogVersion.objects.filter(name=name).values_list('version', flat=True).first()
+    return 0 if version is None else version
+
+
+def next_version(name):
+    """Tăng version của danh mục, trả về version mới. Gọi trong transaction của thay đổi dữ liệu."""
+    versions = CatalogVersion.objects.filter(name=name)
+    if not versions.update(version=F('version') + 1):
+        try:
+            with transaction.atomic():
+                return CatalogVersion.objects.create(name=name, version=1).version
+        except IntegrityError:
+            # Transaction khác vừa tạo dòng này
+            versions.update(version=F('version') + 1)
+    return versions.values_list('version', flat=True).get()
+
+
+# --- Đọc file danh mục (lệnh load_medications, load_icd10) ---
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        # Dòng 1 là tiêu đề; dòng dữ liệu đầu tiên là dòng 2 của file
+        yield from enumerate(csv.DictReader(file), start=2)
+
+
+def read_json(path):
+    """Mảng JSON các object, hoặc JSON Lines (mỗi dòng 1 object, đọc dần không cần nạp cả file)."""
+    if path.suffix in ('.jsonl', '.ndjson'):
+        with open(path, encoding='utf-8') as file:
+            for number, line in enumerate(file, start=1):
+                if line.strip():
+                    yield number, json.loads(line)
+        return
+    with open(path, encoding='utf-8') as file:
+        data = json.load(file)
+    if not isinstance(data, list):
+        raise CommandError("File JSON phải là một mảng các object.")
+    yield from enumerate(data, start=1)
+
+
+def read_rows(path, file_format=None):
+    """(số dòng, object) của file .csv/.json/.jsonl; file_format mặc định đoán theo đuôi file."""
+    path = Path(path)
+    if not path.exists():
+        raise CommandError(f"Không tìm thấy file {path}.")
+    file_format = file_format or ('csv' if path.suffix == '.csv' else 'json')
+    return (read_csv if file_format == 'csv' else read_json)(path)
+
+
+# --- Chỉ mục trong bộ nhớ ---
+def normalize(text):
+    """Khóa so khớp: chữ thường, bỏ dấu (kể cả đ), gộp khoảng trắng. 'Ibuprofen  Đa' -> 'ibuprofen da'."""
+    if text.isascii(): # Phần lớn tên thuốc: bỏ qua bước tách dấu
+        return ' '.join(text.lower().split())
+    text = unicodedata.normalize('NFKD', text.casefold().replace('đ', 'd'))
+    return ' '.join(''.join(ch for ch in text if not unicodedata.combining(ch)).split())
+
+
+class PrefixIndex:
+    """Tra theo tiền tố trên mảng khóa đã sắp xếp. keys: [(khóa, vị trí entry)], mỗi entry có thể có nhiều khóa."""
+
+    def __init__(self, keys):
+        keys = sorted(keys)
+        self._keys = [key for key, _ in keys]
+        self._positions = [position for _, position in keys]
+
+    def search(self, prefix, limit, exclude=()):
+        """Vị trí của tối đa `limit` entry có khóa bắt đầu bằng `prefix` (đã normalize), theo thứ tự khóa, không trùng."""
+        results, seen = [], set(exclude)
+        start = bisect_left(self._keys, prefix)
+        for index in range(start, len(self._keys)):
+            if len(results) >= limit or not self._keys[index].startswith(prefix):
+                break
+            position = self._positions[index]
+            if position not in seen:
+                seen.add(position)
+                results.append(position)
+        return results
+
+
+class CachedIndex:
+    """Chỉ mục dựng từ 1 danh mục, dựng lại khi version của danh mục đổi. build(version) -> chỉ mục."""
+
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+        self._lock = threading.Lock()
+        self._current, self._checked_at = None, 0.0 # (version, chỉ mục): đổi cả cặp trong 1 phép gán
+
+    def get(self):
+        """(version, chỉ mục) hiện tại."""
+        current = self._current
+        if current is not None and time.monotonic() - self._checked_at < getattr(settings, 'CATALOG_CHECK_SECONDS', 5):
+            return current
+        # Đã có chỉ mục mà thread khác đang kiểm tra/dựng lại: dùng tạm chỉ mục cũ thay vì chờ
+        if not self._lock.acquire(blocking=current is None):
+            return current
+        try:
+            # Version đọc trước dữ liệu: chỉ mục không bao giờ cũ hơn version nó mang
+            version = current_version(self.name)
+            if self._current is None or self._current[0] != version:
+                self._current = (version, self.build(version))
+            self._checked_at = time.monotonic()
+            return self._current
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        with self._lock:
+            self._current, self._checked_at = None, 0.0
+
+
+# --- Danh mục thuốc ---
+class MedicationIndex:
+    """
+    Gợi ý thuốc theo tiền tố của tên, hoạt chất hoặc mã. Thuốc khớp từ đầu tên đứng trước,
+    sau đó là khớp từ đầu một từ khác trong tên/hoạt chất ('clav' -> 'Amoxicillin Clavulanic Acid').
+    """
+    fields = ('id', 'code', 'name', 'generic_name', 'strength', 'form')
+
+    def __init__(self, rows):
+        entries, primary, secondary = [], [], []
+        for position, row in enumerate(rows):
+            entry = dict(zip(self.fields, row))
+            entries.append(entry)
+            name = normalize(entry['name'])
+            primary.append((name, position))
+            primary.append((normalize(entry['code']), position))
+            for text in (name, normalize(entry['generic_name'])):
+                if not text:
+                    continue
+                words = text.split(' ')
+                # Mỗi hậu tố bắt đầu từ 1 từ: khớp được cả 'clavulanic acid'
+                for start in range(1 if text == name else 0, len(words)):
+                    secondary.append((' '.join(words[start:]), position))
+        self.entries = entries
+        self._primary = PrefixIndex(primary)
+        self._secondary = PrefixIndex(secondary)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, query, limit):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        positions = self._primary.search(prefix, limit)
+        if len(positions) < limit:
+            positions += self._secondary.search(prefix, limit - len(positions), exclude=positions)
+        return [self.entries[position] for position in positions]
+
+
+def build_medication_index(version):
+    rows = Medication.objects.filter(is_active=True).order_by('id').values_list(*MedicationIndex.fields)
+    return MedicationIndex(rows.iterator(chunk_size=10000))
+
+
+medication_index = CachedIndex(MEDICATIONS, build_medication_index)
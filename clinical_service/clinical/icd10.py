@@ -0,0 +1,203 @@
+# clinical/icd10.py
+"""
+Danh mục ICD-10 (IcdCode): cây chương -> nhóm -> loại -> mã, nạp bằng `manage.py load_icd10`.
+
+- Mã được chuẩn hóa ('j069' -> 'J06.9'). Mỗi nút ứng với 1 khoảng chuỗi [range_start, range_end):
+  'J06' -> ['J06', 'J07'), 'J00-J06' -> ['J00', 'J07'), chương 'J00-J99' -> ['J00', 'J9:').
+  Vì mã chuẩn sắp xếp theo thứ tự chuỗi, "mọi chẩn đoán J06.*" là 1 range scan trên index
+  (diagnosis_code, diagnosis_time) thay vì LIKE 'J06%' trên dữ liệu không chuẩn.
+- Bảng tra trong bộ nhớ (IcdTable, dựng lại khi version danh mục đổi, xem clinical/catalog.py) dùng để
+  kiểm tra mã khi tạo chẩn đoán và tìm nút/nút cha mà không query DB.
+- Số chẩn đoán theo tháng của từng nút (IcdTally, đã cộng cả nhánh con) được cập nhật sau khi transaction
+  ghi chẩn đoán commit; lỗi chỉ ghi log, `manage.py check_icd_tallies --fix` đếm lại từ bảng Diagnosis
+  (cũng cần sau khi ghi chẩn đoán bằng bulk_create, ví dụ generate_benchmark_data).
+- Chưa nạp danh mục thì không kiểm tra mã, không đếm.
+"""
+import logging
+import re
+from collections import Counter, namedtuple
+from datetime import date
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import catalog
+from .models import Diagnosis, IcdCode, IcdTally
+
+logger = logging.getLogger(__name__)
+
+ICD10 = 'icd10'
+# Mức được dùng làm mã chẩn đoán (chương/nhóm chỉ để gom nhóm)
+DIAGNOSIS_LEVELS = (IcdCode.LEVEL_CATEGORY, IcdCode.LEVEL_CODE)
+
+_CODE = re.compile(r'^([A-Z][0-9][0-9A-Z])\.?([0-9A-Z]{1,4})?$')
+_BLOCK = re.compile(r'^([A-Z][0-9][0-9A-Z])-([A-Z][0-9][0-9A-Z])$')
+
+
+# --- Mã chuẩn và khoảng mã ---
+def canonical(code):
+    """'j069 ' -> 'J06.9', 'J06' -> 'J06', 'j00 - j06' -> 'J00-J06'. Chuỗi khác (số chương...) chỉ bỏ khoảng trắng, viết hoa."""
+    code = ''.join(code.split()).upper()
+    match = _CODE.match(code)
+    if match:
+        return match.group(1) + (f'.{match.group(2)}' if match.group(2) else '')
+    return code
+
+
+def upper_bound(code):
+    """Chuỗi nhỏ nhất lớn hơn mọi mã bắt đầu bằng `code`: 'J06' -> 'J07', 'J99' -> 'J9:'."""
+    return code[:-1] + chr(ord(code[-1]) + 1)
+
+
+def code_range(code, level, range_text=''):
+    """[start, end) của nút. Chương cần range_text dạng 'J00-J99'; nhóm lấy từ chính mã của nó."""
+    if level in DIAGNOSIS_LEVELS:
+        return code, upper_bound(code)
+    match = _BLOCK.match(canonical(range_text or code))
+    if not match:
+        raise ValueError(f"{code}: cần khoảng mã dạng 'J00-J99'")
+    return match.group(1), upper_bound(match.group(2))
+
+
+def month_of(moment):
+    """Ngày đầu tháng (giờ địa phương) của một thời điểm."""
+    return timezone.localtime(moment).date().replace(day=1)
+
+
+# --- Bảng tra trong bộ nhớ ---
+Node = namedtuple('Node', ['code', 'level', 'title', 'parent_code', 'range_start', 'range_end'])
+
+
+class IcdTable:
+    fields = Node._fields
+
+    def __init__(self, rows):
+        self.nodes = {}
+        self.children = {}
+        for row in rows: # Đã sắp xếp theo range_start: danh sách con theo thứ tự mã
+            node = Node(*row)
+            self.nodes[node.code] = node
+            self.children.setdefault(node.parent_code, []).append(node.code)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get(self, code):
+        return self.nodes.get(canonical(code))
+
+    def roots(self):
+        return self.children.get('', [])
+
+    def lineage(self, code):
+        """Nút chứa mã chẩn đoán này và các nút cha tới chương. Mã chi tiết chưa có trong danh mục thì tính vào loại của nó."""
+        code = canonical(code)
+        node = self.nodes.get(code) or self.nodes.get(code[:3])
+        chain = []
+        while node is not None and len(chain) < 10: # Chặn vòng lặp nếu dữ liệu nạp sai
+            chain.append(node.code)
+            node = self.nodes.get(node.parent_code)
+        return chain
+
+
+def build_table(version):
+    rows = IcdCode.objects.order_by('range_start', '-range_end').values_list(*IcdTable.fields)
+    return IcdTable(rows.iterator(chunk_size=10000))
+
+
+table = catalog.CachedIndex(ICD10, build_table)
+
+
+# --- Số chẩn đoán theo nút ---
+def deltas(changes, lookup):
+    """changes: [(mã chẩn đoán, thời điểm, +1/-1)] -> Counter {(nút, tháng): thay đổi}."""
+    result = Counter()
+    for code, moment, step in changes:
+        if not code or moment is None:
+            continue
+        month = month_of(moment)
+        for node in lookup.lineage(code):
+            result[node, month] += step
+    return result
+
+
+def apply(counts):
+    """Cộng dồn Counter {(nút, tháng): thay đổi} vào IcdTally."""
+    for (code, month), step in sorted(counts.items()):
+        if not step:
+            continue
+        tallies = IcdTally.objects.filter(code=code, month=month)
+        if tallies.update(count=F('count') + step):
+            continue
+        try:
+            with transaction.atomic():
+                IcdTally.objects.create(code=code, month=month, count=step)
+        except IntegrityError:
+            # Transaction khác vừa tạo dòng này
+            tallies.update(count=F('count') + step)
+
+
+def schedule_count(changes):
+    """
+    Cập nhật số đếm sau khi transaction ghi chẩn đoán commit (gọi từ clinical/signals.py), để dòng đếm
+    của chương/nhóm không bị khóa suốt transaction của từng bác sĩ. Ngoài transaction thì chạy ngay.
+    """
+    def run():
+        try:
+            _, lookup = table.get()
+            if len(lookup):
+                apply(deltas(changes, lookup))
+        except Exception:
+            logger.exception("Failed to update ICD-10 tallies for %s", changes)
+    transaction.on_commit(run)
+
+
+def compute(lookup):
+    """Đếm lại toàn bộ từ bảng Diagnosis: Counter {(nút, tháng): số chẩn đoán}."""
+    counts = Counter()
+    # TruncMonth theo TIME_ZONE, giống month_of()
+    rows = (
+        Diagnosis.objects.exclude(diagnosis_code__isnull=True).exclude(diagnosis_code='')
+        .annotate(month=TruncMonth('diagnosis_time', output_field=DateField())).values_list('diagnosis_code', 'month')
+        .annotate(total=Count('id')).order_by()
+    )
+    for code, month, total in rows:
+        for node in lookup.lineage(code):
+            counts[node, month] += total
+    return counts
+
+
+def stored():
+    return Counter({(code, month): count for code, month, count in IcdTally.objects.values_list('code', 'month', 'count') if count})
+
+
+def rebuild():
+    """Ghi lại toàn bộ IcdTally từ bảng Diagnosis (sau khi nạp danh mục, hoặc khi số đếm bị lệch)."""
+    lookup = build_table(catalog.current_version(ICD10))
+    with transaction.atomic():
+        IcdTally.objects.all().delete()
+        IcdTally.objects.bulk_create(
+            [IcdTally(code=code, month=month, count=count) for (code, month), count in compute(lookup).items()],
+            batch_size=5000,
+        )
+
+
+def totals(codes, first=None, last=None):
+    """{nút: {tháng: số chẩn đoán}} của các nút trong khoảng tháng [first, last] (1 query trên IcdTally)."""
+    tallies = IcdTally.objects.filter(code__in=codes)
+    if first is not None:
+        tallies = tallies.filter(month__gte=first)
+    if last is not None:
+        tallies = tallies.filter(month__lte=last)
+    result = {code: {} for code in codes}
+    for code, month, count in tallies.order_by('month').values_list('code', 'month', 'count'):
+        if count:
+            result[code][month] = count
+    return result
+
+
+def parse_month(value):
+    """'2026-09' -> date(2026, 9, 1). ValueError nếu sai định dạng."""
+    year, month = value.split('-')
+    return date(int(year), int(month), 1)
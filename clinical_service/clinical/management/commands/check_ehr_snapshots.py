@@ -0,0 +1,52 @@
+# clinical/management/commands/check_ehr_snapshots.py
+from django.core.management.base import BaseCommand, CommandError
+
+from clinical import snapshots
+from clinical.models import Diagnosis, PatientEHRSnapshot
+
+
+class Command(BaseCommand):
+    help = ("So hồ sơ EHR dựng sẵn (PatientEHRSnapshot) với bảng gốc Diagnosis/Prescription/LabOrder: "
+            "báo snapshot cũ hơn hồ sơ (stale) hoặc lệch nội dung. --fix để dựng lại, "
+            "--build-missing để dựng trước snapshot cho các bệnh nhân chưa có.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient-id', type=int, action='append', dest='patient_ids', help="Chỉ kiểm tra bệnh nhân này (có thể lặp lại)")
+        parser.add_argument('--fix', action='store_true', help="Dựng lại các snapshot bị cũ/lệch")
+        parser.add_argument('--build-missing', action='store_true', help="Dựng snapshot cho bệnh nhân có hồ sơ nhưng chưa có snapshot")
+
+    def handle(self, *args, **options):
+        stored = PatientEHRSnapshot.objects.order_by('patient_id')
+        if options['patient_ids']:
+            stored = stored.filter(patient_id__in=options['patient_ids'])
+
+        checked, problems = 0, []
+        for snapshot in stored.iterator(chunk_size=500):
+            checked += 1
+            version, diagnoses = snapshots.render(snapshot.patient_id)
+            document = snapshots.decode(snapshot.document)
+            # So sau khi qua JSON để kiểu dữ liệu giống hệt bản đã lưu
+            expected = snapshots.decode(snapshots.encode(snapshot.patient_id, version, diagnoses))
+            if snapshot.version != version:
+                problems.append(snapshot.patient_id)
+                self.stdout.write(f"Patient ID {snapshot.patient_id}: snapshot v{snapshot.version}, hồ sơ v{version} (stale)")
+            elif document['diagnoses'] != expected['diagnoses'] or snapshot.diagnosis_count != len(diagnoses):
+                problems.append(snapshot.patient_id)
+                self.stdout.write(f"Patient ID {snapshot.patient_id}: nội dung lệch với bảng gốc (v{version})")
+
+        missing = Diagnosis.objects.exclude(patient_id__in=PatientEHRSnapshot.objects.values('patient_id'))
+        if options['patient_ids']:
+            missing = missing.filter(patient_id__in=options['patient_ids'])
+        missing_ids = list(missing.values_list('patient_id', flat=True).distinct().order_by('patient_id'))
+
+        if options['fix']:
+            for patient_id in problems:
+                snapshots.rebuild(patient_id)
+        if options['build_missing']:
+            for patient_id in missing_ids:
+                snapshots.rebuild(patient_id)
+
+        summary = f"Đã kiểm tra {checked} snapshot, {len(problems)} bị cũ/lệch, {len(missing_ids)} bệnh nhân chưa có snapshot."
+        if problems and not options['fix']:
+            raise CommandError(f"{summary} Chạy lại với --fix để dựng lại.")
+        self.stdout.write(self.style.SUCCESS(summary + (" Đã sửa." if problems else "")))
@@ -0,0 +1,28 @@
+# clinical/management/commands/check_icd_tallies.py
+from django.core.management.base import BaseCommand, CommandError
+
+from clinical import catalog, icd10
+
+
+class Command(BaseCommand):
+    help = ("So số chẩn đoán theo nút ICD-10 (IcdTally) với bảng Diagnosis, báo các (nút, tháng) bị lệch. "
+            "--fix để đếm lại toàn bộ (nên chạy lúc ít ghi: chẩn đoán tạo trong lúc đếm lại có thể bị tính thiếu/thừa).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Ghi lại toàn bộ số đếm từ bảng Diagnosis")
+
+    def handle(self, *args, **options):
+        expected = icd10.compute(icd10.build_table(catalog.current_version(icd10.ICD10)))
+        expected = {key: count for key, count in expected.items() if count}
+        stored = icd10.stored()
+
+        problems = sorted(key for key in expected.keys() | stored.keys() if expected.get(key, 0) != stored.get(key, 0))
+        for code, month in problems[:50]:
+            self.stdout.write(f"{code} {month:%Y-%m}: lưu {stored.get((code, month), 0)}, thực tế {expected.get((code, month), 0)}")
+
+        if options['fix'] and problems:
+            icd10.rebuild()
+        summary = f"Đã kiểm tra {len(expected)} (nút, tháng), {len(problems)} bị lệch."
+        if problems and not options['fix']:
+            raise CommandError(f"{summary} Chạy lại với --fix để đếm lại.")
+        self.stdout.write(self.style.SUCCESS(summary + (" Đã sửa." if problems else "")))
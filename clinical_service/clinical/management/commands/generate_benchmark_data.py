@@ -0,0 +1,197 @@
+# clinical/management/commands/generate_benchmark_data.py
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from clinical import icd10, snapshots, sync
+from clinical.models import Diagnosis, IcdCode, LabOrder, PrescribedMedication, Prescription
+
+# Một ít dữ liệu "giống thật" để chọn ngẫu nhiên
+DIAGNOSES = [
+    ('J06.9', 'Nhiễm trùng đường hô hấp trên cấp'), ('I10', 'Tăng huyết áp vô căn'),
+    ('E11.9', 'Đái tháo đường type 2'), ('K29.7', 'Viêm dạ dày'), ('M54.5', 'Đau thắt lưng'),
+    ('J45.9', 'Hen phế quản'), ('N39.0', 'Nhiễm trùng đường tiết niệu'), ('R51', 'Đau đầu'),
+    ('A09', 'Tiêu chảy nhiễm trùng'), ('E78.5', 'Rối loạn lipid máu'), ('J02.9', 'Viêm họng cấp'),
+    ('K21.9', 'Trào ngược dạ dày thực quản'), ('L30.9', 'Viêm da'), ('F41.1', 'Rối loạn lo âu lan tỏa'),
+]
+MEDICATIONS = [
+    ('Paracetamol', '500mg'), ('Amoxicillin', '500mg'), ('Ibuprofen', '400mg'), ('Omeprazole', '20mg'),
+    ('Metformin', '850mg'), ('Amlodipine', '5mg'), ('Losartan', '50mg'), ('Atorvastatin', '20mg'),
+    ('Cetirizine', '10mg'), ('Salbutamol', '100mcg'), ('Azithromycin', '250mg'), ('Loperamide', '2mg'),
+    ('Vitamin C', '500mg'), ('Domperidone', '10mg'), ('Ciprofloxacin', '500mg'), ('Prednisolone', '5mg'),
+]
+FREQUENCIES = ['1 lần/ngày', '2 lần/ngày', '3 lần/ngày', 'Mỗi 6 giờ', 'Khi cần']
+DURATIONS = ['3 ngày', '5 ngày', '7 ngày', '10 ngày', '14 ngày', '30 ngày']
+LAB_TESTS = ['Công thức máu', 'Đường huyết lúc đói', 'HbA1c', 'Mỡ máu', 'Chức năng gan', 'Chức năng thận', 'Tổng phân tích nước tiểu', 'X-quang ngực']
+
+
+@contextmanager
+def historical_timestamps(*fields):
+    """Tạm tắt auto_now_add để bulk_create giữ thời điểm sinh ra (dữ liệu quá khứ)."""
+    saved = [(field, field.auto_now_add) for field in fields]
+    for field, _ in saved:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in saved:
+            field.auto_now_add = value
+
+
+class Command(BaseCommand):
+    help = ("Sinh dữ liệu giả lập cho benchmark bằng bulk_create: chẩn đoán (mỗi lịch hẹn 1 chẩn đoán), "
+            "đơn thuốc kèm các dòng thuốc và yêu cầu xét nghiệm, rải trong --days-back ngày. "
+            "ID bác sĩ/bệnh nhân lấy theo dải in ra bởi generate_benchmark_data của user_service. "
+            "Sau đó dựng dữ liệu dẫn xuất như đường ghi thật: version hồ sơ (sync.touch_many, theo từng lô), "
+            "số đếm ICD-10 (nạp danh mục bằng load_icd10 trước) và EHR snapshot.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=10000)
+        parser.add_argument('--first-doctor-id', type=int, default=1)
+        parser.add_argument('--patients', type=int, default=100000)
+        parser.add_argument('--first-patient-id', type=int, help="Mặc định ngay sau dải bác sĩ (như user_service sinh ra)")
+        parser.add_argument('--diagnoses', type=int, default=1000000)
+        parser.add_argument('--first-appointment-id', type=int, default=1, help="appointment_id của chẩn đoán đầu tiên (unique)")
+        parser.add_argument('--medications', type=int, default=5000000, help="Tổng số dòng PrescribedMedication")
+        parser.add_argument('--lab-order-share', type=float, default=0.2, help="Tỉ lệ chẩn đoán có yêu cầu xét nghiệm")
+        parser.add_argument('--days-back', type=int, default=180)
+        parser.add_argument('--scale', type=float, default=1.0, help="Nhân số bác sĩ/bệnh nhân/chẩn đoán/thuốc (ví dụ 0.01)")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=2000, help="Số chẩn đoán mỗi lô")
+        parser.add_argument('--clear', action='store_true', help="Xóa dữ liệu cũ trong dải appointment_id này trước")
+        parser.add_argument('--skip-snapshots', action='store_true', help="Không dựng EHR snapshot (benchmark sẽ đo đường dựng lúc đọc)")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        scale = options['scale']
+        doctors = max(1, int(options['doctors'] * scale))
+        patients = max(1, int(options['patients'] * scale))
+        diagnoses = int(options['diagnoses'] * scale)
+        medications = int(options['medications'] * scale)
+        first_doctor = options['first_doctor_id']
+        first_patient = options['first_patient_id'] or first_doctor + doctors
+        self.doctor_ids = range(first_doctor, first_doctor + doctors)
+        self.patient_ids = range(first_patient, first_patient + patients)
+        first_appointment = options['first_appointment_id']
+        self.now = timezone.now()
+        self.days_back = options['days_back']
+        if connection.vendor == 'sqlite' and not connection.in_atomic_block:
+            # Dữ liệu giả lập: không cần fsync từng transaction (PRAGMA này không đổi được trong transaction, ví dụ trong test)
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous = OFF')
+
+        if options['clear']:
+            self.clear(first_appointment, first_appointment + diagnoses)
+
+        # Mỗi đơn có trung bình medications/diagnoses dòng thuốc (ít nhất 1)
+        per_prescription = medications / diagnoses if diagnoses else 0
+        counts = {'diagnoses': 0, 'medications': 0, 'lab_orders': 0}
+        started = time.perf_counter()
+        timestamps = (
+            Diagnosis._meta.get_field('diagnosis_time'),
+            Prescription._meta.get_field('prescription_date'),
+            LabOrder._meta.get_field('order_time'),
+        )
+        with historical_timestamps(*timestamps):
+            for offset in range(0, diagnoses, options['batch_size']):
+                appointment_ids = range(first_appointment + offset, first_appointment + min(offset + options['batch_size'], diagnoses))
+                self.create_batch(rng, appointment_ids, per_prescription, options['lab_order_share'], counts)
+                self.stdout.write(
+                    f"  {counts['diagnoses']}/{diagnoses} chẩn đoán, {counts['medications']} dòng thuốc "
+                    f"({time.perf_counter() - started:.0f}s)", ending='\r'
+                )
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã tạo {counts['diagnoses']} chẩn đoán, {counts['medications']} dòng thuốc, "
+            f"{counts['lab_orders']} yêu cầu xét nghiệm trong {time.perf_counter() - started:.1f}s."
+        ))
+        self.build_derived(options['skip_snapshots'])
+
+    @transaction.atomic
+    def create_batch(self, rng, appointment_ids, per_prescription, lab_order_share, counts):
+        diagnoses = Diagnosis.objects.bulk_create([
+            Diagnosis(
+                appointment_id=appointment_id,
+                patient_id=rng.choice(self.patient_ids),
+                doctor_id=rng.choice(self.doctor_ids),
+                diagnosis_code=code,
+                description=description,
+                diagnosis_time=self.now - timedelta(seconds=rng.randrange(self.days_back * 86400)),
+            )
+            for appointment_id, (code, description) in ((appointment_id, rng.choice(DIAGNOSES)) for appointment_id in appointment_ids)
+        ])
+        prescriptions = Prescription.objects.bulk_create([
+            Prescription(diagnosis=diagnosis, prescription_date=timezone.localdate(diagnosis.diagnosis_time))
+            for diagnosis in diagnoses
+        ])
+
+        whole, fraction = int(per_prescription), per_prescription - int(per_prescription)
+        medications = []
+        for prescription in prescriptions:
+            for name, dosage in rng.sample(MEDICATIONS, max(1, whole + (rng.random() < fraction))):
+                medications.append(PrescribedMedication(
+                    prescription=prescription,
+                    medication_name=name,
+                    dosage=dosage,
+                    frequency=rng.choice(FREQUENCIES),
+                    duration=rng.choice(DURATIONS),
+                ))
+        PrescribedMedication.objects.bulk_create(medications, batch_size=5000)
+
+        lab_orders = [
+            LabOrder(
+                diagnosis=diagnosis,
+                appointment_id=diagnosis.appointment_id,
+                patient_id=diagnosis.patient_id,
+                doctor_id=diagnosis.doctor_id,
+                test_name=rng.choice(LAB_TESTS),
+                order_time=diagnosis.diagnosis_time,
+                status=LabOrder.STATUS_COMPLETED if rng.random() < 0.8 else LabOrder.STATUS_ORDERED,
+            )
+            for diagnosis in diagnoses if rng.random() < lab_order_share
+        ]
+        LabOrder.objects.bulk_create(lab_orders)
+        # bulk_create không phát signal: mỗi chẩn đoán nhận version riêng, bộ đếm hồ sơ tăng như khi ghi qua API
+        sync.touch_many(diagnoses)
+
+        counts['diagnoses'] += len(diagnoses)
+        counts['medications'] += len(medications)
+        counts['lab_orders'] += len(lab_orders)
+
+    def build_derived(self, skip_snapshots):
+        """Số đếm ICD-10 và EHR snapshot cho dữ liệu vừa sinh, để benchmark đo đường đọc thật chứ không phải đường dự phòng."""
+        started = time.perf_counter()
+        if IcdCode.objects.exists():
+            icd10.rebuild()
+            self.stdout.write(f"Đã đếm lại số chẩn đoán theo ICD-10 ({time.perf_counter() - started:.1f}s).")
+        else:
+            self.stdout.write(self.style.WARNING(
+                "Chưa nạp danh mục ICD-10: chạy load_icd10 rồi check_icd_tallies --fix trước khi đo các API icd10/."
+            ))
+        if skip_snapshots:
+            return
+        # Cả dải bệnh nhân: hồ sơ bị --clear xóa hết thì snapshot cũ cũng bị xóa
+        started = time.perf_counter()
+        for done, patient_id in enumerate(self.patient_ids, start=1):
+            snapshots.rebuild(patient_id)
+            if done % 1000 == 0:
+                self.stdout.write(f"  {done}/{len(self.patient_ids)} EHR snapshot ({time.perf_counter() - started:.0f}s)", ending='\r')
+        self.stdout.write('')
+        self.stdout.write(f"Đã dựng EHR snapshot cho {len(self.patient_ids)} bệnh nhân ({time.perf_counter() - started:.1f}s).")
+
+    def clear(self, first_appointment, end_appointment):
+        # Xóa thẳng bằng SQL theo thứ tự khóa ngoại, không nạp từng object
+        diagnoses = Diagnosis.objects.filter(appointment_id__gte=first_appointment, appointment_id__lt=end_appointment)
+        for queryset in (
+            PrescribedMedication.objects.filter(prescription__diagnosis__in=diagnoses),
+            Prescription.objects.filter(diagnosis__in=diagnoses),
+            LabOrder.objects.filter(diagnosis__in=diagnoses),
+            diagnoses,
+        ):
+            deleted = queryset._raw_delete(queryset.db)
+            self.stdout.write(f"Đã xóa {deleted} dòng {queryset.model._meta.model_name}.")
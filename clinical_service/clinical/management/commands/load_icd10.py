@@ -0,0 +1,114 @@
+# clinical/management/commands/load_icd10.py
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from clinical import catalog, icd10
+from clinical.models import IcdCode
+
+UPDATE_FIELDS = ('level', 'title', 'parent_code', 'range_start', 'range_end', 'loaded_version')
+# Mức cha hợp lệ của từng mức (mã chi tiết có thể nằm dưới mã chi tiết ngắn hơn, ví dụ J06.91 -> J06.9)
+PARENT_LEVELS = {
+    IcdCode.LEVEL_BLOCK: (IcdCode.LEVEL_CHAPTER,),
+    IcdCode.LEVEL_CATEGORY: (IcdCode.LEVEL_BLOCK, IcdCode.LEVEL_CHAPTER),
+}
+
+
+def infer_level(code):
+    if icd10._BLOCK.match(code):
+        return IcdCode.LEVEL_BLOCK
+    if icd10._CODE.match(code):
+        return IcdCode.LEVEL_CODE if '.' in code else IcdCode.LEVEL_CATEGORY
+    return IcdCode.LEVEL_CHAPTER
+
+
+class Command(BaseCommand):
+    help = ("Nạp danh mục ICD-10 từ CSV (có dòng tiêu đề) hoặc JSON/JSON Lines, các cột/trường: "
+            "code, title, level (chapter/block/category/code, bỏ trống thì suy từ mã), "
+            "range (bắt buộc với chương, ví dụ 'J00-J99'), parent (bỏ trống thì tìm nút nhỏ nhất chứa mã). "
+            "Ghi bằng bulk_create trong 1 transaction, tăng version danh mục 1 lần, rồi đếm lại số chẩn đoán theo nút. "
+            "--replace xóa các mã không có trong file.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Đường dẫn file .csv, .json, .jsonl")
+        parser.add_argument('--format', choices=['csv', 'json'], help="Mặc định đoán theo đuôi file")
+        parser.add_argument('--replace', action='store_true', help="File là toàn bộ danh mục: xóa các mã không có trong file")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        # Cả cây nằm trong bộ nhớ (vài chục nghìn mã) để suy ra nút cha
+        nodes = {}
+        for number, row in catalog.read_rows(options['path'], options['format']):
+            node = self.parse(number, row)
+            nodes[node.code] = node
+
+        with transaction.atomic():
+            version = catalog.next_version(icd10.ICD10)
+            # Không --replace thì nút cha có thể là mã đã nạp trước đó
+            existing = {} if options['replace'] else {
+                code: (level, start, end)
+                for code, level, start, end in IcdCode.objects.values_list('code', 'level', 'range_start', 'range_end')
+            }
+            self.link(nodes, existing)
+            for node in nodes.values():
+                node.loaded_version = version
+            records = iter(nodes.values())
+            while batch := list(islice(records, options['batch_size'])):
+                IcdCode.objects.bulk_create(batch, update_conflicts=True, unique_fields=['code'], update_fields=UPDATE_FIELDS)
+            removed = 0
+            if options['replace']:
+                removed, _ = IcdCode.objects.filter(loaded_version__lt=version).delete()
+            # Cây đổi thì số đếm cộng dồn theo nút cũng đổi
+            icd10.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã nạp {len(nodes)} mã ICD-10, xóa {removed} mã, danh mục v{version} trong {time.monotonic() - started:.1f}s."
+        ))
+
+    def parse(self, number, row):
+        if not isinstance(row, dict):
+            raise CommandError(f"Dòng {number}: phải là một object.")
+        code = icd10.canonical(str(row.get('code') or ''))
+        title = str(row.get('title') or '').strip()
+        if not code or not title:
+            raise CommandError(f"Dòng {number}: thiếu code hoặc title.")
+        level = str(row.get('level') or '').strip().lower() or infer_level(code)
+        if level not in dict(IcdCode.LEVEL_CHOICES):
+            raise CommandError(f"Dòng {number}: level '{level}' không hợp lệ.")
+        try:
+            start, end = icd10.code_range(code, level, str(row.get('range') or ''))
+        except ValueError as exc:
+            raise CommandError(f"Dòng {number}: {exc}.")
+        if len(code) > 20 or len(title) > 255:
+            raise CommandError(f"Dòng {number}: code/title quá dài.")
+        node = IcdCode(code=code, level=level, title=title, range_start=start, range_end=end,
+                       parent_code=icd10.canonical(str(row.get('parent') or '')))
+        node.line = number
+        return node
+
+    def link(self, nodes, existing):
+        """Điền parent_code còn trống: nút nhỏ nhất (mức cha hợp lệ) có khoảng mã chứa khoảng của nút này."""
+        ranges = {**existing, **{code: (node.level, node.range_start, node.range_end) for code, node in nodes.items()}}
+        # Chỉ chương/nhóm (vài trăm nút) làm cha theo khoảng mã; sắp xếp để nút nhỏ nhất chứa mã đứng đầu
+        groups = [(code, level, start, end) for code, (level, start, end) in ranges.items() if level in PARENT_LEVELS[IcdCode.LEVEL_CATEGORY]]
+        groups.sort(key=lambda item: item[3])
+        groups.sort(key=lambda item: item[2], reverse=True)
+        for node in nodes.values():
+            if node.parent_code:
+                if node.parent_code not in ranges:
+                    raise CommandError(f"Dòng {node.line}: không có mã cha {node.parent_code}.")
+            elif node.level == IcdCode.LEVEL_CODE:
+                # J06.91 -> J06.9 -> J06
+                candidates = [node.code[:length].rstrip('.') for length in range(len(node.code) - 1, 2, -1)]
+                node.parent_code = next((code for code in candidates if code in ranges), '')
+                if not node.parent_code:
+                    raise CommandError(f"Dòng {node.line}: không có loại {node.code[:3]} cho mã {node.code}.")
+            elif node.level in PARENT_LEVELS:
+                node.parent_code = next((
+                    code for code, level, start, end in groups
+                    if level in PARENT_LEVELS[node.level] and code != node.code
+                    and start <= node.range_start and node.range_end <= end
+                ), '')
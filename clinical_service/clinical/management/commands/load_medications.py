@@ -0,0 +1,60 @@
+# clinical/management/commands/load_medications.py
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from clinical import catalog
+from clinical.models import Medication
+
+FIELDS = ('code', 'name', 'generic_name', 'strength', 'form')
+UPDATE_FIELDS = ('name', 'generic_name', 'strength', 'form', 'is_active', 'loaded_version')
+
+
+class Command(BaseCommand):
+    help = ("Nạp danh mục thuốc từ CSV (có dòng tiêu đề) hoặc JSON/JSON Lines, các cột/trường: "
+            "code, name, generic_name, strength, form. Thêm mới hoặc cập nhật theo code bằng bulk_create "
+            "trong 1 transaction; tăng version danh mục 1 lần để các process dựng lại chỉ mục gợi ý. "
+            "--replace ngừng (is_active=False) các thuốc không có trong file.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Đường dẫn file .csv, .json, .jsonl")
+        parser.add_argument('--format', choices=['csv', 'json'], help="Mặc định đoán theo đuôi file")
+        parser.add_argument('--replace', action='store_true', help="File là toàn bộ danh mục: ngừng các thuốc không có trong file")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rows = catalog.read_rows(options['path'], options['format'])
+
+        started = time.monotonic()
+        loaded = 0
+        with transaction.atomic():
+            version = catalog.next_version(catalog.MEDICATIONS)
+            records = (self.parse(number, row, version) for number, row in rows)
+            while batch := list(islice(records, options['batch_size'])):
+                # Trùng code trong cùng 1 câu INSERT ... ON CONFLICT bị DB từ chối: giữ dòng sau cùng
+                batch = list({medication.code: medication for medication in batch}.values())
+                Medication.objects.bulk_create(
+                    batch, update_conflicts=True, unique_fields=['code'], update_fields=UPDATE_FIELDS,
+                )
+                loaded += len(batch)
+            retired = 0
+            if options['replace']:
+                retired = Medication.objects.filter(loaded_version__lt=version, is_active=True).update(is_active=False)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã nạp {loaded} thuốc, ngừng {retired} thuốc, danh mục v{version} trong {time.monotonic() - started:.1f}s."
+        ))
+
+    def parse(self, number, row, version):
+        if not isinstance(row, dict):
+            raise CommandError(f"Dòng {number}: phải là một object.")
+        values = {field: str(row.get(field) or '').strip() for field in FIELDS}
+        if not values['code'] or not values['name']:
+            raise CommandError(f"Dòng {number}: thiếu code hoặc name.")
+        for field in FIELDS:
+            max_length = Medication._meta.get_field(field).max_length
+            if len(values[field]) > max_length:
+                raise CommandError(f"Dòng {number}: {field} dài quá {max_length} ký tự.")
+        return Medication(is_active=True, loaded_version=version, **values)
@@ -0,0 +1,31 @@
+# clinical/management/commands/publish_outbox.py
+from django.core.management.base import BaseCommand
+
+from clinical_service import outbox
+
+
+class Command(BaseCommand):
+    help = ("Gửi các sự kiện trong outbox tới sink (OUTBOX_SINK) theo lô. Mặc định chạy liên tục; "
+            "--once để gửi hết rồi thoát (cron/test).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=outbox.BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=1.0, help="Số giây chờ khi outbox trống")
+        parser.add_argument('--once', action='store_true', help="Gửi hết các sự kiện hiện có rồi thoát")
+        parser.add_argument('--file', help="Ghi ra file NDJSON này thay cho OUTBOX_SINK")
+        parser.add_argument('--socket', help="Gửi tới 'host:port' hoặc Unix socket này thay cho OUTBOX_SINK")
+
+    def handle(self, *args, **options):
+        if options['file']:
+            sink = outbox.FileSink(options['file'])
+        elif options['socket']:
+            sink = outbox.SocketSink(options['socket'])
+        else:
+            sink = outbox.get_sink()
+        try:
+            sent = outbox.run(sink, interval=options['interval'], batch_size=options['batch_size'], once=options['once'])
+        except KeyboardInterrupt:
+            return
+        finally:
+            sink.close()
+        self.stdout.write(self.style.SUCCESS(f"Đã gửi {sent} sự kiện."))
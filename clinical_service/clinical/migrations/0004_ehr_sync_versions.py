@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0003_idempotency_records'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiagnosisTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('diagnosis_id', models.BigIntegerField(verbose_name='diagnosis id')),
+                ('patient_id', models.IntegerField(verbose_name='patient id')),
+                ('version', models.BigIntegerField(verbose_name='version')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, verbose_name='deleted at')),
+            ],
+            options={
+                'verbose_name': 'diagnosis tombstone',
+                'verbose_name_plural': 'diagnosis tombstones',
+            },
+        ),
+        migrations.CreateModel(
+            name='PatientRecordVersion',
+            fields=[
+                ('patient_id', models.IntegerField(primary_key=True, serialize=False, verbose_name='patient id')),
+                ('version', models.BigIntegerField(default=1, verbose_name='version')),
+            ],
+            options={
+                'verbose_name': 'patient record version',
+                'verbose_name_plural': 'patient record versions',
+            },
+        ),
+        migrations.AddField(
+            model_name='diagnosis',
+            name='version',
+            field=models.BigIntegerField(default=1, editable=False, verbose_name='version'),
+        ),
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=models.Index(fields=['patient_id', 'diagnosis_time', 'id'], name='diagnosis_patient_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=models.Index(fields=['patient_id', 'version'], name='diagnosis_patient_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='diagnosistombstone',
+            index=models.Index(fields=['patient_id', 'version'], name='tombstone_patient_version_idx'),
+        ),
+    ]
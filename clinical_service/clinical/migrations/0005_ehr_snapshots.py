@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0004_ehr_sync_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientEHRSnapshot',
+            fields=[
+                ('patient_id', models.IntegerField(primary_key=True, serialize=False, verbose_name='patient id')),
+                ('version', models.BigIntegerField(verbose_name='version')),
+                ('document', models.BinaryField(verbose_name='document')),
+                ('diagnosis_count', models.PositiveIntegerField(default=0, verbose_name='diagnosis count')),
+                ('updated_at', models.DateTimeField(verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name': 'patient EHR snapshot',
+                'verbose_name_plural': 'patient EHR snapshots',
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0005_ehr_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='name')),
+                ('version', models.BigIntegerField(default=0, verbose_name='version')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name': 'catalog version',
+                'verbose_name_plural': 'catalog versions',
+            },
+        ),
+        migrations.CreateModel(
+            name='Medication',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=50, unique=True, verbose_name='code')),
+                ('name', models.CharField(max_length=255, verbose_name='name')),
+                ('generic_name', models.CharField(blank=True, max_length=255, verbose_name='generic name')),
+                ('strength', models.CharField(blank=True, help_text="e.g., '500mg'", max_length=100, verbose_name='strength')),
+                ('form', models.CharField(blank=True, help_text="e.g., 'tablet', 'syrup'", max_length=100, verbose_name='form')),
+                ('is_active', models.BooleanField(default=True, verbose_name='active')),
+                ('loaded_version', models.BigIntegerField(default=0, editable=False, verbose_name='loaded version')),
+            ],
+            options={
+                'verbose_name': 'medication',
+                'verbose_name_plural': 'medications',
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0006_medication_catalog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IcdCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20, unique=True, verbose_name='code')),
+                ('level', models.CharField(choices=[('chapter', 'Chapter'), ('block', 'Block'), ('category', 'Category'), ('code', 'Code')], max_length=10, verbose_name='level')),
+                ('title', models.CharField(max_length=255, verbose_name='title')),
+                ('parent_code', models.CharField(blank=True, db_index=True, max_length=20, verbose_name='parent code')),
+                ('range_start', models.CharField(max_length=20, verbose_name='range start')),
+                ('range_end', models.CharField(max_length=20, verbose_name='range end')),
+                ('loaded_version', models.BigIntegerField(default=0, editable=False, verbose_name='loaded version')),
+            ],
+            options={
+                'verbose_name': 'ICD-10 code',
+                'verbose_name_plural': 'ICD-10 codes',
+                'ordering': ['range_start', 'range_end'],
+            },
+        ),
+        migrations.CreateModel(
+            name='IcdTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20, verbose_name='code')),
+                ('month', models.DateField(verbose_name='month')),
+                ('count', models.IntegerField(default=0, verbose_name='count')),
+            ],
+            options={
+                'verbose_name': 'ICD-10 tally',
+                'verbose_name_plural': 'ICD-10 tallies',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=models.Index(fields=['diagnosis_code', 'diagnosis_time'], name='diagnosis_code_time_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='icdtally',
+            constraint=models.UniqueConstraint(fields=('code', 'month'), name='icd_tally_code_month_uniq'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Dữ liệu có trước 0004 (và dòng bulk_create chưa touch) cùng mang version mặc định 1:
+# gán version riêng cho từng chẩn đoán trong hồ sơ và đặt bộ đếm PatientRecordVersion khớp với dữ liệu.
+
+from django.db import migrations
+from django.db.models import Count, Max
+
+BATCH_SIZE = 1000
+
+
+def assign_distinct_versions(apps, schema_editor):
+    Diagnosis = apps.get_model('clinical', 'Diagnosis')
+    DiagnosisTombstone = apps.get_model('clinical', 'DiagnosisTombstone')
+    PatientRecordVersion = apps.get_model('clinical', 'PatientRecordVersion')
+    PatientEHRSnapshot = apps.get_model('clinical', 'PatientEHRSnapshot')
+
+    latest = {}
+    for model in (Diagnosis, DiagnosisTombstone):
+        for patient_id, version in model.objects.values_list('patient_id').annotate(top=Max('version')).order_by():
+            latest[patient_id] = max(latest.get(patient_id, 0), version)
+    counters = dict(PatientRecordVersion.objects.values_list('patient_id', 'version'))
+
+    shared = Diagnosis.objects.values('patient_id', 'version').annotate(rows=Count('id')).filter(rows__gt=1)
+    patients = sorted({row['patient_id'] for row in shared})
+    for patient_id in patients:
+        version = max(counters.get(patient_id, 1), latest.get(patient_id, 0))
+        changed, previous = [], None
+        # Dòng đầu của mỗi nhóm giữ version cũ, các dòng còn lại nhận version mới sau version lớn nhất hiện có
+        for diagnosis in Diagnosis.objects.filter(patient_id=patient_id).only('id', 'version').order_by('version', 'id'):
+            if diagnosis.version == previous:
+                version += 1
+                diagnosis.version = version
+                changed.append(diagnosis)
+            else:
+                previous = diagnosis.version
+        Diagnosis.objects.bulk_update(changed, ['version'], batch_size=BATCH_SIZE)
+        latest[patient_id] = version
+    # Snapshot của các hồ sơ vừa đổi version đã cũ: dựng lại ở lần đọc sau
+    PatientEHRSnapshot.objects.filter(patient_id__in=patients).delete()
+
+    missing = []
+    for patient_id, version in latest.items():
+        if patient_id not in counters:
+            missing.append(PatientRecordVersion(patient_id=patient_id, version=version))
+        elif counters[patient_id] < version:
+            PatientRecordVersion.objects.filter(patient_id=patient_id).update(version=version)
+    PatientRecordVersion.objects.bulk_create(missing, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinical', '0007_icd10_catalog'),
+    ]
+
+    operations = [
+        migrations.RunPython(assign_distinct_versions, migrations.RunPython.noop),
+    ]
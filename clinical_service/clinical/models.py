@@ -1,4 +1,5 @@
 # clinical/models.py
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
@@ -25,7 +26,8 @@ class Diagnosis(models.Model):
         help_text=_("ID of the Doctor")
     )
 
-    # Mã chẩn đoán theo ICD (tùy chọn)
+    # Mã chẩn đoán theo ICD (tùy chọn). Khi đã nạp danh mục ICD-10, API tạo chẩn đoán kiểm tra mã
+    # và lưu dạng chuẩn ('J06.9'), nên các nhánh của cây mã là các khoảng liên tục trên index
     diagnosis_code = models.CharField(
         _("diagnosis code"),
         max_length=50,
@@ -43,11 +45,22 @@ class Diagnosis(models.Model):
         auto_now_add=True, # Tự động ghi thời gian lúc tạo record
         help_text=_("Timestamp when the diagnosis was recorded.")
     )
+    # Phiên bản hồ sơ của bệnh nhân lúc chẩn đoán (hoặc đơn thuốc/xét nghiệm của nó) thay đổi lần cuối,
+    # dùng cho đồng bộ tăng dần EHR (?since=), xem clinical/sync.py. Dữ liệu có sẵn là phiên bản 1.
+    version = models.BigIntegerField(_("version"), default=1, editable=False)
 
     class Meta:
         verbose_name = _('diagnosis')
         verbose_name_plural = _('diagnoses')
         ordering = ['-diagnosis_time']
+        indexes = [
+            # EHR phân trang theo (diagnosis_time, id) trong hồ sơ 1 bệnh nhân
+            models.Index(fields=['patient_id', 'diagnosis_time', 'id'], name='diagnosis_patient_time_idx'),
+            # Đồng bộ tăng dần: các chẩn đoán có version > since
+            models.Index(fields=['patient_id', 'version'], name='diagnosis_patient_version_idx'),
+            # Truy vấn theo nhánh ICD-10 (khoảng mã, xem clinical/icd10.py) trong một khoảng thời gian
+            models.Index(fields=['diagnosis_code', 'diagnosis_time'], name='diagnosis_code_time_idx'),
+        ]
 
     def __str__(self):
         return f"Diagnosis for Appt ID {self.appointment_id} (Patient ID: {self.patient_id})"
@@ -94,8 +107,8 @@ class PrescribedMedication(models.Model):
         related_name='medications', # Từ Prescription -> medications
         verbose_name=_("prescription")
     )
-    # Tên thuốc - Lý tưởng nên link đến một Catalog thuốc riêng (có thể ở PharmacyService)
-    # Tạm thời lưu dạng text
+    # Tên thuốc - dạng text; client chọn từ danh mục thuốc (Medication, API medications/autocomplete/)
+    # nhưng vẫn cho phép nhập tự do thuốc chưa có trong danh mục
     medication_name = models.CharField(_("medication name"), max_length=255)
     dosage = models.CharField(_("dosage"), max_length=100, help_text=_("e.g., '500mg', '1 tablet'"))
     frequency = models.CharField(_("frequency"), max_length=100, help_text=_("e.g., 'Twice a day', 'Every 6 hours'"))
@@ -184,4 +197,179 @@ class LabOrder(models.Model):
         ordering = ['-order_time']
 
     def __str__(self):
-        return f"Lab Order ID: {self.id} for Patient ID: {self.patient_id} - {self.test_name}"
\ No newline at end of file
+        return f"Lab Order ID: {self.id} for Patient ID: {self.patient_id} - {self.test_name}"
+
+# Bộ đếm phiên bản hồ sơ EHR của từng bệnh nhân (xem clinical/sync.py)
+# Chưa có dòng nghĩa là hồ sơ đang ở phiên bản 1.
+class PatientRecordVersion(models.Model):
+    patient_id = models.IntegerField(_("patient id"), primary_key=True)
+    version = models.BigIntegerField(_("version"), default=1)
+
+    class Meta:
+        verbose_name = _('patient record version')
+        verbose_name_plural = _('patient record versions')
+
+    def __str__(self):
+        return f"Patient ID {self.patient_id}: v{self.version}"
+
+# Chẩn đoán đã bị xóa, để client đồng bộ tăng dần biết mà xóa bản sao của mình
+class DiagnosisTombstone(models.Model):
+    diagnosis_id = models.BigIntegerField(_("diagnosis id"))
+    patient_id = models.IntegerField(_("patient id"))
+    version = models.BigIntegerField(_("version"))
+    deleted_at = models.DateTimeField(_("deleted at"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('diagnosis tombstone')
+        verbose_name_plural = _('diagnosis tombstones')
+        indexes = [
+            models.Index(fields=['patient_id', 'version'], name='tombstone_patient_version_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deleted diagnosis ID {self.diagnosis_id} (Patient ID: {self.patient_id}, v{self.version})"
+
+# Hồ sơ EHR dựng sẵn của từng bệnh nhân: JSON nén gzip, cập nhật sau mỗi lần ghi (xem clinical/snapshots.py)
+class PatientEHRSnapshot(models.Model):
+    patient_id = models.IntegerField(_("patient id"), primary_key=True)
+    # Version hồ sơ (clinical/sync.py) mà document phản ánh
+    version = models.BigIntegerField(_("version"))
+    document = models.BinaryField(_("document"))
+    diagnosis_count = models.PositiveIntegerField(_("diagnosis count"), default=0)
+    updated_at = models.DateTimeField(_("updated at"))
+
+    class Meta:
+        verbose_name = _('patient EHR snapshot')
+        verbose_name_plural = _('patient EHR snapshots')
+
+    def __str__(self):
+        return f"EHR snapshot for Patient ID {self.patient_id} (v{self.version}, {self.diagnosis_count} diagnoses)"
+
+# Phiên bản của từng danh mục dùng chung (thuốc...), tăng mỗi lần danh mục thay đổi.
+# Các process so version này để biết khi nào dựng lại chỉ mục trong bộ nhớ (xem clinical/catalog.py).
+class CatalogVersion(models.Model):
+    name = models.CharField(_("name"), max_length=50, primary_key=True) # Ví dụ: 'medications'
+    version = models.BigIntegerField(_("version"), default=0)
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    class Meta:
+        verbose_name = _('catalog version')
+        verbose_name_plural = _('catalog versions')
+
+    def __str__(self):
+        return f"{self.name}: v{self.version}"
+
+# Danh mục thuốc (formulary), nạp bằng lệnh load_medications; tra cứu gợi ý qua medications/autocomplete/
+class Medication(models.Model):
+    code = models.CharField(_("code"), max_length=50, unique=True) # Mã thuốc trong danh mục nguồn (số đăng ký...)
+    name = models.CharField(_("name"), max_length=255) # Tên thương mại, điền vào PrescribedMedication.medication_name
+    generic_name = models.CharField(_("generic name"), max_length=255, blank=True) # Hoạt chất
+    strength = models.CharField(_("strength"), max_length=100, blank=True, help_text=_("e.g., '500mg'"))
+    form = models.CharField(_("form"), max_length=100, blank=True, help_text=_("e.g., 'tablet', 'syrup'"))
+    is_active = models.BooleanField(_("active"), default=True) # Ngừng lưu hành: không gợi ý nữa
+    # Version danh mục của lần nạp gần nhất có thuốc này (load_medications --replace ngừng các thuốc cũ hơn)
+    loaded_version = models.BigIntegerField(_("loaded version"), default=0, editable=False)
+
+    class Meta:
+        verbose_name = _('medication')
+        verbose_name_plural = _('medications')
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name} {self.strength}".strip()
+
+# Danh mục ICD-10: cây chương -> nhóm -> loại -> mã, nạp bằng lệnh load_icd10 (xem clinical/icd10.py)
+class IcdCode(models.Model):
+    LEVEL_CHAPTER = 'chapter'   # Chương, ví dụ 'X' (J00-J99)
+    LEVEL_BLOCK = 'block'       # Nhóm, ví dụ 'J00-J06'
+    LEVEL_CATEGORY = 'category' # Loại 3 ký tự, ví dụ 'J06'
+    LEVEL_CODE = 'code'         # Mã chi tiết, ví dụ 'J06.9'
+
+    LEVEL_CHOICES = [
+        (LEVEL_CHAPTER, _('Chapter')),
+        (LEVEL_BLOCK, _('Block')),
+        (LEVEL_CATEGORY, _('Category')),
+        (LEVEL_CODE, _('Code')),
+    ]
+
+    code = models.CharField(_("code"), max_length=20, unique=True)
+    level = models.CharField(_("level"), max_length=10, choices=LEVEL_CHOICES)
+    title = models.CharField(_("title"), max_length=255)
+    parent_code = models.CharField(_("parent code"), max_length=20, blank=True, db_index=True)
+    # Mọi mã chẩn đoán thuộc nhánh này nằm trong [range_start, range_end) theo thứ tự chuỗi
+    range_start = models.CharField(_("range start"), max_length=20)
+    range_end = models.CharField(_("range end"), max_length=20)
+    # Version danh mục của lần nạp gần nhất có mã này (load_icd10 --replace xóa các mã cũ hơn)
+    loaded_version = models.BigIntegerField(_("loaded version"), default=0, editable=False)
+
+    class Meta:
+        verbose_name = _('ICD-10 code')
+        verbose_name_plural = _('ICD-10 codes')
+        ordering = ['range_start', 'range_end']
+
+    def __str__(self):
+        return f"{self.code} {self.title}"
+
+# Số chẩn đoán theo tháng của từng nút ICD-10 (đã cộng dồn các nhánh con), cập nhật sau mỗi lần ghi chẩn đoán
+class IcdTally(models.Model):
+    code = models.CharField(_("code"), max_length=20) # IcdCode.code của nút
+    month = models.DateField(_("month")) # Ngày đầu tháng, theo TIME_ZONE
+    count = models.IntegerField(_("count"), default=0)
+
+    class Meta:
+        verbose_name = _('ICD-10 tally')
+        verbose_name_plural = _('ICD-10 tallies')
+        constraints = [
+            models.UniqueConstraint(fields=['code', 'month'], name='icd_tally_code_month_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.code} {self.month:%Y-%m}: {self.count}"
+
+# Model Sự kiện chờ gửi ra ngoài (transactional outbox, xem clinical_service/outbox.py)
+# Được ghi trong cùng transaction với thay đổi dữ liệu; lệnh publish_outbox gửi theo lô tới sink.
+class OutboxEvent(models.Model):
+    event_type = models.CharField(_("event type"), max_length=100) # Ví dụ: 'prescription.created'
+    key = models.CharField(_("key"), max_length=100, blank=True) # Đối tượng liên quan, ví dụ 'prescription:7'
+    payload = models.JSONField(_("payload"), encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(_("published at"), null=True, blank=True)
+    # Số lần gửi lỗi và lỗi gần nhất (theo dõi sự kiện bị kẹt)
+    attempts = models.PositiveIntegerField(_("attempts"), default=0)
+    last_error = models.TextField(_("last error"), blank=True)
+
+    class Meta:
+        verbose_name = _('outbox event')
+        verbose_name_plural = _('outbox events')
+        indexes = [
+            # Publisher chỉ đọc các sự kiện chưa gửi theo id: index từng phần chỉ chứa hàng đợi hiện tại
+            models.Index(fields=['id'], condition=models.Q(published_at__isnull=True), name='outbox_pending_idx'),
+            # Dọn các sự kiện đã gửi quá hạn lưu giữ
+            models.Index(fields=['published_at'], name='outbox_published_idx'),
+        ]
+        ordering = ['id']
+
+    def __str__(self):
+        return f"Outbox #{self.id}: {self.event_type} {self.key}".strip()
+
+
+class IdempotencyRecord(models.Model):
+    # sha256(user_id:Idempotency-Key) và sha256(method, path, body) - xem clinical_service/idempotency.py
+    key_hash = models.CharField(_("key hash"), max_length=64, unique=True)
+    request_hash = models.CharField(_("request hash"), max_length=64)
+    # None = request đầu tiên đang được xử lý
+    status_code = models.PositiveSmallIntegerField(_("status code"), null=True, blank=True)
+    response_body = models.JSONField(_("response body"), null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+    expires_at = models.DateTimeField(_("expires at"))
+
+    class Meta:
+        verbose_name = _('idempotency record')
+        verbose_name_plural = _('idempotency records')
+        indexes = [
+            # purge_idempotency_keys xóa theo hạn
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"Idempotency {self.key_hash[:12]}... -> {self.status_code or 'pending'}"
@@ -1,22 +1,31 @@
 # clinical_service/clinical/permissions.py
 from rest_framework.permissions import BasePermission
 
+
+def _claim(user, name, default):
+    """Đọc claim của JWT từ TokenUser (user.token), hoặc thuộc tính của user Django thông thường."""
+    token = getattr(user, 'token', None)
+    if token is not None:
+        return token.get(name, default)
+    return getattr(user, name, default)
+
+
 class IsAdminClaim(BasePermission):
     def has_permission(self, request, view):
         return bool(
             request.user and
             request.user.is_authenticated and
-            request.user.get('is_staff', False)
+            _claim(request.user, 'is_staff', False)
         )
 
 class IsDoctorClaim(BasePermission):
     def has_permission(self, request, view):
         if not (request.user and request.user.is_authenticated):
             return False
-        return 'Doctor' in request.user.get('roles', [])
+        return 'Doctor' in (_claim(request.user, 'roles', None) or [])
 
 class IsPatientClaim(BasePermission): # Thêm nếu Patient được xem EHR
     def has_permission(self, request, view):
         if not (request.user and request.user.is_authenticated):
             return False
-        return 'Patient' in request.user.get('roles', [])
\ No newline at end of file
+        return 'Patient' in (_claim(request.user, 'roles', None) or [])
\ No newline at end of file
@@ -1,5 +1,7 @@
 # clinical/serializers.py
+from django.db import transaction
 from rest_framework import serializers
+from . import icd10, sync
 from .models import Diagnosis, Prescription, PrescribedMedication, LabOrder
 
 # --- Serializer cho Chi tiết Thuốc trong Đơn (để lồng) ---
@@ -69,10 +71,18 @@ class DiagnosisSerializer(serializers.ModelSerializer):
             'diagnosis_code',
             'description',
             'diagnosis_time',
+            'version',       # Phiên bản hồ sơ lúc chẩn đoán thay đổi lần cuối (đồng bộ ?since=)
             'prescriptions', # Danh sách đơn thuốc lồng vào
             'lab_orders',    # Danh sách yêu cầu xét nghiệm lồng vào
         ]
-        read_only_fields = ('id', 'diagnosis_time', 'prescriptions', 'lab_orders')
+        read_only_fields = ('id', 'diagnosis_time', 'version', 'prescriptions', 'lab_orders')
+
+# --- Serializer gọn cho danh sách chẩn đoán theo nhánh ICD-10 (không lồng đơn thuốc/xét nghiệm) ---
+class DiagnosisSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Diagnosis
+        fields = ['id', 'appointment_id', 'patient_id', 'doctor_id', 'diagnosis_code', 'diagnosis_time']
+        read_only_fields = fields
 
 # --- Serializer riêng cho việc TẠO Chẩn đoán ---
 class DiagnosisCreateSerializer(serializers.ModelSerializer):
@@ -96,14 +106,88 @@ class DiagnosisCreateSerializer(serializers.ModelSerializer):
         # Hoặc giả định dữ liệu này được truyền vào đáng tin cậy.
         return value
 
+    def validate_diagnosis_code(self, value):
+        """Kiểm tra mã với danh mục ICD-10 trong bộ nhớ (không query) và lưu dạng chuẩn, ví dụ 'j069' -> 'J06.9'."""
+        if not value:
+            return value
+        _, table = icd10.table.get()
+        if not len(table): # Chưa nạp danh mục (manage.py load_icd10): giữ nguyên như trước
+            return value
+        node = table.get(value)
+        if node is None or node.level not in icd10.DIAGNOSIS_LEVELS:
+            raise serializers.ValidationError(f"Unknown ICD-10 code {value}.")
+        return node.code
+
     # Không cần ghi đè create() nếu logic đơn giản
 
+# --- Tạo Đơn thuốc (dùng chung cho tạo 1 đơn và tạo theo lô) ---
+def create_prescriptions(items):
+    """
+    Tạo các đơn thuốc (validated_data của PrescriptionCreateSerializer, 'diagnosis' là object đã load)
+    trong 1 transaction: 1 câu INSERT cho đơn thuốc, 1 câu cho toàn bộ thuốc, rồi tăng version hồ sơ
+    của các chẩn đoán liên quan (bulk_create không phát signal, xem clinical/sync.py).
+    Trả về danh sách đơn thuốc theo thứ tự đầu vào, đã gắn sẵn danh sách thuốc (không cần query lại).
+    """
+    with transaction.atomic():
+        prescriptions = Prescription.objects.bulk_create([
+            Prescription(**{field: value for field, value in item.items() if field != 'medications'})
+            for item in items
+        ])
+        medications = [
+            [PrescribedMedication(prescription=prescription, **medication_data) for medication_data in item['medications']]
+            for prescription, item in zip(prescriptions, items)
+        ]
+        PrescribedMedication.objects.bulk_create([medication for group in medications for medication in group])
+        for prescription, group in zip(prescriptions, medications):
+            # Gắn như kết quả prefetch_related('medications')
+            cached = PrescribedMedication.objects.filter(prescription=prescription)
+            cached._result_cache, cached._prefetch_done = group, True
+            prescription._prefetched_objects_cache = {'medications': cached}
+        sync.touch_many(prescription.diagnosis for prescription in prescriptions)
+    return prescriptions
+
+
+class DiagnosisField(serializers.PrimaryKeyRelatedField):
+    """ID chẩn đoán. Khi tạo theo lô, lấy từ context['diagnoses'] đã nạp sẵn bằng 1 query cho cả lô."""
+
+    def to_internal_value(self, data):
+        preloaded = self.context.get('diagnoses')
+        if preloaded is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return preloaded[int(data)]
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class PrescriptionListSerializer(serializers.ListSerializer):
+    """Tạo nhiều đơn thuốc một lần (PrescriptionCreateSerializer(many=True))."""
+
+    def to_internal_value(self, data):
+        # Nạp mọi chẩn đoán được tham chiếu bằng 1 query thay vì 1 query cho mỗi đơn
+        ids = set()
+        for item in data if isinstance(data, list) else ():
+            try:
+                ids.add(int(item['diagnosis']))
+            except (KeyError, TypeError, ValueError):
+                pass # Sai kiểu/thiếu: DiagnosisField báo lỗi cho đúng mục
+        self._context['diagnoses'] = Diagnosis.objects.in_bulk(ids)
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        return create_prescriptions(validated_data)
+
+
 # --- Serializer riêng cho việc TẠO Đơn thuốc (nhận cả danh sách thuốc) ---
 class PrescriptionCreateSerializer(serializers.ModelSerializer):
     # Nhận một danh sách các object thuốc để tạo PrescribedMedication
     medications = PrescribedMedicationSerializer(many=True)
     # Client cần gửi diagnosis (ID của Diagnosis đã tạo)
-    diagnosis = serializers.PrimaryKeyRelatedField(queryset=Diagnosis.objects.all())
+    diagnosis = DiagnosisField(queryset=Diagnosis.objects.all())
 
     class Meta:
         model = Prescription
@@ -113,16 +197,11 @@ class PrescriptionCreateSerializer(serializers.ModelSerializer):
             'medications', # Danh sách các thuốc cần tạo
         ]
         # prescription_date tự động tạo
+        list_serializer_class = PrescriptionListSerializer
 
     def create(self, validated_data):
-        # Tách dữ liệu medications ra khỏi validated_data
-        medications_data = validated_data.pop('medications')
-        # Tạo đối tượng Prescription trước
-        prescription = Prescription.objects.create(**validated_data)
-        # Tạo các đối tượng PrescribedMedication liên quan
-        for medication_data in medications_data:
-            PrescribedMedication.objects.create(prescription=prescription, **medication_data)
-        return prescription
+        # Cùng đường ghi với tạo theo lô: đơn thuốc + thuốc + version hồ sơ trong 1 transaction
+        return create_prescriptions([validated_data])[0]
 
 # --- Serializer riêng cho việc TẠO Yêu cầu Xét nghiệm ---
 class LabOrderCreateSerializer(serializers.ModelSerializer):
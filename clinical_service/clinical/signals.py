@@ -0,0 +1,121 @@
+# clinical/signals.py
+"""
+Tăng phiên bản hồ sơ EHR (clinical/sync.py) khi chẩn đoán, đơn thuốc, thuốc hoặc xét nghiệm thay đổi.
+Đồng thời cập nhật số chẩn đoán theo nút ICD-10 (clinical/icd10.py) khi chẩn đoán được tạo/đổi mã/xóa.
+Lưu ý: QuerySet.update()/bulk_create() không phát signal, cần tự gọi sync.touch() nếu dùng
+(clinical.serializers.create_prescriptions tạo đơn thuốc/thuốc bằng bulk_create rồi gọi sync.touch_many()).
+"""
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from . import catalog, icd10, sync
+from .models import Diagnosis, IcdCode, LabOrder, Medication, PrescribedMedication, Prescription
+
+
+# Ghi nhớ giá trị lúc load để biết chẩn đoán chuyển hồ sơ / xét nghiệm chuyển chẩn đoán
+# (đọc từ __dict__ để không kích hoạt query cho các trường bị defer)
+@receiver(post_init, sender=Diagnosis)
+def remember_diagnosis_patient(sender, instance, **kwargs):
+    instance._loaded_patient_id = instance.__dict__.get('patient_id')
+    instance._loaded_code = instance.__dict__.get('diagnosis_code')
+
+
+@receiver(pre_save, sender=Diagnosis)
+def bump_diagnosis_version(sender, instance, raw=False, **kwargs):
+    # Version được ghi cùng câu INSERT/UPDATE của chính chẩn đoán, không cần UPDATE riêng
+    if not raw:
+        instance.version = sync.next_version(instance.patient_id)
+
+
+@receiver(post_save, sender=Diagnosis)
+def bury_moved_diagnosis(sender, instance, created, raw=False, **kwargs):
+    old_patient_id = getattr(instance, '_loaded_patient_id', None)
+    if not created and not raw and old_patient_id is not None and old_patient_id != instance.patient_id:
+        sync.bury(instance.pk, old_patient_id)
+    instance._loaded_patient_id = instance.patient_id
+
+
+@receiver(post_delete, sender=Diagnosis)
+def bury_deleted_diagnosis(sender, instance, **kwargs):
+    sync.bury(instance.pk, instance.patient_id)
+
+
+# Số chẩn đoán theo nút ICD-10 (xem clinical/icd10.py), cập nhật sau khi commit
+@receiver(post_save, sender=Diagnosis)
+def count_diagnosis_code(sender, instance, created, raw=False, **kwargs):
+    old_code = None if created else getattr(instance, '_loaded_code', None)
+    if not raw and old_code != instance.diagnosis_code:
+        icd10.schedule_count([(old_code, instance.diagnosis_time, -1), (instance.diagnosis_code, instance.diagnosis_time, 1)])
+    instance._loaded_code = instance.diagnosis_code
+
+
+@receiver(post_delete, sender=Diagnosis)
+def uncount_diagnosis_code(sender, instance, **kwargs):
+    if instance.diagnosis_code:
+        icd10.schedule_count([(instance.diagnosis_code, instance.diagnosis_time, -1)])
+
+
+def _touch(diagnosis_id, cached=None):
+    # Dùng chẩn đoán đã load sẵn (ví dụ từ serializer) để khỏi query lại patient_id
+    if diagnosis_id is not None:
+        sync.touch(diagnosis_id, cached.patient_id if cached is not None else None)
+
+
+def _cascading(instance, origin):
+    # Đang bị xóa theo chẩn đoán/đơn thuốc cha (origin là object hoặc QuerySet): thay đổi của cha đã được ghi nhận
+    if origin is None:
+        return False
+    model = getattr(origin, 'model', type(origin))
+    return issubclass(model, (Diagnosis, Prescription)) and not isinstance(instance, model)
+
+
+@receiver(post_save, sender=Prescription)
+@receiver(post_delete, sender=Prescription)
+def touch_prescription_diagnosis(sender, instance, raw=False, origin=None, **kwargs):
+    if raw or _cascading(instance, origin):
+        return
+    cached = instance.diagnosis if Prescription.diagnosis.is_cached(instance) else None
+    _touch(instance.diagnosis_id, cached)
+
+
+@receiver(post_save, sender=PrescribedMedication)
+@receiver(post_delete, sender=PrescribedMedication)
+def touch_medication_diagnosis(sender, instance, raw=False, origin=None, **kwargs):
+    if raw or _cascading(instance, origin):
+        return
+    diagnosis_id = Prescription.objects.filter(pk=instance.prescription_id).values_list('diagnosis_id', flat=True).first()
+    _touch(diagnosis_id)
+
+
+@receiver(post_init, sender=LabOrder)
+def remember_lab_order_diagnosis(sender, instance, **kwargs):
+    instance._loaded_diagnosis_id = instance.__dict__.get('diagnosis_id')
+
+
+@receiver(post_save, sender=LabOrder)
+@receiver(post_delete, sender=LabOrder)
+def touch_lab_order_diagnosis(sender, instance, raw=False, origin=None, **kwargs):
+    if raw or _cascading(instance, origin):
+        return
+    old_diagnosis_id = getattr(instance, '_loaded_diagnosis_id', None)
+    if old_diagnosis_id not in (None, instance.diagnosis_id):
+        _touch(old_diagnosis_id)
+    cached = instance.diagnosis if LabOrder.diagnosis.is_cached(instance) else None
+    _touch(instance.diagnosis_id, cached)
+    instance._loaded_diagnosis_id = instance.diagnosis_id
+
+
+# Danh mục sửa từng dòng (admin...): các process dựng lại chỉ mục/bảng tra (xem clinical/catalog.py).
+# load_medications/load_icd10 ghi bằng bulk_create và tự tăng version 1 lần cho cả lô.
+@receiver(post_save, sender=Medication)
+@receiver(post_delete, sender=Medication)
+def bump_medication_catalog(sender, instance, raw=False, **kwargs):
+    if not raw:
+        catalog.next_version(catalog.MEDICATIONS)
+
+
+@receiver(post_save, sender=IcdCode)
+@receiver(post_delete, sender=IcdCode)
+def bump_icd10_catalog(sender, instance, raw=False, **kwargs):
+    if not raw:
+        catalog.next_version(icd10.ICD10)
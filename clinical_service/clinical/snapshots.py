@@ -0,0 +1,151 @@
+# clinical/snapshots.py
+"""
+Hồ sơ EHR dựng sẵn (denormalized) cho từng bệnh nhân: toàn bộ chẩn đoán kèm đơn thuốc, thuốc và xét nghiệm,
+đã serialize thành JSON và nén gzip, lưu 1 dòng PatientEHRSnapshot theo patient_id.
+
+- Đọc (GET ehr/patient/<id>/?snapshot=1): 1 query theo khóa chính, trả thẳng bytes đã nén
+  (Content-Encoding: gzip) - không prefetch, không serializer, không mã hóa JSON.
+- Ghi: mỗi lần version hồ sơ tăng (clinical/sync.py), sau khi transaction commit, snapshot được cập nhật
+  tăng dần bằng delta sync.changes(since=version của snapshot): chỉ serialize lại các chẩn đoán đã đổi,
+  bỏ các chẩn đoán đã xóa. Ghi bằng compare-and-swap trên version nên 2 cập nhật song song không ghi đè
+  lẫn nhau; cập nhật thua thì đọc lại và thử tiếp.
+- Chưa có snapshot (dữ liệu cũ, bulk_create) thì dựng đầy đủ ở lần đọc đầu tiên.
+- `manage.py check_ehr_snapshots` so snapshot với bảng gốc (--fix để dựng lại).
+"""
+import gzip
+import json
+import logging
+from datetime import datetime
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.utils import encoders
+
+from . import sync
+from .models import Diagnosis, PatientEHRSnapshot
+from .serializers import DiagnosisSerializer
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_LEVEL = 6
+MAX_DELTA = 500 # Delta lớn hơn thì dựng lại toàn bộ
+MAX_ATTEMPTS = 3
+
+
+def ehr_queryset(patient_id):
+    """Chẩn đoán của bệnh nhân kèm prefetch đơn thuốc/thuốc/xét nghiệm (dùng chung với PatientEHRView)."""
+    return Diagnosis.objects.filter(patient_id=patient_id).prefetch_related(
+        'prescriptions__medications',
+        'lab_orders',
+    )
+
+
+# --- Mã hóa ---
+def encode(patient_id, version, diagnoses):
+    body = json.dumps(
+        {'patient_id': patient_id, 'version': version, 'diagnoses': diagnoses},
+        cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':'),
+    )
+    # mtime=0: cùng nội dung thì cùng bytes
+    return gzip.compress(body.encode('utf-8'), COMPRESS_LEVEL, mtime=0)
+
+
+def decode(document):
+    return json.loads(gzip.decompress(bytes(document)))
+
+
+def _order(item):
+    # Mới nhất trước, như phân trang của PatientEHRView
+    return datetime.fromisoformat(item['diagnosis_time']), item['id']
+
+
+def render(patient_id):
+    """(version, danh sách chẩn đoán đã serialize) dựng từ bảng gốc. Version đọc trước dữ liệu như sync.changes."""
+    version = sync.current_version(patient_id)
+    diagnoses = ehr_queryset(patient_id).order_by('-diagnosis_time', '-id')
+    return version, list(DiagnosisSerializer(diagnoses, many=True).data)
+
+
+# --- Ghi ---
+def _save(patient_id, version, diagnoses, expected=None):
+    """
+    Ghi snapshot. expected = version đang có (compare-and-swap);
+    None = dựng lại, chỉ ghi đè snapshot không mới hơn. Trả về True nếu đã ghi.
+    """
+    fields = {
+        'version': version,
+        'document': encode(patient_id, version, diagnoses),
+        'diagnosis_count': len(diagnoses),
+        'updated_at': timezone.now(),
+    }
+    rows = PatientEHRSnapshot.objects.filter(patient_id=patient_id)
+    if expected is not None:
+        return rows.filter(version=expected).update(**fields) == 1
+    if rows.filter(version__lte=version).update(**fields):
+        return True
+    try:
+        with transaction.atomic():
+            PatientEHRSnapshot.objects.create(patient_id=patient_id, **fields)
+        return True
+    except IntegrityError:
+        return False # Đã có snapshot mới hơn
+
+
+def rebuild(patient_id):
+    """Dựng lại toàn bộ snapshot từ bảng gốc. Hồ sơ rỗng thì xóa snapshot. Trả về snapshot (None nếu rỗng)."""
+    version, diagnoses = render(patient_id)
+    if not diagnoses:
+        PatientEHRSnapshot.objects.filter(patient_id=patient_id, version__lte=version).delete()
+        return None
+    _save(patient_id, version, diagnoses)
+    return PatientEHRSnapshot.objects.filter(patient_id=patient_id).first()
+
+
+def refresh(patient_id):
+    """Đưa snapshot lên version hiện tại bằng delta (chưa có snapshot thì bỏ qua, sẽ dựng khi đọc)."""
+    for _ in range(MAX_ATTEMPTS):
+        snapshot = PatientEHRSnapshot.objects.filter(patient_id=patient_id).only('version', 'document').first()
+        if snapshot is None:
+            return
+        changed, deleted, version, cursor = sync.changes(patient_id, snapshot.version, MAX_DELTA, ehr_queryset(patient_id))
+        if cursor is not None:
+            break # Delta quá lớn: dựng lại
+        if version <= snapshot.version:
+            return # Đã mới nhất (cập nhật khác vừa làm xong)
+        diagnoses = {item['id']: item for item in decode(snapshot.document)['diagnoses']}
+        for diagnosis_id in deleted:
+            diagnoses.pop(diagnosis_id, None)
+        for item in DiagnosisSerializer(changed, many=True).data:
+            diagnoses[item['id']] = item
+        if not diagnoses:
+            break
+        if _save(patient_id, version, sorted(diagnoses.values(), key=_order, reverse=True), expected=snapshot.version):
+            return
+    rebuild(patient_id)
+
+
+def schedule_refresh(patient_id):
+    """
+    Cập nhật snapshot sau khi transaction hiện tại commit (gọi từ sync.next_version).
+    Lỗi chỉ được ghi log: snapshot cũ hơn hồ sơ sẽ được lần ghi sau hoặc check_ehr_snapshots --fix sửa.
+    Ngoài transaction thì không cập nhật (on_commit sẽ chạy ngay, trước khi dữ liệu được ghi):
+    snapshot chỉ bị cũ hơn hồ sơ, lần cập nhật sau vẫn lấy đủ delta.
+    """
+    if not transaction.get_connection().in_atomic_block:
+        return
+
+    def run():
+        try:
+            refresh(patient_id)
+        except Exception:
+            logger.exception("Failed to refresh EHR snapshot for patient %s", patient_id)
+    transaction.on_commit(run)
+
+
+# --- Đọc ---
+def get(patient_id):
+    """Snapshot của bệnh nhân (1 query); chưa có thì dựng từ bảng gốc. None nếu không có hồ sơ."""
+    snapshot = PatientEHRSnapshot.objects.filter(patient_id=patient_id).first()
+    if snapshot is None:
+        snapshot = rebuild(patient_id)
+    return snapshot
@@ -0,0 +1,125 @@
+# clinical/sync.py
+"""
+Phiên bản hồ sơ EHR theo bệnh nhân, cho đồng bộ tăng dần (GET ehr/patient/<id>/?since=<version>).
+
+- Mỗi bệnh nhân có 1 bộ đếm (PatientRecordVersion). Mỗi khi một chẩn đoán, hoặc đơn thuốc/thuốc/xét nghiệm
+  của nó, được tạo/sửa/xóa, bộ đếm tăng 1 và chẩn đoán nhận version mới; chẩn đoán bị xóa để lại
+  DiagnosisTombstone mang version mới. Trong 1 hồ sơ mỗi version thuộc đúng 1 dòng, client chỉ cần nhớ 1 số.
+  Dòng ghi bằng bulk_create mà chưa touch_many có thể trùng version: changes() sắp theo (version, id) và
+  link 'next' mang thêm ?after=<id> khi trang cắt giữa nhóm đó, nên không dòng nào bị bỏ sót.
+- Tăng bộ đếm bằng UPDATE nên dòng đếm bị khóa tới khi transaction commit: các thay đổi của cùng 1 bệnh nhân
+  commit đúng theo thứ tự version. Vì vậy việc tăng version phải nằm trong cùng transaction với thay đổi
+  (clinical/signals.py làm việc này; các view ghi đều bọc transaction.atomic).
+- Khi đọc, version hiện tại được đọc TRƯỚC dữ liệu và chỉ trả các dòng có version <= nó: mọi thay đổi có
+  version đó trở xuống đã commit, nên client lưu version trả về làm `since` lần sau không bỏ sót gì.
+- Mỗi lần tăng version, hồ sơ dựng sẵn (clinical/snapshots.py) được cập nhật sau khi transaction commit.
+- bulk_create/QuerySet.update() không phát signal: tự gọi touch() nếu dùng.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Case, F, Q, Value, When
+
+from .models import Diagnosis, DiagnosisTombstone, PatientRecordVersion
+
+FIRST_VERSION = 1 # Hồ sơ chưa có bộ đếm (dữ liệu có sẵn) đang ở phiên bản này
+
+
+def current_version(patient_id):
+    version = PatientRecordVersion.objects.filter(patient_id=patient_id).values_list('version', flat=True).first()
+    return FIRST_VERSION if version is None else version
+
+
+def next_version(patient_id, count=1):
+    """
+    Tăng bộ đếm của bệnh nhân thêm `count`, trả về version mới (lớn nhất); các version
+    (mới - count, mới] thuộc về người gọi. Gọi trong transaction của thay đổi dữ liệu.
+    """
+    from . import snapshots # snapshots import module này
+
+    snapshots.schedule_refresh(patient_id)
+    counters = PatientRecordVersion.objects.filter(patient_id=patient_id)
+    if not counters.update(version=F('version') + count):
+        try:
+            with transaction.atomic():
+                return PatientRecordVersion.objects.create(patient_id=patient_id, version=FIRST_VERSION + count).version
+        except IntegrityError:
+            # Transaction khác vừa tạo bộ đếm này
+            counters.update(version=F('version') + count)
+    return counters.values_list('version', flat=True).get()
+
+
+def touch(diagnosis_id, patient_id=None):
+    """Đánh dấu chẩn đoán đã thay đổi (đơn thuốc/xét nghiệm của nó đổi). Trả về version mới, None nếu không còn."""
+    if patient_id is None:
+        patient_id = Diagnosis.objects.filter(pk=diagnosis_id).values_list('patient_id', flat=True).first()
+        if patient_id is None:
+            return None
+    version = next_version(patient_id)
+    Diagnosis.objects.filter(pk=diagnosis_id).update(version=version)
+    return version
+
+
+def touch_many(diagnoses):
+    """
+    touch() cho nhiều chẩn đoán (object đã load, cần id và patient_id), dùng sau bulk_create đơn thuốc/xét nghiệm;
+    version mới cũng được gán lên chính các object.
+    Mỗi bệnh nhân: tăng bộ đếm 1 lần cho cả nhóm, mỗi chẩn đoán nhận 1 version riêng, ghi bằng 1 câu UPDATE.
+    Khóa bộ đếm theo thứ tự patient_id để 2 lô song song không deadlock.
+    """
+    by_patient = {}
+    for diagnosis in diagnoses:
+        by_patient.setdefault(diagnosis.patient_id, {}).setdefault(diagnosis.pk, []).append(diagnosis)
+    for patient_id in sorted(by_patient):
+        ids = sorted(by_patient[patient_id])
+        last = next_version(patient_id, len(ids))
+        versions = {pk: last - len(ids) + 1 + index for index, pk in enumerate(ids)}
+        Diagnosis.objects.filter(pk__in=ids).update(
+            version=Case(*(When(pk=pk, then=Value(version)) for pk, version in versions.items()), output_field=BigIntegerField())
+        )
+        for pk, version in versions.items():
+            for diagnosis in by_patient[patient_id][pk]:
+                diagnosis.version = version
+
+
+def bury(diagnosis_id, patient_id):
+    """Ghi tombstone cho chẩn đoán đã xóa (hoặc đã chuyển sang hồ sơ khác) khỏi hồ sơ của patient_id."""
+    DiagnosisTombstone.objects.create(diagnosis_id=diagnosis_id, patient_id=patient_id, version=next_version(patient_id))
+
+
+def changes(patient_id, since, limit, queryset=None, after=None):
+    """
+    Các thay đổi của hồ sơ sau vị trí (since, after), theo thứ tự (version, id chẩn đoán), tối đa `limit` mục.
+    after=None: mọi thay đổi có version > since; có after: thêm các dòng version == since, id > after
+    (tiếp tục một nhóm cùng version bị cắt ở trang trước).
+    Trả về (danh sách chẩn đoán, danh sách ID đã xóa, version, cursor trang sau hoặc None nếu hết).
+    version: mọi thay đổi tới version này đã được trả - client lưu làm since lần sau.
+    cursor: (since, after) cho trang sau; after=None trừ khi trang cắt giữa nhóm cùng version.
+    `queryset`: queryset Diagnosis gốc (ví dụ đã prefetch đơn thuốc/xét nghiệm).
+    """
+    upto = current_version(patient_id)
+    queryset = Diagnosis.objects.all() if queryset is None else queryset
+    window = Q(version__gt=since)
+    tombstone_window = Q(version__gt=since)
+    if after is not None:
+        window |= Q(version=since, id__gt=after)
+        tombstone_window |= Q(version=since, diagnosis_id__gt=after)
+    diagnoses = list(queryset.filter(window, patient_id=patient_id, version__lte=upto).order_by('version', 'id')[:limit + 1])
+    tombstones = list(
+        DiagnosisTombstone.objects.filter(tombstone_window, patient_id=patient_id, version__lte=upto)
+        .order_by('version', 'diagnosis_id').values_list('version', 'diagnosis_id')[:limit + 1]
+    )
+
+    # Trộn 2 danh sách đã sắp xếp theo (version, id), lấy `limit` mục đầu
+    merged = sorted(
+        [(d.version, d.id, d) for d in diagnoses] + [(v, diagnosis_id, diagnosis_id) for v, diagnosis_id in tombstones],
+        key=lambda item: item[:2]
+    )
+    page = merged[:limit]
+    results = [item for _, _, item in page if isinstance(item, Diagnosis)]
+    deleted = [item for _, _, item in page if not isinstance(item, Diagnosis)]
+    if len(merged) <= limit:
+        return results, deleted, max(upto, since), None
+    last_version, last_id, _ = page[-1]
+    if merged[limit][0] == last_version:
+        # Trang cắt giữa các dòng cùng version (dữ liệu cũ, bulk_create chưa touch): version đó chưa trả hết
+        return results, deleted, last_version - 1, (last_version, last_id)
+    return results, deleted, last_version, (last_version, None)
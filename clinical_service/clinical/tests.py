@@ -1,3 +1,402 @@
-from django.test import TestCase
+import importlib
+import os
+import tempfile
+from io import StringIO
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import catalog, icd10, sync
+from .models import (
+    Diagnosis, IcdTally, LabOrder, Medication, PatientEHRSnapshot, PatientRecordVersion, PrescribedMedication, Prescription,
+)
+
+
+def make_client(user_id, roles=('Patient',)):
+    token = AccessToken()
+    token['user_id'] = user_id
+    token['roles'] = list(roles)
+    client = APIClient()
+    client.force_authenticate(user=TokenUser(token))
+    return client
+
+
+class PatientEHRSyncTests(TestCase):
+    patient_id = 7
+
+    def setUp(self):
+        self.client = make_client(self.patient_id)
+        self.url = f'/api/v1/clinical/ehr/patient/{self.patient_id}/'
+        self.diagnoses = [
+            Diagnosis.objects.create(appointment_id=n, patient_id=self.patient_id, doctor_id=3, description=f'Lần khám {n}')
+            for n in range(1, 6)
+        ]
+        prescription = Prescription.objects.create(diagnosis=self.diagnoses[0])
+        PrescribedMedication.objects.create(prescription=prescription, medication_name='Paracetamol', dosage='500mg', frequency='2 lần/ngày', duration='3 ngày')
+
+    def test_cursor_pages_cover_history_newest_first(self):
+        seen, url = [], f'{self.url}?page_size=2'
+        while url:
+            # Tối đa: version + chẩn đoán + 3 prefetch, không còn query exists()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertLessEqual(len(queries), 5)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [d.id for d in reversed(self.diagnoses)])
+
+    def test_no_records_is_404(self):
+        response = self.client.get('/api/v1/clinical/ehr/patient/999/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_since_returns_only_changes_and_deletions(self):
+        version = self.client.get(self.url).data['version']
+
+        LabOrder.objects.create(diagnosis=self.diagnoses[1], patient_id=self.patient_id, doctor_id=3, test_name='HbA1c')
+        added = Diagnosis.objects.create(appointment_id=10, patient_id=self.patient_id, doctor_id=3, description='Mới')
+        removed_id = self.diagnoses[0].id
+        self.diagnoses[0].delete()
+
+        response = self.client.get(f'{self.url}?since={version}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['results']], [self.diagnoses[1].id, added.id])
+        self.assertEqual(response.data['results'][0]['lab_orders'][0]['test_name'], 'HbA1c')
+        self.assertEqual(response.data['deleted'], [removed_id])
+        self.assertFalse(response.data['has_more'])
+        self.assertGreater(response.data['version'], version)
+
+        # Đã đồng bộ xong: không còn thay đổi
+        response = self.client.get(f"{self.url}?since={response.data['version']}")
+        self.assertEqual((response.data['results'], response.data['deleted']), ([], []))
+
+    def test_since_pages_by_version(self):
+        version = self.client.get(self.url).data['version']
+        for diagnosis in self.diagnoses:
+            diagnosis.description += ' (sửa)'
+            diagnosis.save()
+
+        seen, since = [], version
+        while True:
+            data = self.client.get(f'{self.url}?since={since}&page_size=2').data
+            seen.extend(item['id'] for item in data['results'])
+            since = data['version']
+            if not data['has_more']:
+                break
+        self.assertEqual(seen, [d.id for d in self.diagnoses])
+
+    def test_invalid_since_is_400(self):
+        self.assertEqual(self.client.get(f'{self.url}?since=abc').status_code, 400)
+        self.assertEqual(self.client.get(f'{self.url}?since=1&after=x').status_code, 400)
+        self.assertEqual(self.client.get(f'{self.url}?since={2 ** 63}').status_code, 400)
+
+    def make_legacy(self, count):
+        """Hồ sơ như dữ liệu có trước 0004 / bulk_create chưa touch: mọi chẩn đoán cùng version 1, chưa có bộ đếm."""
+        Diagnosis.objects.bulk_create([
+            Diagnosis(appointment_id=100 + n, patient_id=self.patient_id, doctor_id=3, description=f'Cũ {n}')
+            for n in range(count)
+        ])
+        Diagnosis.objects.filter(patient_id=self.patient_id).update(version=sync.FIRST_VERSION)
+        PatientRecordVersion.objects.filter(patient_id=self.patient_id).delete()
+        return list(Diagnosis.objects.filter(patient_id=self.patient_id).order_by('id').values_list('id', flat=True))
+
+    def test_since_pages_through_same_version_rows(self):
+        expected = self.make_legacy(30)
+        seen, url = [], f'{self.url}?since=0&page_size=20'
+        while url:
+            data = self.client.get(url).data
+            seen.extend(item['id'] for item in data['results'])
+            url = data['next']
+        self.assertEqual(seen, expected)
+        self.assertFalse(data['has_more'])
+
+        # 'version' của trang cắt giữa nhóm chưa bao gồm nhóm đó: dùng làm since không bỏ sót dòng nào
+        first = self.client.get(f'{self.url}?since=0&page_size=20').data
+        self.assertEqual((first['version'], len(first['results'])), (0, 20))
+        self.assertEqual(len(self.client.get(f"{self.url}?since={first['version']}&page_size=50").data['results']), 35)
+
+    def test_migration_assigns_distinct_versions(self):
+        expected = self.make_legacy(30)
+        PatientEHRSnapshot.objects.create(patient_id=self.patient_id, version=1, document=b'', updated_at=timezone.now())
+        migration = importlib.import_module('clinical.migrations.0008_distinct_record_versions')
+        migration.assign_distinct_versions(django_apps, None)
+
+        versions = list(Diagnosis.objects.filter(patient_id=self.patient_id).values_list('version', flat=True))
+        self.assertEqual(len(set(versions)), len(versions))
+        self.assertEqual(sync.current_version(self.patient_id), max(versions))
+        self.assertFalse(PatientEHRSnapshot.objects.exists())
+        seen, since = [], 0
+        while True:
+            data = self.client.get(f'{self.url}?since={since}&page_size=20').data
+            self.assertNotIn('after=', data['next'] or '')
+            seen.extend(item['id'] for item in data['results'])
+            since = data['version']
+            if not data['has_more']:
+                break
+        self.assertEqual(sorted(seen), expected)
+
+
+class PatientEHRSnapshotTests(TestCase):
+    patient_id = 8
+
+    def setUp(self):
+        self.doctor = make_client(3, roles=('Doctor',))
+        self.patient = make_client(self.patient_id)
+        self.url = f'/api/v1/clinical/ehr/patient/{self.patient_id}/'
+
+    def create_diagnosis(self, appointment_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.doctor.post('/api/v1/clinical/diagnoses/create/', {
+                'appointment_id': appointment_id, 'patient_id': self.patient_id, 'doctor_id': 3, 'description': 'Sốt',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Diagnosis.objects.get(appointment_id=appointment_id)
+
+    def test_snapshot_follows_writes_and_matches_source(self):
+        first = self.create_diagnosis(1)
+        self.assertEqual(self.patient.get(f'{self.url}?snapshot=1').json()['diagnoses'][0]['id'], first.id) # Dựng lần đầu
+
+        second = self.create_diagnosis(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.post('/api/v1/clinical/prescriptions/create/', {
+                'diagnosis': first.id,
+                'medications': [{'medication_name': 'Amoxicillin', 'dosage': '500mg', 'frequency': '3 lần/ngày', 'duration': '7 ngày'}],
+            }, format='json')
+
+        with self.assertNumQueries(1):
+            response = self.patient.get(f'{self.url}?snapshot=1')
+        document = response.json()
+        self.assertEqual([item['id'] for item in document['diagnoses']], [second.id, first.id])
+        self.assertEqual(document['diagnoses'][1]['prescriptions'][0]['medications'][0]['medication_name'], 'Amoxicillin')
+        self.assertEqual(document['version'], self.patient.get(self.url).data['version'])
+        self.assertEqual(document['diagnoses'], self.patient.get(self.url).json()['results'])
+
+        response = self.patient.get(f'{self.url}?snapshot=1', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        call_command('check_ehr_snapshots', stdout=StringIO())
+
+    def test_check_command_detects_stale_snapshot(self):
+        diagnosis = self.create_diagnosis(1)
+        self.patient.get(f'{self.url}?snapshot=1')
+        # Callback on_commit không chạy (như process chết ngay sau commit): snapshot bị cũ
+        diagnosis.description = 'Viêm họng'
+        diagnosis.save()
+
+        with self.assertRaises(CommandError):
+            call_command('check_ehr_snapshots', stdout=StringIO())
+        call_command('check_ehr_snapshots', '--fix', stdout=StringIO())
+        self.assertEqual(self.patient.get(f'{self.url}?snapshot=1').json()['diagnoses'][0]['description'], 'Viêm họng')
+
+
+class PrescriptionBatchCreateTests(TestCase):
+    url = '/api/v1/clinical/prescriptions/batch/'
+
+    def setUp(self):
+        self.doctor = make_client(3, roles=('Doctor',))
+        self.diagnoses = [
+            Diagnosis.objects.create(appointment_id=n, patient_id=10 + n % 2, doctor_id=3, description=f'Lần khám {n}')
+            for n in range(1, 5)
+        ]
+
+    def payload(self, diagnosis_id, name='Paracetamol'):
+        return {'diagnosis': diagnosis_id, 'notes': '', 'medications': [
+            {'medication_name': name, 'dosage': '500mg', 'frequency': '2 lần/ngày', 'duration': '3 ngày'},
+            {'medication_name': 'Vitamin C', 'dosage': '1 viên', 'frequency': '1 lần/ngày', 'duration': '7 ngày'},
+        ]}
+
+    def test_batch_writes_in_constant_queries(self):
+        versions = {d.patient_id: sync.current_version(d.patient_id) for d in self.diagnoses}
+        body = [self.payload(d.id) for d in self.diagnoses] * 5
+        with CaptureQueriesContext(connection) as queries:
+            response = self.doctor.post(self.url, body, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual([item['diagnosis'] for item in response.data], [item['diagnosis'] for item in body])
+        self.assertEqual(len(response.data[0]['medications']), 2)
+        self.assertEqual((Prescription.objects.count(), PrescribedMedication.objects.count()), (20, 40))
+        # Không phụ thuộc số đơn: chẩn đoán, 2 INSERT, outbox, savepoint, và 3 query version cho mỗi bệnh nhân
+        self.assertLessEqual(len(queries), 15)
+
+        # Mỗi chẩn đoán nhận 1 version riêng, mới hơn version trước lô
+        for diagnosis in self.diagnoses:
+            diagnosis.refresh_from_db()
+            self.assertGreater(diagnosis.version, versions[diagnosis.patient_id])
+        self.assertEqual(len({(d.patient_id, d.version) for d in self.diagnoses}), len(self.diagnoses))
+
+    def test_invalid_item_rejects_whole_batch(self):
+        response = self.doctor.post(self.url, [self.payload(self.diagnoses[0].id), self.payload(9999)], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data), [1]) # Lỗi theo vị trí mục
+        self.assertIn('diagnosis', response.data[1])
+        self.assertFalse(Prescription.objects.exists())
+
+
+@override_settings(CATALOG_CHECK_SECONDS=0)
+class MedicationAutocompleteTests(TestCase):
+    url = '/api/v1/clinical/medications/autocomplete/'
+
+    def setUp(self):
+        catalog.medication_index.clear() # Version quay lại sau mỗi test (rollback), chỉ mục của test trước không còn đúng
+        self.addCleanup(catalog.medication_index.clear)
+        self.doctor = make_client(3, roles=('Doctor',))
+
+    def load(self, text, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as file:
+            file.write(text)
+        self.addCleanup(os.remove, file.name)
+        call_command('load_medications', file.name, *args, stdout=StringIO())
+
+    def names(self, query):
+        return [item['name'] for item in self.doctor.get(self.url, {'q': query}).data['results']]
+
+    def test_load_and_autocomplete_by_prefix(self):
+        self.load(
+            'code,name,generic_name,strength,form\n'
+            'VN-1,Augmentin,Amoxicillin Clavulanic Acid,625mg,tablet\n'
+            'VN-2,Amoxicillin,Amoxicillin,500mg,capsule\n'
+            'VN-3,Panadol,Paracetamol,500mg,tablet\n'
+            'VN-3,Panadol Extra,Paracetamol Caffeine,500mg,tablet\n' # Trùng code: dòng sau thắng
+            'VN-4,Efferalgan Đau Đầu,Paracetamol,500mg,effervescent tablet\n'
+        )
+        self.assertEqual(Medication.objects.count(), 4)
+        self.assertEqual(self.names('amox'), ['Amoxicillin', 'Augmentin']) # Khớp tên trước, rồi hoạt chất
+        with self.assertNumQueries(1): # Chỉ mục đã dựng: chỉ đọc version danh mục, không quét bảng thuốc
+            self.assertEqual(self.names('amoxi'), ['Amoxicillin', 'Augmentin'])
+        self.assertEqual(self.names('PARA'), ['Efferalgan Đau Đầu', 'Panadol Extra']) # Theo thứ tự khóa hoạt chất
+        self.assertEqual(self.names('dau dau'), ['Efferalgan Đau Đầu'])
+        self.assertEqual(self.names('vn-3'), ['Panadol Extra'])
+        self.assertEqual(self.names(''), [])
+
+        # Nạp lại toàn bộ danh mục: thuốc không còn trong file bị ngừng, chỉ mục dựng lại theo version mới
+        self.load('code,name\nVN-2,Amoxicillin\n', '--replace')
+        self.assertEqual(self.names('a'), ['Amoxicillin'])
+
+    def test_single_edit_rebuilds_index(self):
+        self.assertEqual(self.names('ceti'), [])
+        Medication.objects.create(code='VN-9', name='Cetirizine', strength='10mg')
+        response = self.doctor.get(self.url, {'q': 'ceti'})
+        self.assertEqual(response.data['results'][0]['strength'], '10mg')
+        self.assertEqual(response.data['version'], catalog.current_version(catalog.MEDICATIONS))
+
+
+ICD10_CSV = (
+    'code,title,level,range\n'
+    'X,Bệnh hệ hô hấp,chapter,J00-J99\n'
+    'J00-J06,Nhiễm trùng đường hô hấp trên cấp,,\n'
+    'J09-J18,Cúm và viêm phổi,,\n'
+    'J06,Nhiễm trùng đường hô hấp trên cấp ở nhiều vị trí,,\n'
+    'J06.0,Viêm thanh hầu cấp,,\n'
+    'J06.9,Nhiễm trùng đường hô hấp trên cấp không đặc hiệu,,\n'
+    'J18,Viêm phổi không rõ tác nhân,,\n'
+)
+
+
+@override_settings(CATALOG_CHECK_SECONDS=0)
+class Icd10CatalogTests(TestCase):
+    def setUp(self):
+        icd10.table.clear()
+        self.addCleanup(icd10.table.clear)
+        self.doctor = make_client(3, roles=('Doctor',))
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as file:
+            file.write(ICD10_CSV)
+        self.addCleanup(os.remove, file.name)
+        call_command('load_icd10', file.name, stdout=StringIO())
+
+    def create_diagnosis(self, appointment_id, code):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.doctor.post('/api/v1/clinical/diagnoses/create/', {
+                'appointment_id': appointment_id, 'patient_id': 5, 'doctor_id': 3, 'diagnosis_code': code, 'description': 'Ho, sốt',
+            }, format='json')
+
+    def test_codes_are_validated_and_canonicalized(self):
+        self.assertEqual(self.create_diagnosis(1, 'j069').status_code, 201)
+        self.assertEqual(Diagnosis.objects.get(appointment_id=1).diagnosis_code, 'J06.9')
+        for code in ('J99.9', 'J00-J06'): # Không có trong danh mục / nhóm không dùng làm mã chẩn đoán
+            response = self.create_diagnosis(2, code)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('diagnosis_code', response.data)
+
+    def test_rollup_counts_and_range_queries(self):
+        for appointment_id, code in enumerate(['J06.9', 'J06.0', 'J06', 'J18'], start=1):
+            self.assertEqual(self.create_diagnosis(appointment_id, code).status_code, 201)
+        with self.captureOnCommitCallbacks(execute=True):
+            Diagnosis.objects.get(appointment_id=2).delete()
+
+        month = f'{icd10.month_of(timezone.now()):%Y-%m}'
+        with self.assertNumQueries(2): # Version danh mục + IcdTally, không đếm trên bảng Diagnosis
+            response = self.doctor.get('/api/v1/clinical/icd10/X/', {'from': month, 'to': month})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(response.data['range'], {'start': 'J00', 'end': 'J9:'})
+        self.assertEqual([(child['code'], child['count']) for child in response.data['children']], [('J00-J06', 2), ('J09-J18', 1)])
+        self.assertEqual(self.doctor.get('/api/v1/clinical/icd10/j06/').data['children'][1], {
+            'code': 'J06.9', 'level': 'code', 'title': 'Nhiễm trùng đường hô hấp trên cấp không đặc hiệu', 'count': 1,
+        })
+
+        response = self.doctor.get('/api/v1/clinical/icd10/J06/diagnoses/', {'from': month})
+        self.assertEqual(sorted(item['diagnosis_code'] for item in response.data['results']), ['J06', 'J06.9'])
+        self.assertEqual(self.doctor.get('/api/v1/clinical/icd10/J06/diagnoses/', {'to': '2000-01'}).data['results'], [])
+        self.assertEqual(self.make_patient_request().status_code, 403)
+
+        call_command('check_icd_tallies', stdout=StringIO())
+        IcdTally.objects.filter(code='X').update(count=0)
+        with self.assertRaises(CommandError):
+            call_command('check_icd_tallies', stdout=StringIO())
+        call_command('check_icd_tallies', '--fix', stdout=StringIO())
+        self.assertEqual(self.doctor.get('/api/v1/clinical/icd10/X/').data['count'], 3)
+
+    def make_patient_request(self):
+        return make_client(5).get('/api/v1/clinical/icd10/X/')
+
+
+# --- Kiểm tra xác thực JWT không tra DB: token do user_service ký, user không có trong DB của service này ---
+class StatelessJWTAuthTests(TestCase):
+    def client_for(self, user_id, roles, is_staff=False):
+        # Cùng các claim MyTokenObtainPairSerializer (user_service) thêm vào token
+        token = AccessToken()
+        token['user_id'] = user_id
+        token['username'] = f'user{user_id}'
+        token['is_staff'] = is_staff
+        token['roles'] = list(roles)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def test_user_service_tokens_are_accepted(self):
+        doctor = self.client_for(3, ['Doctor'])
+        with CaptureQueriesContext(connection) as captured:
+            response = doctor.post('/api/v1/clinical/diagnoses/create/', {
+                'appointment_id': 1, 'patient_id': 7, 'doctor_id': 3, 'description': 'Viêm họng',
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+            response = self.client_for(7, ['Patient']).get('/api/v1/clinical/ehr/patient/7/')
+            self.assertEqual(response.status_code, 200)
+        self.assertFalse([query['sql'] for query in captured.captured_queries if 'auth_user' in query['sql']])
+        self.assertEqual(Diagnosis.objects.get().doctor_id, 3)
+
+    def test_claims_drive_permissions(self):
+        body = {'appointment_id': 2, 'patient_id': 7, 'doctor_id': 3, 'description': 'Sốt'}
+        self.assertEqual(self.client_for(7, ['Patient']).post('/api/v1/clinical/diagnoses/create/', body, format='json').status_code, 403)
+        self.assertEqual(APIClient().post('/api/v1/clinical/diagnoses/create/', body, format='json').status_code, 401)
+        invalid = APIClient()
+        invalid.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(invalid.get('/api/v1/clinical/ehr/patient/7/').status_code, 401)
+
+
+class BenchmarkDataTests(TestCase):
+    def test_generated_data_has_versions_and_snapshots(self):
+        call_command('generate_benchmark_data', doctors=3, patients=4, diagnoses=30, medications=60,
+                     batch_size=7, stdout=StringIO())
+        versions = list(Diagnosis.objects.values_list('patient_id', 'version'))
+        self.assertEqual(len(versions), 30)
+        self.assertEqual(len(set(versions)), len(versions))
+        for patient_id in Diagnosis.objects.values_list('patient_id', flat=True).distinct():
+            snapshot = PatientEHRSnapshot.objects.get(patient_id=patient_id)
+            self.assertEqual(snapshot.version, sync.current_version(patient_id))
+            self.assertEqual(snapshot.diagnosis_count, Diagnosis.objects.filter(patient_id=patient_id).count())
@@ -4,8 +4,12 @@ from django.urls import path, include
 from .views import (
     DiagnosisCreateView,
     PrescriptionCreateView,
+    PrescriptionBatchCreateView,
     LabOrderCreateView,
     PatientEHRView,
+    MedicationAutocompleteView,
+    IcdNodeView,
+    IcdDiagnosisListView,
     # DiagnosisViewSet, # Nếu dùng ViewSet
 )
 
@@ -18,9 +22,16 @@ app_name = 'clinical'
 urlpatterns = [
     path('diagnoses/create/', DiagnosisCreateView.as_view(), name='diagnosis-create'),
     path('prescriptions/create/', PrescriptionCreateView.as_view(), name='prescription-create'),
+    path('prescriptions/batch/', PrescriptionBatchCreateView.as_view(), name='prescription-batch-create'),
     path('lab-orders/create/', LabOrderCreateView.as_view(), name='laborder-create'),
     # URL để lấy EHR theo ID bệnh nhân
     path('ehr/patient/<int:patient_id>/', PatientEHRView.as_view(), name='patient-ehr'),
+    # Gợi ý thuốc từ danh mục (nạp bằng manage.py load_medications)
+    path('medications/autocomplete/', MedicationAutocompleteView.as_view(), name='medication-autocomplete'),
+    # Danh mục ICD-10 (nạp bằng manage.py load_icd10): cây mã, số chẩn đoán theo nút, chẩn đoán theo nhánh
+    path('icd10/', IcdNodeView.as_view(), name='icd10-root'),
+    path('icd10/<str:code>/', IcdNodeView.as_view(), name='icd10-node'),
+    path('icd10/<str:code>/diagnoses/', IcdDiagnosisListView.as_view(), name='icd10-diagnoses'),
 
     # Include router URLs nếu dùng ViewSet
     # path('', include(router.urls)),
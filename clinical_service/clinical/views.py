@@ -1,25 +1,39 @@
 # clinical/views.py
+import gzip
+from datetime import datetime, time
+
+from django.conf import settings
+from django.http import HttpResponse
 from rest_framework import generics, permissions, status, views
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.http import Http404
+from django.utils import timezone
 from .models import Diagnosis, Prescription, LabOrder, PrescribedMedication
 from .serializers import (
     DiagnosisSerializer,
     DiagnosisCreateSerializer,
+    DiagnosisSummarySerializer,
     PrescriptionSerializer,
     PrescriptionCreateSerializer,
     LabOrderSerializer,
     LabOrderCreateSerializer,
 )
 from rest_framework.permissions import IsAuthenticated, IsAdminUser # Import permissions
+from .pagination import MAX_ID, DiagnosisKeysetPagination
 from .permissions import IsAdminClaim, IsDoctorClaim, IsPatientClaim
+from . import catalog, icd10, snapshots, sync
 from rest_framework.permissions import IsAuthenticated
+from clinical_service import idempotency, instrumentation, outbox
 
 # --- View Tạo Chẩn đoán mới ---
-class DiagnosisCreateView(generics.CreateAPIView):
+class DiagnosisCreateView(idempotency.IdempotentCreateMixin, generics.CreateAPIView):
     """
     API tạo một Chẩn đoán mới.
-    Yêu cầu quyền Bác sĩ (hoặc Admin).
+    Yêu cầu quyền Bác sĩ (hoặc Admin). Hỗ trợ header Idempotency-Key.
     """
     serializer_class = DiagnosisCreateSerializer
     # permission_classes = [IsAuthenticated, IsDoctorPermission] # Cần Custom Permission
@@ -29,30 +43,77 @@ class DiagnosisCreateView(generics.CreateAPIView):
         # Giả định doctor_id lấy từ user đang request
         # Cần cơ chế xác định user là Doctor và lấy ID của họ
         # patient_id có thể lấy từ appointment_id (cần gọi service khác hoặc giả định)
-        serializer.save(doctor_id=self.request.user.id) # Tạm gán ID user hiện tại là doctor
+        # Tăng version hồ sơ (signal) và ghi chẩn đoán trong cùng transaction (xem clinical/sync.py)
+        with transaction.atomic():
+            serializer.save(doctor_id=self.request.user.id) # Tạm gán ID user hiện tại là doctor
 
 # --- View Tạo Đơn thuốc mới ---
-class PrescriptionCreateView(generics.CreateAPIView):
+class PrescriptionCreateView(idempotency.IdempotentCreateMixin, generics.CreateAPIView):
     """
     API tạo một Đơn thuốc mới (kèm chi tiết thuốc).
-    Yêu cầu quyền Bác sĩ (hoặc Admin).
+    Yêu cầu quyền Bác sĩ (hoặc Admin). Hỗ trợ header Idempotency-Key.
     """
     serializer_class = PrescriptionCreateSerializer
     # permission_classes = [IsAuthenticated, IsDoctorPermission]
     permission_classes = [IsAuthenticated, IsDoctorClaim]
 
     def perform_create(self, serializer):
-        # --- Placeholder for Inter-service Communication ---
-        prescription = serializer.save()
-        print(f"--- Gửi sự kiện 'prescription_created' vào Message Queue ---")
-        print(f"--- Dữ liệu: prescription_id={prescription.id}, diagnosis_id={prescription.diagnosis.id} ---")
-        # Ví dụ: publish_event('prescription_created', {'prescription_id': prescription.id, ...})
+        # Đơn thuốc và sự kiện outbox (cho PharmacyService...) commit cùng nhau; publish_outbox gửi đi sau
+        with instrumentation.span('prescription_create.save'), transaction.atomic():
+            prescription = serializer.save()
+            outbox.record(*prescription_event(prescription))
+        instrumentation.event('prescription_created', prescription_id=prescription.id, diagnosis_id=prescription.diagnosis_id)
+
+
+def prescription_event(prescription):
+    """(event_type, payload, key) của sự kiện outbox 'prescription.created'."""
+    diagnosis = prescription.diagnosis
+    return 'prescription.created', {
+        'prescription_id': prescription.id,
+        'diagnosis_id': diagnosis.id,
+        'patient_id': diagnosis.patient_id,
+        'doctor_id': diagnosis.doctor_id,
+        'medications': [
+            {'medication_name': medication.medication_name, 'dosage': medication.dosage,
+             'frequency': medication.frequency, 'duration': medication.duration}
+            for medication in prescription.medications.all()
+        ],
+    }, f'prescription:{prescription.id}'
+
+# --- View Tạo nhiều Đơn thuốc một lần ---
+class PrescriptionBatchCreateView(idempotency.IdempotentCreateMixin, generics.CreateAPIView):
+    """
+    API tạo nhiều Đơn thuốc (kèm chi tiết thuốc) trong 1 request: body là danh sách, mỗi mục như prescriptions/create/.
+    Validate cả lô trước (lỗi trả theo vị trí từng mục, không tạo gì); các chẩn đoán được nạp bằng 1 query,
+    đơn thuốc/thuốc/sự kiện outbox được ghi bằng bulk_create trong 1 transaction.
+    Tối đa settings.PRESCRIPTION_BATCH_MAX_SIZE đơn mỗi lô. Yêu cầu quyền Bác sĩ. Hỗ trợ header Idempotency-Key.
+    """
+    serializer_class = PrescriptionCreateSerializer
+    permission_classes = [IsAuthenticated, IsDoctorClaim]
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(many=True, allow_empty=False, max_length=settings.PRESCRIPTION_BATCH_MAX_SIZE)
+        return super().get_serializer(*args, **kwargs)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        prescriptions = self.perform_create(serializer)
+        # Trả kèm ID và ngày kê; thuốc đã gắn sẵn khi tạo nên không query thêm
+        return Response(PrescriptionSerializer(prescriptions, many=True).data, status=status.HTTP_201_CREATED)
+
+    def perform_create(self, serializer):
+        with instrumentation.span('prescription_batch_create.save'), transaction.atomic():
+            prescriptions = serializer.save()
+            outbox.record_many([prescription_event(prescription) for prescription in prescriptions])
+        instrumentation.event('prescriptions_batch_created', count=len(prescriptions))
+        return prescriptions
 
 # --- View Tạo Yêu cầu Xét nghiệm mới ---
-class LabOrderCreateView(generics.CreateAPIView):
+class LabOrderCreateView(idempotency.IdempotentCreateMixin, generics.CreateAPIView):
     """
     API tạo một Yêu cầu Xét nghiệm mới.
-    Yêu cầu quyền Bác sĩ (hoặc Admin).
+    Yêu cầu quyền Bác sĩ (hoặc Admin). Hỗ trợ header Idempotency-Key.
     """
     serializer_class = LabOrderCreateSerializer
     # permission_classes = [IsAuthenticated, IsDoctorPermission]
@@ -60,17 +121,32 @@ class LabOrderCreateView(generics.CreateAPIView):
 
     def perform_create(self, serializer):
         # Giả định doctor_id và patient_id lấy từ context hoặc payload đã validate
-        lab_order = serializer.save(doctor_id=self.request.user.id) # Tạm gán ID user hiện tại là doctor
-        # --- Placeholder for Inter-service Communication ---
-        print(f"--- Gửi sự kiện 'lab_order_created' vào Message Queue ---")
-        print(f"--- Dữ liệu: lab_order_id={lab_order.id}, patient_id={lab_order.patient_id}, test_name={lab_order.test_name} ---")
-        # Ví dụ: publish_event('lab_order_created', {'lab_order_id': lab_order.id, ...})
+        with instrumentation.span('lab_order_create.save'), transaction.atomic():
+            lab_order = serializer.save(doctor_id=self.request.user.id) # Tạm gán ID user hiện tại là doctor
+            # Sự kiện cho LabService, commit cùng yêu cầu xét nghiệm
+            outbox.record('lab_order.created', {
+                'lab_order_id': lab_order.id,
+                'diagnosis_id': lab_order.diagnosis_id,
+                'patient_id': lab_order.patient_id,
+                'doctor_id': lab_order.doctor_id,
+                'test_name': lab_order.test_name,
+                'status': lab_order.status,
+            }, key=f'lab_order:{lab_order.id}')
+        instrumentation.event('lab_order_created', lab_order_id=lab_order.id, patient_id=lab_order.patient_id, test_name=lab_order.test_name)
 
 # --- View Lấy Tóm tắt EHR của Bệnh nhân ---
 class PatientEHRView(views.APIView):
     """
     API lấy tóm tắt Hồ sơ sức khỏe điện tử (EHR) của một bệnh nhân.
     Yêu cầu quyền Admin hoặc Bác sĩ liên quan hoặc chính Bệnh nhân đó.
+    - Mặc định: phân trang cursor theo diagnosis_time, mới nhất trước (?cursor=, ?page_size=),
+      kèm 'version' hiện tại của hồ sơ.
+    - ?since=<version>: chỉ trả các thay đổi sau version đó (đồng bộ tăng dần, xem get_changes);
+      ?after=<id> chỉ có trong link 'next' khi trang cắt giữa các dòng cùng version.
+    - ?snapshot=1: toàn bộ hồ sơ từ bản dựng sẵn (clinical/snapshots.py), 1 query, hỗ trợ ETag/If-None-Match.
+      Cố ý để client tự chọn, không làm mặc định: snapshot là cả hồ sơ trong 1 document (không phân trang,
+      hồ sơ dài thì payload lớn) và được cập nhật sau commit nên có thể chậm hơn bảng gốc 1 nhịp ghi.
+      Client cần cả hồ sơ (đồng bộ ban đầu, in ấn) dùng snapshot; giao diện cuộn danh sách dùng trang mặc định.
     """
     # Permission này cần phức tạp hơn: IsOwner (Patient) OR IsAssociatedDoctor OR IsAdminClaim
     # Tạm thời:
@@ -84,25 +160,209 @@ class PatientEHRView(views.APIView):
     #     if not (is_owner or is_doctor_associated or is_admin):
     #         return Response({"detail": "Not authorized."}, status=status.HTTP_403_FORBIDDEN)
 
+    pagination_class = DiagnosisKeysetPagination
+    since_query_param = 'since'
+    after_query_param = 'after'
+    snapshot_query_param = 'snapshot'
+
+    def get_queryset(self, patient_id):
+        # Prefetch sâu để lấy cả thuốc và xét nghiệm
+        return snapshots.ehr_queryset(patient_id)
+
     def get(self, request, patient_id, format=None):
         # Kiểm tra quyền truy cập ở đây nếu dùng permission phức tạp hơn
+        if request.query_params.get(self.snapshot_query_param) in ('1', 'true'):
+            return self.get_snapshot(request, patient_id)
+        since = request.query_params.get(self.since_query_param)
+        if since is not None:
+            return self.get_changes(request, patient_id, self.parse_since(since))
 
-        # Lấy tất cả các chẩn đoán của bệnh nhân
-        diagnoses = Diagnosis.objects.filter(patient_id=patient_id).prefetch_related(
-            'prescriptions__medications', # Prefetch sâu để lấy cả thuốc
-            'lab_orders'
-        ).order_by('-diagnosis_time')
-
-        if not diagnoses.exists():
+        # Version đọc trước dữ liệu: client lưu lại để lần sau chỉ hỏi ?since=<version> (xem clinical/sync.py)
+        version = sync.current_version(patient_id)
+        paginator = self.pagination_class()
+        diagnoses = paginator.paginate_queryset(self.get_queryset(patient_id), request, view=self)
+        # Trang đầu rỗng = chưa có hồ sơ (biết ngay từ kết quả trang, không cần query exists() riêng)
+        if not diagnoses and not paginator.has_cursor:
             return Response({"detail": "No clinical records found for this patient."}, status=status.HTTP_404_NOT_FOUND)
 
         # Serialize dữ liệu chẩn đoán (đã bao gồm đơn thuốc và xét nghiệm lồng nhau)
-        serializer = DiagnosisSerializer(diagnoses, many=True)
+        response = paginator.get_paginated_response(DiagnosisSerializer(diagnoses, many=True).data)
+        response.data = {'version': version, **response.data}
 
         # Trong thực tế, có thể cần tổng hợp thêm thông tin từ các service khác
         # Ví dụ: gọi LabService để lấy kết quả chi tiết cho lab_orders
 
-        return Response(serializer.data)
+        return response
+
+    def get_snapshot(self, request, patient_id):
+        """
+        Trả nguyên document JSON đã nén của snapshot: {"patient_id", "version", "diagnoses": [...]}.
+        Client nhận gzip thì gửi thẳng bytes đã lưu, không giải nén/serialize lại.
+        """
+        snapshot = snapshots.get(patient_id)
+        if snapshot is None:
+            return Response({"detail": "No clinical records found for this patient."}, status=status.HTTP_404_NOT_FOUND)
+        etag = f'"ehr-{patient_id}-v{snapshot.version}"'
+        headers = {'ETag': etag, 'Vary': 'Accept-Encoding'}
+        if etag in request.headers.get('If-None-Match', ''):
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        body = bytes(snapshot.document)
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            headers['Content-Encoding'] = 'gzip'
+        else:
+            body = gzip.decompress(body)
+        return HttpResponse(body, content_type='application/json', headers=headers)
+
+    def parse_since(self, value):
+        try:
+            since = int(value)
+        except ValueError:
+            since = -1
+        if not 0 <= since <= MAX_ID: # Số quá lớn làm driver DB lỗi (OverflowError) khi query
+            raise ValidationError({self.since_query_param: "Must be a non-negative integer version."})
+        return since
+
+    def parse_after(self, value):
+        try:
+            after = int(value)
+        except ValueError:
+            after = -1
+        if not 0 <= after <= MAX_ID:
+            raise ValidationError({self.after_query_param: "Must be a diagnosis id."})
+        return after
+
+    def get_changes(self, request, patient_id, since):
+        """
+        Đồng bộ tăng dần: các chẩn đoán đã tạo/sửa (kèm đơn thuốc, xét nghiệm) và ID chẩn đoán đã xóa sau `since`.
+        Client lưu 'version' trả về làm since lần sau; has_more = còn thay đổi, gọi tiếp 'next'
+        ('next' có thể mang thêm ?after=<id> khi trang cắt giữa các dòng cùng version, xem sync.changes).
+        """
+        after = request.query_params.get(self.after_query_param)
+        if after is not None:
+            after = self.parse_after(after)
+        limit = self.pagination_class().get_page_size(request)
+        diagnoses, deleted, version, cursor = sync.changes(patient_id, since, limit, self.get_queryset(patient_id), after)
+        next_url = None
+        if cursor is not None:
+            next_url = replace_query_param(request.build_absolute_uri(), self.since_query_param, cursor[0])
+            if cursor[1] is None:
+                next_url = remove_query_param(next_url, self.after_query_param)
+            else:
+                next_url = replace_query_param(next_url, self.after_query_param, cursor[1])
+        return Response({
+            'version': version,
+            'has_more': cursor is not None,
+            'next': next_url,
+            'results': DiagnosisSerializer(diagnoses, many=True).data,
+            'deleted': deleted,
+        })
+
+# --- View Gợi ý thuốc từ danh mục ---
+class MedicationAutocompleteView(views.APIView):
+    """
+    API gợi ý thuốc khi bác sĩ gõ tên: GET ?q=<tiền tố>&limit=<n>.
+    Khớp tiền tố của tên, hoạt chất hoặc mã, không phân biệt hoa thường/dấu. Tra trên chỉ mục trong bộ nhớ
+    (clinical/catalog.py), không query DB; 'version' là version danh mục mà kết quả phản ánh.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'autocomplete' # Mỗi phím gõ 1 request
+    default_limit = 10
+    max_limit = 50
+
+    def get(self, request, format=None):
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            raise ValidationError({'limit': "Must be an integer."})
+        if limit < 1:
+            raise ValidationError({'limit': "Must be a positive integer."})
+        version, index = catalog.medication_index.get()
+        return Response({
+            'version': version,
+            'results': index.search(request.query_params.get('q', ''), limit),
+        })
+
+# --- Danh mục ICD-10: tra cứu nút và thống kê theo nhánh ---
+class IcdMonthRangeMixin:
+    """Query params from/to dạng YYYY-MM (cả 2 tháng đều tính), tùy chọn."""
+
+    def get_month_range(self):
+        months = []
+        for name in ('from', 'to'):
+            value = self.request.query_params.get(name)
+            try:
+                months.append(icd10.parse_month(value) if value else None)
+            except ValueError:
+                raise ValidationError({name: "Must be a month in YYYY-MM format."})
+        return months
+
+    def get_node(self, code):
+        """Nút ICD-10 từ bảng tra trong bộ nhớ, 404 nếu không có."""
+        version, table = icd10.table.get()
+        node = table.get(code)
+        if node is None:
+            raise Http404("Unknown ICD-10 code.")
+        return version, table, node
+
+
+class IcdNodeView(IcdMonthRangeMixin, views.APIView):
+    """
+    API tra cứu một nút ICD-10 (chương 'X', nhóm 'J00-J06', loại 'J06', mã 'J06.9'; không có mã = danh sách chương)
+    kèm số chẩn đoán của nút và từng nút con, theo tháng trong khoảng ?from=&to=.
+    Nút và cây lấy từ bảng tra trong bộ nhớ; số đếm lấy từ IcdTally đã cộng dồn sẵn (1 query),
+    không đếm trên bảng Diagnosis. Yêu cầu quyền Admin hoặc Bác sĩ.
+    """
+    permission_classes = [IsAuthenticated, IsAdminClaim | IsDoctorClaim]
+
+    def get(self, request, code=None, format=None):
+        first, last = self.get_month_range()
+        if code is None:
+            version, table = icd10.table.get()
+            node, children = None, table.roots()
+        else:
+            version, table, node = self.get_node(code)
+            children = table.children.get(node.code, [])
+        counts = icd10.totals(children + ([node.code] if node else []), first, last)
+
+        data = {'version': version}
+        if node is not None:
+            data.update({
+                'code': node.code,
+                'level': node.level,
+                'title': node.title,
+                'parent': node.parent_code or None,
+                # Mọi chẩn đoán thuộc nút: range_start <= diagnosis_code < range_end
+                'range': {'start': node.range_start, 'end': node.range_end},
+                'count': sum(counts[node.code].values()),
+                'months': [{'month': f'{month:%Y-%m}', 'count': count} for month, count in counts[node.code].items()],
+            })
+        data['children'] = [
+            {'code': child.code, 'level': child.level, 'title': child.title, 'count': sum(counts[child.code].values())}
+            for child in (table.nodes[code] for code in children)
+        ]
+        return Response(data)
+
+
+class IcdDiagnosisListView(IcdMonthRangeMixin, generics.ListAPIView):
+    """
+    API liệt kê các chẩn đoán thuộc một nút ICD-10 (cả nhánh con), mới nhất trước, lọc ?from=&to= theo tháng.
+    Nút được đổi thành khoảng mã [range_start, range_end) nên truy vấn là range scan trên index
+    (diagnosis_code, diagnosis_time). Phân trang cursor như EHR. Yêu cầu quyền Admin hoặc Bác sĩ.
+    """
+    serializer_class = DiagnosisSummarySerializer
+    pagination_class = DiagnosisKeysetPagination
+    permission_classes = [IsAuthenticated, IsAdminClaim | IsDoctorClaim]
+
+    def get_queryset(self):
+        _, _, node = self.get_node(self.kwargs['code'])
+        first, last = self.get_month_range()
+        queryset = Diagnosis.objects.filter(diagnosis_code__gte=node.range_start, diagnosis_code__lt=node.range_end)
+        if first is not None:
+            queryset = queryset.filter(diagnosis_time__gte=timezone.make_aware(datetime.combine(first, time.min)))
+        if last is not None:
+            following = last.replace(year=last.year + last.month // 12, month=last.month % 12 + 1)
+            queryset = queryset.filter(diagnosis_time__lt=timezone.make_aware(datetime.combine(following, time.min)))
+        return queryset
 
 # --- (Tùy chọn) Thêm các ViewSet/Generic Views cho CRUD Diagnosis, Prescription, LabOrder ---
 # class DiagnosisViewSet(viewsets.ReadOnlyModelViewSet): # Ví dụ chỉ cho đọc
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 
@@ -46,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'clinical_service.instrumentation.InstrumentationMiddleware', # Đo thời gian/đếm request, lấy mẫu log debug
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,6 +88,17 @@ DATABASES = {
     }
 }
 
+# PostgreSQL local (benchmark/triển khai): đặt POSTGRES_DB, tùy chọn POSTGRES_USER/PASSWORD/HOST/PORT
+if os.environ.get('POSTGRES_DB'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -130,12 +144,23 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Không tra bảng user trong DB của service này: request.user là TokenUser dựng từ claims (xem SIMPLE_JWT).
+        # JWTAuthentication tra auth_user theo user_id, mà user chỉ tồn tại ở user_service -> mọi token đều 401.
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    # Token bucket theo user_id (JWT) hoặc IP, xem clinical_service/throttling.py. View chọn scope bằng throttle_scope.
+    'DEFAULT_THROTTLE_CLASSES': (
+        'clinical_service.throttling.TokenBucketThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': '60/min',
+        'user': '600/min',
+        'autocomplete': '1200/min', # Gợi ý thuốc theo từng phím gõ
+    },
 }
 
 TIME_ZONE = 'Asia/Ho_Chi_Minh'
@@ -180,4 +205,81 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_EXP_CLAIM': 'refresh_exp',
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5),
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
-}
\ No newline at end of file
+}
+
+
+# Instrumentation (clinical_service/instrumentation.py)
+# Chỉ INSTRUMENTATION_SAMPLE_RATE request được ghi sự kiện debug chi tiết; log đi qua hàng đợi
+# không chặn, thread nền mới ghi ra stderr.
+INSTRUMENTATION_SAMPLE_RATE = 0.01
+INSTRUMENTATION_FLUSH_SECONDS = 60 # Chu kỳ ghi bộ đếm theo view ra log
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'instrumentation': {
+            'class': 'clinical_service.instrumentation.NonBlockingQueueHandler',
+            'maxsize': 10000,
+        },
+    },
+    'loggers': {
+        'instrumentation': {
+            'handlers': ['instrumentation'],
+            'level': 'DEBUG',
+            'propagate': False,
+        },
+    },
+}
+
+# Chạy test (manage.py test): tắt lấy mẫu và bỏ log instrumentation (không mở thread nền ghi JSON ra stderr).
+# Test cần log thì tự bật bằng override_settings(INSTRUMENTATION_SAMPLE_RATE=1) + assertLogs('instrumentation').
+TESTING = sys.argv[1:2] == ['test']
+if TESTING:
+    INSTRUMENTATION_SAMPLE_RATE = 0
+    LOGGING['handlers']['instrumentation'] = {'class': 'logging.NullHandler'}
+
+
+# Transactional outbox (clinical_service/outbox.py): sự kiện được ghi cùng transaction với dữ liệu,
+# lệnh `manage.py publish_outbox` gửi theo lô tới sink.
+OUTBOX_MODEL = 'clinical.OutboxEvent'
+OUTBOX_SOURCE = 'clinical_service'
+OUTBOX_SINK = {
+    # Hoặc 'clinical_service.outbox.SocketSink' với {'address': 'host:port'}, 'clinical_service.outbox.MemorySink' cho test
+    'BACKEND': 'clinical_service.outbox.FileSink',
+    'OPTIONS': {'path': BASE_DIR / 'outbox_events.ndjson'},
+}
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_RETENTION_HOURS = 24 # Giữ sự kiện đã gửi bao lâu trước khi xóa
+
+# EHR phân trang theo cursor (clinical/pagination.py), cũng là số mục tối đa mỗi lần đồng bộ ?since=
+EHR_PAGE_SIZE = 20
+EHR_MAX_PAGE_SIZE = 100
+
+# Số đơn thuốc tối đa mỗi request của prescriptions/batch/
+PRESCRIPTION_BATCH_MAX_SIZE = 500
+
+# Mỗi process kiểm tra version danh mục (thuốc...) tối đa mỗi N giây để dựng lại chỉ mục gợi ý (clinical/catalog.py)
+CATALOG_CHECK_SECONDS = 5
+
+# Idempotency-Key cho các API tạo mới (clinical_service/idempotency.py)
+IDEMPOTENCY_MODEL = 'clinical.IdempotencyRecord'
+IDEMPOTENCY_TTL_SECONDS = 24 * 3600 # Thời gian client được retry với cùng key
+IDEMPOTENCY_LOCK_SECONDS = 60 # Request đầu "đang xử lý" quá lâu thì coi như đã chết
+
+# Nơi giữ các token bucket (clinical_service/throttling.py). FileStore dùng chung cho mọi worker trên cùng máy;
+# nhiều máy thì dùng 'clinical_service.throttling.SocketStore' với {'address': 'host:port'} (manage.py throttle_server),
+# test/dev 1 process có thể dùng 'clinical_service.throttling.LocMemStore'.
+# File bucket nằm cạnh DB của checkout này (không dùng /tmp chung); khi chạy test mỗi process giữ bucket riêng.
+THROTTLE_STORE = {
+    'BACKEND': 'clinical_service.throttling.FileStore',
+    'OPTIONS': {'path': str(BASE_DIR / 'clinical_service-throttle.buckets')},
+}
+if TESTING:
+    THROTTLE_STORE = {'BACKEND': 'clinical_service.throttling.LocMemStore'}
+
+# Chạy benchmark (benchmarks/suite.py): BENCHMARK_MODE=1 tắt giới hạn tần suất và trả header X-DB-Queries
+BENCHMARK_MODE = os.environ.get('BENCHMARK_MODE') == '1'
+INSTRUMENTATION_QUERY_HEADER = BENCHMARK_MODE
+if BENCHMARK_MODE:
+    REST_FRAMEWORK['DEFAULT_THROTTLE_CLASSES'] = ()
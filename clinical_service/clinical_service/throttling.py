@@ -0,0 +1,281 @@
+# throttling.py
+"""
+Giới hạn tần suất request bằng token bucket, dùng chung cho các service Django (user/appointment/clinical).
+Mỗi service giữ một bản sao giống hệt file này trong package project của nó (như instrumentation.py).
+Sửa ở một bản thì chép sang các bản còn lại: SharedModuleTests (appointment_service/appointments/tests.py) báo lỗi khi chúng khác nhau.
+
+- TokenBucketThrottle (DEFAULT_THROTTLE_CLASSES): mỗi (scope, người gọi) có 1 bucket chứa tối đa N token,
+  hồi đều N token mỗi chu kỳ; mỗi request lấy 1 token, hết token -> 429 kèm Retry-After.
+  Người gọi = claim user_id của JWT, hoặc IP (DRF get_ident, tôn trọng NUM_PROXIES) nếu chưa đăng nhập.
+- Giới hạn theo view: thuộc tính `throttle_scope` (tra DEFAULT_THROTTLE_RATES, ví dụ 'slots': '120/min')
+  hoặc `throttle_rate = '10/min'`; không khai báo thì dùng scope 'user' / 'anon'. Scope không có rate -> không giới hạn.
+- Bucket nằm trong store dùng chung (THROTTLE_STORE), mỗi lần quyết định là O(1) và không chạm DB:
+  LocMemStore (trong process, cho test/dev), FileStore (bảng băm cố định trong file mmap, dùng chung cho
+  các worker trên cùng máy), SocketStore (gửi tới `manage.py throttle_server`, dùng chung giữa nhiều máy).
+"""
+import hashlib
+import logging
+import mmap
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from . import instrumentation
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'120/min' -> (dung lượng 120 token, hồi 2 token/giây). None -> None (không giới hạn)."""
+    if rate is None:
+        return None
+    count, period = rate.split('/')
+    capacity = float(count)
+    return capacity, capacity / PERIODS[period.strip()[0]]
+
+
+def consume(tokens, updated, now, capacity, refill, cost=1):
+    """Hồi token theo thời gian đã trôi rồi lấy `cost` token. Trả về (cho phép, token còn lại, số giây phải chờ)."""
+    tokens = min(capacity, tokens + max(0.0, now - updated) * refill)
+    if tokens >= cost:
+        return True, tokens - cost, 0.0
+    return False, tokens, (cost - tokens) / refill
+
+
+def _connect(address, timeout):
+    """'host:port' -> TCP, còn lại là đường dẫn Unix socket."""
+    if ':' in address and not address.startswith('/'):
+        host, port = address.rsplit(':', 1)
+        return socket.create_connection((host, int(port)), timeout=timeout)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    sock.connect(address)
+    return sock
+
+
+# --- Stores ---
+class LocMemStore:
+    """Bucket trong bộ nhớ process (mỗi worker một bản). Giữ tối đa max_entries key, bỏ key lâu không dùng nhất."""
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill, cost=1):
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            allowed, tokens, wait = consume(tokens, updated, now, capacity, refill, cost)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return allowed, wait
+
+
+class FileStore:
+    """
+    Bảng băm kích thước cố định trong 1 file được mmap (mỗi ô: hash 64-bit của key, số token, thời điểm cập nhật).
+    Các worker trên cùng máy mở cùng file. Ô được chia thành nhóm `ways` ô liền nhau; key chỉ nằm trong nhóm
+    theo hash của nó, và mỗi nhóm được khóa riêng bằng fcntl.lockf nên không tranh nhau một khóa chung.
+    Key chưa có ô thì lấy ô trống, hết ô trống thì lấy ô cập nhật lâu nhất trong nhóm (bucket gần như đã hồi đầy).
+    Chỉ khi hơn `ways` key cùng hoạt động trong 1 nhóm, một key mới bị đẩy ra và bắt đầu lại bucket đầy
+    (nới giới hạn, không chặn nhầm) - 2 key trùng ô không còn luân phiên xóa bucket của nhau.
+    """
+    record = struct.Struct('<Qdd')
+
+    def __init__(self, path, slots=65536, ways=4):
+        import fcntl # Chỉ có trên POSIX
+        self._fcntl = fcntl
+        self.path = os.fspath(path)
+        self.ways = ways
+        self.groups = max(1, slots // ways)
+        self.slots = self.groups * ways
+        self._group_size = ways * self.record.size
+        size = self.slots * self.record.size
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        # lockf khóa theo process; các thread trong cùng process cần thêm khóa riêng
+        self._thread_locks = [threading.Lock() for _ in range(64)]
+
+    def _find(self, start, digest):
+        """Offset của ô dành cho digest trong nhóm bắt đầu tại start, và (token, thời điểm) hiện có (None nếu ô mới)."""
+        victim, oldest = None, None
+        for offset in range(start, start + self._group_size, self.record.size):
+            owner, tokens, updated = self.record.unpack_from(self._map, offset)
+            if owner == digest:
+                return offset, (tokens, updated)
+            if owner == 0: # Ô trống: dùng ngay, nhưng vẫn phải chắc key chưa nằm ở ô sau
+                updated = float('-inf')
+            if oldest is None or updated < oldest:
+                victim, oldest = offset, updated
+        return victim, None
+
+    def take(self, key, capacity, refill, cost=1):
+        digest = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        group = digest % self.groups
+        start = group * self._group_size
+        with self._thread_locks[group % len(self._thread_locks)]:
+            self._fcntl.lockf(self._fd, self._fcntl.LOCK_EX, self._group_size, start)
+            try:
+                now = time.time()
+                offset, state = self._find(start, digest)
+                tokens, updated = state or (capacity, now)
+                allowed, tokens, wait = consume(tokens, updated, now, capacity, refill, cost)
+                self.record.pack_into(self._map, offset, digest, tokens, now)
+            finally:
+                self._fcntl.lockf(self._fd, self._fcntl.LOCK_UN, self._group_size, start)
+        return allowed, wait
+
+
+class SocketStore:
+    """
+    Hỏi một throttle server (`manage.py throttle_server`) qua TCP 'host:port' hoặc Unix socket.
+    Mỗi thread giữ 1 kết nối. Server không trả lời được thì cho request đi qua (fail-open), ghi log
+    và không thử lại trong retry_after giây, để sự cố của server giới hạn không làm sập/chậm API.
+    """
+    def __init__(self, address, timeout=0.2, retry_after=1.0):
+        self.address = address
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._down_until = 0.0
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            sock = _connect(self.address, self.timeout)
+            connection = self._local.connection = (sock, sock.makefile('rb'))
+        return connection
+
+    def _close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection[1].close()
+            connection[0].close()
+            self._local.connection = None
+
+    def take(self, key, capacity, refill, cost=1):
+        if time.monotonic() < self._down_until:
+            return True, 0.0
+        try:
+            sock, reader = self._connection()
+            sock.sendall(f'{key} {capacity!r} {refill!r} {cost!r}\n'.encode('utf-8'))
+            allowed, wait = reader.readline().split()
+            if allowed not in (b'0', b'1'): # Server báo request lỗi ('E')
+                raise ValueError(f"Throttle server rejected request for {key!r}")
+            return allowed == b'1', float(wait)
+        except (OSError, ValueError):
+            self._close()
+            self._down_until = time.monotonic() + self.retry_after
+            logger.warning("Throttle server %s unavailable, allowing request", self.address, exc_info=True)
+            return True, 0.0
+
+
+class _StoreRequestHandler(socketserver.StreamRequestHandler):
+    # Mỗi dòng: "<key> <capacity> <refill> <cost>" -> "<1|0> <số giây chờ>"
+    def handle(self):
+        for line in self.rfile:
+            try:
+                key, capacity, refill, cost = line.decode('utf-8').split()
+                allowed, wait = self.server.store.take(key, float(capacity), float(refill), float(cost))
+                reply = f'{int(allowed)} {wait:.3f}\n'
+            except ValueError:
+                reply = 'E 0\n'
+            self.wfile.write(reply.encode('utf-8'))
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(address, store=None):
+    """Server cho SocketStore, giữ bucket trong store (mặc định LocMemStore). Gọi serve_forever() để chạy."""
+    if ':' in address and not address.startswith('/'):
+        host, port = address.rsplit(':', 1)
+        server = _TCPServer((host, int(port)), _StoreRequestHandler)
+    else:
+        if os.path.exists(address):
+            os.unlink(address)
+        server = _UnixServer(address, _StoreRequestHandler)
+    server.store = store or LocMemStore()
+    return server
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Store theo settings.THROTTLE_STORE = {'BACKEND': ..., 'OPTIONS': {...}}, tạo 1 lần mỗi process."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                spec = getattr(settings, 'THROTTLE_STORE', {'BACKEND': f'{__name__}.LocMemStore'})
+                _store = import_string(spec['BACKEND'])(**spec.get('OPTIONS', {}))
+    return _store
+
+
+def _reset_store(*, setting, **kwargs):
+    global _store
+    if setting == 'THROTTLE_STORE':
+        _store = None
+
+
+setting_changed.connect(_reset_store)
+
+
+# --- DRF throttle ---
+class TokenBucketThrottle(BaseThrottle):
+    wait_seconds = None
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        if getattr(view, 'throttle_rate', None):
+            return type(view).__name__
+        return 'user' if request.user and request.user.is_authenticated else 'anon'
+
+    def get_rate(self, scope, view):
+        rate = getattr(view, 'throttle_rate', None)
+        return rate if rate else api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+
+    def get_ident_key(self, request):
+        user = request.user
+        if user and user.is_authenticated:
+            return f'u{user.id}'
+        return f'ip{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        limit = parse_rate(self.get_rate(scope, view))
+        if limit is None:
+            return True
+        capacity, refill = limit
+        allowed, self.wait_seconds = get_store().take(f'{scope}:{self.get_ident_key(request)}', capacity, refill)
+        if not allowed:
+            instrumentation.incr(f'throttled:{scope}')
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
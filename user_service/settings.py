@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'user_service.instrumentation.InstrumentationMiddleware', # Đo thời gian/đếm request, lấy mẫu log debug
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +90,17 @@ DATABASES = {
     }
 }
 
+# PostgreSQL local (benchmark/triển khai): đặt POSTGRES_DB, tùy chọn POSTGRES_USER/PASSWORD/HOST/PORT
+if os.environ.get('POSTGRES_DB'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -143,6 +157,65 @@ REST_FRAMEWORK = {
         # Yêu cầu xác thực cho tất cả các view theo mặc định
         # Bạn có thể ghi đè ở từng view nếu cần (ví dụ: cho phép đăng ký)
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    # Token bucket theo user_id (JWT) hoặc IP, xem user_service/throttling.py. View chọn scope bằng throttle_scope.
+    'DEFAULT_THROTTLE_CLASSES': (
+        'user_service.throttling.TokenBucketThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': '60/min',
+        'user': '600/min',
+        'token': '20/min', # Đăng nhập/refresh token theo IP, chặn dò mật khẩu
+        'register': '10/hour',
+    },
     # Có thể thêm các cài đặt DRF khác ở đây (pagination, filtering,...)
-}
\ No newline at end of file
+}
+
+
+# Instrumentation (user_service/instrumentation.py)
+# Chỉ INSTRUMENTATION_SAMPLE_RATE request được ghi sự kiện debug chi tiết; log đi qua hàng đợi
+# không chặn, thread nền mới ghi ra stderr.
+INSTRUMENTATION_SAMPLE_RATE = 0.01
+INSTRUMENTATION_FLUSH_SECONDS = 60 # Chu kỳ ghi bộ đếm theo view ra log
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'instrumentation': {
+            'class': 'user_service.instrumentation.NonBlockingQueueHandler',
+            'maxsize': 10000,
+        },
+    },
+    'loggers': {
+        'instrumentation': {
+            'handlers': ['instrumentation'],
+            'level': 'DEBUG',
+            'propagate': False,
+        },
+    },
+}
+
+# Chạy test (manage.py test): tắt lấy mẫu và bỏ log instrumentation (không mở thread nền ghi JSON ra stderr).
+# Test cần log thì tự bật bằng override_settings(INSTRUMENTATION_SAMPLE_RATE=1) + assertLogs('instrumentation').
+TESTING = sys.argv[1:2] == ['test']
+if TESTING:
+    INSTRUMENTATION_SAMPLE_RATE = 0
+    LOGGING['handlers']['instrumentation'] = {'class': 'logging.NullHandler'}
+
+# Nơi giữ các token bucket (user_service/throttling.py). FileStore dùng chung cho mọi worker trên cùng máy;
+# nhiều máy thì dùng 'user_service.throttling.SocketStore' với {'address': 'host:port'} (manage.py throttle_server),
+# test/dev 1 process có thể dùng 'user_service.throttling.LocMemStore'.
+# File bucket nằm cạnh DB của checkout này (không dùng /tmp chung); khi chạy test mỗi process giữ bucket riêng.
+THROTTLE_STORE = {
+    'BACKEND': 'user_service.throttling.FileStore',
+    'OPTIONS': {'path': str(BASE_DIR / 'user_service-throttle.buckets')},
+}
+if TESTING:
+    THROTTLE_STORE = {'BACKEND': 'user_service.throttling.LocMemStore'}
+
+# Chạy benchmark (benchmarks/suite.py): BENCHMARK_MODE=1 tắt giới hạn tần suất và trả header X-DB-Queries
+BENCHMARK_MODE = os.environ.get('BENCHMARK_MODE') == '1'
+INSTRUMENTATION_QUERY_HEADER = BENCHMARK_MODE
+if BENCHMARK_MODE:
+    REST_FRAMEWORK['DEFAULT_THROTTLE_CLASSES'] = ()
@@ -30,6 +30,13 @@ from rest_framework_simplejwt.views import TokenObtainPairView as BaseTokenObtai
 # Tạo một view mới sử dụng custom serializer
 class MyTokenObtainPairView(BaseTokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
+    throttle_scope = 'token' # Giới hạn theo IP, xem DEFAULT_THROTTLE_RATES
+
+class MyTokenRefreshView(TokenRefreshView):
+    throttle_scope = 'token'
+
+class MyTokenVerifyView(TokenVerifyView):
+    throttle_scope = 'token'
 
 # urlpatterns = [
 #     # ... (admin, users.urls)
@@ -56,7 +63,7 @@ urlpatterns = [
     # path('api/v1/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
     
     path('api/v1/token/', MyTokenObtainPairView.as_view(), name='token_obtain_pair'), # Dùng view tùy chỉnh
-    path('api/v1/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('api/v1/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
+    path('api/v1/token/refresh/', MyTokenRefreshView.as_view(), name='token_refresh'),
+    path('api/v1/token/verify/', MyTokenVerifyView.as_view(), name='token_verify'),
 ]
 
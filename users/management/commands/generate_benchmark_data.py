@@ -0,0 +1,85 @@
+# users/management/commands/generate_benchmark_data.py
+import json
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from users.models import Profile, Role, User
+
+USERNAME_PREFIX = 'bench_'
+
+
+class Command(BaseCommand):
+    help = ("Sinh dữ liệu giả lập cho benchmark (benchmarks/suite.py) bằng bulk_create: bác sĩ và bệnh nhân "
+            "(username bench_doctor_N / bench_patient_N, cùng một mật khẩu). In ra (và ghi --manifest) dải ID "
+            "để dùng cho generate_benchmark_data của appointment_service/clinical_service.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=10000)
+        parser.add_argument('--patients', type=int, default=100000)
+        parser.add_argument('--scale', type=float, default=1.0, help="Nhân số lượng (ví dụ 0.01 để chạy thử nhanh)")
+        parser.add_argument('--password', default='benchmark', help="Mật khẩu chung của mọi user sinh ra")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true', help="Xóa các user benchmark cũ (username bench_*) trước")
+        parser.add_argument('--manifest', help="Ghi dải ID và mật khẩu ra file JSON (benchmarks/suite.py --manifest)")
+
+    def handle(self, *args, **options):
+        doctors = int(options['doctors'] * options['scale'])
+        patients = int(options['patients'] * options['scale'])
+        batch_size = options['batch_size']
+        if connection.vendor == 'sqlite':
+            # Dữ liệu giả lập: không cần fsync từng transaction
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous = OFF')
+
+        if options['clear']:
+            deleted, _ = User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+            self.stdout.write(f"Đã xóa {deleted} dòng dữ liệu benchmark cũ.")
+
+        roles = {name: Role.objects.get_or_create(name=name)[0] for name in ('Doctor', 'Patient')}
+        # Băm mật khẩu 1 lần cho tất cả (mỗi lần băm PBKDF2 mất hàng trăm ms)
+        password = make_password(options['password'])
+        started = time.perf_counter()
+        doctor_ids = self.create_users('doctor', doctors, roles['Doctor'], password, batch_size)
+        patient_ids = self.create_users('patient', patients, roles['Patient'], password, batch_size)
+        elapsed = time.perf_counter() - started
+
+        manifest = {
+            'doctor_ids': [doctor_ids[0], doctor_ids[-1]] if doctor_ids else None,
+            'patient_ids': [patient_ids[0], patient_ids[-1]] if patient_ids else None,
+            'doctor_usernames': f'{USERNAME_PREFIX}doctor_<1..{doctors}>',
+            'patient_usernames': f'{USERNAME_PREFIX}patient_<1..{patients}>',
+            'password': options['password'],
+        }
+        if options['manifest']:
+            with open(options['manifest'], 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã tạo {doctors} bác sĩ (id {manifest['doctor_ids']}) và {patients} bệnh nhân "
+            f"(id {manifest['patient_ids']}) trong {elapsed:.1f}s."
+        ))
+
+    def create_users(self, kind, count, role, password, batch_size):
+        """Tạo user theo lô; trả về danh sách ID (liên tiếp nếu bảng không bị ghi song song)."""
+        ids = []
+        RoleLink = User.roles.through
+        for offset in range(0, count, batch_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(
+                        username=f'{USERNAME_PREFIX}{kind}_{n}',
+                        email=f'{kind}{n}@benchmark.local',
+                        first_name=kind.capitalize(),
+                        last_name=str(n),
+                        password=password,
+                    )
+                    for n in range(offset + 1, min(offset + batch_size, count) + 1)
+                ], batch_size=batch_size)
+                Profile.objects.bulk_create([Profile(user=user) for user in users], batch_size=batch_size)
+                RoleLink.objects.bulk_create([RoleLink(user_id=user.id, role_id=role.id) for user in users], batch_size=batch_size)
+            ids.extend(user.id for user in users)
+            self.stdout.write(f"  {kind}: {len(ids)}/{count}", ending='\r')
+        self.stdout.write('')
+        return ids
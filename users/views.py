@@ -18,6 +18,7 @@ class UserRegistrationView(generics.CreateAPIView):
     queryset = User.objects.all() # Cần thiết cho CreateAPIView nhưng không dùng nhiều ở đây
     serializer_class = UserRegistrationSerializer
     permission_classes = [AllowAny] # Cho phép bất kỳ ai cũng có thể đăng ký
+    throttle_scope = 'register' # Giới hạn theo IP (chưa đăng nhập)
 
     # Có thể ghi đè perform_create nếu cần thêm logic sau khi tạo user thành công
     # def perform_create(self, serializer):